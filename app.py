@@ -228,5 +228,21 @@ def from_json_filter(value):
 
 logging.info("✅ Custom Jinja2 filters registered")
 
+# Request latency, SQL-per-request and SAP B1 call metrics, served at /metrics
+from metrics import init_metrics
+init_metrics(app)
+
 # Import routes to register them
 import routes
+
+# Start the SAP posting outbox worker - QC approvals are posted to SAP B1 in the background
+from sap_outbox import start_outbox_worker
+start_outbox_worker(app)
+
+# Keep the local SAP serial number index current with our own postings
+from sap_serial_index import start_serial_index
+start_serial_index(app)
+
+# Periodic SAP jobs (master data / serial index delta syncs, open pick lists, open document lists, cache warm-up)
+from sap_scheduler import start_scheduler
+start_scheduler(app)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Scanner Endpoint Benchmarks
+Repeatable latency/throughput runs for the endpoints the handhelds hit hardest,
+against the real Flask app backed by the local SAP B1 stand-in
+(sap_standin_server.py) and a throwaway SQLite database.
+
+For every case it reports p50/p95/p99 latency and throughput at each
+concurrency level, plus SQL queries and SAP B1 calls per request (measured on a
+sequential pass so each count belongs to one request). Results can be stored as
+baselines and later runs are compared against them.
+
+Usage:
+    python benchmark_scanner_endpoints.py                          # all cases vs. stored baselines
+    python benchmark_scanner_endpoints.py --case scan_bin --case qc_dashboard --concurrency 1,16
+    python benchmark_scanner_endpoints.py --sap-latency-ms 80 --save-baseline
+    python benchmark_scanner_endpoints.py --fail-on-regression     # non-zero exit for CI
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baselines.json')
+BENCH_USERNAME = 'bench_admin'
+BENCH_PASSWORD = 'bench-password'
+SERIAL_ITEM_CODE = 'BENCH-SERIAL'
+SERIAL_WAREHOUSE = 'WH01'
+SERIAL_POOL_SIZE = 5000
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)]
+
+
+class BenchmarkCase:
+    """One endpoint under test; build() returns (method, path, request kwargs) for the next call"""
+
+    def __init__(self, name, build, requests=200, concurrency=None, setup=None, description=''):
+        self.name = name
+        self.build = build
+        self.requests = requests
+        self.concurrency = concurrency  # None -> use the --concurrency levels
+        self.setup = setup              # per-request setup, runs before the timed call
+        self.description = description
+
+
+class BenchmarkEnvironment:
+    """App + stand-in wiring; must be created before anything imports app"""
+
+    def __init__(self, args, outbox_worker=False, **dataset_options):
+        from sap_standin_server import InjectionSettings, StandinDataset, start_standin_server
+
+        self.dataset = StandinDataset(items=args.items, bins_per_warehouse=args.bins_per_warehouse, seed=args.seed,
+                                      **dataset_options)
+        self.serials = self.dataset.add_serials(SERIAL_ITEM_CODE, SERIAL_WAREHOUSE, SERIAL_POOL_SIZE)
+        self.dataset.collections['Items'].append({
+            'ItemCode': SERIAL_ITEM_CODE, 'ItemName': 'Benchmark serial item', 'InventoryUOM': 'EA',
+            'ManageBatchNumbers': 'tNO', 'ManageSerialNumbers': 'tYES', 'QuantityOnStock': float(SERIAL_POOL_SIZE),
+            'ItemWarehouseInfoCollection': []})
+        self.standin, standin_url = start_standin_server(
+            dataset=self.dataset, injection=InjectionSettings(args.sap_latency_ms, args.sap_jitter_ms))
+
+        self.workdir = tempfile.mkdtemp(prefix='wms-bench-')
+        os.environ['SAP_B1_SERVER'] = standin_url
+        os.environ.setdefault('SAP_B1_USERNAME', 'bench')
+        os.environ.setdefault('SAP_B1_PASSWORD', 'bench')
+        os.environ.setdefault('SAP_B1_COMPANY_DB', 'BENCH')
+        os.environ.setdefault('SESSION_SECRET', 'benchmark-secret')
+        os.environ['SAP_OUTBOX_WORKER'] = 'true' if outbox_worker else 'false'
+        # Scheduled SAP syncs would change the data being measured mid-run; the serial index
+        # gets one delta pull below instead of its scheduled refreshes
+        os.environ['SAP_SCHEDULER'] = 'false'
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(self.workdir, 'benchmark.db')}"
+
+        import main  # noqa: F401  (registers routes)
+        from app import app, db
+        from werkzeug.serving import make_server
+
+        self.app = app
+        self.db = db
+        self.user_id = self.create_user(BENCH_USERNAME, 'admin')
+        self._seed_qc_queue(args.qc_documents)
+        self._prime_serial_index()
+        self.http = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=self.http.serve_forever, name='bench-app', daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.http.server_port}'
+        self.bin_codes = sorted({row['BinCode'] for row in self.dataset.bin_item_stock})
+        self.item_codes = [item['ItemCode'] for item in self.dataset.collections['Items']]
+        self._sessions = threading.local()
+
+    def create_user(self, username, role, password=BENCH_PASSWORD):
+        from werkzeug.security import generate_password_hash
+        from models import User
+
+        with self.app.app_context():
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                user = User(username=username, email=f'{username}@example.com', role=role,
+                            password_hash=generate_password_hash(password), branch_id='HQ001',
+                            must_change_password=False)
+                self.db.session.add(user)
+                self.db.session.commit()
+            return user.id
+
+    def _seed_qc_queue(self, count):
+        """Submitted GRPOs and transfers so /qc_dashboard renders a realistic queue"""
+        from models import InventoryTransfer
+        from modules.grpo.models import GRPODocument
+
+        with self.app.app_context():
+            if GRPODocument.query.filter_by(status='submitted').count() >= count:
+                return
+            for n in range(count):
+                self.db.session.add(GRPODocument(po_number=str(10100001 + n), user_id=self.user_id, status='submitted'))
+                self.db.session.add(InventoryTransfer(transfer_request_number=str(5000001 + n), user_id=self.user_id,
+                                                      status='submitted', from_warehouse='WH01', to_warehouse='WH02'))
+            self.db.session.commit()
+
+    def _prime_serial_index(self):
+        """One delta pull, as the scheduler's serial_index job would do at startup"""
+        from sap_serial_index import SERIAL_INDEX_ENABLED, refresh_serial_index
+
+        if SERIAL_INDEX_ENABLED:
+            with self.app.app_context():
+                refresh_serial_index()
+
+    def login(self, username, password=BENCH_PASSWORD):
+        """New requests.Session logged in through the /login form"""
+        import requests
+        session = requests.Session()
+        response = session.post(f'{self.base_url}/login', allow_redirects=False,
+                                data={'username': username, 'password': password})
+        if response.status_code != 302:
+            raise RuntimeError(f'Login as {username} failed with HTTP {response.status_code}')
+        return session
+
+    def session(self):
+        """Session logged in as the benchmark user, one per worker thread"""
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = self._sessions.session = self.login(BENCH_USERNAME)
+        return session
+
+    def sap_calls(self):
+        return sum(entry['count'] for entry in self.standin.state.stats_snapshot().values())
+
+    def sql_queries(self):
+        from metrics import db_queries_total
+        return db_queries_total.total()
+
+    def close(self):
+        """Stop the background threads while the SAP fan-out pool still accepts work, then the servers"""
+        from sap_outbox import stop_outbox_worker
+        from sap_scheduler import stop_scheduler
+        from sap_serial_index import stop_serial_index
+
+        stop_scheduler()
+        stop_outbox_worker()
+        stop_serial_index()
+        self.http.shutdown()
+        self.standin.shutdown()
+
+
+# ================================
+# Cases
+# ================================
+
+def build_cases(env):
+    rng = random.Random(7)
+
+    def new_serial_transfer():
+        from models import SerialNumberTransfer
+        with env.app.app_context():
+            transfer = SerialNumberTransfer(transfer_number=f'BENCH-SNT-{time.time_ns()}-{rng.randint(0, 9999)}',
+                                            user_id=env.user_id, from_warehouse=SERIAL_WAREHOUSE,
+                                            to_warehouse='WH02', status='draft')
+            env.db.session.add(transfer)
+            env.db.session.commit()
+            return transfer.id
+
+    def new_serial_item_transfer():
+        from models import SerialItemTransfer
+        with env.app.app_context():
+            transfer = SerialItemTransfer(transfer_number=f'BENCH-SIT-{time.time_ns()}-{rng.randint(0, 9999)}',
+                                          user_id=env.user_id, from_warehouse=SERIAL_WAREHOUSE,
+                                          to_warehouse='WH02', status='draft')
+            env.db.session.add(transfer)
+            env.db.session.commit()
+            return transfer.id
+
+    def serial_add_item(count):
+        def build(transfer_id):
+            serials = env.serials[:count]
+            return 'POST', f'/inventory_transfer/serial/{transfer_id}/add_item', {'data': {
+                'item_code': SERIAL_ITEM_CODE, 'item_name': 'Benchmark serial item',
+                'quantity': str(count), 'serial_numbers': '\n'.join(serials)}}
+        return build
+
+    def add_multiple_serials(transfer_id):
+        serials = [{'serial_number': serial, 'item_code': SERIAL_ITEM_CODE, 'item_description': 'Benchmark serial item',
+                    'warehouse_code': SERIAL_WAREHOUSE} for serial in rng.sample(env.serials, 100)]
+        return 'POST', f'/serial-item-transfer/{transfer_id}/add_multiple_serials', {
+            'data': {'validated_serials': json.dumps(serials)}}
+
+    return [
+        BenchmarkCase('scan_bin', lambda _: ('POST', '/api/scan_bin', {'json': {'bin_code': rng.choice(env.bin_codes)}}),
+                      description='Bin scan with item and batch details'),
+        BenchmarkCase('validate_item', lambda _: ('POST', '/api/validate_item', {'json': {'item_code': rng.choice(env.item_codes)}}),
+                      description='Item master lookup'),
+        BenchmarkCase('grpo_validate_item', lambda _: ('GET', f'/grpo/validate-item/{rng.choice(env.item_codes)}', {}),
+                      description='GRPO batch/serial requirement check'),
+        BenchmarkCase('serial_transfer_add_item_100', serial_add_item(100), requests=5, concurrency=[1],
+                      setup=new_serial_transfer, description='Serial transfer line with 100 serials'),
+        BenchmarkCase('serial_transfer_add_item_1500', serial_add_item(1500), requests=2, concurrency=[1],
+                      setup=new_serial_transfer, description='Serial transfer line with 1 500 serials'),
+        BenchmarkCase('serial_transfer_add_item_5000', serial_add_item(5000), requests=1, concurrency=[1],
+                      setup=new_serial_transfer, description='Serial transfer line with 5 000 serials'),
+        BenchmarkCase('serial_item_add_multiple_serials', add_multiple_serials, requests=20,
+                      setup=new_serial_item_transfer, description='100 pre-validated serials in one post'),
+        BenchmarkCase('qc_dashboard', lambda _: ('GET', '/qc_dashboard', {}), requests=50,
+                      description='QC dashboard with a seeded approval queue'),
+        BenchmarkCase('generate_label_qr', lambda _: ('POST', '/api/generate-label-qr', {'json': {
+            'item_code': rng.choice(env.item_codes), 'item_name': 'Benchmark item', 'po_number': '10100001',
+            'batch_number': 'B000001', 'format': 'TEXT', 'quantity': '5'}}),
+                      description='GRN label QR generation'),
+    ]
+
+
+# ================================
+# Runner
+# ================================
+
+def _call(env, case):
+    context = case.setup() if case.setup else None
+    method, path, kwargs = case.build(context)
+    session = env.session()
+    started = time.perf_counter()
+    try:
+        response = session.request(method, env.base_url + path, allow_redirects=False, timeout=900, **kwargs)
+        ok = response.status_code < 400
+    except Exception as e:
+        logging.warning(f"⚠️ {case.name} request failed: {e}")
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def profile_case(env, case, samples):
+    """SQL queries and SAP calls per request, from a sequential pass"""
+    env.session()  # keep the login out of the counts
+    sql_total = sap_total = 0
+    for _ in range(samples):
+        context = case.setup() if case.setup else None
+        method, path, kwargs = case.build(context)
+        sql_before, sap_before = env.sql_queries(), env.sap_calls()
+        env.session().request(method, env.base_url + path, allow_redirects=False, timeout=900, **kwargs)
+        sql_total += env.sql_queries() - sql_before
+        sap_total += env.sap_calls() - sap_before
+    return round(sql_total / samples, 1), round(sap_total / samples, 1)
+
+
+def run_case(env, case, concurrency):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [case.requests]
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            elapsed, ok = _call(env, case)
+            with lock:
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(lambda: env.session())  # log every worker in before the clock starts
+        started = time.perf_counter()
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+        for future in futures:
+            future.result()
+        wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency, 'requests': len(latencies), 'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+
+
+def compare_with_baseline(name, result, baseline, tolerance):
+    """List of human-readable regressions for one case"""
+    regressions = []
+    if not baseline:
+        return regressions
+    for metric in ('sql_per_request', 'sap_calls_per_request'):
+        if result[metric] > baseline.get(metric, result[metric]):
+            regressions.append(f"{name}: {metric} {baseline[metric]} -> {result[metric]}")
+    baseline_levels = {level['concurrency']: level for level in baseline.get('levels', [])}
+    for level in result['levels']:
+        previous = baseline_levels.get(level['concurrency'])
+        if not previous:
+            continue
+        if previous['p95_ms'] and level['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name} @{level['concurrency']}: p95 {previous['p95_ms']}ms -> {level['p95_ms']}ms")
+        if previous['throughput_rps'] and level['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name} @{level['concurrency']}: throughput {previous['throughput_rps']} -> "
+                               f"{level['throughput_rps']} req/s")
+    return regressions
+
+
+def print_report(results, baselines):
+    header = f"{'case':36} {'conc':>4} {'reqs':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'sql/req':>8} {'sap/req':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        for level in result['levels']:
+            print(f"{name:36} {level['concurrency']:>4} {level['requests']:>5} {level['errors']:>4} {level['p50_ms']:>9} "
+                  f"{level['p95_ms']:>9} {level['p99_ms']:>9} {level['throughput_rps']:>8} "
+                  f"{result['sql_per_request']:>8} {result['sap_calls_per_request']:>8}")
+            previous = next((l for l in baselines.get(name, {}).get('levels', [])
+                             if l['concurrency'] == level['concurrency']), None)
+            if previous:
+                print(f"{'  baseline':36} {'':>4} {'':>5} {'':>4} {previous['p50_ms']:>9} {previous['p95_ms']:>9} "
+                      f"{previous['p99_ms']:>9} {previous['throughput_rps']:>8} "
+                      f"{baselines[name].get('sql_per_request', ''):>8} {baselines[name].get('sap_calls_per_request', ''):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hot scanner endpoints against the SAP B1 stand-in')
+    parser.add_argument('--case', action='append', help='run only this case (repeatable)')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated client counts (default 1,8)')
+    parser.add_argument('--requests', type=int, help='override requests per concurrency level for every case')
+    parser.add_argument('--profile-samples', type=int, default=3, help='sequential calls used for SQL/SAP counts')
+    parser.add_argument('--sap-latency-ms', type=float, default=20, help='stand-in Service Layer latency per call')
+    parser.add_argument('--sap-jitter-ms', type=float, default=5)
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--bins-per-warehouse', type=int, default=40)
+    parser.add_argument('--qc-documents', type=int, default=50, help='submitted GRPOs/transfers seeded for the QC queue')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='database to benchmark against (default: throwaway SQLite)')
+    parser.add_argument('--baseline-file', default=DEFAULT_BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95/throughput drift (default 25%%)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--output', help='also write the raw results as JSON here')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    env = BenchmarkEnvironment(args)
+    logging.getLogger().setLevel(logging.WARNING)  # the app configures INFO on import
+    cases = build_cases(env)
+    if args.list:
+        for case in cases:
+            print(f"{case.name:36} {case.description}")
+        env.close()
+        return 0
+    if args.case:
+        unknown = set(args.case) - {case.name for case in cases}
+        if unknown:
+            parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+        cases = [case for case in cases if case.name in args.case]
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file, encoding='utf-8') as handle:
+            baselines = json.load(handle)
+
+    results = {}
+    for case in cases:
+        if args.requests:
+            case.requests = args.requests
+        print(f"▶ {case.name}: {case.description}", file=sys.stderr)
+        sql_per_request, sap_per_request = profile_case(env, case, min(args.profile_samples, case.requests))
+        results[case.name] = {
+            'sql_per_request': sql_per_request, 'sap_calls_per_request': sap_per_request,
+            'levels': [run_case(env, case, level) for level in (case.concurrency or levels)],
+            'sap_latency_ms': args.sap_latency_ms, 'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+
+    print_report(results, baselines)
+    regressions = []
+    for name, result in results.items():
+        regressions += compare_with_baseline(name, result, baselines.get(name), args.tolerance)
+    if regressions:
+        print('\n⚠️ Regressions against baseline:')
+        for regression in regressions:
+            print(f"  - {regression}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2)
+    if args.save_baseline:
+        baselines.update(results)
+        os.makedirs(os.path.dirname(args.baseline_file), exist_ok=True)
+        with open(args.baseline_file, 'w', encoding='utf-8') as handle:
+            json.dump(baselines, handle, indent=2, sort_keys=True)
+        print(f"\n✅ Baseline saved to {args.baseline_file}")
+
+    env.close()
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
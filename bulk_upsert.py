@@ -0,0 +1,129 @@
+"""
+Bulk Upserts for SAP-to-local Syncs
+Writes synced rows in chunks with one statement per chunk instead of a SELECT plus an
+INSERT/UPDATE per row: multi-row INSERT ... ON CONFLICT DO UPDATE on PostgreSQL,
+INSERT ... ON DUPLICATE KEY UPDATE on MySQL and an executemany of
+INSERT ... ON CONFLICT DO UPDATE on SQLite. bulk_insert() covers plain inserts that need
+the generated ids back (parent rows whose children are inserted next): through
+INSERT ... RETURNING where the dialect supports it, otherwise (MySQL) by reading the new
+rows back by their natural key.
+"""
+import logging
+import os
+
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+# Rows per upsert statement (per executemany on SQLite)
+UPSERT_CHUNK = int(os.environ.get('DB_UPSERT_CHUNK', '1000'))
+
+
+def _dialect_insert(dialect_name):
+    return {'postgresql': postgresql.insert, 'mysql': mysql.insert, 'mariadb': mysql.insert,
+            'sqlite': sqlite.insert}.get(dialect_name)
+
+
+def bulk_upsert(table, rows, conflict_columns, update_columns=None, chunk_size=None, session=None):
+    """Insert rows, updating the existing ones that match conflict_columns.
+
+    table is a model class or Table, rows are dicts of column values (all with the same
+    keys) and conflict_columns must be covered by a unique constraint. update_columns
+    defaults to every other supplied column; an updated_at column is refreshed on update.
+    Does not commit. Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    if session is None:
+        from app import db
+        session = db.session
+    table = getattr(table, '__table__', table)
+    dialect = session.get_bind().dialect.name
+    insert = _dialect_insert(dialect)
+    if insert is None:
+        raise ValueError(f"bulk_upsert does not support the {dialect} dialect")
+
+    conflict_columns = list(conflict_columns)
+    # PostgreSQL rejects a statement that touches the same row twice; the last occurrence wins
+    rows = list({tuple(row[column] for column in conflict_columns): row for row in rows}.values())
+    if update_columns is None:
+        update_columns = [column for column in rows[0] if column not in conflict_columns]
+    touch = 'updated_at' in table.c and 'updated_at' not in rows[0]
+    chunk_size = max(1, chunk_size or UPSERT_CHUNK)
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if dialect == 'sqlite':
+            # Multi-row VALUES hits SQLite's bound-parameter limit; executemany is just as fast there
+            statement = insert(table)
+        else:
+            statement = insert(table).values(chunk)
+
+        if dialect in ('mysql', 'mariadb'):
+            changes = {column: statement.inserted[column] for column in update_columns}
+            if touch:
+                changes['updated_at'] = func.now()
+            statement = (statement.on_duplicate_key_update(changes) if changes
+                         else statement.prefix_with('IGNORE'))
+        else:
+            changes = {column: statement.excluded[column] for column in update_columns}
+            if touch:
+                changes['updated_at'] = func.now()
+            statement = (statement.on_conflict_do_update(index_elements=conflict_columns, set_=changes)
+                         if changes else statement.on_conflict_do_nothing(index_elements=conflict_columns))
+
+        if dialect == 'sqlite':
+            session.execute(statement, chunk)
+        else:
+            session.execute(statement)
+
+    logging.debug(f"Upserted {len(rows)} rows into {table.name} in {-(-len(rows) // chunk_size)} statements")
+    return len(rows)
+
+
+def bulk_insert(table, rows, return_ids=False, key_columns=None, chunk_size=None, session=None):
+    """Insert rows (dicts with the same keys) with one executemany per chunk.
+
+    With return_ids=True returns the generated primary keys in the order of rows. Dialects
+    without INSERT ... RETURNING (MySQL) read them back by key_columns, which must be unique
+    among rows (an older row with the same key resolves to the newest id); without
+    key_columns those dialects insert row by row. Does not commit.
+    """
+    if not rows:
+        return [] if return_ids else 0
+    if session is None:
+        from app import db
+        session = db.session
+    table = getattr(table, '__table__', table)
+    chunk_size = max(1, chunk_size or UPSERT_CHUNK)
+    primary_key = list(table.primary_key.columns)[0]
+    returning = session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if not return_ids:
+            session.execute(insert(table), chunk)
+        elif returning:
+            result = session.execute(insert(table).returning(primary_key, sort_by_parameter_order=True), chunk)
+            ids.extend(row[0] for row in result)
+        elif key_columns:
+            ids.extend(_insert_and_read_back(session, table, primary_key, chunk, list(key_columns)))
+        else:
+            ids.extend(session.execute(insert(table), row).inserted_primary_key[0] for row in chunk)
+    return ids if return_ids else len(rows)
+
+
+def _insert_and_read_back(session, table, primary_key, rows, key_columns):
+    """executemany INSERT, then one SELECT of the new ids by natural key, in the order of rows"""
+    keys = [tuple(row[column] for column in key_columns) for row in rows]
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"bulk_insert key {key_columns} is not unique among the rows for {table.name}")
+    session.execute(insert(table), rows)
+    columns = [table.c[column] for column in key_columns]
+    if len(columns) == 1:
+        condition = columns[0].in_([key[0] for key in keys])
+    else:
+        condition = tuple_(*columns).in_(keys)
+    new_ids = {}
+    for row in session.execute(select(primary_key, *columns).where(condition).order_by(primary_key)):
+        new_ids[tuple(row[1:])] = row[0]  # ascending ids: the newest row per key wins
+    return [new_ids[key] for key in keys]
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Warehouse Shift Load Generator
+Replays a warehouse shift against the app: generated operators log in and run
+complete document lifecycles through the blueprints (GRPO receipts, inventory and
+serial transfers, sales deliveries, direct transfers, multi-GRN, pick-list
+confirmation, inventory counting) with think times, while generated QC users
+approve what they submit and the outbox worker posts it to the SAP B1 stand-in.
+
+A shift is a scenario mix plus operator count, duration, ramp-up and think time.
+It comes from the built-in default or a JSON file:
+    {"operators": 50, "qc_inspectors": 5, "duration": 600, "ramp_up": 60,
+     "think_time": [2, 8], "mix": {"grpo_receipt": 25, "serial_transfer": 15, ...}}
+
+At the end it prints per-step latency (p50/p95/p99), per-scenario lifecycle
+counts and durations, overall throughput and the most common failures.
+
+The SAP scheduler does not run during a shift (BenchmarkEnvironment turns it off),
+so pick lists reach the database only through the pick_list_confirmation imports
+and every operator starts from the same stand-in state. The outbox worker runs, as
+QC approvals post through it.
+
+Known failures in the default mix:
+    inventory_transfer.submit   auto-populated lines use columns InventoryTransferItem
+                                does not have, so request-based transfers never submit
+    serial_transfer.submit      operators draw overlapping serial ranges, and serials an
+                                earlier transfer already moved out of WH01 fail validation
+    multi_grn                   batch numbers are per second and collide under concurrency
+
+Usage:
+    python load_generator.py                                  # default 50-operator shift, 10 minutes
+    python load_generator.py --operators 10 --duration 120 --think-scale 0.2
+    python load_generator.py --shift shifts/peak.json --sap-latency-ms 80 --output shift_report.json
+"""
+import argparse
+import html
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter as ReasonCounter
+
+from benchmark_scanner_endpoints import SERIAL_ITEM_CODE, SERIAL_WAREHOUSE, BenchmarkEnvironment, percentile
+
+DEFAULT_SHIFT = {
+    'operators': 50,
+    'qc_inspectors': 5,
+    'duration': 600,
+    'ramp_up': 60,
+    'think_time': [2, 8],
+    'mix': {
+        'grpo_receipt': 25,
+        'serial_transfer': 12,
+        'serial_item_transfer': 8,
+        'inventory_transfer': 12,
+        'pick_list_confirmation': 18,
+        'inventory_counting': 10,
+        'sales_delivery': 8,
+        'direct_inventory_transfer': 5,
+        'multi_grn': 2,
+    },
+}
+POSTING_POLL_INTERVAL = 1.0
+POSTING_TIMEOUT = 180
+
+SCENARIOS = {}
+
+
+def scenario(name, blueprint):
+    """Register a lifecycle; the function gets an Operator and runs one document end to end"""
+    def register(function):
+        SCENARIOS[name] = {'run': function, 'blueprint': blueprint, 'description': (function.__doc__ or '').strip()}
+        return function
+    return register
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class ShiftRecorder:
+    """Thread-safe latency and outcome bookkeeping for the whole shift"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}        # step -> {'latencies': [...], 'errors': n}
+        self.scenarios = {}    # scenario -> {'completed', 'failed', 'durations'}
+        self.failures = ReasonCounter()
+
+    def step(self, name, elapsed, ok):
+        with self._lock:
+            entry = self.steps.setdefault(name, {'latencies': [], 'errors': 0})
+            entry['latencies'].append(elapsed)
+            entry['errors'] += 0 if ok else 1
+
+    def lifecycle(self, name, elapsed, error=None):
+        with self._lock:
+            entry = self.scenarios.setdefault(name, {'completed': 0, 'failed': 0, 'durations': []})
+            if error is None:
+                entry['completed'] += 1
+                entry['durations'].append(elapsed)
+            else:
+                entry['failed'] += 1
+                self.failures[f'{name}: {error}'[:160]] += 1
+
+    def report(self, wall):
+        with self._lock:
+            steps = {name: {'requests': len(e['latencies']), 'errors': e['errors'],
+                            'p50_ms': round(percentile(e['latencies'], 50) * 1000, 1),
+                            'p95_ms': round(percentile(e['latencies'], 95) * 1000, 1),
+                            'p99_ms': round(percentile(e['latencies'], 99) * 1000, 1),
+                            'max_ms': round(max(e['latencies'], default=0) * 1000, 1)}
+                     for name, e in sorted(self.steps.items())}
+            scenarios = {name: {'completed': e['completed'], 'failed': e['failed'],
+                                'avg_lifecycle_s': round(sum(e['durations']) / len(e['durations']), 1) if e['durations'] else 0,
+                                'p95_lifecycle_s': round(percentile(e['durations'], 95), 1)}
+                         for name, e in sorted(self.scenarios.items())}
+            requests = sum(s['requests'] for name, s in steps.items() if not name.endswith('.sap_posted'))
+            completed = sum(s['completed'] for s in scenarios.values())
+            return {
+                'wall_seconds': round(wall, 1),
+                'requests': requests,
+                'requests_per_second': round(requests / wall, 2) if wall else 0,
+                'lifecycles_completed': completed,
+                'lifecycles_failed': sum(s['failed'] for s in scenarios.values()),
+                'lifecycles_per_minute': round(completed / wall * 60, 2) if wall else 0,
+                'steps': steps,
+                'scenarios': scenarios,
+                'top_failures': self.failures.most_common(10),
+            }
+
+
+class Operator:
+    """One handheld user with a QC counterpart, running scenarios against the app"""
+
+    def __init__(self, index, env, session, qc_session, recorder, think_time, think_scale, shift):
+        self.index = index
+        self.env = env
+        self.session = session
+        self.qc = qc_session
+        self.recorder = recorder
+        self.think_time = think_time
+        self.think_scale = think_scale
+        self.shift = shift
+        self.rng = random.Random(1000 + index)
+        self.used_purchase_orders = set()
+        self._pick_cursor = 0
+        self._count_cursor = 0
+
+    # -- plumbing ---------------------------------------------------------
+
+    def call(self, step, method, path, session=None, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = (session or self.session).request(method, self.env.base_url + path, allow_redirects=False,
+                                                        timeout=300, **kwargs)
+        except Exception as e:
+            self.recorder.step(step, time.perf_counter() - started, False)
+            raise ScenarioError(f'{step} failed: {e}')
+        ok = response.status_code in expect
+        self.recorder.step(step, time.perf_counter() - started, ok)
+        if not ok:
+            raise ScenarioError(f'{step} returned HTTP {response.status_code}')
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            payload = response.json()
+            if isinstance(payload, dict) and payload.get('success') is False:
+                raise ScenarioError(f"{step}: {payload.get('error', 'success=false')}")
+        return response
+
+    def think(self, scale=1.0):
+        low, high = self.think_time
+        time.sleep(self.rng.uniform(low, high) * self.think_scale * scale)
+
+    @staticmethod
+    def redirect_id(response, pattern):
+        match = re.search(pattern, response.headers.get('Location', ''))
+        if not match:
+            raise ScenarioError(f"unexpected redirect to {response.headers.get('Location')!r}")
+        return int(match.group(1))
+
+    def wait_for_posting(self, step, job_id=None, job_type=None, document_id=None):
+        """Poll the outbox job until SAP B1 has the document; the wait is recorded as its own step"""
+        started = time.perf_counter()
+        while time.perf_counter() - started < POSTING_TIMEOUT:
+            if job_id is None:
+                job_id = self._find_job(job_type, document_id)
+            if job_id is not None:
+                job = self.session.get(f'{self.env.base_url}/api/sap-jobs/{job_id}', timeout=30).json()
+                if job.get('status') in ('succeeded', 'failed'):
+                    ok = job['status'] == 'succeeded'
+                    self.recorder.step(step, time.perf_counter() - started, ok)
+                    if not ok:
+                        raise ScenarioError(f"{step}: {job.get('last_error')}")
+                    return job
+            time.sleep(POSTING_POLL_INTERVAL)
+        self.recorder.step(step, time.perf_counter() - started, False)
+        raise ScenarioError(f'{step}: still queued after {POSTING_TIMEOUT}s')
+
+    def _find_job(self, job_type, document_id):
+        from models import SAPPostingJob
+        with self.env.app.app_context():
+            job = SAPPostingJob.query.filter_by(job_type=job_type, document_id=document_id) \
+                .order_by(SAPPostingJob.id.desc()).first()
+            return job.id if job else None
+
+    # -- data the operator works on ----------------------------------------
+
+    def plain_item(self, item_code):
+        item = self.env.dataset.find('Items', item_code) or {}
+        return item.get('ManageBatchNumbers') != 'tYES' and item.get('ManageSerialNumbers') != 'tYES'
+
+    def purchase_order(self):
+        orders = self.env.dataset.collection('PurchaseOrders')
+        for _ in range(20):
+            order = self.rng.choice(orders)
+            if order['DocNum'] not in self.used_purchase_orders and \
+                    any(self.plain_item(line['ItemCode']) for line in order['DocumentLines']):
+                self.used_purchase_orders.add(order['DocNum'])
+                return order
+        raise ScenarioError('no unused purchase order with plain items left for this operator')
+
+    def own_entry(self, collection, key_field, cursor_name):
+        """Documents are split between operators so nobody edits another operator's pick list or count"""
+        rows = self.env.dataset.collection(collection)
+        mine = [row for position, row in enumerate(rows) if position % self.shift['operators'] == self.index]
+        if not mine:
+            raise ScenarioError(f'no {collection} assigned to operator {self.index}')
+        cursor = getattr(self, cursor_name)
+        setattr(self, cursor_name, cursor + 1)
+        return mine[cursor % len(mine)][key_field]
+
+
+# ================================
+# Scenarios
+# ================================
+
+@scenario('grpo_receipt', 'grpo')
+def grpo_receipt(op):
+    """Receive a purchase order line by line, submit, QC approve, wait for the SAP post"""
+    order = op.purchase_order()
+    response = op.call('grpo.create', 'POST', '/grpo/create', data={'po_number': order['DocNum']}, expect=(302,))
+    grpo_id = op.redirect_id(response, r'/grpo/detail/(\d+)')
+    op.call('grpo.detail', 'GET', f'/grpo/detail/{grpo_id}')
+    for line in [l for l in order['DocumentLines'] if op.plain_item(l['ItemCode'])][:3]:
+        op.think()
+        op.call('grpo.validate_item', 'GET', f"/grpo/validate-item/{line['ItemCode']}")
+        op.call('grpo.add_item', 'POST', f'/grpo/{grpo_id}/add_item', expect=(302,), data={
+            'item_code': line['ItemCode'], 'item_name': line['ItemDescription'], 'quantity': line['Quantity'],
+            'unit_of_measure': line.get('UoMCode', 'EA'), 'warehouse_code': line['WarehouseCode']})
+    op.think()
+    op.call('grpo.submit', 'POST', f'/grpo/{grpo_id}/submit')
+    op.think(0.5)
+    response = op.call('grpo.qc_approve', 'POST', f'/grpo/{grpo_id}/approve', session=op.qc,
+                       json={'qc_notes': 'Load test approval'}, expect=(202,))
+    op.wait_for_posting('grpo.sap_posted', job_id=response.json()['job_id'])
+
+
+@scenario('inventory_transfer', 'inventory_transfer')
+def inventory_transfer(op):
+    """Pull a transfer request with its lines, submit, QC approve, wait for the SAP post"""
+    request_doc = op.rng.choice(op.env.dataset.collection('InventoryTransferRequests'))
+    response = op.call('inventory_transfer.create', 'POST', '/inventory_transfer/create', expect=(302,), data={
+        'transfer_request_number': request_doc['DocNum'], 'auto_populate_items': 'on'})
+    transfer_id = op.redirect_id(response, r'/inventory_transfer/detail/(\d+)')
+    op.call('inventory_transfer.detail', 'GET', f'/inventory_transfer/detail/{transfer_id}')
+    op.think(2)
+    op.call('inventory_transfer.submit', 'POST', f'/inventory_transfer/{transfer_id}/submit')
+    op.think(0.5)
+    response = op.call('inventory_transfer.qc_approve', 'POST', f'/inventory_transfer/{transfer_id}/qc_approve',
+                       session=op.qc, json={'qc_notes': 'Load test approval'}, expect=(202,))
+    op.wait_for_posting('inventory_transfer.sap_posted', job_id=response.json()['job_id'])
+
+
+@scenario('serial_transfer', 'inventory_transfer')
+def serial_transfer(op):
+    """Serial number transfer: paste a batch of scanned serials, submit, QC approve (posts to SAP)"""
+    response = op.call('serial_transfer.create', 'POST', '/inventory_transfer/serial/create', expect=(302,), data={
+        'series': '301', 'doc_num': '5000001', 'doc_entry': '1',
+        'from_warehouse': SERIAL_WAREHOUSE, 'to_warehouse': 'WH02'})
+    transfer_id = op.redirect_id(response, r'/inventory_transfer/serial/(\d+)')
+    count = op.rng.randint(10, 50)
+    start = op.rng.randrange(0, len(op.env.serials) - count)
+    op.think(2)
+    op.call('serial_transfer.add_item', 'POST', f'/inventory_transfer/serial/{transfer_id}/add_item', data={
+        'item_code': SERIAL_ITEM_CODE, 'item_name': 'Benchmark serial item', 'quantity': str(count),
+        'serial_numbers': '\n'.join(op.env.serials[start:start + count])})
+    op.think()
+    op.call('serial_transfer.submit', 'POST', f'/inventory_transfer/serial/{transfer_id}/submit')
+    op.think(0.5)
+    op.call('serial_transfer.qc_approve', 'POST', f'/inventory_transfer/serial/{transfer_id}/qc_approve',
+            session=op.qc, json={'qc_notes': 'Load test approval'})
+
+
+@scenario('serial_item_transfer', 'serial_item_transfer')
+def serial_item_transfer(op):
+    """Scan serials one at a time, submit, QC approve, post to SAP"""
+    response = op.call('serial_item_transfer.create', 'POST', '/serial-item-transfer/create', expect=(302,), data={
+        'from_warehouse': SERIAL_WAREHOUSE, 'to_warehouse': 'WH02', 'priority': 'normal'})
+    transfer_id = op.redirect_id(response, r'/serial-item-transfer/(\d+)')
+    for serial in op.rng.sample(op.env.serials, op.rng.randint(5, 15)):
+        op.think(0.3)
+        op.call('serial_item_transfer.add_serial_item', 'POST', f'/serial-item-transfer/{transfer_id}/add_serial_item',
+                data={'serial_number': serial})
+    op.call('serial_item_transfer.submit', 'POST', f'/serial-item-transfer/{transfer_id}/submit')
+    op.think(0.5)
+    op.call('serial_item_transfer.qc_approve', 'POST', f'/serial-item-transfer/{transfer_id}/approve',
+            session=op.qc, data={'qc_notes': 'Load test approval'}, expect=(302,))
+    op.call('serial_item_transfer.post_to_sap', 'POST', f'/serial-item-transfer/{transfer_id}/post_to_sap',
+            session=op.qc)
+
+
+@scenario('sales_delivery', 'sales_delivery')
+def sales_delivery(op):
+    """Deliver against a sales order, submit, QC approve, wait for the SAP post"""
+    order = op.rng.choice(op.env.dataset.collection('Orders'))
+    response = op.call('sales_delivery.create', 'POST', '/sales_delivery/create', expect=(302,), data={
+        'so_series': order['Series'], 'so_doc_num': order['DocNum']})
+    delivery_id = op.redirect_id(response, r'/sales_delivery/detail/(\d+)')
+    op.call('sales_delivery.detail', 'GET', f'/sales_delivery/detail/{delivery_id}')
+    for line in order['DocumentLines'][:3]:
+        op.think()
+        op.call('sales_delivery.add_item', 'POST', '/sales_delivery/api/add_item', json={
+            'delivery_id': delivery_id, 'base_line': line['LineNum'], 'item_code': line['ItemCode'],
+            'quantity': line['Quantity']})
+    op.call('sales_delivery.submit', 'POST', '/sales_delivery/api/submit_delivery', json={'delivery_id': delivery_id})
+    op.think(0.5)
+    op.call('sales_delivery.qc_approve', 'POST', f'/sales_delivery/{delivery_id}/qc_approve', session=op.qc,
+            data={'qc_notes': 'Load test approval'}, expect=(302,))
+    op.wait_for_posting('sales_delivery.sap_posted', job_type='sales_delivery', document_id=delivery_id)
+
+
+@scenario('direct_inventory_transfer', 'direct_inventory_transfer')
+def direct_inventory_transfer(op):
+    """Move a plain item bin to bin between warehouses, submit, approve, wait for the SAP post"""
+    stock = [row for row in op.env.dataset.bin_item_stock
+             if row['WhsCode'] == SERIAL_WAREHOUSE and op.plain_item(row['ItemCode'])]
+    row = op.rng.choice(stock)
+    to_bin = next(b['BinCode'] for b in op.env.dataset.collection('BinLocations') if b['Warehouse'] == 'WH02')
+    response = op.call('direct_inventory_transfer.create', 'POST', '/direct-inventory-transfer/create',
+                       expect=(302,), data={
+                           'item_code': row['ItemCode'], 'item_type': 'none', 'quantity': '1',
+                           'from_warehouse': SERIAL_WAREHOUSE, 'to_warehouse': 'WH02',
+                           'from_bin': row['BinCode'], 'to_bin': to_bin})
+    transfer_id = op.redirect_id(response, r'/direct-inventory-transfer/(\d+)')
+    op.think()
+    op.call('direct_inventory_transfer.submit', 'POST', f'/direct-inventory-transfer/{transfer_id}/submit')
+    op.think(0.5)
+    response = op.call('direct_inventory_transfer.qc_approve', 'POST',
+                       f'/direct-inventory-transfer/{transfer_id}/approve', session=op.qc,
+                       json={'qc_notes': 'Load test approval'}, expect=(202,))
+    op.wait_for_posting('direct_inventory_transfer.sap_posted', job_id=response.json()['job_id'])
+
+
+@scenario('multi_grn', 'multi_grn')
+def multi_grn(op):
+    """Walk the five-step multi-GRN wizard for one supplier and post the GRNs"""
+    order = op.rng.choice(op.env.dataset.collection('PurchaseOrders'))
+    response = op.call('multi_grn.step1', 'POST', '/multi-grn/create/step1', expect=(302,), data={
+        'customer_code': order['CardCode'], 'customer_name': order['CardName']})
+    batch_id = op.redirect_id(response, r'/multi-grn/create/step2/(\d+)')
+    page = op.call('multi_grn.step2_load', 'GET', f'/multi-grn/create/step2/{batch_id}').text
+    purchase_orders = [html.unescape(value) for value in re.findall(r'name="selected_pos\[\]" value=\'([^\']*)\'', page)]
+    if not purchase_orders:
+        raise ScenarioError('multi_grn.step2_load listed no purchase orders')
+    op.think()
+    op.call('multi_grn.step2_select', 'POST', f'/multi-grn/create/step2/{batch_id}', expect=(302,),
+            data={'selected_pos[]': purchase_orders[:2]})
+    page = op.call('multi_grn.step3_load', 'GET', f'/multi-grn/create/step3/{batch_id}').text
+    form = {}
+    for link_id, value in re.findall(r'name="lines_po_(\d+)\[\]"\s*value=\'([^\']*)\'', page):
+        form.setdefault(f'lines_po_{link_id}[]', [])
+        if len(form[f'lines_po_{link_id}[]']) < 3:
+            form[f'lines_po_{link_id}[]'].append(html.unescape(value))
+    if not form:
+        raise ScenarioError('multi_grn.step3_load listed no open lines')
+    op.think()
+    op.call('multi_grn.step3_select', 'POST', f'/multi-grn/create/step3/{batch_id}', data=form, expect=(302,))
+    op.call('multi_grn.step4_review', 'GET', f'/multi-grn/create/step4/{batch_id}')
+    op.think(0.5)
+    op.call('multi_grn.step5_post', 'POST', f'/multi-grn/create/step5/{batch_id}')
+
+
+@scenario('pick_list_confirmation', 'pick_list')
+def pick_list_confirmation(op):
+    """Import an SAP pick list and confirm each line as picked"""
+    absolute_entry = op.own_entry('PickLists', 'Absoluteentry', '_pick_cursor')
+    op.call('pick_list.import', 'POST', f'/api/import-sap-pick-list/{absolute_entry}')
+    pick_list = op.env.dataset.find('PickLists', absolute_entry)
+    for line in pick_list['PickListsLines']:
+        op.think(0.5)
+        op.call('pick_list.mark_line_picked', 'PATCH', f'/api/pick-list/line/{absolute_entry}/mark-picked', json={
+            'line_number': line['LineNumber'], 'item_code': '', 'picked_quantity': line['ReleasedQuantity']})
+
+
+@scenario('inventory_counting', 'inventory_counting')
+def inventory_counting(op):
+    """Load a counting document, count every line, send the counts to SAP"""
+    doc_entry = op.own_entry('InventoryCountings', 'DocumentEntry', '_count_cursor')
+    op.call('inventory_counting.load', 'GET', f'/api/get-invcnt-details?doc_entry={doc_entry}')
+    counting = op.env.dataset.find('InventoryCountings', doc_entry)
+    lines = []
+    for line in counting['InventoryCountingLines']:
+        op.think(0.3)
+        lines.append({'LineNumber': line['LineNumber'], 'CountedQuantity': line['InWarehouseQuantity'] +
+                      op.rng.choice([0, 0, 0, -1, 1]), 'Counted': 'tYES'})
+    op.call('inventory_counting.update', 'POST', '/api/update-inventory-counting', json={
+        'doc_entry': doc_entry, 'document': {'InventoryCountingLines': lines}})
+
+
+# ================================
+# Shift runner
+# ================================
+
+def run_operator(op, mix, deadline, start_delay):
+    time.sleep(start_delay)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        name = op.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            SCENARIOS[name]['run'](op)
+            op.recorder.lifecycle(name, time.perf_counter() - started)
+        except ScenarioError as e:
+            op.recorder.lifecycle(name, time.perf_counter() - started, str(e))
+        except Exception as e:
+            logging.exception(f"❌ Operator {op.index} crashed in {name}")
+            op.recorder.lifecycle(name, time.perf_counter() - started, f'{type(e).__name__}: {e}')
+        op.think()
+
+
+def print_report(report):
+    print(f"\nShift: {report['wall_seconds']}s, {report['requests']} requests "
+          f"({report['requests_per_second']} req/s), {report['lifecycles_completed']} documents completed "
+          f"({report['lifecycles_per_minute']}/min), {report['lifecycles_failed']} failed\n")
+    header = f"{'scenario':28} {'done':>6} {'failed':>6} {'avg s':>8} {'p95 s':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, entry in report['scenarios'].items():
+        print(f"{name:28} {entry['completed']:>6} {entry['failed']:>6} {entry['avg_lifecycle_s']:>8} {entry['p95_lifecycle_s']:>8}")
+    header = f"\n{'step':44} {'reqs':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print('-' * (len(header) - 1))
+    for name, entry in report['steps'].items():
+        print(f"{name:44} {entry['requests']:>6} {entry['errors']:>5} {entry['p50_ms']:>9} {entry['p95_ms']:>9} "
+              f"{entry['p99_ms']:>9} {entry['max_ms']:>9}")
+    if report['top_failures']:
+        print('\nMost common failures:')
+        for reason, count in report['top_failures']:
+            print(f"  {count:>5} x {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a warehouse shift of handheld operators against the WMS')
+    parser.add_argument('--shift', help='JSON shift definition (operators, qc_inspectors, duration, ramp_up, think_time, mix)')
+    parser.add_argument('--operators', type=int, help='override the shift operator count')
+    parser.add_argument('--duration', type=int, help='override the shift length in seconds')
+    parser.add_argument('--think-scale', type=float, default=1.0, help='multiply think times (0.1 = ten times faster)')
+    parser.add_argument('--list-scenarios', action='store_true')
+    parser.add_argument('--sap-latency-ms', type=float, default=40, help='stand-in Service Layer latency per call')
+    parser.add_argument('--sap-jitter-ms', type=float, default=20)
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--bins-per-warehouse', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='database to run against (default: throwaway SQLite)')
+    parser.add_argument('--output', help='write the report as JSON here')
+    args = parser.parse_args()
+
+    if args.list_scenarios:
+        for name, definition in SCENARIOS.items():
+            print(f"{name:28} [{definition['blueprint']}] {definition['description']}")
+        return 0
+
+    shift = dict(DEFAULT_SHIFT)
+    if args.shift:
+        with open(args.shift, encoding='utf-8') as handle:
+            shift.update(json.load(handle))
+    if args.operators:
+        shift['operators'] = args.operators
+    if args.duration:
+        shift['duration'] = args.duration
+    unknown = set(shift['mix']) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s) in mix: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    args.qc_documents = 0
+    operators = shift['operators']
+    env = BenchmarkEnvironment(args, outbox_worker=True, purchase_orders=max(100, operators * 10),
+                               sales_orders=max(100, operators * 4), pick_lists=max(50, operators * 2),
+                               countings=max(20, operators * 2))
+    logging.getLogger().setLevel(logging.WARNING)
+
+    qc_sessions = []
+    for n in range(1, shift['qc_inspectors'] + 1):
+        env.create_user(f'load_qc_{n:02d}', 'qc')
+        qc_sessions.append(env.login(f'load_qc_{n:02d}'))
+    recorder = ShiftRecorder()
+    crew = []
+    for index in range(operators):
+        username = f'load_op_{index + 1:03d}'
+        env.create_user(username, 'user')
+        crew.append(Operator(index, env, env.login(username), qc_sessions[index % len(qc_sessions)], recorder,
+                             shift['think_time'], args.think_scale, shift))
+
+    print(f"▶ Shift: {operators} operators, {shift['qc_inspectors']} QC, {shift['duration']}s "
+          f"(ramp-up {shift['ramp_up']}s, think {shift['think_time']} x{args.think_scale})", file=sys.stderr)
+    started = time.perf_counter()
+    deadline = time.monotonic() + shift['duration']
+    threads = [threading.Thread(target=run_operator, name=f'operator-{op.index + 1}', daemon=True,
+                                args=(op, shift['mix'], deadline, shift['ramp_up'] * op.index / max(1, operators)))
+               for op in crew]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()  # operators finish the document they are on after the deadline
+    report = recorder.report(time.perf_counter() - started)
+    report['shift'] = shift
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+    env.close()
+    return 0 if report['lifecycles_completed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+Application Metrics
+Counters and latency histograms for SAP B1 Service Layer calls, Flask routes and
+SQLAlchemy queries per request, plus the SAP client statistics, rendered in the
+Prometheus text exposition format at /metrics.
+"""
+import logging
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += series[index]
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+# ================================
+# SAP B1 Service Layer calls
+# ================================
+
+sap_requests_total = Counter(
+    'sap_sl_requests_total', 'SAP B1 Service Layer calls by endpoint and HTTP status (or failure kind)',
+    ('method', 'endpoint', 'status'))
+sap_request_errors_total = Counter(
+    'sap_sl_request_errors_total', 'SAP B1 Service Layer calls that failed or returned 4xx/5xx',
+    ('method', 'endpoint', 'reason'))
+sap_request_duration = Histogram(
+    'sap_sl_request_duration_seconds', 'SAP B1 Service Layer call latency',
+    ('method', 'endpoint'))
+
+_ENTITY_KEY_RE = re.compile(r"\((?:'[^']*'|[^)]*)\)")
+_SQL_QUERY_RE = re.compile(r"^SQLQueries\('([^']*)'\)")
+
+
+def sap_endpoint(url):
+    """Service Layer path with entity keys collapsed, e.g. Orders({key}) or SQLQueries('Name')/List"""
+    path = url.split('?', 1)[0]
+    if '/b1s/v1/' in path:
+        path = path.split('/b1s/v1/', 1)[1]
+    # SQL query names are a small fixed set and tell the flows apart, so keep them
+    query = _SQL_QUERY_RE.match(path)
+    if query:
+        return f"SQLQueries('{query.group(1)}')" + _ENTITY_KEY_RE.sub('({key})', path[query.end():])
+    return _ENTITY_KEY_RE.sub('({key})', path)
+
+
+def record_sap_call(method, url, status=None, elapsed=None, error=None):
+    """Record one Service Layer call; status is the HTTP status, error the failure kind if none came back"""
+    method = method.upper()
+    endpoint = sap_endpoint(url)
+    sap_requests_total.inc(method, endpoint, str(status) if status is not None else error)
+    if error is not None:
+        sap_request_errors_total.inc(method, endpoint, error)
+    elif status >= 400:
+        sap_request_errors_total.inc(method, endpoint, f'http_{status}')
+    if elapsed is not None:
+        sap_request_duration.observe(elapsed, method, endpoint)
+
+
+# ================================
+# Flask routes and SQLAlchemy queries
+# ================================
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Flask request latency by route',
+    ('method', 'route', 'status'))
+db_queries_per_request = Histogram(
+    'db_queries_per_request', 'SQLAlchemy queries executed while handling one request',
+    ('route',), buckets=QUERY_COUNT_BUCKETS)
+db_query_seconds_per_request = Histogram(
+    'db_query_seconds_per_request', 'Time spent in SQLAlchemy queries while handling one request',
+    ('route',))
+db_queries_total = Counter(
+    'db_queries_total', 'SQLAlchemy queries by route (background work is reported as "-")',
+    ('route',))
+
+
+def _route_label():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return '-' if not has_request_context() else 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    db_queries_total.inc(_route_label())
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_query_count += 1
+        g.metrics_query_seconds += elapsed
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_query_count = 0
+    g.metrics_query_seconds = 0.0
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = _route_label()
+        http_request_duration.observe(time.perf_counter() - started, request.method, route,
+                                      str(response.status_code))
+        db_queries_per_request.observe(g.metrics_query_count, route)
+        db_query_seconds_per_request.observe(g.metrics_query_seconds, route)
+    return response
+
+
+_installed = False
+
+
+def init_metrics(app):
+    """Time every request and count SQL per request for the /metrics endpoint"""
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    _installed = True
+    logging.info("✅ Request, SQL and SAP B1 call metrics enabled at /metrics")
+
+
+# ================================
+# SAP client statistics (pool, breaker, cache, fan-out, single-flight)
+# ================================
+
+def _metric_lines(name, documentation, samples, metric_type='gauge'):
+    """samples: list of (labels dict, value); non-numeric values are skipped"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        label_text = _format_labels(tuple(labels), tuple(labels.values()))
+        lines.append(f"{name}{label_text} {_format_value(value)}")
+    return lines
+
+
+# Monotonic figures of each stats source, exported as <prefix>_<stat>_total counters; the
+# remaining numeric figures (sizes, states, latencies) stay in the <prefix>{stat=...} gauge
+COUNTER_STATS = {
+    'sap_circuit_breaker': ('successes', 'failures', 'short_circuited', 'opened', 'probes'),
+    'sap_session_pool': ('leases', 'waits', 'logins', 'relogins', 'keepalives', 'created'),
+    'sap_cache': ('hits', 'shared_hits', 'misses', 'sets', 'evictions', 'invalidations'),
+    'sap_fanout': ('fanouts', 'calls', 'errors', 'timeouts', 'inline'),
+    'sap_single_flight': ('calls', 'executed', 'coalesced', 'errors'),
+}
+
+
+def _stats_lines(prefix, documentation, sources):
+    """sources: list of (labels dict, stats dict) from one of the SAP client stats functions"""
+    counters = COUNTER_STATS.get(prefix, ())
+    lines = _metric_lines(prefix, documentation,
+                         [(dict(labels, stat=key), value) for labels, stats in sources
+                          for key, value in stats.items() if key not in counters])
+    for key in counters:
+        lines += _metric_lines(f"{prefix}_{key}_total", f"{documentation}: {key.replace('_', ' ')}",
+                              [(labels, stats.get(key)) for labels, stats in sources], metric_type='counter')
+    return lines
+
+
+def _sap_client_lines():
+    from sap_cache import sap_cache
+    from sap_circuit_breaker import get_breaker_stats
+    from sap_fanout import get_fanout_stats
+    from sap_session_pool import get_pool_stats
+    from sap_singleflight import get_single_flight_stats
+
+    breaker_states = {'closed': 0, 'half_open': 1, 'open': 2}
+    breakers = [({'host': host}, dict(stats, state=breaker_states.get(stats.get('state'), -1)))
+                for host, stats in get_breaker_stats().items()]
+
+    lines = []
+    lines += _stats_lines('sap_circuit_breaker',
+                          'SAP B1 circuit breaker figures (state: 0 closed, 1 half-open, 2 open)', breakers)
+    lines += _stats_lines('sap_session_pool', 'SAP B1 session pool figures',
+                          [({'pool': pool_name}, stats) for pool_name, stats in get_pool_stats().items()])
+    lines += _stats_lines('sap_cache', 'SAP B1 response cache figures per namespace',
+                          [({'namespace': namespace}, stats) for namespace, stats in sap_cache.stats().items()])
+    lines += _stats_lines('sap_fanout', 'SAP B1 concurrent fan-out figures', [({}, get_fanout_stats())])
+    lines += _stats_lines('sap_single_flight', 'SAP B1 read coalescing figures', [({}, get_single_flight_stats())])
+    return lines
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in (sap_requests_total, sap_request_errors_total, sap_request_duration,
+                   http_request_duration, db_queries_per_request, db_query_seconds_per_request,
+                   db_queries_total):
+        lines += metric.render()
+    try:
+        lines += _sap_client_lines()
+    except Exception as e:
+        logging.warning(f"⚠️ Could not collect SAP client stats for metrics: {e}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,11 @@
+-- Migration: Bin Location AbsEntry Map
+-- Created: 2026-10-16
+-- Description: bin_locations.sap_abs_entry is now filled by the bins sync and by pick list bin lookups;
+--              index it so a whole pick list resolves its bin AbsEntries with one local query
+
+-- UP SQL (Apply Changes)
+
+CREATE INDEX ix_bin_locations_sap_abs_entry ON bin_locations(sap_abs_entry);
+
+-- DOWN SQL (Rollback Changes)
+-- DROP INDEX ix_bin_locations_sap_abs_entry ON bin_locations;
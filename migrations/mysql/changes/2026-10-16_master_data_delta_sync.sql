@@ -0,0 +1,28 @@
+-- Migration: SAP Master Data Delta Sync
+-- Created: 2026-10-16
+-- Description: Declare business_partners and pdn_sequence up front (previously created at runtime by
+--              sync_business_partners / generate_external_reference_number); watermarks live in sap_sync_state
+
+-- UP SQL (Apply Changes)
+
+CREATE TABLE IF NOT EXISTS business_partners (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    card_code VARCHAR(50) UNIQUE NOT NULL,
+    card_name VARCHAR(200) NOT NULL,
+    card_type VARCHAR(20) NOT NULL,
+    phone VARCHAR(50),
+    email VARCHAR(100),
+    address TEXT,
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS pdn_sequence (
+    date_key VARCHAR(8) PRIMARY KEY,
+    sequence_number INT DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- DOWN SQL (Rollback Changes)
+-- DROP TABLE IF EXISTS pdn_sequence;
+-- DROP TABLE IF EXISTS business_partners;
@@ -0,0 +1,37 @@
+-- Migration: QC Dashboard Indexes
+-- Created: 2026-10-16
+-- Description: The QC dashboard pages every document type's pending list by (status, created_at)
+--              in one UNION query and counts today's approvals with a qc_approved_at range
+
+-- UP SQL (Apply Changes)
+
+CREATE INDEX idx_grpo_documents_status_created ON grpo_documents(status, created_at);
+CREATE INDEX idx_grpo_documents_qc_approved_at ON grpo_documents(qc_approved_at);
+
+CREATE INDEX idx_inventory_transfers_status_created ON inventory_transfers(status, created_at);
+CREATE INDEX idx_inventory_transfers_qc_approved_at ON inventory_transfers(qc_approved_at);
+
+CREATE INDEX idx_serial_number_transfers_status_created ON serial_number_transfers(status, created_at);
+CREATE INDEX idx_serial_number_transfers_qc_approved_at ON serial_number_transfers(qc_approved_at);
+
+CREATE INDEX idx_serial_item_transfers_status_created ON serial_item_transfers(status, created_at);
+CREATE INDEX idx_serial_item_transfers_qc_approved_at ON serial_item_transfers(qc_approved_at);
+
+CREATE INDEX idx_direct_inventory_transfers_status_created ON direct_inventory_transfers(status, created_at);
+CREATE INDEX idx_direct_inventory_transfers_qc_approved_at ON direct_inventory_transfers(qc_approved_at);
+
+-- delivery_documents(qc_approved_at) is already indexed as idx_delivery_qc_approved_at
+CREATE INDEX idx_delivery_documents_status_created ON delivery_documents(status, created_at);
+
+-- DOWN SQL (Rollback Changes)
+-- DROP INDEX idx_grpo_documents_status_created ON grpo_documents;
+-- DROP INDEX idx_grpo_documents_qc_approved_at ON grpo_documents;
+-- DROP INDEX idx_inventory_transfers_status_created ON inventory_transfers;
+-- DROP INDEX idx_inventory_transfers_qc_approved_at ON inventory_transfers;
+-- DROP INDEX idx_serial_number_transfers_status_created ON serial_number_transfers;
+-- DROP INDEX idx_serial_number_transfers_qc_approved_at ON serial_number_transfers;
+-- DROP INDEX idx_serial_item_transfers_status_created ON serial_item_transfers;
+-- DROP INDEX idx_serial_item_transfers_qc_approved_at ON serial_item_transfers;
+-- DROP INDEX idx_direct_inventory_transfers_status_created ON direct_inventory_transfers;
+-- DROP INDEX idx_direct_inventory_transfers_qc_approved_at ON direct_inventory_transfers;
+-- DROP INDEX idx_delivery_documents_status_created ON delivery_documents;
@@ -0,0 +1,44 @@
+-- Migration: Multi-Device Counting Sessions
+-- Created: 2026-10-16
+-- Description: Devices count an SAP inventory counting document in parallel sessions and append
+--              count deltas to a log; the counting_flush scheduler job merges the log into the
+--              lines and sends the changed lines to SAP B1
+
+-- UP SQL (Apply Changes)
+
+CREATE TABLE IF NOT EXISTS sap_counting_sessions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    count_id INT NOT NULL COMMENT 'Reference to sap_inventory_counts.id',
+    user_id INT NOT NULL,
+    device_id VARCHAR(100) NOT NULL,
+    u_floor VARCHAR(50) NULL COMMENT 'Session scope; NULL = any',
+    u_rack VARCHAR(50) NULL,
+    u_level VARCHAR(50) NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'open' COMMENT 'open, closed',
+    last_sequence INT NOT NULL DEFAULT 0 COMMENT 'Highest entry sequence received from the device',
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    closed_at DATETIME NULL,
+    FOREIGN KEY (count_id) REFERENCES sap_inventory_counts(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    INDEX idx_sap_counting_sessions_device (count_id, user_id, device_id, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS sap_counting_entries (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    count_id INT NOT NULL COMMENT 'Reference to sap_inventory_counts.id',
+    session_id INT NOT NULL COMMENT 'Reference to sap_counting_sessions.id',
+    sequence INT NOT NULL COMMENT 'Per-session number set by the device',
+    line_number INT NOT NULL COMMENT 'SAP B1 LineNumber',
+    quantity DECIMAL(19,6) NOT NULL COMMENT 'Counted quantity delta (negative for corrections)',
+    recorded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    merged_at DATETIME NULL COMMENT 'When the delta was added to the line',
+    FOREIGN KEY (count_id) REFERENCES sap_inventory_counts(id) ON DELETE CASCADE,
+    FOREIGN KEY (session_id) REFERENCES sap_counting_sessions(id) ON DELETE CASCADE,
+    UNIQUE KEY uq_sap_counting_entries_session_sequence (session_id, sequence),
+    INDEX idx_sap_counting_entries_pending (merged_at, count_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- DOWN SQL (Rollback Changes)
+-- DROP TABLE IF EXISTS sap_counting_entries;
+-- DROP TABLE IF EXISTS sap_counting_sessions;
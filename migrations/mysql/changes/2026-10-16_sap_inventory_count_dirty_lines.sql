@@ -0,0 +1,15 @@
+-- Migration: Inventory Counting Dirty Lines
+-- Created: 2026-10-16
+-- Description: Counting saves mark the lines whose count changed locally; only those lines are
+--              PATCHed to SAP B1 (in chunks) and the flag is cleared once SAP accepts them
+
+-- UP SQL (Apply Changes)
+
+ALTER TABLE sap_inventory_count_lines
+    ADD COLUMN is_dirty TINYINT(1) NOT NULL DEFAULT 0 COMMENT 'Counted locally, not yet sent to SAP B1' AFTER variance;
+
+CREATE INDEX idx_sap_count_lines_dirty ON sap_inventory_count_lines(count_id, is_dirty);
+
+-- DOWN SQL (Rollback Changes)
+-- DROP INDEX idx_sap_count_lines_dirty ON sap_inventory_count_lines;
+-- ALTER TABLE sap_inventory_count_lines DROP COLUMN is_dirty;
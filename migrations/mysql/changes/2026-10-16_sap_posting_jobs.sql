@@ -0,0 +1,31 @@
+-- Migration: SAP Posting Outbox
+-- Created: 2026-10-16
+-- Description: Add sap_posting_jobs outbox table - QC approvals queue SAP B1 posts, a background worker posts them
+
+-- UP SQL (Apply Changes)
+
+CREATE TABLE IF NOT EXISTS sap_posting_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    job_type VARCHAR(30) NOT NULL COMMENT 'grpo, inventory_transfer, direct_inventory_transfer, sales_delivery',
+    document_id INT NOT NULL,
+    reference VARCHAR(100) NULL UNIQUE COMMENT 'Idempotency key sent to SAP as NumAtCard / Reference2',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' COMMENT 'queued, running, succeeded, failed',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    next_attempt_at DATETIME NULL,
+    locked_by VARCHAR(100) NULL,
+    locked_at DATETIME NULL,
+    last_error TEXT NULL,
+    sap_document_number VARCHAR(50) NULL,
+    sap_doc_entry INT NULL,
+    created_by INT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    completed_at DATETIME NULL,
+    FOREIGN KEY (created_by) REFERENCES users(id),
+    INDEX idx_sap_posting_jobs_due (status, next_attempt_at),
+    INDEX idx_sap_posting_jobs_document (job_type, document_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- DOWN SQL (Rollback Changes)
+-- DROP TABLE IF EXISTS sap_posting_jobs;
@@ -0,0 +1,29 @@
+-- Migration: SAP Background Scheduler
+-- Created: 2026-10-16
+-- Description: Last outcome of every background scheduler job (sap_scheduler.py), shared by all
+--              gunicorn workers for the /admin/scheduler page
+
+-- UP SQL (Apply Changes)
+
+CREATE TABLE IF NOT EXISTS sap_scheduler_jobs (
+    name VARCHAR(50) PRIMARY KEY,
+    description VARCHAR(200),
+    interval_seconds INT,
+    leader_only BOOLEAN DEFAULT TRUE,
+    status VARCHAR(20),
+    last_started_at DATETIME,
+    last_finished_at DATETIME,
+    last_duration_ms INT,
+    last_success_at DATETIME,
+    last_error TEXT,
+    last_result TEXT,
+    last_runner VARCHAR(100),
+    run_count INT DEFAULT 0,
+    failure_count INT DEFAULT 0,
+    run_requested BOOLEAN DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_sap_scheduler_jobs_run_requested (run_requested)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- DOWN SQL (Rollback Changes)
+-- DROP TABLE IF EXISTS sap_scheduler_jobs;
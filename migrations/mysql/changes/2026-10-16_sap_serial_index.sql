@@ -0,0 +1,38 @@
+-- Migration: SAP Serial Number Index
+-- Created: 2026-10-16
+-- Description: Add sap_serial_index (local mirror of SAP serial numbers) and sap_sync_state (incremental sync watermarks)
+
+-- UP SQL (Apply Changes)
+
+CREATE TABLE IF NOT EXISTS sap_serial_index (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    serial_number VARCHAR(100) NOT NULL COMMENT 'OSRN.DistNumber',
+    item_code VARCHAR(50) NOT NULL,
+    system_number INT NULL COMMENT 'OSRN.SysNumber',
+    warehouse_code VARCHAR(50) NULL COMMENT 'Warehouse holding the serial; NULL when not in stock',
+    bin_code VARCHAR(100) NULL,
+    bin_abs_entry INT NULL,
+    status VARCHAR(20) NULL COMMENT 'OSRN.Status: 0 released, 1 not accessible, 2 locked',
+    sap_update_date DATETIME NULL COMMENT 'OSRN.UpdateDate',
+    sap_log_entry INT NULL COMMENT 'Latest OITL LogEntry seen for the serial',
+    source VARCHAR(20) NULL COMMENT 'sap_sync, sap_lookup, wms_posting',
+    refreshed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT 'Last time SAP confirmed this entry',
+    UNIQUE KEY uq_sap_serial_index_serial_item (serial_number, item_code),
+    INDEX ix_sap_serial_index_serial_number (serial_number),
+    INDEX idx_sap_serial_index_warehouse (warehouse_code, item_code)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS sap_sync_state (
+    entity VARCHAR(50) PRIMARY KEY,
+    last_update_date DATETIME NULL COMMENT 'SAP UpdateDate watermark',
+    last_log_entry INT NULL COMMENT 'OITL LogEntry watermark',
+    last_run_at DATETIME NULL,
+    last_success_at DATETIME NULL COMMENT 'SAP changes up to this time are in the local copy',
+    rows_synced INT DEFAULT 0,
+    last_error TEXT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- DOWN SQL (Rollback Changes)
+-- DROP TABLE IF EXISTS sap_sync_state;
+-- DROP TABLE IF EXISTS sap_serial_index;
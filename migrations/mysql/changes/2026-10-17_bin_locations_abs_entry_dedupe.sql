@@ -0,0 +1,17 @@
+-- Migration: One Bin Location Row per AbsEntry
+-- Created: 2026-10-17
+-- Description: A bin renamed in SAP keeps its AbsEntry; the bins sync upserts on bin_code, so the
+--              row under the old code kept a stale sap_abs_entry. The sync now clears it first;
+--              this clears the duplicates already written, keeping the most recently updated row.
+
+-- UP SQL (Apply Changes)
+
+UPDATE bin_locations stale
+  JOIN bin_locations current_bin
+    ON current_bin.sap_abs_entry = stale.sap_abs_entry
+   AND (current_bin.updated_at > stale.updated_at
+        OR (current_bin.updated_at = stale.updated_at AND current_bin.id > stale.id))
+   SET stale.sap_abs_entry = NULL;
+
+-- DOWN SQL (Rollback Changes)
+-- No rollback: the cleared AbsEntries were stale; the next bins sync rewrites the current ones
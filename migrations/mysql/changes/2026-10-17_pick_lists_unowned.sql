@@ -0,0 +1,18 @@
+-- Migration: Unowned Pick Lists
+-- Created: 2026-10-17
+-- Description: Pick lists synced in the background have no owner until a picker imports or
+--              claims them, so pick_lists.user_id becomes nullable
+
+-- UP SQL (Apply Changes)
+
+ALTER TABLE pick_lists
+    MODIFY COLUMN user_id INT NULL COMMENT 'Picker who imported or claimed the list; NULL until then';
+
+-- Pick lists the background sync handed to the first admin go back to the pool
+-- UPDATE pick_lists SET user_id = NULL
+--  WHERE status NOT IN ('ps_Closed', 'completed')
+--    AND user_id = (SELECT id FROM (SELECT MIN(id) AS id FROM users WHERE role = 'admin') AS first_admin);
+
+-- DOWN SQL (Rollback Changes)
+-- UPDATE pick_lists SET user_id = (SELECT MIN(id) FROM users WHERE role = 'admin') WHERE user_id IS NULL;
+-- ALTER TABLE pick_lists MODIFY COLUMN user_id INT NOT NULL;
@@ -0,0 +1,14 @@
+-- Migration: Per-Worker Scheduler Run Requests
+-- Created: 2026-10-17
+-- Description: Jobs every gunicorn worker runs (cache warm-up, open documents) fill that worker's
+--              own cache, so a "Run now" must reach every worker, not just the leader. Each worker
+--              runs the job once per new run_requested_at and keeps the outcome in process.
+
+-- UP SQL (Apply Changes)
+
+ALTER TABLE sap_scheduler_jobs
+    ADD COLUMN run_requested_at DATETIME NULL COMMENT 'Last Run now request of a job every worker runs'
+    AFTER run_requested;
+
+-- DOWN SQL (Rollback Changes)
+-- ALTER TABLE sap_scheduler_jobs DROP COLUMN run_requested_at;
@@ -0,0 +1,22 @@
+-- SAP B1 Service Layer SQL Query: Bin_Batch_Serial_Stock
+-- Date: 2026-10-16
+-- Description: Batch (OBBQ) and serial (OSBQ) quantities in one bin location, used by /api/scan_bin
+-- Register once via POST /b1s/v1/SQLQueries:
+--   {"SqlCode": "Bin_Batch_Serial_Stock", "SqlName": "Bin_Batch_Serial_Stock", "SqlText": "<query below>"}
+-- Called as: POST /b1s/v1/SQLQueries('Bin_Batch_Serial_Stock')/List  {"ParamList": "binCode='01-A01-001'"}
+
+SELECT 'B' AS "Kind", T0."ItemCode", T1."DistNumber", T0."OnHandQty" AS "Quantity",
+       T1."ExpDate", T1."InDate", T1."Status"
+FROM OBBQ T0
+INNER JOIN OBIN B ON B."AbsEntry" = T0."BinAbs"
+INNER JOIN OBTN T1 ON T1."AbsEntry" = T0."SnBMDAbs"
+WHERE B."BinCode" = :binCode
+  AND T0."OnHandQty" > 0
+UNION ALL
+SELECT 'S' AS "Kind", T0."ItemCode", T1."DistNumber", T0."OnHandQty" AS "Quantity",
+       T1."ExpDate", T1."InDate", T1."Status"
+FROM OSBQ T0
+INNER JOIN OBIN B ON B."AbsEntry" = T0."BinAbs"
+INNER JOIN OSRN T1 ON T1."AbsEntry" = T0."SnBMDAbs"
+WHERE B."BinCode" = :binCode
+  AND T0."OnHandQty" > 0
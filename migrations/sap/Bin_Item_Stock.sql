@@ -0,0 +1,22 @@
+-- SAP B1 Service Layer SQL Query: Bin_Item_Stock
+-- Date: 2026-10-16
+-- Description: Stock sitting in one bin location (OIBQ), used by /api/scan_bin
+-- Register once via POST /b1s/v1/SQLQueries:
+--   {"SqlCode": "Bin_Item_Stock", "SqlName": "Bin_Item_Stock", "SqlText": "<query below>"}
+-- Called as: POST /b1s/v1/SQLQueries('Bin_Item_Stock')/List  {"ParamList": "binCode='01-A01-001'"}
+
+SELECT
+    T0."ItemCode",
+    T1."ItemName",
+    T1."InvntryUom",
+    T0."OnHandQty",
+    T1."OnHand" AS "QuantityOnStock",
+    T0."WhsCode",
+    T2."OnOrder" AS "Ordered",
+    T2."AvgPrice"
+FROM OIBQ T0
+INNER JOIN OBIN B ON B."AbsEntry" = T0."BinAbs"
+INNER JOIN OITM T1 ON T1."ItemCode" = T0."ItemCode"
+INNER JOIN OITW T2 ON T2."ItemCode" = T0."ItemCode" AND T2."WhsCode" = T0."WhsCode"
+WHERE B."BinCode" = :binCode
+  AND T0."OnHandQty" > 0
@@ -0,0 +1,33 @@
+-- SAP B1 Service Layer SQL Query: Serial_Index_Delta
+-- Date: 2026-10-16
+-- Description: Serial numbers changed since the last pull - OSRN master changes (UpdateDate) and
+--              inventory movements (OITL LogEntry) - with their current warehouse and bin, for sap_serial_index
+-- Register once via POST /b1s/v1/SQLQueries:
+--   {"SqlCode": "Serial_Index_Delta", "SqlName": "Serial_Index_Delta", "SqlText": "<query below>"}
+-- Called as: POST /b1s/v1/SQLQueries('Serial_Index_Delta')/List  {"ParamList": "sinceDate='2026-10-16'&sinceLog='0'"}
+--   with header Prefer: odata.maxpagesize=1000 (follow odata.nextLink)
+
+SELECT
+    T0."DistNumber" AS "SerialNumber",
+    T0."ItemCode",
+    T0."SysNumber" AS "SystemNumber",
+    T0."Status",
+    T1."WhsCode",
+    B."BinCode",
+    T2."BinAbs",
+    T0."UpdateDate",
+    (SELECT MAX(L0."LogEntry")
+       FROM ITL1 L1
+       INNER JOIN OITL L0 ON L0."LogEntry" = L1."LogEntry"
+      WHERE L1."ItemCode" = T0."ItemCode" AND L1."SysNumber" = T0."SysNumber") AS "LogEntry"
+FROM OSRN T0
+LEFT JOIN OSRQ T1 ON T1."ItemCode" = T0."ItemCode" AND T1."SysNumber" = T0."SysNumber" AND T1."Quantity" > 0
+LEFT JOIN OSBQ T2 ON T2."SnBMDAbs" = T0."AbsEntry" AND T2."WhsCode" = T1."WhsCode" AND T2."OnHandQty" > 0
+LEFT JOIN OBIN B ON B."AbsEntry" = T2."BinAbs"
+WHERE T0."UpdateDate" >= :sinceDate
+   OR EXISTS (SELECT 1
+                FROM ITL1 L1
+                INNER JOIN OITL L0 ON L0."LogEntry" = L1."LogEntry"
+               WHERE L1."ItemCode" = T0."ItemCode" AND L1."SysNumber" = T0."SysNumber"
+                 AND L0."LogEntry" > :sinceLog)
+ORDER BY T0."ItemCode", T0."SysNumber"
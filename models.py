@@ -148,6 +148,11 @@ class InventoryTransfer(db.Model):
                         default=datetime.utcnow,
                         onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_inventory_transfers_status_created', 'status', 'created_at'),
+        db.Index('idx_inventory_transfers_qc_approved_at', 'qc_approved_at'),
+    )
+
     # Relationships
     user = relationship('User', back_populates='inventory_transfers', foreign_keys=[user_id])
     qc_approver = relationship('User', foreign_keys=[qc_approver_id])
@@ -204,7 +209,7 @@ class PickList(db.Model):
     pick_list_number = db.Column(db.String(20), nullable=True)
     
     # WMS specific fields
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # None until a picker imports or claims it
     approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     priority = db.Column(db.String(10), nullable=True, default='normal')  # low, normal, high, urgent
     warehouse_code = db.Column(db.String(10), nullable=True)
@@ -407,9 +412,14 @@ class SAPInventoryCountLine(db.Model):
     freeze = db.Column(db.String(5), nullable=True, default='tNO')
     u_invcount = db.Column(db.String(50), nullable=True)
     variance = db.Column(db.Float, nullable=True, default=0)
+    is_dirty = db.Column(db.Boolean, nullable=False, default=False)  # Counted locally, not yet sent to SAP
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_sap_count_lines_dirty', 'count_id', 'is_dirty'),
+    )
+
     # Relationships
     count_document = relationship('SAPInventoryCount', back_populates='lines')
 
@@ -417,6 +427,67 @@ class SAPInventoryCountLine(db.Model):
         return f'<SAPInventoryCountLine Line={self.line_number} Item={self.item_code}>'
 
 
+class SAPCountingSession(db.Model):
+    """One device counting part of an SAP inventory counting document (e.g. a floor or rack)"""
+    __tablename__ = 'sap_counting_sessions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    count_id = db.Column(db.Integer, db.ForeignKey('sap_inventory_counts.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    device_id = db.Column(db.String(100), nullable=False)
+    u_floor = db.Column(db.String(50), nullable=True)  # Scope of the session; NULL = any
+    u_rack = db.Column(db.String(50), nullable=True)
+    u_level = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, closed
+    last_sequence = db.Column(db.Integer, nullable=False, default=0)  # Highest entry sequence received
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_sap_counting_sessions_device', 'count_id', 'user_id', 'device_id', 'status'),
+    )
+
+    # Relationships
+    count_document = relationship('SAPInventoryCount')
+    user = relationship('User', foreign_keys=[user_id])
+
+    def to_dict(self):
+        return {
+            'session_id': self.id,
+            'doc_entry': self.count_document.doc_entry if self.count_document else None,
+            'user_id': self.user_id,
+            'device_id': self.device_id,
+            'u_floor': self.u_floor,
+            'u_rack': self.u_rack,
+            'u_level': self.u_level,
+            'status': self.status,
+            'last_sequence': self.last_sequence,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None,
+            'closed_at': self.closed_at.isoformat() if self.closed_at else None
+        }
+
+
+class SAPCountingEntry(db.Model):
+    """Append-only count delta recorded by a counting session for one document line"""
+    __tablename__ = 'sap_counting_entries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    count_id = db.Column(db.Integer, db.ForeignKey('sap_inventory_counts.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('sap_counting_sessions.id'), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)  # Per-session number set by the device; retries are ignored
+    line_number = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)  # Delta in the line's UoM; negative for corrections
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    merged_at = db.Column(db.DateTime, nullable=True)  # Added to the line's counted quantity
+
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'sequence', name='uq_sap_counting_entries_session_sequence'),
+        db.Index('idx_sap_counting_entries_pending', 'merged_at', 'count_id'),
+    )
+
+
 class BarcodeLabel(db.Model):
     __tablename__ = 'barcode_labels'
 
@@ -442,7 +513,7 @@ class BinLocation(db.Model):
     bin_name = db.Column(db.String(150), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     is_system_bin = db.Column(db.Boolean, default=False)
-    sap_abs_entry = db.Column(db.Integer, nullable=True)
+    sap_abs_entry = db.Column(db.Integer, nullable=True, index=True)  # SAP BinLocations AbsEntry
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -692,7 +763,12 @@ class SerialNumberTransfer(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
+
+    __table_args__ = (
+        db.Index('idx_serial_number_transfers_status_created', 'status', 'created_at'),
+        db.Index('idx_serial_number_transfers_qc_approved_at', 'qc_approved_at'),
+    )
+
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='serial_transfers')
     qc_approver = db.relationship('User', foreign_keys=[qc_approver_id])
@@ -760,7 +836,12 @@ class SerialItemTransfer(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
+
+    __table_args__ = (
+        db.Index('idx_serial_item_transfers_status_created', 'status', 'created_at'),
+        db.Index('idx_serial_item_transfers_qc_approved_at', 'qc_approved_at'),
+    )
+
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='serial_item_transfers')
     qc_approver = db.relationship('User', foreign_keys=[qc_approver_id])
@@ -812,7 +893,12 @@ class DirectInventoryTransfer(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
+
+    __table_args__ = (
+        db.Index('idx_direct_inventory_transfers_status_created', 'status', 'created_at'),
+        db.Index('idx_direct_inventory_transfers_qc_approved_at', 'qc_approved_at'),
+    )
+
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='direct_inventory_transfers')
     qc_approver = db.relationship('User', foreign_keys=[qc_approver_id])
@@ -844,5 +930,188 @@ class DirectInventoryTransferItem(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+# ================================
+# SAP Posting Outbox
+# ================================
+
+class SAPPostingJob(db.Model):
+    """Queued SAP B1 document post - written with the QC approval, posted by the outbox worker"""
+    __tablename__ = 'sap_posting_jobs'
+    __table_args__ = (
+        db.Index('idx_sap_posting_jobs_due', 'status', 'next_attempt_at'),
+        db.Index('idx_sap_posting_jobs_document', 'job_type', 'document_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(30), nullable=False)  # grpo, inventory_transfer, direct_inventory_transfer, sales_delivery
+    document_id = db.Column(db.Integer, nullable=False)
+    reference = db.Column(db.String(100), unique=True)  # Idempotency key sent to SAP (NumAtCard / Reference2)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    sap_document_number = db.Column(db.String(50))
+    sap_doc_entry = db.Column(db.Integer)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'job_type': self.job_type,
+            'document_id': self.document_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'sap_document_number': self.sap_document_number,
+            'reference': self.reference,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+    def __repr__(self):
+        return f'<SAPPostingJob {self.id} {self.job_type}:{self.document_id} {self.status}>'
+
+
+
+# ================================
+# SAP Serial Number Index
+# ================================
+
+class SAPSerialIndex(db.Model):
+    """Local mirror of one SAP serial number (OSRN/OSRQ/OSBQ) for O(1) scan validation"""
+    __tablename__ = 'sap_serial_index'
+    __table_args__ = (
+        db.UniqueConstraint('serial_number', 'item_code', name='uq_sap_serial_index_serial_item'),
+        db.Index('idx_sap_serial_index_warehouse', 'warehouse_code', 'item_code'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    serial_number = db.Column(db.String(100), nullable=False, index=True)  # OSRN.DistNumber
+    item_code = db.Column(db.String(50), nullable=False)
+    system_number = db.Column(db.Integer)  # OSRN.SysNumber
+    warehouse_code = db.Column(db.String(50))  # Warehouse holding the serial; NULL when not in stock
+    bin_code = db.Column(db.String(100))
+    bin_abs_entry = db.Column(db.Integer)
+    status = db.Column(db.String(20))  # OSRN.Status: 0 released, 1 not accessible, 2 locked
+    sap_update_date = db.Column(db.DateTime)  # OSRN.UpdateDate
+    sap_log_entry = db.Column(db.Integer)  # Latest OITL LogEntry seen for the serial
+    source = db.Column(db.String(20))  # sap_sync, sap_lookup, wms_posting
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<SAPSerialIndex {self.serial_number} {self.item_code}@{self.warehouse_code}>'
+
+
+class SAPSyncState(db.Model):
+    """Watermarks and last-run outcome of an incremental SAP B1 sync, one row per entity"""
+    __tablename__ = 'sap_sync_state'
+
+    entity = db.Column(db.String(50), primary_key=True)
+    last_update_date = db.Column(db.DateTime)  # SAP UpdateDate(/UpdateTime) watermark
+    last_log_entry = db.Column(db.Integer)  # OITL LogEntry watermark (inventory movements)
+    last_run_at = db.Column(db.DateTime)
+    last_success_at = db.Column(db.DateTime)  # SAP changes up to this time are in the local copy
+    rows_synced = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'entity': self.entity,
+            'last_update_date': self.last_update_date.isoformat() if self.last_update_date else None,
+            'last_log_entry': self.last_log_entry,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_success_at': self.last_success_at.isoformat() if self.last_success_at else None,
+            'rows_synced': self.rows_synced,
+            'last_error': self.last_error
+        }
+
+
+class SAPSchedulerJob(db.Model):
+    """Last outcome of a background scheduler job, one row per job (shared by all workers).
+
+    Jobs every worker runs keep their outcome in each process; their row holds the schedule
+    and the time of the last "Run now" request, which every worker honours once.
+    """
+    __tablename__ = 'sap_scheduler_jobs'
+
+    name = db.Column(db.String(50), primary_key=True)
+    description = db.Column(db.String(200))
+    interval_seconds = db.Column(db.Integer)  # NULL = runs once at startup
+    leader_only = db.Column(db.Boolean, default=True)
+    status = db.Column(db.String(20))  # running, success, failed
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_duration_ms = db.Column(db.Integer)
+    last_success_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    last_result = db.Column(db.Text)
+    last_runner = db.Column(db.String(100))  # host:pid of the process that ran it
+    run_count = db.Column(db.Integer, default=0)
+    failure_count = db.Column(db.Integer, default=0)
+    run_requested = db.Column(db.Boolean, default=False)  # "Run now" from the admin page (leader jobs)
+    run_requested_at = db.Column(db.DateTime)  # Last "Run now" of a job every worker runs
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'description': self.description,
+            'interval_seconds': self.interval_seconds,
+            'leader_only': self.leader_only,
+            'status': self.status,
+            'last_started_at': self.last_started_at.isoformat() if self.last_started_at else None,
+            'last_finished_at': self.last_finished_at.isoformat() if self.last_finished_at else None,
+            'last_duration_ms': self.last_duration_ms,
+            'last_success_at': self.last_success_at.isoformat() if self.last_success_at else None,
+            'last_error': self.last_error,
+            'last_result': self.last_result,
+            'last_runner': self.last_runner,
+            'run_count': self.run_count,
+            'failure_count': self.failure_count,
+            'run_requested': self.run_requested,
+            'run_requested_at': self.run_requested_at.isoformat() if self.run_requested_at else None
+        }
+
+
+# ================================
+# SAP Master Data (local copies)
+# ================================
+
+class BusinessPartner(db.Model):
+    """Supplier/customer master data synced from SAP B1 BusinessPartners"""
+    __tablename__ = 'business_partners'
+
+    id = db.Column(db.Integer, primary_key=True)
+    card_code = db.Column(db.String(50), unique=True, nullable=False)
+    card_name = db.Column(db.String(200), nullable=False)
+    card_type = db.Column(db.String(20), nullable=False)
+    phone = db.Column(db.String(50))
+    email = db.Column(db.String(100))
+    address = db.Column(db.Text)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BusinessPartner {self.card_code}>'
+
+
+class PDNSequence(db.Model):
+    """Daily counter behind GRPO external reference numbers (EXT-REF-YYYYMMDD-NNN)"""
+    __tablename__ = 'pdn_sequence'
+
+    date_key = db.Column(db.String(8), primary_key=True)
+    sequence_number = db.Column(db.Integer, default=0)
+
+
 # Import delivery module models
 from modules.sales_delivery.models import DeliveryDocument, DeliveryItem
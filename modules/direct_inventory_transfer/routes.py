@@ -7,6 +7,7 @@ import json
 from app import db
 from models import DirectInventoryTransfer, DirectInventoryTransferItem, DocumentNumberSeries
 from sap_integration import SAPIntegration
+from sap_outbox import enqueue_posting, wake_outbox_worker
 
 direct_inventory_transfer_bp = Blueprint('direct_inventory_transfer', __name__, url_prefix='/direct-inventory-transfer')
 
@@ -403,7 +404,7 @@ def submit_transfer(transfer_id):
 @direct_inventory_transfer_bp.route('/<int:transfer_id>/approve', methods=['POST'])
 @login_required
 def approve_transfer(transfer_id):
-    """Approve Direct Inventory Transfer and post to SAP B1"""
+    """Approve Direct Inventory Transfer and queue it for posting to SAP B1"""
     try:
         transfer = DirectInventoryTransfer.query.get_or_404(transfer_id)
 
@@ -424,30 +425,19 @@ def approve_transfer(transfer_id):
         for item in transfer.items:
             item.qc_status = 'approved'
 
-        sap = SAPIntegration()
-        if not sap.ensure_logged_in():
-            db.session.rollback()
-            return jsonify({'success': False, 'error': 'SAP B1 authentication failed'}), 500
-
-        sap_result = sap.post_direct_inventory_transfer_to_sap(transfer)
-
-        if not sap_result.get('success'):
-            db.session.rollback()
-            sap_error = sap_result.get('error', 'Unknown SAP error')
-            logging.error(f"❌ SAP B1 posting failed: {sap_error}")
-            return jsonify({'success': False, 'error': f'SAP B1 posting failed: {sap_error}'}), 500
-
-        transfer.sap_document_number = sap_result.get('document_number')
-        transfer.status = 'posted'
-        
+        # Queue the SAP B1 Stock Transfer post with the approval; the outbox worker posts it
+        job = enqueue_posting('direct_inventory_transfer', transfer.id, created_by=current_user.id)
         db.session.commit()
+        wake_outbox_worker()
 
-        logging.info(f"✅ Direct Inventory Transfer {transfer_id} approved and posted to SAP B1 as {transfer.sap_document_number}")
+        logging.info(f"✅ Direct Inventory Transfer {transfer_id} approved - SAP B1 posting queued as job {job.id}")
         return jsonify({
             'success': True,
-            'message': f'Transfer approved and posted to SAP B1 as {transfer.sap_document_number}',
-            'sap_document_number': transfer.sap_document_number
-        })
+            'message': 'Transfer approved - posting to SAP B1 in the background',
+            'status': 'qc_approved',
+            'job_id': job.id,
+            'job_status_url': url_for('sap_job_status', job_id=job.id)
+        }), 202
 
     except Exception as e:
         logging.error(f"Error approving transfer: {str(e)}")
@@ -26,6 +26,11 @@ class GRPODocument(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_grpo_documents_status_created', 'status', 'created_at'),
+        db.Index('idx_grpo_documents_qc_approved_at', 'qc_approved_at'),
+    )
+
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='grpo_documents')
     qc_approver = db.relationship('User', foreign_keys=[qc_approver_id])
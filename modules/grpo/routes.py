@@ -143,7 +143,7 @@ def submit(grpo_id):
 @grpo_bp.route('/<int:grpo_id>/approve', methods=['POST'])
 @login_required
 def approve(grpo_id):
-    """QC approve GRPO and post to SAP B1"""
+    """QC approve GRPO and queue it for posting to SAP B1"""
     try:
         grpo = GRPODocument.query.get_or_404(grpo_id)
         
@@ -171,42 +171,20 @@ def approve(grpo_id):
         grpo.qc_approved_at = datetime.utcnow()
         grpo.qc_notes = qc_notes
         
-        # Initialize SAP integration and post to SAP B1
-        from sap_integration import SAPIntegration
-        sap = SAPIntegration()
-        
-        # Log the posting attempt
-        logging.info(f"🚀 Attempting to post GRPO {grpo_id} to SAP B1...")
-        logging.info(f"GRPO Items: {len(grpo.items)} items, QC Approved: {len([i for i in grpo.items if i.qc_status == 'approved'])}")
-        
-        # Post GRPO to SAP B1 as Purchase Delivery Note
-        sap_result = sap.post_grpo_to_sap(grpo)
-        
-        # Log the result
-        logging.info(f"📡 SAP B1 posting result: {sap_result}")
+        # Queue the SAP B1 Purchase Delivery Note post with the approval; the outbox worker posts it
+        from sap_outbox import enqueue_posting, wake_outbox_worker
+        job = enqueue_posting('grpo', grpo.id, created_by=current_user.id)
+        db.session.commit()
+        wake_outbox_worker()
         
-        if sap_result.get('success'):
-            grpo.sap_document_number = sap_result.get('sap_document_number')
-            grpo.status = 'posted'
-            db.session.commit()
-            
-            logging.info(f"✅ GRPO {grpo_id} QC approved and posted to SAP B1 as {grpo.sap_document_number}")
-            return jsonify({
-                'success': True,
-                'message': f'GRPO approved and posted to SAP B1 as {grpo.sap_document_number}',
-                'sap_document_number': grpo.sap_document_number
-            })
-        else:
-            # If SAP posting fails, still mark as QC approved but not posted
-            db.session.commit()
-            error_msg = sap_result.get('error', 'Unknown SAP error')
-            
-            logging.warning(f"⚠️ GRPO {grpo_id} QC approved but SAP posting failed: {error_msg}")
-            return jsonify({
-                'success': False,
-                'error': f'GRPO approved but SAP posting failed: {error_msg}',
-                'status': 'qc_approved'
-            })
+        logging.info(f"✅ GRPO {grpo_id} QC approved - SAP B1 posting queued as job {job.id}")
+        return jsonify({
+            'success': True,
+            'message': 'GRPO approved - posting to SAP B1 in the background',
+            'status': 'qc_approved',
+            'job_id': job.id,
+            'job_status_url': url_for('sap_job_status', job_id=job.id)
+        }), 202
         
     except Exception as e:
         logging.error(f"Error approving GRPO: {str(e)}")
@@ -2,11 +2,12 @@
 Inventory Transfer Routes
 All routes related to inventory transfers between warehouses/bins
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db
 from models import InventoryTransfer, InventoryTransferItem, User, SerialNumberTransfer, SerialNumberTransferItem, SerialNumberTransferSerial
 from sqlalchemy import or_
+import json
 import logging
 import random
 import re
@@ -294,7 +295,7 @@ def submit(transfer_id):
 @transfer_bp.route('/<int:transfer_id>/qc_approve', methods=['POST'])
 @login_required
 def qc_approve(transfer_id):
-    """QC approve transfer and post to SAP B1"""
+    """QC approve transfer and queue it for posting to SAP B1"""
     try:
         transfer = InventoryTransfer.query.get_or_404(transfer_id)
         
@@ -319,36 +320,23 @@ def qc_approve(transfer_id):
         transfer.qc_approved_at = datetime.utcnow()
         transfer.qc_notes = qc_notes
         
-        # Post to SAP B1 as Stock Transfer - MUST succeed for approval
-        from sap_integration import SAPIntegration
-        sap = SAPIntegration()
-        
-        logging.info(f"🚀 Posting Inventory Transfer {transfer_id} to SAP B1...")
-        sap_result = sap.post_inventory_transfer_to_sap(transfer)
-        
-        if not sap_result.get('success'):
-            # Rollback approval if SAP posting fails
-            db.session.rollback()
-            sap_error = sap_result.get('error', 'Unknown SAP error')
-            logging.error(f"❌ SAP B1 posting failed: {sap_error}")
-            return jsonify({'success': False, 'error': f'SAP B1 posting failed: {sap_error}'}), 500
-        
-        # SAP posting succeeded - update with document number
-        transfer.sap_document_number = sap_result.get('document_number')
-        transfer.status = 'posted'
-        logging.info(f"✅ Successfully posted to SAP B1: {transfer.sap_document_number}")
-        
+        # Queue the SAP B1 Stock Transfer post with the approval; the outbox worker posts it
+        from sap_outbox import enqueue_posting, wake_outbox_worker
+        job = enqueue_posting('inventory_transfer', transfer.id, created_by=current_user.id)
         db.session.commit()
+        wake_outbox_worker()
         
         # Log status change
-        log_status_change(transfer_id, old_status, 'posted', current_user.id, f'Transfer QC approved and posted to SAP B1 as {transfer.sap_document_number}')
+        log_status_change(transfer_id, old_status, 'qc_approved', current_user.id, f'Transfer QC approved - SAP B1 posting queued as job {job.id}')
         
-        logging.info(f"✅ Inventory Transfer {transfer_id} QC approved and posted to SAP B1")
+        logging.info(f"✅ Inventory Transfer {transfer_id} QC approved - SAP B1 posting queued as job {job.id}")
         return jsonify({
             'success': True,
-            'message': f'Transfer QC approved and posted to SAP B1 as {transfer.sap_document_number}',
-            'sap_document_number': transfer.sap_document_number
-        })
+            'message': 'Transfer QC approved - posting to SAP B1 in the background',
+            'status': 'qc_approved',
+            'job_id': job.id,
+            'job_status_url': url_for('sap_job_status', job_id=job.id)
+        }), 202
         
     except Exception as e:
         logging.error(f"Error approving transfer: {str(e)}")
@@ -751,255 +739,52 @@ def serial_add_item(transfer_id):
         db.session.add(transfer_item)
         db.session.flush()  # Get the ID
         
-        # **ULTRA-ADVANCED BATCH PROCESSING FOR 1500+ SERIAL NUMBERS - ENTERPRISE LEVEL**
-        # Multi-stage processing with AI-like intelligent batching and enterprise error recovery
+        # **SET-BASED SAP VALIDATION** - the whole serial set is validated in a few
+        # concurrent range/IN-list queries instead of one SAP call per serial
         validated_count = 0
         failed_count = 0
         
-        # ENTERPRISE-GRADE DYNAMIC BATCH SIZING with AI-like optimization
-        if len(serial_numbers) <= 50:
-            batch_size = 10  # Small batches for precision
-        elif len(serial_numbers) <= 200:
-            batch_size = 25  # Medium batches
-        elif len(serial_numbers) <= 500:
-            batch_size = 50  # Standard batches
-        elif len(serial_numbers) <= 1000:
-            batch_size = 75  # Large batches
-        elif len(serial_numbers) <= 1500:
-            batch_size = 100  # Very large batches
-        elif len(serial_numbers) <= 2000:
-            batch_size = 125  # Ultra-large batches
-        else:  # 2000+ serial numbers - MEGA PROCESSING
-            batch_size = 150  # Maximum efficiency batches
-        
-        total_batches = (len(serial_numbers) + batch_size - 1) // batch_size
-        
-        # ADVANCED PERFORMANCE METRICS
-        processing_mode = 'ENTERPRISE' if len(serial_numbers) > 1500 else 'HIGH-VOLUME' if len(serial_numbers) > 1000 else 'STANDARD'
-        
-        logging.info(f"🚀 ULTRA-ADVANCED PROCESSING: {len(serial_numbers)} serial numbers")
-        logging.info(f"📊 Processing Mode: {processing_mode} | Batches: {total_batches} x {batch_size}")
-        logging.info(f"⚡ Memory Optimization: {'AGGRESSIVE' if len(serial_numbers) > 1500 else 'STANDARD'}")
-        
-        # ENTERPRISE-LEVEL MEMORY PRE-ALLOCATION
-        if len(serial_numbers) > 1500:
-            logging.info(f"🧠 Preparing enterprise-level memory management for {len(serial_numbers)} items...")
-            # Pre-allocate memory structures for optimal performance
-            db.session.expunge_all()  # Clear session cache before heavy processing
-        
-        # **DUPLICATE DETECTION LOGIC** - Track serial numbers to mark duplicates
+        # **DUPLICATE DETECTION LOGIC** - Serial numbers entered more than once are all marked as duplicates
         serial_number_count = {}
         for sn in serial_numbers:
             serial_number_count[sn] = serial_number_count.get(sn, 0) + 1
+        unique_serials = [sn for sn, count in serial_number_count.items() if count == 1]
         
-        for batch_index in range(total_batches):
-            start_index = batch_index * batch_size
-            end_index = min(start_index + batch_size, len(serial_numbers))
-            batch = serial_numbers[start_index:end_index]
-            
-            logging.info(f"Processing batch {batch_index + 1}/{total_batches} ({len(batch)} serials)")
-            
-            for serial_number in batch:
-                try:
-                    # **DUPLICATE DETECTION** - Check if this serial number appears multiple times
-                    is_duplicate = serial_number_count[serial_number] > 1
-                    
-                    # **EXISTING DUPLICATE CHECK** - Check if already exists in database
-                    existing_serial = SerialNumberTransferSerial.query.filter_by(
-                        transfer_item_id=transfer_item.id,
-                        serial_number=serial_number
-                    ).first()
-                    
-                    if existing_serial:
-                        is_duplicate = True
-                    
-                    if is_duplicate:
-                        # Mark as duplicate with red status
-                        serial_record = SerialNumberTransferSerial()
-                        serial_record.transfer_item_id = transfer_item.id
-                        serial_record.serial_number = serial_number
-                        serial_record.internal_serial_number = serial_number
-                        serial_record.is_validated = False
-                        serial_record.validation_error = 'Duplication'
-                        failed_count += 1
-                        logging.warning(f"⚠️ Duplicate serial number {serial_number} marked as invalid")
-                    else:
-                        # **ONE-BY-ONE SAP VALIDATION** to prevent timeouts for 1000+ items
-                        validation_result = validate_series_with_warehouse_sap(serial_number, item_code, transfer.from_warehouse)
-                        
-                        serial_record = SerialNumberTransferSerial()
-                        serial_record.transfer_item_id = transfer_item.id
-                        serial_record.serial_number = serial_number
-                        serial_record.internal_serial_number = validation_result.get('SerialNumber') or validation_result.get('DistNumber', serial_number)
-                        serial_record.system_serial_number = validation_result.get('SystemNumber')
-                        serial_record.is_validated = validation_result.get('valid', False)
-                        serial_record.validation_error = validation_result.get('error') or validation_result.get('warning')
-                        
-                        if validation_result.get('valid'):
-                            validated_count += 1
-                        else:
-                            failed_count += 1
-                    
-                    db.session.add(serial_record)
-                    
-                    # **SAP TIMEOUT PREVENTION** for large datasets
-                    if len(serial_numbers) >= 1000:
-                        current_item = (batch_index * batch_size) + batch.index(serial_number) + 1
-                        if current_item % 50 == 0:  # Every 50 items
-                            import time
-                            time.sleep(0.05)  # 50ms delay to prevent SAP overload
-                            logging.debug(f"🕰️ SAP timeout prevention: Processed {current_item}/{len(serial_numbers)} items")
-                    
-                except Exception as e:
-                    # Note: Duplicate database errors should no longer occur since unique constraint removed
-                    # if "Duplicate entry" in str(e) or "unique_serial_per_item" in str(e):
-                    #     logging.warning(f"⚠️ Duplicate serial number {serial_number} detected via database error, skipping")
-                    #     continue
-                        
-                    logging.error(f"Error validating serial number {serial_number}: {str(e)}")
-                    
-                    # Add as unvalidated with error message
-                    serial_record = SerialNumberTransferSerial()
-                    serial_record.transfer_item_id = transfer_item.id
-                    serial_record.serial_number = serial_number
-                    serial_record.internal_serial_number = serial_number
-                    serial_record.is_validated = False
-                    serial_record.validation_error = str(e)
-                    db.session.add(serial_record)
+        validation_results = validate_batch_series_with_warehouse_sap(unique_serials, item_code, transfer.from_warehouse)
+        
+        serial_records = []
+        for serial_number in serial_numbers:
+            serial_record = SerialNumberTransferSerial()
+            serial_record.transfer_item_id = transfer_item.id
+            serial_record.serial_number = serial_number
             
-            # ULTRA-ADVANCED BATCH PROCESSING WITH AI-LIKE ERROR RECOVERY AND PERFORMANCE OPTIMIZATION
-            try:
-                db.session.flush()  # Flush instead of commit to maintain transaction
-                
-                # ENTERPRISE-LEVEL PERFORMANCE METRICS AND REPORTING
-                progress_percent = ((batch_index + 1) / total_batches) * 100
-                current_batch_size = len(batch)
-                batch_success_count = len([s for s in batch if len(s.strip()) > 0]) 
-                batch_success_rate = (batch_success_count / current_batch_size) * 100 if current_batch_size > 0 else 0
-                overall_success_rate = (validated_count / ((batch_index * batch_size) + len(batch))) * 100 if ((batch_index * batch_size) + len(batch)) > 0 else 0
-                
-                # ADVANCED PROGRESS REPORTING WITH ENTERPRISE METRICS
-                logging.info(f"✅ BATCH {batch_index + 1}/{total_batches} ({progress_percent:.1f}%) | ✓{validated_count}/{len(serial_numbers)} | Batch: {batch_success_rate:.1f}% | Overall: {overall_success_rate:.1f}%")
-                
-                # ULTRA-INTELLIGENT COMMIT STRATEGY FOR ENTERPRISE DATASETS
-                if len(serial_numbers) <= 500:
-                    commit_frequency = 10  # Standard frequency
-                elif len(serial_numbers) <= 1000:
-                    commit_frequency = 8   # More frequent for medium datasets
-                elif len(serial_numbers) <= 1500:
-                    commit_frequency = 5   # High frequency for large datasets
-                else:  # 1500+ items - ENTERPRISE MODE
-                    commit_frequency = 3   # Ultra-frequent commits for massive datasets
-                
-                if (batch_index + 1) % commit_frequency == 0:
-                    db.session.commit()
-                    logging.info(f"🔄 ENTERPRISE CHECKPOINT: Batch {batch_index + 1} | Progress: {progress_percent:.1f}% | Validated: {validated_count}")
-                    
-                # AGGRESSIVE MEMORY OPTIMIZATION FOR ENTERPRISE PROCESSING
-                memory_clear_frequency = 15 if len(serial_numbers) > 1500 else 25
-                if (batch_index + 1) % memory_clear_frequency == 0:
-                    db.session.expunge_all()
-                    logging.info(f"🧠 ENTERPRISE MEMORY OPTIMIZATION: Cache cleared at batch {batch_index + 1}")
-                    
-                # PERFORMANCE MONITORING FOR ULTRA-LARGE DATASETS
-                if len(serial_numbers) > 1500 and (batch_index + 1) % 5 == 0:
-                    logging.info(f"📊 PERFORMANCE MONITOR: {validated_count} validated, {progress_percent:.1f}% complete, processing at {batch_size} items/batch")
-                    
-            except Exception as e:
-                logging.error(f"❌ ENTERPRISE ERROR in batch {batch_index + 1}: {str(e)}")
-                failed_count += len(batch)
+            if serial_number_count[serial_number] > 1:
+                # Mark as duplicate with red status
+                serial_record.internal_serial_number = serial_number
+                serial_record.is_validated = False
+                serial_record.validation_error = 'Duplication'
+                failed_count += 1
+            else:
+                validation_result = validation_results.get(serial_number) or {
+                    'valid': False, 'error': 'Serial number was not validated'}
+                serial_record.internal_serial_number = validation_result.get('SerialNumber') or serial_number
+                serial_record.system_serial_number = validation_result.get('SystemNumber')
+                serial_record.is_validated = validation_result.get('valid', False)
+                serial_record.validation_error = validation_result.get('error') or validation_result.get('warning')
                 
-                # ULTRA-ADVANCED ERROR RECOVERY WITH INTELLIGENT RETRY SYSTEM
-                try:
-                    db.session.rollback()
-                    
-                    # INTELLIGENT SUB-BATCH SIZING based on error type and dataset size
-                    if len(serial_numbers) > 1500:
-                        sub_batch_size = max(3, len(batch) // 8)  # Very small sub-batches for enterprise datasets
-                    elif len(serial_numbers) > 1000:
-                        sub_batch_size = max(5, len(batch) // 6)  # Small sub-batches for large datasets
-                    else:
-                        sub_batch_size = max(5, len(batch) // 4)  # Standard sub-batches
-                        
-                    logging.info(f"🔄 ENTERPRISE RECOVERY: Retrying batch {batch_index + 1} with {sub_batch_size}-item sub-batches")
-                    
-                    # MULTI-LEVEL RECOVERY PROCESSING
-                    for sub_start in range(0, len(batch), sub_batch_size):
-                        sub_batch = batch[sub_start:sub_start + sub_batch_size]
-                        try:
-                            # Process sub-batch with individual error handling
-                            for serial_number in sub_batch:
-                                try:
-                                    # **DUPLICATE DETECTION IN RECOVERY** - Mark duplicates as invalid
-                                    is_duplicate = serial_number_count[serial_number] > 1
-                                    existing_serial = SerialNumberTransferSerial.query.filter_by(
-                                        transfer_item_id=transfer_item.id,
-                                        serial_number=serial_number
-                                    ).first()
-                                    
-                                    if existing_serial:
-                                        is_duplicate = True
-                                    
-                                    if is_duplicate:
-                                        # Mark as duplicate with red status
-                                        serial_record = SerialNumberTransferSerial()
-                                        serial_record.transfer_item_id = transfer_item.id
-                                        serial_record.serial_number = serial_number
-                                        serial_record.internal_serial_number = serial_number
-                                        serial_record.is_validated = False
-                                        serial_record.validation_error = 'Duplication'
-                                    else:
-                                        validation_result = validate_series_with_warehouse_sap(serial_number, item_code, transfer.from_warehouse)
-                                        serial_record = SerialNumberTransferSerial()
-                                        serial_record.transfer_item_id = transfer_item.id
-                                        serial_record.serial_number = serial_number
-                                        serial_record.internal_serial_number = validation_result.get('SerialNumber') or validation_result.get('DistNumber', serial_number)
-                                        serial_record.system_serial_number = validation_result.get('SystemNumber')
-                                        serial_record.is_validated = validation_result.get('valid', False)
-                                        serial_record.validation_error = validation_result.get('error') or validation_result.get('warning')
-                                        
-                                        if validation_result.get('valid'):
-                                            validated_count += 1
-                                    db.session.add(serial_record)
-                                except Exception as individual_error:
-                                    # Check if it's a duplicate error that we should skip
-                                    if "Duplicate entry" in str(individual_error) or "unique_serial_per_item" in str(individual_error):
-                                        logging.warning(f"⚠️ Duplicate serial number {serial_number} detected via database error, skipping")
-                                        continue
-                                        
-                                    # GRACEFUL DEGRADATION - Add as unvalidated but continue processing
-                                    logging.warning(f"⚠️ Individual item error for {serial_number}: {str(individual_error)}")
-                                    
-                                    # Check for duplicates before adding even in error recovery
-                                    existing_serial = SerialNumberTransferSerial.query.filter_by(
-                                        transfer_item_id=transfer_item.id,
-                                        serial_number=serial_number
-                                    ).first()
-                                    
-                                    if not existing_serial:
-                                        serial_record = SerialNumberTransferSerial(
-                                            transfer_item_id=transfer_item.id,
-                                            serial_number=serial_number,
-                                            internal_serial_number=serial_number,
-                                            is_validated=False,
-                                            validation_error=f"Recovery processing error: {str(individual_error)}"
-                                        )
-                                        db.session.add(serial_record)
-                            
-                            # Flush sub-batch
-                            db.session.flush()
-                            
-                        except Exception as sub_batch_error:
-                            logging.error(f"❌ Sub-batch error: {str(sub_batch_error)}")
-                            # Continue with next sub-batch instead of failing entirely
-                            continue
-                            
-                    logging.info(f"✅ ENTERPRISE RECOVERY COMPLETE: Batch {batch_index + 1} processed with recovery")
-                    
-                except Exception as recovery_error:
-                    logging.error(f"❌ ENTERPRISE RECOVERY FAILED for batch {batch_index + 1}: {str(recovery_error)}")
-                    # Log the failure but continue with next batch to maintain system stability
-                    continue
+                if validation_result.get('valid'):
+                    validated_count += 1
+                else:
+                    failed_count += 1
+            
+            serial_records.append(serial_record)
+        
+        duplicate_count = len(serial_numbers) - len(unique_serials)
+        if duplicate_count:
+            logging.warning(f"⚠️ {duplicate_count} duplicate serial number entries marked as invalid")
+        
+        # One executemany instead of an INSERT per serial
+        db.session.bulk_save_objects(serial_records)
         
         # **QUANTITY VALIDATION - Prevent excess valid serials, allow insufficient for manual addition**
         if validated_count > expected_quantity:
@@ -1033,7 +818,6 @@ def serial_add_item(transfer_id):
             logging.info(f"   Expected Quantity: {expected_quantity}")
             logging.info(f"   Quantity Match: {'✅ YES' if validated_count == expected_quantity else '❌ NO'}")
             logging.info(f"   Success Rate: {success_rate:.1f}%")
-            logging.info(f"   Batches Processed: {total_batches}")
             
         except Exception as final_error:
             logging.error(f"❌ Final commit failed: {str(final_error)}")
@@ -1373,8 +1157,10 @@ def serial_add_more_serials(item_id):
         
         # Validate against SAP B1 and add serials
         validated_count = 0
+        validation_results = validate_batch_series_with_warehouse_sap(new_serials, item.item_code, transfer.from_warehouse)
         for serial_number in new_serials:
-            validation_result = validate_series_with_warehouse_sap(serial_number, item.item_code, transfer.from_warehouse)
+            validation_result = validation_results.get(serial_number) or {
+                'valid': False, 'error': 'Serial number was not validated'}
             
             serial_record = SerialNumberTransferSerial()
             serial_record.transfer_item_id = item.id
@@ -1527,10 +1313,11 @@ def validate_series_with_warehouse_sap(serial_number, item_code, warehouse_code)
         }
 
 def validate_batch_series_with_warehouse_sap(serial_numbers, item_code, warehouse_code):
-    """Batch validate multiple series against SAP B1 API for optimal performance
+    """Batch validate multiple series against SAP B1 for optimal performance
     
-    This function processes large batches of serial numbers in chunks to avoid API timeouts
-    and significantly improve performance when processing 1000+ serial numbers.
+    Consecutive serials are sent as ranges and the rest as large IN lists, with the
+    query chunks running concurrently, so 1000+ serials need only a handful of calls.
+    A serial is valid only when it has stock in warehouse_code.
     
     Args:
         serial_numbers: List of serial numbers to validate
@@ -1543,49 +1330,11 @@ def validate_batch_series_with_warehouse_sap(serial_numbers, item_code, warehous
     try:
         from sap_integration import SAPIntegration
         
-        sap = SAPIntegration()
-        
         if not serial_numbers:
             return {}
         
         logging.info(f"🚀 Starting batch validation for {len(serial_numbers)} serial numbers")
-        
-        # Use the new batch validation method with optimized chunk size
-        batch_results = sap.validate_batch_series_with_warehouse(
-            serial_numbers, 
-            item_code, 
-            warehouse_code, 
-            batch_size=100  # Process in chunks of 100 for optimal performance
-        )
-        
-        # Transform results to match expected format
-        formatted_results = {}
-        for serial, result in batch_results.items():
-            if result.get('valid') and result.get('available_in_warehouse'):
-                formatted_results[serial] = {
-                    'valid': True,
-                    'SerialNumber': result.get('DistNumber'),
-                    'ItemCode': result.get('ItemCode'),
-                    'WhsCode': result.get('WhsCode'),
-                    'available_in_warehouse': True,
-                    'validation_type': result.get('validation_type', 'batch_warehouse_specific')
-                }
-            elif result.get('valid') and not result.get('available_in_warehouse'):
-                formatted_results[serial] = {
-                    'valid': False,
-                    'error': result.get('warning') or f'Series {serial} is not available in warehouse {warehouse_code}',
-                    'available_in_warehouse': False,
-                    'validation_type': result.get('validation_type', 'batch_warehouse_unavailable')
-                }
-            else:
-                formatted_results[serial] = {
-                    'valid': False,
-                    'error': result.get('error', 'Batch validation failed'),
-                    'validation_type': result.get('validation_type', 'batch_validation_failed')
-                }
-        
-        logging.info(f"✅ Completed batch validation for {len(formatted_results)} serial numbers")
-        return formatted_results
+        return SAPIntegration().validate_batch_series_with_warehouse(serial_numbers, item_code, warehouse_code)
         
     except Exception as e:
         logging.error(f"❌ Error in batch series validation: {str(e)}")
@@ -1630,6 +1379,46 @@ def validate_serial_api():
             'error': f'Validation error: {str(e)}'
         }), 500
 
+@transfer_bp.route('/serial/validate_batch', methods=['POST'])
+@login_required
+def validate_serial_batch_api():
+    """Validate a whole serial set, streaming one NDJSON line per serial as SAP answers"""
+    data = request.get_json(silent=True) or request.form
+    
+    serial_numbers = data.get('serial_numbers') or ''
+    if isinstance(serial_numbers, str):
+        serial_numbers = re.split(r'[,\n\r\s]+', serial_numbers.strip())
+    serial_numbers = [str(sn).strip() for sn in serial_numbers if str(sn).strip()]
+    item_code = (data.get('item_code') or '').strip()
+    warehouse_code = (data.get('warehouse_code') or '').strip()
+    
+    if not serial_numbers or not item_code:
+        return jsonify({
+            'success': False,
+            'error': 'Serial numbers and item code are required'
+        }), 400
+    
+    from sap_integration import SAPIntegration
+    sap = SAPIntegration()
+    
+    def generate():
+        validated = failed = 0
+        try:
+            for serial_number, result in sap.iter_batch_series_validation(serial_numbers, item_code, warehouse_code or None):
+                if result.get('valid'):
+                    validated += 1
+                else:
+                    failed += 1
+                yield json.dumps(dict(result, serial_number=serial_number)) + '\n'
+        except Exception as e:
+            logging.error(f"Error in batch serial validation API: {str(e)}")
+            yield json.dumps({'done': True, 'success': False, 'error': f'Validation error: {str(e)}'}) + '\n'
+            return
+        yield json.dumps({'done': True, 'success': True, 'total': validated + failed,
+                          'validated_count': validated, 'failed_count': failed}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @transfer_bp.route('/serial/<int:transfer_id>/qc_approve', methods=['POST'])
 @login_required 
 def serial_transfer_qc_approve(transfer_id):
@@ -7,12 +7,13 @@ from flask_login import login_required, current_user
 from app import db
 from modules.multi_grn_creation.models import MultiGRNBatch, MultiGRNPOLink, MultiGRNLineSelection
 from modules.multi_grn_creation.services import SAPMultiGRNService
+from sap_fanout import fan_out
 import logging
 from datetime import datetime, date
 import json
 from decimal import Decimal, InvalidOperation
 
-multi_grn_bp = Blueprint('multi_grn', __name__, url_prefix='/multi-grn')
+multi_grn_bp = Blueprint('multi_grn', __name__, url_prefix='/multi-grn', template_folder='templates')
 
 @multi_grn_bp.route('/')
 @login_required
@@ -192,6 +193,7 @@ def create_step5_post(batch_id):
         sap_service = SAPMultiGRNService()
         results = []
         success_count = 0
+        grn_postings = []
         
         for po_link in batch.po_links:
             if not po_link.line_selections:
@@ -239,7 +241,17 @@ def create_step5_post(batch_id):
                 'DocumentLines': document_lines
             }
             
-            result = sap_service.create_purchase_delivery_note(grn_data)
+            grn_postings.append((po_link, grn_data))
+        
+        # Post the GRNs concurrently - the POs are independent documents in SAP. No fan-out
+        # timeout: a post still queued or running must not be marked failed and retried into
+        # a duplicate GRN; each post is bounded by its HTTP timeout instead
+        posted = fan_out(lambda posting: sap_service.create_purchase_delivery_note(posting[1]), grn_postings,
+                         timeout=False)
+        
+        for posting in posted:
+            po_link = posting.item[0]
+            result = posting.value if posting.ok else {'success': False, 'error': str(posting.error)}
             
             if result['success']:
                 po_link.status = 'posted'
@@ -10,6 +10,7 @@ import os
 from flask import current_app
 import urllib.parse
 import urllib3
+from sap_session_pool import SAPLoginError, SAPSessionProxy
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class SAPMultiGRNService:
@@ -21,8 +22,9 @@ class SAPMultiGRNService:
         self.password = os.environ.get('SAP_B1_PASSWORD', '')
         self.company_db = os.environ.get('SAP_B1_COMPANY_DB', '')
         self.session_id = None
-        self.session = requests.Session()
-        self.session.verify = False  # For development, in production use proper SSL
+        # Shared, already-authenticated sessions from the process-wide pool
+        self.session = SAPSessionProxy(self.base_url, self.username,
+                                       self.password, self.company_db)
         self.is_offline = False
         self.enable_mock_data = os.environ.get('ENABLE_MOCK_SAP_DATA', 'false').lower() == 'true'
 
@@ -39,25 +41,14 @@ class SAPMultiGRNService:
             logging.warning(f"   SAP_B1_COMPANY_DB: {'✓' if self.company_db else '✗'}")
             return False
         
-        login_url = f"{self.base_url}/b1s/v1/Login"
-        login_data = {
-            "UserName": self.username,
-            "Password": self.password,
-            "CompanyDB": self.company_db
-        }
-        
         try:
             logging.info(f"🔐 Attempting SAP login to {self.base_url}...")
-            response = self.session.post(login_url, json=login_data, timeout=30)
-            if response.status_code == 200:
-                self.session_id = response.json().get('SessionId')
-                logging.info("✅ SAP B1 login successful"+self.session_id)
-                logging.info("✅ SAP B1 login successful")
-                return True
-            else:
-                logging.warning(f"❌ SAP B1 login failed (Status {response.status_code}): {response.text}")
-                logging.error(f"❌ SAP B1 login failed (Status {response.status_code}): {response.text}")
-                return False
+            self.session_id = self.session.ensure_session()
+            logging.info("✅ SAP B1 login successful")
+            return True
+        except SAPLoginError as e:
+            logging.error(f"❌ {str(e)}")
+            return False
         except requests.exceptions.ConnectionError as e:
             logging.error(f"❌ SAP B1 connection failed: Cannot reach {self.base_url}")
             logging.error(f"❌ SAP B1 connection failed: Cannot reach {self.base_url}")
@@ -73,6 +64,9 @@ class SAPMultiGRNService:
     
     def ensure_logged_in(self):
         """Ensure we have a valid session, login if needed"""
+        if self.session.circuit_open():
+            logging.debug("SAP B1 circuit open - skipping SAP call")
+            return False
         if not self.session_id:
             return self.login()
         return True
@@ -28,6 +28,11 @@ class DeliveryDocument(db.Model):
     submitted_at = db.Column(db.DateTime, nullable=True)
     last_updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_delivery_documents_status_created', 'status', 'created_at'),
+        db.Index('idx_delivery_qc_approved_at', 'qc_approved_at'),
+    )
+
     # Relationships
     user = relationship('User', foreign_keys=[user_id])
     qc_approver = relationship('User', foreign_keys=[qc_approver_id])
@@ -171,6 +171,13 @@ def api_add_item():
     
     validation = sap.validate_item_code(item_code)
     
+    if serial_number:
+        serials = [s.strip() for s in str(serial_number).replace(',', '\n').splitlines() if s.strip()]
+        results = sap.validate_batch_series_with_warehouse(serials, item_code, so_line.get('WarehouseCode'))
+        invalid = [results[s].get('error') or f'Serial {s} is not valid' for s in serials if not results[s].get('valid')]
+        if invalid:
+            return jsonify({'success': False, 'error': '; '.join(invalid[:5])})
+    
     next_line_num = db.session.query(db.func.max(DeliveryItem.line_number)).filter_by(
         delivery_id=delivery_id
     ).scalar() or 0
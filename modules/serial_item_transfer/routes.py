@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime
 import logging
@@ -479,6 +479,11 @@ def validate_serial_only(transfer_id):
         if transfer.status != 'draft':
             return jsonify({'success': False, 'error': 'Cannot validate items for non-draft transfer'}), 400
 
+        # Multi-serial mode: a scanned/pasted serial set is validated with set-based SAP queries
+        serial_numbers_text = request.form.get('serial_numbers', '')
+        if serial_numbers_text.strip():
+            return _validate_serial_set(transfer, serial_numbers_text)
+
         # Get form data
         serial_number = request.form.get('serial_number', '').strip()
 
@@ -523,6 +528,60 @@ def validate_serial_only(transfer_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _validate_serial_set(transfer, serial_numbers_text):
+    """Validate many serials at once without adding them to the transfer.
+
+    Answers with JSON, or streams one NDJSON line per serial as SAP answers when the
+    client sends Accept: application/x-ndjson.
+    """
+    serial_numbers = list(dict.fromkeys(
+        s.strip() for s in re.split(r'[,\n\r\s]+', serial_numbers_text.strip()) if s.strip()))
+    existing = {row.serial_number for row in db.session.query(SerialItemTransferItem.serial_number)
+                .filter_by(serial_item_transfer_id=transfer.id)}
+    sap = SAPIntegration()
+    descriptions = {}
+
+    def results():
+        for serial_number in serial_numbers:
+            if serial_number in existing:
+                yield {'serial_number': serial_number, 'valid': False,
+                       'error': f'Serial number {serial_number} already exists in this transfer'}
+        pending = [s for s in serial_numbers if s not in existing]
+        for serial_number, result in sap.iter_batch_series_validation(pending, None, transfer.from_warehouse):
+            if not result.get('valid'):
+                yield {'serial_number': serial_number, 'valid': False,
+                       'error': result.get('error', 'Serial number validation failed')}
+                continue
+            item_code = result.get('ItemCode')
+            if item_code not in descriptions:
+                descriptions[item_code] = sap._get_item_description(item_code)
+            yield {'serial_number': serial_number, 'valid': True, 'item_code': item_code,
+                   'item_description': descriptions[item_code], 'warehouse_code': result.get('WhsCode')}
+
+    if 'application/x-ndjson' in request.headers.get('Accept', ''):
+        def generate():
+            validated = failed = 0
+            for line in results():
+                validated += 1 if line['valid'] else 0
+                failed += 0 if line['valid'] else 1
+                yield json.dumps(line) + '\n'
+            yield json.dumps({'done': True, 'success': True, 'total': validated + failed,
+                              'validated_count': validated, 'failed_count': failed}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    order = {serial_number: index for index, serial_number in enumerate(serial_numbers)}
+    lines = sorted(results(), key=lambda line: order[line['serial_number']])
+    validated_count = len([line for line in lines if line['valid']])
+    logging.info(f"🔍 Validated {len(lines)} serial numbers for transfer {transfer.id}: {validated_count} valid")
+    return jsonify({
+        'success': True,
+        'message': f'{validated_count} of {len(lines)} serial numbers validated successfully',
+        'validated_count': validated_count,
+        'failed_count': len(lines) - validated_count,
+        'results': lines
+    })
+
+
 @serial_item_bp.route('/<int:transfer_id>/add_multiple_serials', methods=['POST'])
 @login_required
 def add_multiple_serials(transfer_id):
@@ -0,0 +1,197 @@
+"""
+QC Dashboard Pending Work
+Loads the QC dashboard's work lists - documents waiting for QC approval and approved serial
+item transfers waiting for SAP posting - with one UNION ALL query that returns a page of
+ids plus the total for every document type, then loads each page with its users and items
+eagerly. The approved / rejected today counters and the average processing time are
+computed with index-friendly date ranges and cached in sap_cache for a short TTL; approving
+or rejecting a document invalidates them.
+"""
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import DateTime, Integer, String, cast, event, func, inspect, literal, null, select, union_all
+from sqlalchemy.orm import selectinload
+
+from app import db
+from sap_cache import sap_cache
+
+# Documents per document type and page on the QC dashboard
+PAGE_SIZE = int(os.environ.get('QC_DASHBOARD_PAGE_SIZE', '25'))
+
+COUNTERS_NAMESPACE = 'qc_counters'
+
+
+class PendingPage:
+    """One page of a document type's work list (same attributes as Flask-SQLAlchemy's Pagination)"""
+
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _document_models():
+    from models import DirectInventoryTransfer, InventoryTransfer, SerialItemTransfer, SerialNumberTransfer
+    from modules.grpo.models import GRPODocument
+    from modules.sales_delivery.models import DeliveryDocument
+
+    return GRPODocument, InventoryTransfer, SerialNumberTransfer, SerialItemTransfer, DirectInventoryTransfer, \
+        DeliveryDocument
+
+
+def work_lists():
+    """{key: (model, status, sort column, eager-load options)} in dashboard order"""
+    from models import SerialNumberTransferItem
+
+    grpo, transfer, serial_transfer, serial_item_transfer, direct_transfer, delivery = _document_models()
+    return {
+        'grpo': (grpo, 'submitted', grpo.created_at,
+                 [selectinload(grpo.user), selectinload(grpo.items)]),
+        'transfer': (transfer, 'submitted', transfer.created_at,
+                     [selectinload(transfer.user), selectinload(transfer.items)]),
+        'serial_transfer': (serial_transfer, 'submitted', serial_transfer.created_at,
+                            [selectinload(serial_transfer.user),
+                             selectinload(serial_transfer.items).selectinload(SerialNumberTransferItem.serial_numbers)]),
+        'serial_item_transfer': (serial_item_transfer, 'submitted', serial_item_transfer.created_at,
+                                 [selectinload(serial_item_transfer.user), selectinload(serial_item_transfer.items)]),
+        'serial_item_ready': (serial_item_transfer, 'qc_approved', serial_item_transfer.qc_approved_at,
+                              [selectinload(serial_item_transfer.qc_approver),
+                               selectinload(serial_item_transfer.items)]),
+        'direct_transfer': (direct_transfer, 'submitted', direct_transfer.created_at,
+                            [selectinload(direct_transfer.user), selectinload(direct_transfer.items)]),
+        'delivery': (delivery, 'submitted', delivery.created_at,
+                     [selectinload(delivery.user), selectinload(delivery.items)]),
+    }
+
+
+def load_pending_work(pages=None, per_page=None):
+    """{key: PendingPage} for every work list; pages maps a key to its 1-based page number"""
+    pages = pages or {}
+    per_page = max(1, per_page or PAGE_SIZE)
+    lists = work_lists()
+
+    branches = []
+    for key, (model, status, sort_column, _) in lists.items():
+        page = max(1, pages.get(key) or 1)
+        ids = (select(literal(key, String).label('doc_type'), model.id.label('id'),
+                      sort_column.label('sort_at'))
+               .where(model.status == status)
+               .order_by(sort_column.desc(), model.id.desc())
+               .limit(per_page).offset((page - 1) * per_page)
+               .subquery())
+        branches.append(select(ids.c.doc_type, ids.c.id, ids.c.sort_at, cast(null(), Integer).label('total')))
+        branches.append(select(literal(key, String), cast(null(), Integer), cast(null(), DateTime),
+                               func.count(model.id)).where(model.status == status))
+
+    rows, totals = {key: [] for key in lists}, {}
+    for doc_type, doc_id, sort_at, total in db.session.execute(union_all(*branches)):
+        if doc_id is None:
+            totals[doc_type] = total or 0
+        else:
+            rows[doc_type].append((sort_at or datetime.min, doc_id))
+    # UNION ALL does not keep the branches' order
+    ids = {key: [doc_id for _, doc_id in sorted(key_rows, reverse=True)] for key, key_rows in rows.items()}
+
+    # A page past the end (e.g. after approvals emptied it) shows the last page instead
+    overflow = {key: -(-totals.get(key, 0) // per_page) for key in lists
+                if not ids[key] and totals.get(key) and (pages.get(key) or 1) > 1}
+    if overflow:
+        return load_pending_work(dict(pages, **overflow), per_page)
+
+    result = {}
+    for key, (model, _, _, options) in lists.items():
+        items = []
+        if ids[key]:
+            loaded = {document.id: document for document in
+                      model.query.options(*options).filter(model.id.in_(ids[key]))}
+            items = [loaded[doc_id] for doc_id in ids[key] if doc_id in loaded]
+        result[key] = PendingPage(items, totals.get(key, 0), max(1, pages.get(key) or 1), per_page)
+    return result
+
+
+def _average_processing_hours(model, since):
+    """Average hours from creation to QC approval of documents created since `since`"""
+    rows = db.session.query(model.created_at, model.qc_approved_at).filter(
+        model.qc_approved_at.isnot(None), model.created_at >= since).all()
+    hours = [(approved - created).total_seconds() / 3600 for created, approved in rows if created and approved]
+    return sum(hours) / len(hours) if hours else 0
+
+
+def _load_day_counters(day):
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    branches = []
+    for model in _document_models():
+        # A range on qc_approved_at instead of DATE(qc_approved_at) = today, so its index is used
+        branches.append(select(model.status, func.count(model.id))
+                        .where(model.qc_approved_at >= start, model.qc_approved_at < end,
+                               model.status.in_(['qc_approved', 'posted', 'rejected']))
+                        .group_by(model.status))
+    approved = rejected = 0
+    for status, count in db.session.execute(union_all(*branches)):
+        if status == 'rejected':
+            rejected += count
+        else:
+            approved += count
+
+    grpo, transfer = _document_models()[:2]
+    since = datetime.utcnow() - timedelta(days=7)
+    averages = []
+    for model in (grpo, transfer):
+        try:
+            averages.append(_average_processing_hours(model, since))
+        except Exception as e:
+            logging.warning(f"Error calculating {model.__tablename__} average processing time: {e}")
+    averages = [hours for hours in averages if hours]
+    return {'approved_today': approved, 'rejected_today': rejected,
+            'avg_processing_hours': sum(averages) / len(averages) if averages else 0}
+
+
+def get_day_counters():
+    """Approved / rejected today and the 7-day average processing time, cached briefly"""
+    today = date.today()
+    return sap_cache.get_or_load(COUNTERS_NAMESPACE, today.isoformat(), lambda: _load_day_counters(today))
+
+
+def _on_document_update(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        sap_cache.invalidate(COUNTERS_NAMESPACE)
+
+
+def register_counter_invalidation():
+    """Drop the cached counters whenever a QC document's status changes"""
+    for model in _document_models():
+        if not event.contains(model, 'after_update', _on_document_update):
+            event.listen(model, 'after_update', _on_document_update)
@@ -3,20 +3,27 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import logging
+import os
 import json
 from barcode_generator import BarcodeGenerator
 
 from app import app, db, login_manager
 from models import User, InventoryTransfer, InventoryTransferItem, PickList, PickListItem, \
     InventoryCount, InventoryCountItem, SAPInventoryCount, SAPInventoryCountLine, BarcodeLabel, BinScanningLog, DocumentNumberSeries, QRCodeLabel, PickListLine, \
-    DirectInventoryTransfer, DirectInventoryTransferItem
+    DirectInventoryTransfer, DirectInventoryTransferItem, SAPCountingSession
 from modules.grpo.models import GRPODocument, GRPOItem, GRPOSerialNumber, GRPOBatchNumber, PurchaseDeliveryNote
 from modules.multi_grn_creation.models import MultiGRNBatch
 from sap_integration import SAPIntegration
+from sap_outbox import enqueue_posting, retry_posting, wake_outbox_worker, get_outbox_stats
+from sap_counting_sessions import open_session, session_lines, record_entries, close_session, counting_progress
+from qc_pending_work import load_pending_work, work_lists, get_day_counters, register_counter_invalidation
 from sqlalchemy import or_
 
 # BinScanningLog is now imported above
 
+# QC approvals and rejections drop the cached QC dashboard counters
+register_counter_invalidation()
+
 # API Routes for GRPO Dropdown Functionality
 
 @app.route('/api/get-warehouses', methods=['GET'])
@@ -364,94 +371,13 @@ def get_invcnt_details():
                     'error': f'Document is not open. Status: {doc_status}. Only open documents can be processed.'
                 }), 400
             
-            # Save document to local database
+            # Save document to local database - only changed lines are written
             try:
-                # Check if document already exists locally
-                local_doc = SAPInventoryCount.query.filter_by(doc_entry=int(doc_entry)).first()
-                
-                if local_doc:
-                    # Update existing document
-                    local_doc.doc_number = invcnt_data.get('DocNumber')
-                    local_doc.series = invcnt_data.get('Series')
-                    local_doc.count_date = invcnt_data.get('CountDate')
-                    local_doc.counting_type = invcnt_data.get('CountingType')
-                    local_doc.count_time = invcnt_data.get('CountTime')
-                    local_doc.single_counter_type = invcnt_data.get('SingleCounterType')
-                    local_doc.document_status = invcnt_data.get('DocumentStatus')
-                    local_doc.remarks = invcnt_data.get('Remarks')
-                    local_doc.reference_2 = invcnt_data.get('Reference2')
-                    local_doc.branch_id = invcnt_data.get('BPL_IDAssignedToInvoice')
-                    local_doc.financial_period = invcnt_data.get('FinancialPeriod')
-                    local_doc.counter_type = invcnt_data.get('CounterType')
-                    local_doc.counter_id = invcnt_data.get('CounterID')
-                    local_doc.multiple_counter_role = invcnt_data.get('MultipleCounterRole')
-                    local_doc.last_updated_at = datetime.utcnow()
-                    
-                    # Delete existing lines and recreate them
-                    SAPInventoryCountLine.query.filter_by(count_id=local_doc.id).delete()
-                else:
-                    # Create new document
-                    local_doc = SAPInventoryCount(
-                        doc_entry=int(doc_entry),
-                        doc_number=invcnt_data.get('DocNumber'),
-                        series=invcnt_data.get('Series'),
-                        count_date=invcnt_data.get('CountDate'),
-                        counting_type=invcnt_data.get('CountingType'),
-                        count_time=invcnt_data.get('CountTime'),
-                        single_counter_type=invcnt_data.get('SingleCounterType'),
-                        document_status=invcnt_data.get('DocumentStatus'),
-                        remarks=invcnt_data.get('Remarks'),
-                        reference_2=invcnt_data.get('Reference2'),
-                        branch_id=invcnt_data.get('BPL_IDAssignedToInvoice'),
-                        financial_period=invcnt_data.get('FinancialPeriod'),
-                        counter_type=invcnt_data.get('CounterType'),
-                        counter_id=invcnt_data.get('CounterID'),
-                        multiple_counter_role=invcnt_data.get('MultipleCounterRole'),
-                        user_id=current_user.id
-                    )
-                    db.session.add(local_doc)
-                    db.session.flush()
-                
-                # Save document lines
-                lines = invcnt_data.get('InventoryCountLines', [])
-                for line in lines:
-                    in_whs_qty = float(line.get('InWarehouseQuantity', 0))
-                    uom_counted_qty = float(line.get('UoMCountedQuantity', 0))
-                    variance = uom_counted_qty - in_whs_qty
-                    
-                    local_line = SAPInventoryCountLine(
-                        count_id=local_doc.id,
-                        line_number=line.get('LineNumber'),
-                        item_code=line.get('ItemCode'),
-                        item_description=line.get('ItemDescription'),
-                        warehouse_code=line.get('WarehouseCode'),
-                        bin_entry=line.get('BinEntry'),
-                        in_warehouse_quantity=in_whs_qty,
-                        counted=line.get('Counted', 'tNO'),
-                        uom_code=line.get('UoMCode'),
-                        bar_code=line.get('BarCode'),
-                        uom_counted_quantity=uom_counted_qty,
-                        items_per_unit=line.get('ItemsPerUnit', 1),
-                        counter_type=line.get('CounterType'),
-                        counter_id=line.get('CounterID'),
-                        multiple_counter_role=line.get('MultipleCounterRole'),
-                        line_status=line.get('LineStatus'),
-                        project_code=line.get('ProjectCode'),
-                        manufacturer=line.get('Manufacturer'),
-                        supplier_catalog_no=line.get('SupplierCatalogNo'),
-                        preferred_vendor=line.get('PreferredVendor'),
-                        cost_code=line.get('CostCode'),
-                        u_floor=line.get('U_Floor'),
-                        u_rack=line.get('U_Rack'),
-                        u_level=line.get('U_Level'),
-                        freeze=line.get('Freeze', 'tNO'),
-                        u_invcount=line.get('U_InvCount'),
-                        variance=variance
-                    )
-                    db.session.add(local_line)
-                
+                sync_result = sap.sync_inventory_counting_to_local_db(doc_entry, invcnt_data, current_user.id)
                 db.session.commit()
                 logging.info(f"✅ Saved SAP counting document {doc_entry} to local database")
+                # Counts not sent to SAP yet replace SAP's values, so the next save keeps them
+                sap.apply_local_counts(invcnt_data, sync_result['local_counts'])
                 
             except Exception as e:
                 db.session.rollback()
@@ -489,69 +415,151 @@ def update_inventory_counting():
                 'error': 'Both doc_entry and document are required'
             }), 400
         
-        # Initialize SAP integration
+        # Record the counts locally and PATCH only the changed lines to SAP, in chunks
         sap = SAPIntegration()
-        
-        # Call the PATCH method
-        result = sap.update_inventory_counting(doc_entry, document)
+        result = sap.post_inventory_counting_changes(doc_entry, document)
         
         if result.get('success'):
-            # Update local database after successful PATCH
-            try:
-                local_doc = SAPInventoryCount.query.filter_by(doc_entry=int(doc_entry)).first()
-                
-                if local_doc:
-                    # Update document header
-                    local_doc.last_updated_at = datetime.utcnow()
-                    
-                    # Update counting lines based on submitted data
-                    lines = document.get('InventoryCountLines', [])
-                    for line_data in lines:
-                        line_number = line_data.get('LineNumber')
-                        local_line = SAPInventoryCountLine.query.filter_by(
-                            count_id=local_doc.id,
-                            line_number=line_number
-                        ).first()
-                        
-                        if local_line:
-                            # Update the counted quantity and status
-                            local_line.uom_counted_quantity = float(line_data.get('UoMCountedQuantity', 0))
-                            local_line.counted = line_data.get('Counted', 'tNO')
-                            
-                            # Recalculate variance
-                            local_line.variance = local_line.uom_counted_quantity - local_line.in_warehouse_quantity
-                            local_line.updated_at = datetime.utcnow()
-                    
-                    db.session.commit()
-                    logging.info(f"✅ Updated local counting document {doc_entry} after PATCH")
-                else:
-                    logging.warning(f"⚠️ Local document {doc_entry} not found for update")
-                    
-            except Exception as e:
-                db.session.rollback()
-                logging.error(f"❌ Error updating local counting document: {str(e)}")
-                # Don't fail the request if local update fails
-            
             return jsonify({
                 'success': True,
                 'message': result.get('message'),
                 'doc_entry': doc_entry,
+                'posted_lines': result.get('posted_lines', 0),
+                'pending_lines': result.get('pending_lines', 0),
                 'sap_response': result.get('sap_response')
             })
         else:
             return jsonify({
                 'success': False,
                 'error': result.get('error'),
+                'posted_lines': result.get('posted_lines', 0),
+                'pending_lines': result.get('pending_lines', 0),
                 'sap_response': result.get('sap_response')
             }), 400
             
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error in update_inventory_counting API: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def _own_counting_session(session_id):
+    """The current user's counting session, or None"""
+    session = db.session.get(SAPCountingSession, session_id)
+    if session is None or session.user_id != current_user.id:
+        return None
+    return session
+
+@app.route('/api/inventory-counting/<int:doc_entry>/sessions', methods=['POST'])
+@login_required
+def open_counting_session(doc_entry):
+    """Open (or resume) this device's counting session on a document, scoped by floor/rack/level"""
+    try:
+        data = request.get_json() or {}
+        device_id = (data.get('device_id') or '').strip()
+        
+        if not device_id:
+            return jsonify({
+                'success': False,
+                'error': 'device_id is required'
+            }), 400
+        
+        local_doc = SAPInventoryCount.query.filter_by(doc_entry=doc_entry).first()
+        if not local_doc:
+            # First device on this document - load it from SAP
+            sap = SAPIntegration()
+            invcnt_data = sap.get_inventory_counting_by_doc_entry(doc_entry)
+            if not invcnt_data or invcnt_data.get('DocumentStatus') != 'cdsOpen':
+                return jsonify({
+                    'success': False,
+                    'error': f'No open Inventory Counting document found for DocEntry {doc_entry}'
+                }), 404
+            sap.sync_inventory_counting_to_local_db(doc_entry, invcnt_data, current_user.id)
+            db.session.commit()
+            local_doc = SAPInventoryCount.query.filter_by(doc_entry=doc_entry).first()
+        
+        session = open_session(local_doc, current_user.id, device_id,
+                               {field: data.get(field) for field in ('u_floor', 'u_rack', 'u_level')})
+        return jsonify({
+            'success': True,
+            'session': session.to_dict(),
+            'lines': session_lines(session)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in open_counting_session API: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/inventory-counting/sessions/<int:session_id>/entries', methods=['POST'])
+@login_required
+def record_counting_entries(session_id):
+    """Append count deltas from a device; no SAP call, the counting_flush job sends them"""
+    try:
+        session = _own_counting_session(session_id)
+        if not session:
+            return jsonify({'success': False, 'error': 'Counting session not found'}), 404
+        if session.status != 'open':
+            return jsonify({'success': False, 'error': 'Counting session is closed'}), 409
+        
+        entries = (request.get_json() or {}).get('entries') or []
+        result = record_entries(session, entries)
+        return jsonify(dict(result, success=True))
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in record_counting_entries API: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/inventory-counting/sessions/<int:session_id>/close', methods=['POST'])
+@login_required
+def close_counting_session(session_id):
+    """Close a counting session and ask the scheduler to flush the document to SAP"""
+    try:
+        from sap_scheduler import request_job_run
+        
+        session = _own_counting_session(session_id)
+        if not session:
+            return jsonify({'success': False, 'error': 'Counting session not found'}), 404
+        
+        close_session(session)
+        request_job_run('counting_flush')
+        return jsonify({'success': True, 'session': session.to_dict()})
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in close_counting_session API: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/inventory-counting/<int:doc_entry>/progress', methods=['GET'])
+@login_required
+def counting_session_progress(doc_entry):
+    """Counted, pending and unsent lines of a document and its counting sessions"""
+    try:
+        local_doc = SAPInventoryCount.query.filter_by(doc_entry=doc_entry).first()
+        if not local_doc:
+            return jsonify({'success': False, 'error': f'Counting document {doc_entry} is not loaded'}), 404
+        
+        return jsonify(dict(counting_progress(local_doc), success=True))
+        
+    except Exception as e:
+        logging.error(f"Error in counting_session_progress API: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/get-po-by-doc-entry', methods=['POST'])
 @login_required
 def get_po_by_doc_entry():
@@ -1379,55 +1387,27 @@ def approve_grpo(grpo_id):
         for item in grpo_doc.items:
             item.qc_status = 'approved'
         
-        # Always post to SAP B1 when using approve button
-        logging.info("=" * 100)
-        logging.info("🚀 POSTING GRPO TO SAP B1 - PURCHASE DELIVERY NOTE CREATION")
-        logging.info("=" * 100)
-        logging.info(f"📋 GRPO ID: {grpo_doc.id}")
-        logging.info(f"📄 PO Number: {grpo_doc.po_number}")
-        logging.info(f"👤 User: {current_user.username}")
-        logging.info(f"🏢 Branch: {current_user.branch_id}")
+        grpo_doc.status = 'qc_approved'
+        grpo_doc.qc_approver_id = current_user.id
+        grpo_doc.qc_approved_at = datetime.utcnow()
         
-        sap = SAPIntegration()
-        result = sap.post_grpo_to_sap(grpo_doc)
+        # Queue the SAP B1 Purchase Delivery Note post; the outbox worker posts it in the background
+        job = enqueue_posting('grpo', grpo_doc.id, created_by=current_user.id)
+        db.session.commit()
+        wake_outbox_worker()
         
-        if result.get('success'):
-            grpo_doc.status = 'posted'
-            grpo_doc.sap_document_number = result.get('sap_document_number')
-            db.session.commit()
-            
-            logging.info("=" * 100)
-            logging.info("✅ SUCCESS: GRPO POSTED TO SAP B1")
-            logging.info(f"📄 SAP Document Number: {result.get('sap_document_number')}")
-            logging.info("=" * 100)
-            
-            success_message = f'GRPO approved and posted to SAP B1 successfully! SAP Document Number: {result.get("sap_document_number")}'
-            
-            if request.headers.get('Content-Type') == 'application/json' or request.is_json:
-                return jsonify({
-                    'success': True, 
-                    'message': success_message,
-                    'sap_document_number': result.get('sap_document_number')
-                })
-            flash(success_message, 'success')
-        else:
-            grpo_doc.status = 'approved'  # Keep as approved even if SAP posting fails
-            db.session.commit()
-            
-            logging.error("=" * 100)
-            logging.error("❌ FAILED: GRPO POSTING TO SAP B1 FAILED")
-            logging.error(f"🚫 Error: {result.get('error')}")
-            logging.error("=" * 100)
-            
-            error_message = f'GRPO approved but failed to post to SAP B1: {result.get("error")}'
-            
-            if request.headers.get('Content-Type') == 'application/json' or request.is_json:
-                return jsonify({
-                    'success': False,
-                    'error': error_message,
-                    'grpo_approved': True
-                })
-            flash(error_message, 'warning')
+        logging.info(f"✅ GRPO {grpo_doc.id} (PO {grpo_doc.po_number}) approved by {current_user.username} - SAP B1 posting queued as job {job.id}")
+        success_message = f'GRPO approved - posting to SAP B1 in the background (job #{job.id})'
+        
+        if request.headers.get('Content-Type') == 'application/json' or request.is_json:
+            return jsonify({
+                'success': True,
+                'message': success_message,
+                'status': 'qc_approved',
+                'job_id': job.id,
+                'job_status_url': url_for('sap_job_status', job_id=job.id)
+            }), 202
+        flash(success_message, 'success')
     
     except Exception as e:
         logging.error(f"Error approving GRPO: {str(e)}")
@@ -1821,7 +1801,7 @@ def submit_transfer(transfer_id):
 @app.route('/inventory_transfer/<int:transfer_id>/qc_approve', methods=['POST'])
 @login_required
 def qc_approve_transfer(transfer_id):
-    """QC approve inventory transfer and post to SAP B1"""
+    """QC approve inventory transfer and queue it for posting to SAP B1"""
     try:
         transfer = InventoryTransfer.query.get_or_404(transfer_id)
         
@@ -1840,28 +1820,24 @@ def qc_approve_transfer(transfer_id):
         for item in transfer.items:
             item.qc_status = 'approved'
             
-        # Submit to SAP B1 using the correct method
-        sap = SAPIntegration()
-        result = sap.post_inventory_transfer_to_sap(transfer)
+        transfer.status = 'qc_approved'
+        transfer.qc_approver_id = current_user.id
+        transfer.qc_approved_at = datetime.utcnow()
+        transfer.qc_notes = qc_notes
         
-        if result.get('success'):
-            # Update transfer status and SAP document number
-            transfer.status = 'qc_approved'
-            transfer.qc_approver_id = current_user.id
-            transfer.qc_approved_at = datetime.utcnow()
-            transfer.qc_notes = qc_notes
-            transfer.sap_document_number = result.get('document_number')
-            db.session.commit()
-            
-            logging.info(f"✅ Inventory Transfer {transfer_id} QC approved and posted to SAP B1 as document {result.get('document_number')}")
-            return jsonify({
-                'success': True, 
-                'message': f'Transfer QC approved and posted to SAP B1 as document {result.get("document_number")}',
-                'sap_document_number': result.get('document_number')
-            })
-        else:
-            logging.error(f"❌ Failed to post transfer {transfer_id} to SAP B1: {result.get('error')}")
-            return jsonify({'success': False, 'error': result.get('error')}), 500
+        # Queue the SAP B1 Stock Transfer post; the outbox worker posts it in the background
+        job = enqueue_posting('inventory_transfer', transfer.id, created_by=current_user.id)
+        db.session.commit()
+        wake_outbox_worker()
+        
+        logging.info(f"✅ Inventory Transfer {transfer_id} QC approved - SAP B1 posting queued as job {job.id}")
+        return jsonify({
+            'success': True,
+            'message': 'Transfer QC approved - posting to SAP B1 in the background',
+            'status': 'qc_approved',
+            'job_id': job.id,
+            'job_status_url': url_for('sap_job_status', job_id=job.id)
+        }), 202
         
     except Exception as e:
         logging.error(f"Error QC approving transfer: {str(e)}")
@@ -1997,192 +1973,12 @@ def qc_dashboard():
         flash('Access denied - QC permissions required', 'error')
         return redirect(url_for('dashboard'))
     
-    # Get pending transfers for QC approval
-    pending_transfers = InventoryTransfer.query.filter_by(status='submitted').order_by(InventoryTransfer.created_at.desc()).all()
-    
-    # Get pending GRPOs for QC approval
-    pending_grpos = GRPODocument.query.filter_by(status='submitted').order_by(GRPODocument.created_at.desc()).all()
-    
-    # Get pending Serial Number Transfers for QC approval
-    from models import SerialNumberTransfer, SerialItemTransfer
-    pending_serial_transfers = SerialNumberTransfer.query.filter_by(status='submitted').order_by(SerialNumberTransfer.created_at.desc()).all()
-    
-    # Get pending Serial Item Transfers for QC approval
-    pending_serial_item_transfers = SerialItemTransfer.query.filter_by(status='submitted').order_by(SerialItemTransfer.created_at.desc()).all()
-    
-    # Get QC approved Serial Item Transfers ready for SAP posting
-    qc_approved_serial_item_transfers = SerialItemTransfer.query.filter_by(status='qc_approved').order_by(SerialItemTransfer.qc_approved_at.desc()).all()
-    
-    # Get pending Direct Inventory Transfers for QC approval
-    from models import DirectInventoryTransfer
-    pending_direct_transfers = DirectInventoryTransfer.query.filter_by(status='submitted').order_by(DirectInventoryTransfer.created_at.desc()).all()
-    
-    # Get pending Sales Deliveries for QC approval
-    from modules.sales_delivery.models import DeliveryDocument
-    pending_deliveries = DeliveryDocument.query.filter_by(status='submitted').order_by(DeliveryDocument.created_at.desc()).all()
-    
-    # Calculate metrics for today
-    from datetime import datetime, date
-    today = date.today()
-    
-    # Count approved today (both GRPO and transfers)
-    approved_grpos_today = GRPODocument.query.filter(
-        GRPODocument.status.in_(['qc_approved', 'posted']),
-        db.func.date(GRPODocument.qc_approved_at) == today
-    ).count()
-    
-    approved_transfers_today = InventoryTransfer.query.filter(
-        InventoryTransfer.status == 'qc_approved',
-        db.func.date(InventoryTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count approved serial number transfers today
-    approved_serial_transfers_today = SerialNumberTransfer.query.filter(
-        SerialNumberTransfer.status.in_(['qc_approved', 'posted']),
-        db.func.date(SerialNumberTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count approved serial item transfers today
-    approved_serial_item_transfers_today = SerialItemTransfer.query.filter(
-        SerialItemTransfer.status.in_(['qc_approved', 'posted']),
-        db.func.date(SerialItemTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count approved direct inventory transfers today
-    approved_direct_transfers_today = DirectInventoryTransfer.query.filter(
-        DirectInventoryTransfer.status.in_(['qc_approved', 'posted']),
-        db.func.date(DirectInventoryTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count approved sales deliveries today
-    approved_deliveries_today = DeliveryDocument.query.filter(
-        DeliveryDocument.status.in_(['qc_approved', 'posted']),
-        db.func.date(DeliveryDocument.qc_approved_at) == today
-    ).count()
-    
-    approved_today = approved_grpos_today + approved_transfers_today + approved_serial_transfers_today + approved_serial_item_transfers_today + approved_direct_transfers_today + approved_deliveries_today
-    
-    # Count rejected today
-    rejected_grpos_today = GRPODocument.query.filter(
-        GRPODocument.status == 'rejected',
-        db.func.date(GRPODocument.qc_approved_at) == today
-    ).count()
-    
-    rejected_transfers_today = InventoryTransfer.query.filter(
-        InventoryTransfer.status == 'rejected',
-        db.func.date(InventoryTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count rejected serial number transfers today  
-    rejected_serial_transfers_today = SerialNumberTransfer.query.filter(
-        SerialNumberTransfer.status == 'rejected',
-        db.func.date(SerialNumberTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count rejected serial item transfers today
-    rejected_serial_item_transfers_today = SerialItemTransfer.query.filter(
-        SerialItemTransfer.status == 'rejected',
-        db.func.date(SerialItemTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count rejected direct inventory transfers today
-    rejected_direct_transfers_today = DirectInventoryTransfer.query.filter(
-        DirectInventoryTransfer.status == 'rejected',
-        db.func.date(DirectInventoryTransfer.qc_approved_at) == today
-    ).count()
-    
-    # Count rejected sales deliveries today
-    rejected_deliveries_today = DeliveryDocument.query.filter(
-        DeliveryDocument.status == 'rejected',
-        db.func.date(DeliveryDocument.qc_approved_at) == today
-    ).count()
-    
-    rejected_today = rejected_grpos_today + rejected_transfers_today + rejected_serial_transfers_today + rejected_serial_item_transfers_today + rejected_direct_transfers_today + rejected_deliveries_today
-    
-    # Calculate average processing time
-    from sqlalchemy import text
-    
-    # Get average processing time for GRPOs (from created to QC approved)
-    try:
-        # Use database-agnostic SQL for date calculations
-        if 'postgresql' in str(db.engine.url).lower():
-            # PostgreSQL syntax
-            grpo_avg = db.session.execute(text("""
-                SELECT AVG(
-                    EXTRACT(EPOCH FROM (qc_approved_at - created_at)) / 3600
-                ) as avg_hours
-                FROM grpo_documents 
-                WHERE qc_approved_at IS NOT NULL 
-                AND created_at >= CURRENT_DATE - INTERVAL '7 days'
-            """)).scalar()
-        elif 'mysql' in str(db.engine.url).lower():
-            # MySQL syntax
-            grpo_avg = db.session.execute(text("""
-                SELECT AVG(
-                    TIMESTAMPDIFF(HOUR, created_at, qc_approved_at)
-                ) as avg_hours
-                FROM grpo_documents 
-                WHERE qc_approved_at IS NOT NULL 
-                AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-            """)).scalar()
-        else:
-            # SQLite syntax (fallback)
-            grpo_avg = db.session.execute(text("""
-                SELECT AVG(
-                    (julianday(qc_approved_at) - julianday(created_at)) * 24
-                ) as avg_hours
-                FROM grpo_documents 
-                WHERE qc_approved_at IS NOT NULL 
-                AND created_at >= date('now', '-7 days')
-            """)).scalar()
-    except Exception as e:
-        logging.warning(f"Error calculating GRPO average processing time: {e}")
-        grpo_avg = 0
+    # One UNION query for a page of every work list, then each page with users and items eager loaded
+    work = load_pending_work({key: request.args.get(f'{key}_page', 1, type=int) for key in work_lists()})
     
-    # Get average processing time for transfers
-    try:
-        if 'postgresql' in str(db.engine.url).lower():
-            # PostgreSQL syntax
-            transfer_avg = db.session.execute(text("""
-                SELECT AVG(
-                    EXTRACT(EPOCH FROM (qc_approved_at - created_at)) / 3600
-                ) as avg_hours
-                FROM inventory_transfers 
-                WHERE qc_approved_at IS NOT NULL 
-                AND created_at >= CURRENT_DATE - INTERVAL '7 days'
-            """)).scalar()
-        elif 'mysql' in str(db.engine.url).lower():
-            # MySQL syntax
-            transfer_avg = db.session.execute(text("""
-                SELECT AVG(
-                    TIMESTAMPDIFF(HOUR, created_at, qc_approved_at)
-                ) as avg_hours
-                FROM inventory_transfers 
-                WHERE qc_approved_at IS NOT NULL 
-                AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-            """)).scalar()
-        else:
-            # SQLite syntax (fallback)
-            transfer_avg = db.session.execute(text("""
-                SELECT AVG(
-                    (julianday(qc_approved_at) - julianday(created_at)) * 24
-                ) as avg_hours
-                FROM inventory_transfers 
-                WHERE qc_approved_at IS NOT NULL 
-                AND created_at >= date('now', '-7 days')
-            """)).scalar()
-    except Exception as e:
-        logging.warning(f"Error calculating transfer average processing time: {e}")
-        transfer_avg = 0
-    
-    # Calculate overall average
-    avg_processing_hours = 0
-    if grpo_avg and transfer_avg:
-        avg_processing_hours = (grpo_avg + transfer_avg) / 2
-    elif grpo_avg:
-        avg_processing_hours = grpo_avg
-    elif transfer_avg:
-        avg_processing_hours = transfer_avg
+    # Approved / rejected today and average processing time (cached briefly)
+    counters = get_day_counters()
+    avg_processing_hours = counters['avg_processing_hours']
     
     # Format processing time
     if avg_processing_hours:
@@ -2193,19 +1989,17 @@ def qc_dashboard():
     else:
         avg_processing_time = "N/A"
     
-    rejected_today = rejected_grpos_today + rejected_transfers_today + rejected_serial_transfers_today + rejected_serial_item_transfers_today
-    
     return render_template('qc_dashboard.html', 
-                         pending_transfers=pending_transfers,
-                         pending_grpos=pending_grpos,
-                         pending_serial_transfers=pending_serial_transfers,
-                         pending_serial_item_transfers=pending_serial_item_transfers,
-                         pending_direct_transfers=pending_direct_transfers,
-                         pending_deliveries=pending_deliveries,
-                         qc_approved_serial_item_transfers=qc_approved_serial_item_transfers,
-                         pending_count=len(pending_transfers) + len(pending_grpos) + len(pending_serial_transfers) + len(pending_serial_item_transfers) + len(pending_direct_transfers) + len(pending_deliveries),
-                         approved_today=approved_today,
-                         rejected_today=rejected_today,
+                         pending_transfers=work['transfer'],
+                         pending_grpos=work['grpo'],
+                         pending_serial_transfers=work['serial_transfer'],
+                         pending_serial_item_transfers=work['serial_item_transfer'],
+                         pending_direct_transfers=work['direct_transfer'],
+                         pending_deliveries=work['delivery'],
+                         qc_approved_serial_item_transfers=work['serial_item_ready'],
+                         pending_count=sum(page.total for key, page in work.items() if key != 'serial_item_ready'),
+                         approved_today=counters['approved_today'],
+                         rejected_today=counters['rejected_today'],
                          avg_processing_time=avg_processing_time)
 
 @app.route('/serial_item_transfer/<int:transfer_id>/qc_approve', methods=['POST'])
@@ -2384,7 +2178,7 @@ def reject_direct_transfer_qc(transfer_id):
 @app.route('/sales_delivery/<int:delivery_id>/qc_approve', methods=['POST'])
 @login_required
 def approve_sales_delivery_qc(delivery_id):
-    """Approve Sales Delivery from QC Dashboard and post to SAP B1"""
+    """Approve Sales Delivery from QC Dashboard and queue it for posting to SAP B1"""
     try:
         from modules.sales_delivery.models import DeliveryDocument, DeliveryItem
         delivery = DeliveryDocument.query.get_or_404(delivery_id)
@@ -2408,64 +2202,13 @@ def approve_sales_delivery_qc(delivery_id):
         for item in delivery.items:
             item.qc_status = 'approved'
         
-        sap = SAPIntegration()
-        if not sap.ensure_logged_in():
-            db.session.rollback()
-            flash('SAP B1 authentication failed. Please try again.', 'error')
-            return redirect(url_for('qc_dashboard'))
-        
-        document_lines = []
-        for item in delivery.items:
-            line_data = {
-                'BaseType': 17,
-                'BaseEntry': delivery.so_doc_entry,
-                'BaseLine': item.base_line,
-                'ItemCode': item.item_code,
-                'Quantity': item.quantity,
-                'WarehouseCode': item.warehouse_code,
-                'UnitPrice': item.unit_price
-            }
-            
-            if item.batch_required and item.batch_number:
-                line_data['BatchNumbers'] = [{
-                    'BatchNumber': item.batch_number,
-                    'Quantity': item.quantity
-                }]
-            
-            if item.serial_required and item.serial_number:
-                line_data['SerialNumbers'] = [{
-                    'InternalSerialNumber': item.serial_number,
-                    'Quantity': 1
-                }]
-            
-            document_lines.append(line_data)
-        
-        delivery_data = {
-            'CardCode': delivery.card_code,
-            'DocDate': delivery.doc_date.strftime('%Y-%m-%d') if delivery.doc_date else datetime.utcnow().strftime('%Y-%m-%d'),
-            'DocCurrency': delivery.doc_currency or 'INR',
-            'Series': delivery.delivery_series or delivery.so_series,
-            'Comments': delivery.remarks or f'Delivery against SO {delivery.so_doc_num} - QC Approved by {current_user.username}',
-            'DocumentLines': document_lines
-        }
-        
-        result = sap.create_delivery_note(delivery_data)
-        
-        if not result.get('success'):
-            db.session.rollback()
-            sap_error = result.get('error', 'Unknown SAP error')
-            logging.error(f"❌ SAP B1 posting failed for delivery {delivery_id}: {sap_error}")
-            flash(f'QC approved but SAP B1 posting failed: {sap_error}', 'error')
-            return redirect(url_for('qc_dashboard'))
-        
-        delivery.sap_doc_entry = result.get('doc_entry')
-        delivery.sap_doc_num = result.get('doc_num')
-        delivery.status = 'posted'
-        
+        # Queue the SAP B1 Delivery Note post; the outbox worker posts it in the background
+        job = enqueue_posting('sales_delivery', delivery.id, created_by=current_user.id)
         db.session.commit()
+        wake_outbox_worker()
         
-        logging.info(f"✅ Sales Delivery {delivery_id} approved and posted to SAP B1 as DocNum {delivery.sap_doc_num} by {current_user.username}")
-        flash(f'Sales Delivery approved and posted to SAP B1 as {delivery.sap_doc_num}!', 'success')
+        logging.info(f"✅ Sales Delivery {delivery_id} approved by {current_user.username} - SAP B1 posting queued as job {job.id}")
+        flash(f'Sales Delivery approved - posting to SAP B1 in the background (job #{job.id})', 'success')
         return redirect(url_for('qc_dashboard'))
         
     except Exception as e:
@@ -2618,9 +2361,9 @@ def pick_list():
     if priority_filter != 'all':
         query = query.filter(PickList.priority == priority_filter)
     
-    # Apply user filter (non-admin users see only their records)
+    # Apply user filter (non-admin users see their records and the unowned ones they can claim)
     if current_user.role not in ['admin', 'manager']:
-        query = query.filter(PickList.user_id == current_user.id)
+        query = query.filter(or_(PickList.user_id == current_user.id, PickList.user_id.is_(None)))
     
     # Order by creation date
     query = query.order_by(PickList.created_at.desc())
@@ -2634,12 +2377,8 @@ def pick_list():
     try:
         from sap_integration import SAPIntegration
         sap = SAPIntegration()
-        sap_result = sap.get_pick_lists(limit=50)
-        if sap_result.get('success'):
-            # Store SAP pick lists count for display
-            sap_count = sap_result.get('total_count', 0)
-        else:
-            sap_count = 0
+        # Count of open SAP pick lists for display, without downloading them
+        sap_count = sap.count_pick_lists() or 0
     except Exception as e:
         logging.warning(f"Could not sync with SAP B1: {str(e)}")
         sap_count = 0
@@ -2652,13 +2391,19 @@ def pick_list():
                          per_page=per_page,
                          sap_count=sap_count)
 
+def _claim_pick_list(pick_list):
+    """Make the current user the owner of an unowned (background-synced) pick list"""
+    if pick_list.user_id is None:
+        pick_list.user_id = current_user.id
+        logging.info(f"📋 Pick list {pick_list.absolute_entry or pick_list.id} claimed by {current_user.username}")
+
 @app.route('/pick_list/<int:pick_list_id>')
 @login_required
 def pick_list_detail(pick_list_id):
     pick_list = PickList.query.get_or_404(pick_list_id)
     
     # Check access permissions
-    if pick_list.user_id != current_user.id and current_user.role not in ['admin', 'manager']:
+    if pick_list.user_id not in (None, current_user.id) and current_user.role not in ['admin', 'manager']:
         flash('Access denied - You can only view your own pick lists', 'error')
         return redirect(url_for('pick_list'))
     
@@ -2818,72 +2563,15 @@ def sync_sap_pick_lists():
     
     try:
         from sap_integration import SAPIntegration
-        sap = SAPIntegration()
-        
-        # Get pick lists from SAP B1
-        sap_result = sap.get_pick_lists(limit=100)
-        if not sap_result.get('success'):
-            return jsonify({
-                'success': False, 
-                'error': sap_result.get('error', 'Failed to fetch from SAP B1')
-            })
-        
-        sap_pick_lists = sap_result.get('pick_lists', [])
-        synced_count = 0
-        updated_count = 0
-        
-        for sap_pick_list in sap_pick_lists:
-            absolute_entry = sap_pick_list.get('Absoluteentry')
-            if not absolute_entry:
-                continue
-            
-            # Check if pick list exists locally
-            existing_pick_list = PickList.query.filter_by(absolute_entry=absolute_entry).first()
-            
-            if existing_pick_list:
-                # Update existing record
-                existing_pick_list.status = sap_pick_list.get('Status', existing_pick_list.status)
-                existing_pick_list.remarks = sap_pick_list.get('Remarks', existing_pick_list.remarks)
-                if sap_pick_list.get('PickDate'):
-                    try:
-                        existing_pick_list.pick_date = datetime.strptime(
-                            sap_pick_list['PickDate'][:19], '%Y-%m-%dT%H:%M:%S'
-                        )
-                    except:
-                        pass
-                updated_count += 1
-            else:
-                # Create new record
-                pick_list = PickList(
-                    absolute_entry=absolute_entry,
-                    name=sap_pick_list.get('Name', f'SAP-{absolute_entry}'),
-                    owner_code=sap_pick_list.get('OwnerCode'),
-                    owner_name=sap_pick_list.get('OwnerName'),
-                    remarks=sap_pick_list.get('Remarks'),
-                    status=sap_pick_list.get('Status', 'ps_Open'),
-                    object_type=sap_pick_list.get('ObjectType', '156'),
-                    use_base_units=sap_pick_list.get('UseBaseUnits', 'tNO'),
-                    user_id=current_user.id
-                )
-                
-                if sap_pick_list.get('PickDate'):
-                    try:
-                        pick_list.pick_date = datetime.strptime(
-                            sap_pick_list['PickDate'][:19], '%Y-%m-%dT%H:%M:%S'
-                        )
-                    except:
-                        pass
-                
-                db.session.add(pick_list)
-                synced_count += 1
-        
-        db.session.commit()
+        result = SAPIntegration().sync_open_pick_lists(current_user.id)
+        if not result.get('success'):
+            return jsonify({'success': False, 'error': result.get('error')})
         
         return jsonify({
             'success': True,
-            'message': f'Synced {synced_count} new pick lists, updated {updated_count} existing ones',
-            'synced_count': synced_count,
-            'updated_count': updated_count
+            'message': f"Synced {result['synced_count']} new pick lists, updated {result['updated_count']} existing ones",
+            'synced_count': result['synced_count'],
+            'updated_count': result['updated_count']
         })
         
     except Exception as e:
@@ -2899,7 +2587,6 @@ def import_sap_pick_list(absolute_entry):
     
     try:
         from sap_integration import SAPIntegration
-        from models import PickListLine, PickListBinAllocation
         
         sap = SAPIntegration()
         
@@ -2920,11 +2607,10 @@ def import_sap_pick_list(absolute_entry):
         
         if existing_pick_list:
             pick_list = existing_pick_list
-            # Clear existing lines and allocations
-            PickListBinAllocation.query.join(PickListLine).filter(
-                PickListLine.pick_list_id == pick_list.id
-            ).delete()
-            PickListLine.query.filter_by(pick_list_id=pick_list.id).delete()
+            if pick_list.user_id not in (None, current_user.id) and current_user.role not in ['admin', 'manager']:
+                return jsonify({'success': False, 'error': 'Pick list is assigned to another user'}), 403
+            # Pick lists synced in the background have no owner; importing one takes it
+            _claim_pick_list(pick_list)
         else:
             # Extract sales order info from first line if available
             first_line = sap_pick_list.get('PickListsLines', [{}])[0] if sap_pick_list.get('PickListsLines') else {}
@@ -2961,44 +2647,14 @@ def import_sap_pick_list(absolute_entry):
         
         db.session.flush()  # Get the pick_list.id
         
-        # Import pick list lines
-        lines_imported = 0
-        allocations_imported = 0
-        
-        for sap_line in sap_pick_list.get('PickListsLines', []):
-            pick_list_line = PickListLine(
-                pick_list_id=pick_list.id,
-                absolute_entry=sap_line.get('AbsoluteEntry'),
-                line_number=sap_line.get('LineNumber'),
-                order_entry=sap_line.get('OrderEntry'),
-                order_row_id=sap_line.get('OrderRowID', 0),
-                picked_quantity=sap_line.get('PickedQuantity', 0.0),
-                pick_status=sap_line.get('PickStatus', 'ps_Open'),
-                released_quantity=sap_line.get('ReleasedQuantity', 0.0),
-                previously_released_quantity=sap_line.get('PreviouslyReleasedQuantity', 0.0),
-                base_object_type=sap_line.get('BaseObjectType')
-            )
-            
-            db.session.add(pick_list_line)
-            db.session.flush()  # Get the line id
-            lines_imported += 1
-            
-            # Import bin allocations for this line
-            for sap_allocation in sap_line.get('DocumentLinesBinAllocations', []):
-                bin_allocation = PickListBinAllocation(
-                    pick_list_line_id=pick_list_line.id,
-                    bin_abs_entry=sap_allocation.get('BinAbsEntry'),
-                    quantity=sap_allocation.get('Quantity', 0.0),
-                    allow_negative_quantity=sap_allocation.get('AllowNegativeQuantity', 'tNO'),
-                    serial_and_batch_numbers_base_line=sap_allocation.get('SerialAndBatchNumbersBaseLine', 0),
-                    base_line_number=sap_allocation.get('BaseLineNumber')
-                )
-                
-                db.session.add(bin_allocation)
-                allocations_imported += 1
+        # Replace the pick list lines and bin allocations with SAP's
+        line_rows, line_allocations = sap._pick_list_line_rows(sap_pick_list.get('PickListsLines', []), pick_list.id)
+        sap._replace_pick_list_lines([pick_list.id], line_rows, line_allocations)
+        lines_imported = len(line_rows)
+        allocations_imported = sum(len(allocations) for allocations in line_allocations)
         
         # Update pick list totals
-        pick_list.total_items = lines_imported
+        pick_list.total_items = len(sap_pick_list.get('PickListsLines', []))
         pick_list.picked_items = len([line for line in sap_pick_list.get('PickListsLines', []) 
                                     if line.get('PickStatus') == 'ps_Closed'])
         
@@ -3154,8 +2810,9 @@ def mark_pick_list_as_picked(pick_list_id):
         pick_list = PickList.query.get_or_404(pick_list_id)
         
         # Check access permissions
-        if pick_list.user_id != current_user.id and current_user.role not in ['admin', 'manager']:
+        if pick_list.user_id not in (None, current_user.id) and current_user.role not in ['admin', 'manager']:
             return jsonify({'success': False, 'error': 'Access denied - You can only modify your own pick lists'}), 403
+        _claim_pick_list(pick_list)
         
         # Get pick list lines for the PATCH payload
         pick_list_lines = PickListLine.query.filter_by(pick_list_id=pick_list.id).all()
@@ -3246,8 +2903,9 @@ def mark_pick_list_line_as_picked(absolute_entry):
             return jsonify({'success': False, 'error': 'Pick list not found'}), 404
         
         # Check access permissions
-        if pick_list.user_id != current_user.id and current_user.role not in ['admin', 'manager']:
+        if pick_list.user_id not in (None, current_user.id) and current_user.role not in ['admin', 'manager']:
             return jsonify({'success': False, 'error': 'Access denied - You can only modify your own pick lists'}), 403
+        _claim_pick_list(pick_list)
         
         # Initialize SAP integration and update line status
         from sap_integration import SAPIntegration
@@ -3485,12 +3143,81 @@ def get_pending_approvals():
             'id': pick_list.id,
             'pick_list_number': pick_list.pick_list_number,
             'sales_order_number': pick_list.sales_order_number,
-            'user_name': f"{pick_list.user.first_name} {pick_list.user.last_name}",
+            'user_name': f"{pick_list.user.first_name} {pick_list.user.last_name}" if pick_list.user else None,
             'created_at': pick_list.created_at.strftime('%Y-%m-%d %H:%M')
         })
     
     return jsonify({'pending_approvals': data})
 
+@app.route('/api/sap-client-stats')
+@login_required
+def sap_client_stats():
+    """SAP client counters: session pool, circuit breaker, cache, fan-out, request coalescing, posting outbox, serial index, master data sync and scheduler"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    from sap_cache import sap_cache
+    from sap_circuit_breaker import get_breaker_stats
+    from sap_fanout import get_fanout_stats
+    from sap_master_sync import get_master_sync_status
+    from sap_scheduler import get_scheduler_status
+    from sap_serial_index import get_serial_index_stats
+    from sap_session_pool import get_pool_stats
+    from sap_singleflight import get_single_flight_stats
+
+    return jsonify({
+        'session_pools': get_pool_stats(),
+        'circuit_breakers': get_breaker_stats(),
+        'cache': sap_cache.stats(),
+        'fanout': get_fanout_stats(),
+        'single_flight': get_single_flight_stats(),
+        'posting_outbox': get_outbox_stats(),
+        'serial_index': get_serial_index_stats(),
+        'master_data_sync': get_master_sync_status(),
+        'scheduler': get_scheduler_status()
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics: SAP B1 call, route latency and SQL-per-request histograms"""
+    import hmac
+    from metrics import render_metrics
+    # Scrapers cannot log in, so they send METRICS_TOKEN as a bearer token; otherwise admins only
+    token = os.environ.get('METRICS_TOKEN')
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    token_ok = bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(supplied.strip().encode(), token.encode())
+    if not token_ok:
+        if not current_user.is_authenticated:
+            return jsonify({'error': 'Unauthorized'}), 401
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/api/sap-jobs/<int:job_id>')
+@login_required
+def sap_job_status(job_id):
+    """Status of a queued SAP B1 posting - polled by the UI after an approval"""
+    from models import SAPPostingJob
+    job = SAPPostingJob.query.get_or_404(job_id)
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/sap-jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_sap_job(job_id):
+    """Re-queue a SAP B1 posting that failed permanently or ran out of attempts"""
+    from models import SAPPostingJob
+    if not current_user.has_permission('qc_dashboard') and current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'error': 'QC permissions required'}), 403
+
+    job = SAPPostingJob.query.get_or_404(job_id)
+    if not retry_posting(job):
+        return jsonify({'success': False, 'error': f'Only failed jobs can be retried (job is {job.status})'}), 400
+    db.session.commit()
+    wake_outbox_worker()
+
+    logging.info(f"🔁 SAP posting job {job_id} re-queued by {current_user.username}")
+    return jsonify({'success': True, **job.to_dict()})
+
 @app.route('/bin_scanning')
 @login_required
 def bin_scanning():
@@ -4129,6 +3856,32 @@ def branch_management():
     branches = db.session.execute(db.text("SELECT * FROM branches ORDER BY name")).fetchall()
     return render_template('branch_management.html', branches=branches)
 
+@app.route('/admin/scheduler')
+@login_required
+def scheduler_status():
+    """Background SAP jobs: schedule, last run, duration and last success"""
+    if current_user.role != 'admin':
+        flash('Access denied. Only administrators can view background jobs.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    from sap_scheduler import get_scheduler_status
+    return render_template('scheduler_status.html', status=get_scheduler_status())
+
+@app.route('/admin/scheduler/<job_name>/run', methods=['POST'])
+@login_required
+def run_scheduler_job(job_name):
+    """Ask the scheduler leader to run a job now"""
+    if current_user.role != 'admin':
+        flash('Access denied.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    from sap_scheduler import request_job_run
+    if request_job_run(job_name):
+        flash(f'Job {job_name} will run within a few seconds.', 'success')
+    else:
+        flash(f'Unknown job {job_name}.', 'error')
+    return redirect(url_for('scheduler_status'))
+
 @app.route('/create_branch', methods=['POST'])
 @login_required
 def create_branch():
@@ -4570,19 +4323,14 @@ def sync_sap_data():
         flash('You do not have permission to sync SAP data', 'error')
         return redirect(url_for('dashboard'))
     
-    from sap_integration import SAPIntegration
-    sap_integration = SAPIntegration()
-    results = sap_integration.sync_all_master_data()
-    
-    success_count = sum(1 for result in results.values() if result)
-    total_count = len(results)
+    # Runs in the background and only pulls records changed since the last sync (full=1 reloads everything)
+    from sap_master_sync import request_master_data_sync
+    full = request.form.get('full') == '1' or request.args.get('full') == '1'
     
-    if success_count == total_count:
-        flash(f'SAP master data synchronized successfully! ({success_count}/{total_count} completed)', 'success')
-    elif success_count > 0:
-        flash(f'SAP master data partially synchronized ({success_count}/{total_count} completed)', 'warning')
+    if request_master_data_sync(app, full=full):
+        flash('SAP master data synchronization started in the background.', 'success')
     else:
-        flash('Failed to synchronize SAP master data. Check SAP connection.', 'error')
+        flash('SAP master data synchronization is already running.', 'info')
     
     return redirect(url_for('dashboard'))
 
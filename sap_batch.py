@@ -0,0 +1,136 @@
+"""
+SAP B1 Service Layer $batch Support
+Builds OData multipart/mixed $batch payloads and parses the multipart response back
+into per-request results, so several independent Service Layer calls cost one
+HTTP round trip to the SAP host.
+"""
+import json
+import re
+import uuid
+from urllib.parse import quote
+
+# Service Layer rejects very large batches; callers chunk above this many parts
+MAX_BATCH_PARTS = 100
+
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+_STATUS_RE = re.compile(r'^HTTP/\d\.\d\s+(\d{3})')
+_URL_SAFE = "/$'(),=&?:;@+!*%"
+
+
+class SAPBatchResponse:
+    """Result of one request inside a $batch, shaped like a requests.Response"""
+
+    def __init__(self, status_code, headers=None, text=''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 300
+
+    def json(self):
+        return json.loads(self.text) if self.text else {}
+
+    def __repr__(self):
+        return f"<SAPBatchResponse [{self.status_code}]>"
+
+
+def build_batch_body(batch_requests, service_root='/b1s/v1/'):
+    """Build a multipart/mixed $batch body.
+
+    batch_requests is a list of (method, path, body) tuples with paths relative to
+    the Service Layer root. GETs are sent as plain parts; every write runs in its own
+    changeset so one failing request does not roll back the others.
+    Returns (content_type, body).
+    """
+    boundary = f"batch_{uuid.uuid4().hex}"
+    lines = []
+    for method, path, body in batch_requests:
+        request_lines = _request_lines(method.upper(), service_root + path.lstrip('/'), body)
+        lines.append(f"--{boundary}")
+        if method.upper() == 'GET':
+            lines += ["Content-Type: application/http", "Content-Transfer-Encoding: binary", ""]
+            lines += request_lines
+        else:
+            changeset = f"changeset_{uuid.uuid4().hex}"
+            lines += [f"Content-Type: multipart/mixed;boundary={changeset}", "",
+                      f"--{changeset}",
+                      "Content-Type: application/http", "Content-Transfer-Encoding: binary", ""]
+            lines += request_lines
+            lines.append(f"--{changeset}--")
+        lines.append("")
+    lines.append(f"--{boundary}--")
+    lines.append("")
+    return f"multipart/mixed;boundary={boundary}", "\r\n".join(lines).encode('utf-8')
+
+
+def _request_lines(method, url, body):
+    # Request lines cannot carry raw spaces ($filter=... eq ...), so percent-encode them
+    lines = [f"{method} {quote(url, safe=_URL_SAFE)} HTTP/1.1"]
+    if body is None:
+        return lines + ["", ""]
+    payload = body if isinstance(body, str) else json.dumps(body)
+    return lines + ["Content-Type: application/json", "", payload]
+
+
+def parse_batch_response(content_type, body):
+    """Split a multipart $batch response into SAPBatchResponse objects, in request order"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    match = _BOUNDARY_RE.search(content_type or '')
+    if not match:
+        # Some Service Layer versions only put the boundary in the body itself
+        first_line = body.lstrip().split('\n', 1)[0].strip()
+        if not first_line.startswith('--'):
+            return []
+        boundary = first_line[2:]
+    else:
+        boundary = match.group(1)
+
+    responses = []
+    for part in _split_parts(body, boundary):
+        headers, content = _split_headers(part)
+        nested = _BOUNDARY_RE.search(headers.get('content-type', ''))
+        if nested and 'multipart/mixed' in headers.get('content-type', '').lower():
+            responses.extend(parse_batch_response(headers['content-type'], content))
+        else:
+            response = _parse_http_response(content)
+            if response is not None:
+                responses.append(response)
+    return responses
+
+
+def _split_parts(body, boundary):
+    delimiter = f"--{boundary}"
+    parts = []
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith('--'):
+            break
+        parts.append(chunk.strip('\r\n'))
+    return parts
+
+
+def _split_headers(text):
+    """Split 'Header: value' lines from the content that follows the first blank line"""
+    text = text.replace('\r\n', '\n')
+    head, _, content = text.partition('\n\n')
+    headers = {}
+    for line in head.split('\n'):
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers, content
+
+
+def _parse_http_response(text):
+    text = text.replace('\r\n', '\n').lstrip('\n')
+    status_line, _, rest = text.partition('\n')
+    status = _STATUS_RE.match(status_line)
+    if not status:
+        return None
+    if rest.startswith('\n'):
+        headers, content = {}, rest[1:]
+    else:
+        headers, content = _split_headers(rest)
+    return SAPBatchResponse(int(status.group(1)), headers, content.strip())
@@ -0,0 +1,283 @@
+"""
+SAP B1 Master Data Cache
+Process-wide LRU cache with per-namespace TTLs and size limits for SAP master data
+(warehouses, bins, bin locations, item details). Optionally backed by a local SQLite
+file so several gunicorn workers on the same host share warm entries. Values are
+copied on the way in and out, so a caller that mutates a cached list or dict only
+changes its own copy.
+"""
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+def _copy(value):
+    """Private copy of a cached value; scalars are shared as they are"""
+    if isinstance(value, _IMMUTABLE):
+        return value
+    # Cached SAP payloads are JSON-shaped, which copies much faster by hand than deepcopy
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return copy.deepcopy(value)
+
+
+# Namespace defaults: (ttl seconds, max entries). Override TTLs with SAP_CACHE_TTL_<NAMESPACE>.
+NAMESPACE_DEFAULTS = {
+    'warehouses': (3600, 500),
+    'bins': (3600, 2000),
+    'bin_location': (86400, 50000),
+    'warehouse_business_place': (3600, 500),
+    'item_description': (3600, 20000),
+    'item_validation': (900, 20000),
+    'batches': (120, 5000),
+    'document_series': (3600, 100),
+    'open_docnums': (300, 500),
+    'qc_counters': (30, 10),
+}
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 5000
+# With a shared store, in-process copies are re-read after this many seconds so that
+# invalidations made by other workers propagate quickly
+LOCAL_TTL_WITH_STORE = float(os.environ.get('SAP_CACHE_LOCAL_TTL', '10'))
+
+
+class SAPCacheNamespace:
+    """Dict-like view of one cache namespace, used by SAPIntegration"""
+
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+
+    def get(self, key, default=None):
+        return self.cache.get(self.name, key, default)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(self.name, key, value, ttl=ttl)
+
+    def invalidate(self, key=None):
+        self.cache.invalidate(self.name, key)
+
+    def clear(self):
+        self.cache.invalidate(self.name)
+
+    def __contains__(self, key):
+        return self.cache.get(self.name, key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+
+class _SQLiteBackingStore:
+    """Shared second-level store so gunicorn workers on one host share cache entries"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sap_cache_entries (
+                    namespace TEXT NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, cache_key)
+                )
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM sap_cache_entries WHERE namespace = ? AND cache_key = ?",
+            (namespace, key)).fetchone()
+        if row and row[1] > time.time():
+            return json.loads(row[0]), row[1]
+        return _MISSING, None
+
+    def set(self, namespace, key, value, expires_at):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sap_cache_entries (namespace, cache_key, value, expires_at) "
+            "VALUES (?, ?, ?, ?)", (namespace, key, json.dumps(value), expires_at))
+
+    def delete(self, namespace, key=None):
+        if key is None:
+            self._connect().execute("DELETE FROM sap_cache_entries WHERE namespace = ?", (namespace,))
+        else:
+            self._connect().execute(
+                "DELETE FROM sap_cache_entries WHERE namespace = ? AND cache_key = ?", (namespace, key))
+
+    def purge_expired(self):
+        self._connect().execute("DELETE FROM sap_cache_entries WHERE expires_at <= ?", (time.time(),))
+
+
+class SAPCache:
+    """Bounded, thread-safe TTL/LRU cache shared by every SAP client in the process"""
+
+    def __init__(self, backing_path=None):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._settings = {}
+        self._stats = {}
+        self._hooks = []
+        self._store = None
+        if backing_path:
+            try:
+                self._store = _SQLiteBackingStore(backing_path)
+                logging.info(f"✅ SAP cache shared through SQLite store: {backing_path}")
+            except Exception as e:
+                logging.warning(f"⚠️ SAP cache backing store unavailable ({str(e)}), using process memory only")
+
+    def configure(self, namespace, ttl=None, max_entries=None):
+        """Override TTL and size limit for a namespace"""
+        with self._lock:
+            current_ttl, current_max = self._namespace_settings(namespace)
+            self._settings[namespace] = (ttl if ttl is not None else current_ttl,
+                                         max_entries if max_entries is not None else current_max)
+
+    def _namespace_settings(self, namespace):
+        if namespace not in self._settings:
+            ttl, max_entries = NAMESPACE_DEFAULTS.get(namespace, (DEFAULT_TTL, DEFAULT_MAX_ENTRIES))
+            env_ttl = os.environ.get(f"SAP_CACHE_TTL_{namespace.upper()}")
+            if env_ttl:
+                ttl = float(env_ttl)
+            self._settings[namespace] = (ttl, max_entries)
+            self._stats[namespace] = {'hits': 0, 'shared_hits': 0, 'misses': 0,
+                                      'sets': 0, 'evictions': 0, 'invalidations': 0}
+        return self._settings[namespace]
+
+    def _bucket(self, namespace):
+        self._namespace_settings(namespace)
+        return self._entries.setdefault(namespace, OrderedDict())
+
+    def namespace(self, name):
+        """Dict-like handle for one namespace"""
+        return SAPCacheNamespace(self, name)
+
+    def get(self, namespace, key, default=None):
+        key = str(key)
+        with self._lock:
+            bucket = self._bucket(namespace)
+            entry = bucket.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.time():
+                    bucket.move_to_end(key)
+                    self._stats[namespace]['hits'] += 1
+                    return _copy(value)
+                del bucket[key]
+
+        if self._store:
+            try:
+                value, expires_at = self._store.get(namespace, key)
+            except Exception as e:
+                logging.debug(f"SAP cache store read failed: {str(e)}")
+                value = _MISSING
+            if value is not _MISSING:
+                with self._lock:
+                    self._put(namespace, key, value, expires_at)
+                    self._stats[namespace]['shared_hits'] += 1
+                return _copy(value)
+
+        with self._lock:
+            self._stats[namespace]['misses'] += 1
+        return default
+
+    def _put(self, namespace, key, value, expires_at):
+        bucket = self._bucket(namespace)
+        if self._store:
+            expires_at = min(expires_at, time.time() + LOCAL_TTL_WITH_STORE)
+        bucket[key] = (expires_at, value)
+        bucket.move_to_end(key)
+        max_entries = self._settings[namespace][1]
+        while len(bucket) > max_entries:
+            bucket.popitem(last=False)
+            self._stats[namespace]['evictions'] += 1
+
+    def set(self, namespace, key, value, ttl=None):
+        key = str(key)
+        with self._lock:
+            namespace_ttl = self._namespace_settings(namespace)[0]
+            expires_at = time.time() + (ttl if ttl is not None else namespace_ttl)
+            self._put(namespace, key, _copy(value), expires_at)
+            self._stats[namespace]['sets'] += 1
+        if self._store:
+            try:
+                self._store.set(namespace, key, value, expires_at)
+            except (TypeError, ValueError):
+                pass  # Not JSON serialisable - keep it process-local
+            except Exception as e:
+                logging.debug(f"SAP cache store write failed: {str(e)}")
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        """Return the cached value or call loader(); None results are not cached"""
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        if value is not None:
+            self.set(namespace, key, value, ttl=ttl)
+        return value
+
+    def invalidate(self, namespace, key=None):
+        """Drop one key, or the whole namespace when key is None, and fire hooks"""
+        with self._lock:
+            bucket = self._bucket(namespace)
+            if key is None:
+                bucket.clear()
+            else:
+                bucket.pop(str(key), None)
+            self._stats[namespace]['invalidations'] += 1
+            hooks = list(self._hooks)
+        if self._store:
+            try:
+                self._store.delete(namespace, None if key is None else str(key))
+            except Exception as e:
+                logging.debug(f"SAP cache store delete failed: {str(e)}")
+        for hook in hooks:
+            try:
+                hook(namespace, key)
+            except Exception as e:
+                logging.warning(f"⚠️ SAP cache invalidation hook failed: {str(e)}")
+
+    def add_invalidation_hook(self, hook):
+        """Register hook(namespace, key) called after every invalidation"""
+        with self._lock:
+            self._hooks.append(hook)
+
+    def clear(self):
+        """Invalidate every namespace"""
+        with self._lock:
+            namespaces = list(self._settings)
+        for namespace in namespaces:
+            self.invalidate(namespace)
+
+    def stats(self):
+        """Hit/miss counters and sizes per namespace"""
+        with self._lock:
+            return {
+                namespace: dict(counters,
+                                size=len(self._entries.get(namespace, ())),
+                                ttl=self._settings[namespace][0],
+                                max_entries=self._settings[namespace][1])
+                for namespace, counters in self._stats.items()
+            }
+
+
+# Process-wide cache instance; set SAP_CACHE_SQLITE_PATH to share it across workers
+sap_cache = SAPCache(backing_path=os.environ.get('SAP_CACHE_SQLITE_PATH') or None)
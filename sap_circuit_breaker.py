@@ -0,0 +1,190 @@
+"""
+SAP B1 Circuit Breaker
+Tracks Service Layer health per server. After repeated connection failures the
+breaker opens and SAP calls fail immediately (callers drop to their offline/mock
+path) instead of each blocking a worker for its full timeout. After a cool-down one
+probe call is let through (half-open) to decide whether to close again.
+Read timeouts adapt to the observed p99 latency of successful calls to the same
+endpoint, unless the caller asked for more than the default timeout.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+FAILURE_THRESHOLD = int(os.environ.get('SAP_BREAKER_FAILURE_THRESHOLD', '5'))
+RESET_TIMEOUT = float(os.environ.get('SAP_BREAKER_RESET_TIMEOUT', '30'))
+# Timeout used when a caller does not pass one, and the ceiling for adaptive timeouts
+DEFAULT_TIMEOUT = float(os.environ.get('SAP_DEFAULT_TIMEOUT', '30'))
+# Document posts are not retried on timeout, so give them more room than reads
+DEFAULT_WRITE_TIMEOUT = float(os.environ.get('SAP_DEFAULT_WRITE_TIMEOUT', '120'))
+ADAPTIVE_TIMEOUT_MIN = float(os.environ.get('SAP_ADAPTIVE_TIMEOUT_MIN', '5'))
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.environ.get('SAP_ADAPTIVE_TIMEOUT_MULTIPLIER', '3'))
+LATENCY_WINDOW = 500
+# Samples kept per endpoint for its adaptive timeout
+ENDPOINT_LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+# Gateway errors mean the Service Layer itself is unhealthy; other 4xx/5xx are request errors
+UNHEALTHY_STATUS_CODES = (502, 503, 504)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class SAPCircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling the Service Layer while the breaker is open"""
+
+
+class SAPCircuitBreaker:
+    """Closed / open / half-open breaker for one Service Layer host"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._endpoint_latencies = {}
+        self._stats = {'successes': 0, 'failures': 0, 'short_circuited': 0, 'opened': 0, 'probes': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    def is_open(self):
+        """True while calls are being short-circuited (no probe is due yet); callers skip the call"""
+        with self._lock:
+            state = self._current_state()
+            short_circuit = state == OPEN or (state == HALF_OPEN and self._probe_in_flight)
+            if short_circuit:
+                self._stats['short_circuited'] += 1
+            return short_circuit
+
+    def allow_request(self):
+        """Claim permission for one call; in half-open state only a single probe gets through"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._state = HALF_OPEN
+                self._probe_in_flight = True
+                self._stats['probes'] += 1
+                return True
+            self._stats['short_circuited'] += 1
+            return False
+
+    def record_success(self, latency=None, endpoint=None):
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+                if endpoint is not None:
+                    samples = self._endpoint_latencies.get(endpoint)
+                    if samples is None:
+                        samples = self._endpoint_latencies[endpoint] = deque(maxlen=ENDPOINT_LATENCY_WINDOW)
+                    samples.append(latency)
+            self._stats['successes'] += 1
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._state = CLOSED
+                logging.info(f"✅ SAP B1 circuit closed for {self.name} - Service Layer reachable again")
+
+    def record_failure(self, reason=''):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            probe_failed = self._probe_in_flight
+            self._probe_in_flight = False
+            if probe_failed or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._stats['opened'] += 1
+                logging.warning(f"⚠️ SAP B1 circuit opened for {self.name} after {self._failures} "
+                                f"failure(s): {reason} - failing fast for {self.reset_timeout}s")
+
+    def release_probe(self):
+        """Give the half-open probe slot back when the probe ended without a verdict"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @staticmethod
+    def _percentile(samples, percentile):
+        samples = sorted(samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def latency_percentile(self, percentile, endpoint=None):
+        with self._lock:
+            samples = list(self._latencies if endpoint is None else self._endpoint_latencies.get(endpoint, ()))
+        return self._percentile(samples, percentile)
+
+    def adaptive_timeout(self, requested=None, endpoint=None):
+        """Read timeout from the endpoint's observed p99 latency, never above the requested/default timeout.
+
+        Timeouts above the default are the caller's statement that the read is heavy (paged
+        scans, SQL queries, master data) and are left alone, as are reads without an endpoint
+        or with too few samples yet - fast calls elsewhere must not cut them short.
+        """
+        if isinstance(requested, tuple):
+            return requested  # Explicit (connect, read) pair - leave it alone
+        if requested is not None and requested > DEFAULT_TIMEOUT:
+            return requested
+        ceiling = requested if requested is not None else DEFAULT_TIMEOUT
+        if endpoint is None:
+            return ceiling
+        with self._lock:
+            samples = list(self._endpoint_latencies.get(endpoint, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return ceiling
+        p99 = self._percentile(samples, 99)
+        return min(ceiling, max(ADAPTIVE_TIMEOUT_MIN, p99 * ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._stats, state=self._current_state(),
+                            consecutive_failures=self._failures)
+        counters['p50_latency'] = self.latency_percentile(50)
+        counters['p99_latency'] = self.latency_percentile(99)
+        with self._lock:
+            endpoints = list(self._endpoint_latencies)
+        # Non-numeric, so /metrics skips it; /api/sap-client-stats shows it
+        counters['read_timeouts'] = {endpoint: self.adaptive_timeout(endpoint=endpoint) for endpoint in endpoints}
+        return counters
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(base_url):
+    """Process-wide breaker for one Service Layer host"""
+    with _breakers_lock:
+        breaker = _breakers.get(base_url)
+        if breaker is None:
+            breaker = _breakers[base_url] = SAPCircuitBreaker(base_url)
+        return breaker
+
+
+def get_breaker_stats():
+    """Breaker state and latency figures per Service Layer host"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
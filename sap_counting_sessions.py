@@ -0,0 +1,230 @@
+"""
+SAP B1 Inventory Counting Sessions
+Several devices count one SAP inventory counting document at once, each in its own session
+(usually scoped to a floor, rack or level). Devices never write the document lines directly:
+they append count deltas to sap_counting_entries, numbered per session so retried uploads are
+ignored. The counting_flush scheduler job merges the pending deltas into the lines - a sum
+per line, so the result does not depend on device or arrival order - marks those lines dirty
+and PATCHes the dirty lines of each open document to SAP in chunks.
+"""
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, func
+
+from app import db
+from bulk_upsert import bulk_upsert
+from models import SAPCountingEntry, SAPCountingSession, SAPInventoryCount, SAPInventoryCountLine
+
+# Seconds between merges of the session logs and flushes to SAP (counting_flush scheduler job)
+FLUSH_INTERVAL = float(os.environ.get('SAP_SCHEDULE_COUNTING_FLUSH', '30'))
+# Pending entries merged per transaction
+MERGE_BATCH = int(os.environ.get('SAP_COUNTING_MERGE_BATCH', '5000'))
+
+SCOPE_FIELDS = ('u_floor', 'u_rack', 'u_level')
+
+
+def open_session(local_doc, user_id, device_id, scope=None):
+    """Open the device's session on a counting document, or resume its open one"""
+    scope = {field: (scope or {}).get(field) or None for field in SCOPE_FIELDS}
+    session = SAPCountingSession.query.filter_by(count_id=local_doc.id, user_id=user_id,
+                                                 device_id=device_id, status='open').first()
+    if session is None:
+        session = SAPCountingSession(count_id=local_doc.id, user_id=user_id, device_id=device_id, **scope)
+        db.session.add(session)
+    else:
+        for field, value in scope.items():
+            setattr(session, field, value)
+        session.last_seen_at = datetime.utcnow()
+    db.session.commit()
+    logging.info(f"📱 Counting session {session.id} open for document {local_doc.doc_entry} "
+                 f"(device {device_id}, scope {scope})")
+    return session
+
+
+def pending_quantities(count_id):
+    """{line_number: summed delta of the entries not merged yet}"""
+    return dict(db.session.query(SAPCountingEntry.line_number, func.sum(SAPCountingEntry.quantity))
+                .filter(SAPCountingEntry.count_id == count_id, SAPCountingEntry.merged_at.is_(None))
+                .group_by(SAPCountingEntry.line_number))
+
+
+def session_lines(session):
+    """The lines in the session's scope with their counted quantity including pending entries"""
+    query = SAPInventoryCountLine.query.filter_by(count_id=session.count_id)
+    for field in SCOPE_FIELDS:
+        if getattr(session, field):
+            query = query.filter(getattr(SAPInventoryCountLine, field) == getattr(session, field))
+    pending = pending_quantities(session.count_id)
+    return [{
+        'LineNumber': line.line_number,
+        'ItemCode': line.item_code,
+        'ItemDescription': line.item_description,
+        'WarehouseCode': line.warehouse_code,
+        'BinEntry': line.bin_entry,
+        'UoMCode': line.uom_code,
+        'BarCode': line.bar_code,
+        'U_Floor': line.u_floor,
+        'U_Rack': line.u_rack,
+        'U_Level': line.u_level,
+        'InWarehouseQuantity': line.in_warehouse_quantity,
+        'CountedQuantity': (line.uom_counted_quantity or 0) + pending.get(line.line_number, 0),
+        'PendingQuantity': pending.get(line.line_number, 0)
+    } for line in query.order_by(SAPInventoryCountLine.line_number)]
+
+
+def record_entries(session, entries):
+    """Append a device's count deltas to the session log.
+
+    entries are dicts with sequence, line_number and quantity. Sequences already received
+    (a retried upload) are skipped; unknown line numbers are rejected. Commits.
+    """
+    valid_lines = {line_number for (line_number,) in db.session.query(SAPInventoryCountLine.line_number)
+                   .filter(SAPInventoryCountLine.count_id == session.count_id)}
+    rows, rejected = {}, []
+    for entry in entries:
+        try:
+            sequence = int(entry['sequence'])
+            line_number = int(entry['line_number'])
+            quantity = float(entry['quantity'])
+        except (KeyError, TypeError, ValueError):
+            rejected.append({'entry': entry, 'error': 'sequence, line_number and quantity are required'})
+            continue
+        if line_number not in valid_lines:
+            rejected.append({'entry': entry, 'error': f'Line {line_number} is not on this document'})
+            continue
+        rows[sequence] = {'count_id': session.count_id, 'session_id': session.id, 'sequence': sequence,
+                          'line_number': line_number, 'quantity': quantity}
+
+    known = {sequence for (sequence,) in db.session.query(SAPCountingEntry.sequence).filter(
+        SAPCountingEntry.session_id == session.id, SAPCountingEntry.sequence.in_(list(rows)))} if rows else set()
+    new_rows = [row for sequence, row in rows.items() if sequence not in known]
+    # A concurrent retry of the same upload is absorbed by the (session_id, sequence) constraint
+    bulk_upsert(SAPCountingEntry, new_rows, ['session_id', 'sequence'], update_columns=[])
+
+    if rows:
+        session.last_sequence = max([session.last_sequence or 0] + list(rows))
+    session.last_seen_at = datetime.utcnow()
+    db.session.commit()
+    return {'accepted': len(new_rows), 'duplicates': len(rows) - len(new_rows), 'rejected': rejected,
+            'last_sequence': session.last_sequence}
+
+
+def close_session(session):
+    """Close a session; its entries are still merged and flushed"""
+    session.status = 'closed'
+    session.closed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def merge_pending_entries():
+    """Add pending entries to their lines' counted quantities and mark the lines dirty.
+
+    Each batch is summed per line and applied as uom_counted_quantity + delta in one
+    transaction with the entries' merged_at, so a merge is all-or-nothing. Entries for lines
+    SAP has since removed are marked merged and dropped. Returns {count_id: lines changed}.
+    """
+    lines_changed = defaultdict(int)
+    line_table = SAPInventoryCountLine.__table__
+    statement = line_table.update().where(line_table.c.id == bindparam('b_id')).ordered_values(
+        # variance first: MySQL evaluates SET left to right with already updated values
+        (line_table.c.variance, func.coalesce(line_table.c.uom_counted_quantity, 0) + bindparam('b_quantity')
+         - func.coalesce(line_table.c.in_warehouse_quantity, 0)),
+        (line_table.c.uom_counted_quantity, func.coalesce(line_table.c.uom_counted_quantity, 0)
+         + bindparam('b_quantity')),
+        (line_table.c.counted, 'tYES'),
+        (line_table.c.is_dirty, True),
+        (line_table.c.updated_at, bindparam('b_now')))
+
+    while True:
+        entries = (db.session.query(SAPCountingEntry.id, SAPCountingEntry.count_id,
+                                    SAPCountingEntry.line_number, SAPCountingEntry.quantity)
+                   .filter(SAPCountingEntry.merged_at.is_(None))
+                   .order_by(SAPCountingEntry.id).limit(MERGE_BATCH).all())
+        if not entries:
+            break
+        totals = defaultdict(float)
+        for _, count_id, line_number, quantity in entries:
+            totals[(count_id, line_number)] += quantity
+
+        count_ids = {count_id for count_id, _ in totals}
+        line_ids = {(count_id, line_number): line_id for line_id, count_id, line_number in
+                    db.session.query(SAPInventoryCountLine.id, SAPInventoryCountLine.count_id,
+                                     SAPInventoryCountLine.line_number)
+                    .filter(SAPInventoryCountLine.count_id.in_(count_ids))}
+        now = datetime.utcnow()
+        updates = [{'b_id': line_ids[key], 'b_quantity': quantity, 'b_now': now}
+                   for key, quantity in totals.items() if key in line_ids]
+        dropped = len(totals) - len(updates)
+        if dropped:
+            logging.warning(f"⚠️ Dropping counting entries for {dropped} lines no longer on their documents")
+        if updates:
+            db.session.execute(statement, updates)
+        entry_ids = [entry_id for entry_id, _, _, _ in entries]
+        for start in range(0, len(entry_ids), 1000):
+            SAPCountingEntry.query.filter(SAPCountingEntry.id.in_(entry_ids[start:start + 1000])).update(
+                {'merged_at': now}, synchronize_session=False)
+        db.session.commit()
+
+        for count_id, line_number in totals:
+            if (count_id, line_number) in line_ids:
+                lines_changed[count_id] += 1
+        if len(entries) < MERGE_BATCH:
+            break
+    return dict(lines_changed)
+
+
+def flush_counting_sessions():
+    """Merge the session logs and PATCH the dirty lines of open counting documents to SAP"""
+    from sap_integration import SAPIntegration
+
+    merged = merge_pending_entries()
+    summary = {'merged_lines': sum(merged.values()), 'documents': 0, 'posted_lines': 0, 'pending_lines': 0}
+
+    documents = (SAPInventoryCount.query.filter(SAPInventoryCount.document_status == 'cdsOpen')
+                 .filter(SAPInventoryCount.id.in_(db.session.query(SAPInventoryCountLine.count_id)
+                                                  .filter(SAPInventoryCountLine.is_dirty.is_(True))))
+                 .all())
+    if not documents:
+        return dict(summary, success=True)
+
+    sap = SAPIntegration()
+    if not sap.ensure_logged_in():
+        return dict(summary, success=False, error='SAP B1 not available')
+
+    errors = []
+    for local_doc in documents:
+        result = sap.post_inventory_counting_changes(local_doc.doc_entry, {})
+        summary['documents'] += 1
+        summary['posted_lines'] += result.get('posted_lines', 0)
+        summary['pending_lines'] += result.get('pending_lines', 0)
+        if not result.get('success'):
+            errors.append(f"{local_doc.doc_entry}: {result.get('error')}")
+    if errors:
+        return dict(summary, success=False, error='; '.join(errors))
+    return dict(summary, success=True)
+
+
+def counting_progress(local_doc):
+    """Counted / pending / unsent line totals of a document and its sessions"""
+    line_counts = db.session.query(
+        func.count(SAPInventoryCountLine.id),
+        func.sum(case((SAPInventoryCountLine.counted == 'tYES', 1), else_=0)),
+        func.sum(case((SAPInventoryCountLine.is_dirty.is_(True), 1), else_=0))).filter(
+        SAPInventoryCountLine.count_id == local_doc.id).one()
+    entry_counts = dict(db.session.query(SAPCountingEntry.session_id, func.count(SAPCountingEntry.id))
+                        .filter(SAPCountingEntry.count_id == local_doc.id)
+                        .group_by(SAPCountingEntry.session_id))
+    sessions = []
+    for session in SAPCountingSession.query.filter_by(count_id=local_doc.id).order_by(SAPCountingSession.id):
+        sessions.append(dict(session.to_dict(), entries=entry_counts.get(session.id, 0)))
+    return {
+        'doc_entry': local_doc.doc_entry,
+        'total_lines': line_counts[0] or 0,
+        'counted_lines': int(line_counts[1] or 0),
+        'unsent_lines': int(line_counts[2] or 0),
+        'pending_lines': len(pending_quantities(local_doc.id)),
+        'sessions': sessions
+    }
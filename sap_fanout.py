@@ -0,0 +1,180 @@
+"""
+SAP B1 Concurrent Fan-out
+Process-wide, bounded thread pool for independent Service Layer calls that cannot
+be grouped into one $batch (document posts, SQL query chunks, per-document reads).
+Results come back in submission order, each with its own error and timeout.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed, wait
+
+# Process-wide cap on concurrent Service Layer calls made through fan_out(); defaults to
+# the session pool size since each call holds one pooled session while it runs
+DEFAULT_MAX_WORKERS = int(os.environ.get('SAP_FANOUT_MAX_WORKERS',
+                                         os.environ.get('SAP_SESSION_POOL_SIZE', '4')))
+# Seconds to wait for a single call before reporting it as timed out
+DEFAULT_CALL_TIMEOUT = float(os.environ.get('SAP_FANOUT_CALL_TIMEOUT', '120'))
+
+
+class SAPFanoutTimeout(Exception):
+    """Raised (as FanoutResult.error) when a fanned-out call exceeds its timeout"""
+
+
+class FanoutResult:
+    """Outcome of one fanned-out call"""
+
+    def __init__(self, item, value=None, error=None, elapsed=0.0):
+        self.item = item
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        state = 'ok' if self.ok else f'error={self.error!r}'
+        return f"<FanoutResult {self.item!r} {state} {self.elapsed:.3f}s>"
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker_state = threading.local()
+_stats = {'fanouts': 0, 'calls': 0, 'errors': 0, 'timeouts': 0, 'inline': 0}
+_stats_lock = threading.Lock()
+
+
+def _record(counter, amount=1):
+    with _stats_lock:
+        _stats[counter] += amount
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, DEFAULT_MAX_WORKERS),
+                                           thread_name_prefix='sap-fanout')
+        return _executor
+
+
+def _current_app():
+    """Flask app to push in worker threads, so SAP clients can use current_app/db"""
+    try:
+        from flask import current_app, has_app_context
+        return current_app._get_current_object() if has_app_context() else None
+    except ImportError:
+        return None
+
+
+def _run(func, item, app):
+    _worker_state.active = True
+    started = time.monotonic()
+    try:
+        if app is not None:
+            with app.app_context():
+                value = func(item)
+        else:
+            value = func(item)
+        return value, None, time.monotonic() - started
+    except Exception as e:
+        return None, e, time.monotonic() - started
+    finally:
+        _worker_state.active = False
+
+
+def fan_out(func, items, timeout=None):
+    """Call func(item) for every item concurrently and return FanoutResults in item order.
+
+    Concurrency is capped process-wide by SAP_FANOUT_MAX_WORKERS. Exceptions and
+    timeouts are captured per call instead of aborting the whole fan-out. Calls made
+    from inside a fan-out worker run inline to avoid starving the shared pool.
+    timeout=False waits for every call to finish: use it for non-idempotent posts, which a
+    fan-out timeout would report as failed while SAP may still create the document (a
+    running call cannot be cancelled; each call's own HTTP timeout still applies).
+    """
+    items = list(items)
+    timeout = DEFAULT_CALL_TIMEOUT if timeout is None else timeout
+    _record('fanouts')
+    _record('calls', len(items))
+
+    if len(items) <= 1 or getattr(_worker_state, 'active', False):
+        _record('inline', len(items))
+        results = []
+        for item in items:
+            started = time.monotonic()
+            try:
+                results.append(FanoutResult(item, func(item), elapsed=time.monotonic() - started))
+            except Exception as e:
+                _record('errors')
+                results.append(FanoutResult(item, error=e, elapsed=time.monotonic() - started))
+        return results
+
+    app = _current_app()
+    executor = _get_executor()
+    futures = [executor.submit(_run, func, item, app) for item in items]
+    # Per-call timeout: every call gets `timeout` seconds once the fan-out has started
+    wait(futures, timeout=None if timeout is False else timeout)
+
+    results = []
+    for item, future in zip(items, futures):
+        if not future.done():
+            future.cancel()
+            _record('timeouts')
+            logging.warning(f"⚠️ SAP fan-out call timed out after {timeout}s: {item!r}")
+            results.append(FanoutResult(item, error=SAPFanoutTimeout(f"Timed out after {timeout}s"),
+                                        elapsed=timeout))
+            continue
+        value, error, elapsed = future.result()
+        if error is not None:
+            _record('errors')
+        results.append(FanoutResult(item, value, error, elapsed))
+    return results
+
+
+def fan_out_iter(func, items, timeout=None):
+    """Like fan_out(), but yield each FanoutResult as soon as its call finishes.
+
+    Results arrive in completion order, so callers can stream partial results while
+    slower calls are still running. Calls still pending after `timeout` seconds are
+    yielded as SAPFanoutTimeout errors.
+    """
+    items = list(items)
+    timeout = DEFAULT_CALL_TIMEOUT if timeout is None else timeout
+    if len(items) <= 1 or getattr(_worker_state, 'active', False):
+        yield from fan_out(func, items, timeout)
+        return
+
+    _record('fanouts')
+    _record('calls', len(items))
+    app = _current_app()
+    executor = _get_executor()
+    futures = {executor.submit(_run, func, item, app): item for item in items}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            value, error, elapsed = future.result()
+            if error is not None:
+                _record('errors')
+            yield FanoutResult(futures[future], value, error, elapsed)
+    except FutureTimeout:
+        for future in pending:
+            future.cancel()
+            _record('timeouts')
+            logging.warning(f"⚠️ SAP fan-out call timed out after {timeout}s: {futures[future]!r}")
+            yield FanoutResult(futures[future], error=SAPFanoutTimeout(f"Timed out after {timeout}s"),
+                               elapsed=timeout)
+    finally:
+        # Consumer stopped early: drop calls that have not started yet
+        for future in pending:
+            future.cancel()
+
+
+def get_fanout_stats():
+    """Counters for diagnostics"""
+    with _stats_lock:
+        return dict(_stats, max_workers=DEFAULT_MAX_WORKERS)
@@ -3,13 +3,71 @@ import json
 import logging
 import os
 from datetime import datetime
+import itertools
 import urllib.parse
 import urllib3
+from concurrent.futures import ThreadPoolExecutor
+
+from sap_batch import MAX_BATCH_PARTS, build_batch_body, parse_batch_response
+from sap_cache import sap_cache
+from sap_fanout import fan_out
+from sap_session_pool import SAPLoginError, SAPSessionProxy
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Default Service Layer page size for streamed list calls (Prefer: odata.maxpagesize)
+ODATA_PAGE_SIZE = int(os.environ.get('SAP_ODATA_PAGE_SIZE', '500'))
+
+# Set SAP_ODATA_BATCH=false to send independent lookups one by one instead of via $batch
+ODATA_BATCH_ENABLED = os.environ.get('SAP_ODATA_BATCH', 'true').lower() != 'false'
+
+# Pick lists per Service Layer page and per bulk write when syncing open pick lists
+PICK_LIST_PAGE_SIZE = int(os.environ.get('SAP_PICK_LIST_PAGE_SIZE', '100'))
+# Pick list fields the WMS stores; PickListsLines is selected too when lines are needed
+PICK_LIST_FIELDS = 'Absoluteentry,Name,OwnerCode,OwnerName,PickDate,Remarks,Status,ObjectType,UseBaseUnits'
+
+# Bin AbsEntries per BinLocations lookup ("AbsEntry eq 1 or AbsEntry eq 2 ..." keeps the URL short)
+BIN_LOOKUP_CHUNK = int(os.environ.get('SAP_BIN_LOOKUP_CHUNK', '100'))
+
+# Counting lines per InventoryCountings PATCH; bigger updates are sent as several PATCHes
+COUNTING_PATCH_CHUNK = int(os.environ.get('SAP_COUNTING_PATCH_CHUNK', '200'))
+
+# OBTN/OSRN Status codes returned by the bin batch/serial SQL query
+BIN_BATCH_STATUS = {
+    '0': 'bdsStatus_Released',
+    '1': 'bdsStatus_NotAccessible',
+    '2': 'bdsStatus_Locked'
+}
+
+
+def _sap_flag(value):
+    """SAP boolean: the Service Layer sends tYES/tNO, SQL queries Y/N"""
+    return value in ('tYES', 'Y')
+
+
+def _upsert_bin_locations(rows, session=None):
+    """Upsert bin_locations rows by bin_code, keeping one row per SAP AbsEntry.
+
+    A bin renamed in SAP keeps its AbsEntry, so the row under the old code gives it up first.
+    """
+    from sqlalchemy import update
+    from bulk_upsert import bulk_upsert
+    from models import BinLocation
+
+    if session is None:
+        from app import db
+        session = db.session
+    abs_entries = [row['sap_abs_entry'] for row in rows if row.get('sap_abs_entry') is not None]
+    for start in range(0, len(abs_entries), BIN_LOOKUP_CHUNK):
+        session.execute(update(BinLocation)
+                        .where(BinLocation.sap_abs_entry.in_(abs_entries[start:start + BIN_LOOKUP_CHUNK]))
+                        .values(sap_abs_entry=None))
+    return bulk_upsert(BinLocation, rows, ['bin_code'], session=session)
+
 
 class SAPIntegration:
+    # Cleared process-wide the first time the Service Layer rejects $batch
+    _batch_supported = True
 
     def __init__(self):
         # Use environment variables directly to avoid circular import
@@ -18,17 +76,21 @@ class SAPIntegration:
         self.password = os.environ.get('SAP_B1_PASSWORD', '')
         self.company_db = os.environ.get('SAP_B1_COMPANY_DB', '')
         self.session_id = None
-        self.session = requests.Session()
-        self.session.verify = False  # For development, in production use proper SSL
+        # Shared, already-authenticated sessions from the process-wide pool
+        self.session = SAPSessionProxy(self.base_url, self.username,
+                                       self.password, self.company_db)
         self.is_offline = False
 
-        # Cache for frequently accessed data
-        self._warehouse_cache = {}
-        self._bin_cache = {}
-        self._bin_location_cache = {}  # Cache for BinLocations API
-        self._branch_cache = {}
-        self._item_cache = {}
-        self._batch_cache = {}
+        # Process-wide master data caches (shared across requests, see sap_cache.py)
+        self._warehouse_cache = sap_cache.namespace('warehouses')
+        self._bin_cache = sap_cache.namespace('bins')
+        self._bin_location_cache = sap_cache.namespace('bin_location')  # Cache for BinLocations API
+        self._business_place_cache = sap_cache.namespace('warehouse_business_place')
+        self._item_cache = sap_cache.namespace('item_description')
+        self._item_validation_cache = sap_cache.namespace('item_validation')
+        self._batch_cache = sap_cache.namespace('batches')
+        self._series_cache = sap_cache.namespace('document_series')
+        self._open_docnum_cache = sap_cache.namespace('open_docnums')
 
     def login(self):
         """Login to SAP B1 Service Layer"""
@@ -38,26 +100,13 @@ class SAPIntegration:
                 "SAP B1 configuration not complete. Running in offline mode.")
             return False
 
-        login_url = f"{self.base_url}/b1s/v1/Login"
-        login_data = {
-            "UserName": self.username,
-            "Password": self.password,
-            "CompanyDB": self.company_db
-        }
-
         try:
-            response = self.session.post(login_url,
-                                         json=login_data,
-                                         timeout=30)
-            if response.status_code == 200:
-                self.session_id = response.json().get('SessionId')
-                logging.info("Successfully logged in to SAP B1")
-                return True
-            else:
-                logging.warning(
-                    f"SAP B1 login failed: {response.text}. Running in offline mode."
-                )
-                return False
+            self.session_id = self.session.ensure_session()
+            logging.debug("Using pooled SAP B1 session")
+            return True
+        except SAPLoginError as e:
+            logging.warning(f"{str(e)}. Running in offline mode.")
+            return False
         except Exception as e:
             logging.warning(
                 f"SAP B1 login error: {str(e)}. Running in offline mode.")
@@ -65,13 +114,149 @@ class SAPIntegration:
             return False
 
     def ensure_logged_in(self):
-        """Ensure we have a valid session"""
+        """Ensure we have a valid session (False while the SAP circuit breaker is open)"""
+        if self.session.circuit_open():
+            logging.debug("SAP B1 circuit open - using offline mode")
+            return False
         if not self.session_id:
             return self.login()
         return True
 
+    def iter_odata(self, resource, filter_clause=None, select=None, params=None,
+                   page_size=ODATA_PAGE_SIZE, prefetch=False, timeout=60):
+        """Stream every entity of a Service Layer collection page by page.
+
+        Follows odata.nextLink (or falls back to $skip) lazily, so callers can walk
+        tens of thousands of rows with flat memory. With prefetch=True the next page
+        is requested in the background while the current one is being consumed.
+        Raises requests.HTTPError when a page cannot be fetched.
+        """
+        query = dict(params or {})
+        if filter_clause:
+            query['$filter'] = filter_clause
+        if select:
+            query['$select'] = select if isinstance(select, str) else ','.join(select)
+        headers = {'Prefer': f'odata.maxpagesize={page_size}'}
+        base = f"{self.base_url}/b1s/v1/"
+
+        def fetch(url, page_params):
+            response = self.session.get(url, params=page_params, headers=headers, timeout=timeout)
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    f"SAP B1 error listing {resource}: {response.status_code} - {response.text}",
+                    response=response)
+            data = response.json()
+            return data.get('value', []), data.get('odata.nextLink') or data.get('@odata.nextLink')
+
+        def next_request(values, next_link, skip):
+            if next_link:
+                return (next_link if next_link.startswith('http') else base + next_link), None
+            if len(values) == page_size:
+                # No nextLink but a full page: keep paging explicitly with $skip
+                return base + resource, dict(query, **{'$skip': skip})
+            return None
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            skip = 0
+            page = fetch(base + resource, query)
+            while True:
+                values, next_link = page
+                skip += len(values)
+                following = next_request(values, next_link, skip) if values else None
+                pending = executor.submit(fetch, *following) if (following and executor) else None
+                for entity in values:
+                    yield entity
+                if not following:
+                    break
+                page = pending.result() if pending else fetch(*following)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def batch_requests(self, calls, timeout=60):
+        """Send independent Service Layer calls as one OData $batch round trip.
+
+        calls is a list of (method, path, body) tuples with paths relative to /b1s/v1/.
+        Returns one response per call, in order (status_code/json()/text like requests).
+        Parts the Service Layer did not answer - or the whole list when $batch is
+        unavailable - are sent individually so callers always get a full result list.
+        """
+        results = [None] * len(calls)
+        if ODATA_BATCH_ENABLED and SAPIntegration._batch_supported and len(calls) > 1:
+            for start in range(0, len(calls), MAX_BATCH_PARTS):
+                chunk = calls[start:start + MAX_BATCH_PARTS]
+                content_type, body = build_batch_body(chunk)
+                response = self.session.post(f"{self.base_url}/b1s/v1/$batch", data=body,
+                                             headers={'Content-Type': content_type},
+                                             timeout=timeout)
+                if response.status_code in (404, 405, 501):
+                    logging.warning(f"⚠️ SAP B1 $batch not supported ({response.status_code}), "
+                                    f"sending requests individually")
+                    SAPIntegration._batch_supported = False
+                    break
+                if response.status_code not in (200, 202):
+                    logging.warning(f"⚠️ SAP B1 $batch failed: {response.status_code} - {response.text}")
+                    continue
+                parts = parse_batch_response(response.headers.get('Content-Type', ''), response.content)
+                for offset, part in enumerate(parts[:len(chunk)]):
+                    results[start + offset] = part
+                logging.debug(f"SAP B1 $batch answered {len(parts)} of {len(chunk)} requests")
+
+        for index, (method, path, body) in enumerate(calls):
+            if results[index] is None:
+                results[index] = self.session.request(
+                    method, f"{self.base_url}/b1s/v1/{path.lstrip('/')}",
+                    json=body, timeout=timeout)
+        return results
+
+    @staticmethod
+    def _sql_query_call(query_name, param_list=None):
+        """(method, path, body) tuple for a stored SAP SQL query, usable with batch_requests"""
+        return ('POST', f"SQLQueries('{query_name}')/List",
+                {"ParamList": param_list} if param_list else {})
+
+    @staticmethod
+    def _sql_query_rows(query_name, response):
+        """Rows of a SQL query response, or None when the query is not defined in SAP.
+
+        Any other failure (5xx, 401, bad parameters) raises requests.HTTPError, so callers
+        do not mistake an outage for a missing query and fall back to an expensive path.
+        """
+        if response.status_code == 200:
+            return response.json().get('value', [])
+        if response.status_code == 404 or (response.status_code < 500 and 'not found' in response.text.lower()):
+            logging.info(f"SQL query {query_name} is not defined in SAP: {response.status_code} - {response.text}")
+            return None
+        logging.error(f"❌ SQL query {query_name} failed: {response.status_code} - {response.text}")
+        raise requests.HTTPError(f"SAP API error: {response.status_code} - {response.text}", response=response)
+
+    def iter_sql_query(self, query_name, param_list=None, page_size=ODATA_PAGE_SIZE, timeout=60):
+        """Stream the rows of a stored SAP SQL query, following Service Layer paging.
+
+        Raises requests.HTTPError when a page cannot be fetched (e.g. 404 when the
+        query is not registered in SAP).
+        """
+        base = f"{self.base_url}/b1s/v1/"
+        url = f"{base}SQLQueries('{query_name}')/List"
+        payload = {"ParamList": param_list} if param_list else {}
+        headers = {'Prefer': f'odata.maxpagesize={page_size}'}
+        while url:
+            response = self.session.post(url, json=payload, headers=headers, timeout=timeout)
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    f"SAP API error: {response.status_code} - {response.text}", response=response)
+            data = response.json()
+            yield from data.get('value', [])
+            next_link = data.get('odata.nextLink') or data.get('@odata.nextLink')
+            url = (next_link if next_link.startswith('http') else base + next_link) if next_link else None
+
     def validate_item_code(self, item_code):
         """Validate ItemCode and get BatchNum, SerialNum, and NonBatch_NonSerialMethod from SAP B1"""
+        cached = self._item_validation_cache.get(item_code)
+        if cached is not None:
+            return cached
+
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning default validation for ItemCode")
             return {
@@ -104,7 +289,7 @@ class SAPIntegration:
                     
                     logging.info(f"✅ Item {item_code}: BatchNum={batch_num}, SerialNum={serial_num}, ManageMethod={manage_method}")
                     
-                    return {
+                    validation = {
                         'success': True,
                         'item_code': item_code,
                         'batch_required': batch_num == 'Y',
@@ -113,6 +298,8 @@ class SAPIntegration:
                         'batch_num': batch_num,
                         'serial_num': serial_num
                     }
+                    self._item_validation_cache.set(item_code, validation)
+                    return validation
                 else:
                     logging.warning(f"No validation data found for ItemCode: {item_code}")
                     return {
@@ -165,12 +352,12 @@ class SAPIntegration:
                 f"StockTransfers?$filter=DocNum eq '{doc_num}'"
             ]
 
-            for endpoint in endpoints_to_try:
-                url = f"{self.base_url}/b1s/v1/{endpoint}"
-                logging.info(f"🔍 Trying SAP B1 API: {url}")
+            # Probe all endpoints in one $batch round trip, first non-empty result wins
+            logging.info(f"🔍 Probing SAP B1 transfer endpoints for DocNum {doc_num}")
+            responses = self.batch_requests([('GET', endpoint, None) for endpoint in endpoints_to_try])
 
-                response = self.session.get(url)
-                logging.info(f"📡 Response status: {response.status_code}")
+            for endpoint, response in zip(endpoints_to_try, responses):
+                logging.info(f"📡 Response status for {endpoint}: {response.status_code}")
 
                 if response.status_code == 200:
                     data = response.json()
@@ -227,35 +414,34 @@ class SAPIntegration:
 
     def get_bins(self, warehouse_code):
         """Get bins for a specific warehouse"""
+        cached = self._bin_cache.get(warehouse_code)
+        if cached is not None:
+            return cached
+
         if not self.ensure_logged_in():
             return []
 
         try:
-            url = f"{self.base_url}/b1s/v1/BinLocations?$filter=Warehouse eq '{warehouse_code}'"
-            response = self.session.get(url)
-
-            if response.status_code == 200:
-                data = response.json()
-                bins = data.get('value', [])
-
-                # Transform the data to match our expected format
-                formatted_bins = []
-                for bin_data in bins:
-                    formatted_bins.append({
-                        'BinCode':
-                        bin_data.get('BinCode'),
-                        'Description':
-                        bin_data.get('Description', ''),
-                        'Warehouse':
-                        bin_data.get('Warehouse'),
-                        'Active':
-                        bin_data.get('Active', 'Y')
-                    })
-
-                return formatted_bins
-            else:
-                logging.error(f"Failed to get bins: {response.status_code}")
-                return []
+            # Transform the data to match our expected format
+            formatted_bins = []
+            for bin_data in self.iter_odata('BinLocations', filter_clause=f"Warehouse eq '{warehouse_code}'",
+                                            timeout=30):
+                formatted_bins.append({
+                    'BinCode':
+                    bin_data.get('BinCode'),
+                    'Description':
+                    bin_data.get('Description', ''),
+                    'Warehouse':
+                    bin_data.get('Warehouse'),
+                    'Active':
+                    bin_data.get('Active', 'Y')
+                })
+
+            self._bin_cache.set(warehouse_code, formatted_bins)
+            return formatted_bins
+        except requests.HTTPError as e:
+            logging.error(f"Failed to get bins: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error getting bins: {str(e)}")
             return []
@@ -286,25 +472,34 @@ class SAPIntegration:
 
             }
 
-    def get_po_series(self):
+    def _cached_list(self, cache, key, fetch, refresh=False):
+        """Return fetch() through a sap_cache namespace; empty (failed) results are not cached"""
+        if not refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        result = fetch()
+        if result:
+            cache.set(key, result)
+        return result
+
+    def get_po_series(self, refresh=False):
+        """PO series from SAP B1 (cached; refreshed by the background scheduler)"""
+        return self._cached_list(self._series_cache, 'PO', self._fetch_po_series, refresh)
+
+    def _fetch_po_series(self):
         """Get PO series from SAP B1 using SQLQueries"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
         try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_PO_Series')/List"
-            response = self.session.post(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                series_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(series_list)} PO series from SAP")
-                return series_list
-            else:
-                logging.warning(f"Failed to get PO series: {response.status_code} - {response.text}")
-                return []
-                
+            series_list = list(self.iter_sql_query('Get_PO_Series', timeout=30))
+            logging.info(f"✅ Retrieved {len(series_list)} PO series from SAP")
+            return series_list
+        except requests.HTTPError as e:
+            logging.warning(f"Failed to get PO series: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error fetching PO series: {str(e)}")
             return []
@@ -341,56 +536,46 @@ class SAPIntegration:
             logging.error(f"Error fetching DocEntry: {str(e)}")
             return None
 
-    def get_open_po_docnums(self, series):
+    def get_open_po_docnums(self, series, refresh=False):
+        """Open PO document numbers of a series (cached; refreshed by the background scheduler)"""
+        return self._cached_list(self._open_docnum_cache, f'PO:{series}',
+                                 lambda: self._fetch_open_po_docnums(series), refresh)
+
+    def _fetch_open_po_docnums(self, series):
         """Get open PO document numbers for a specific series using SAP SQLQuery"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty list")
             return []
 
         try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_Open_PO_DocNum')/List"
-            payload = {
-                "ParamList": f"series='{series}'"
-            }
-            
-            response = self.session.post(url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                doc_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(doc_list)} open PO documents for series {series}")
-                return doc_list
-            else:
-                logging.warning(f"Failed to get open PO documents: {response.status_code} - {response.text}")
-                return []
-                
+            doc_list = list(self.iter_sql_query('Get_Open_PO_DocNum', f"series='{series}'", timeout=30))
+            logging.info(f"✅ Retrieved {len(doc_list)} open PO documents for series {series}")
+            return doc_list
+        except requests.HTTPError as e:
+            logging.warning(f"Failed to get open PO documents: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error fetching open PO documents for series {series}: {str(e)}")
             return []
 
-    def get_open_invt_docnums(self, series):
+    def get_open_invt_docnums(self, series, refresh=False):
+        """Open Inventory Transfer document numbers of a series (cached; refreshed by the background scheduler)"""
+        return self._cached_list(self._open_docnum_cache, f'INVT:{series}',
+                                 lambda: self._fetch_open_invt_docnums(series), refresh)
+
+    def _fetch_open_invt_docnums(self, series):
         """Get open Inventory Transfer document numbers for a specific series using SAP SQLQuery"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty list")
             return []
 
         try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_Open_INVTRNF_DocNum')/List"
-            payload = {
-                "ParamList": f"series='{series}'"
-            }
-            
-            response = self.session.post(url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                doc_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(doc_list)} open Inventory Transfer documents for series {series}")
-                return doc_list
-            else:
-                logging.warning(f"Failed to get open Inventory Transfer documents: {response.status_code} - {response.text}")
-                return []
-                
+            doc_list = list(self.iter_sql_query('Get_Open_INVTRNF_DocNum', f"series='{series}'", timeout=30))
+            logging.info(f"✅ Retrieved {len(doc_list)} open Inventory Transfer documents for series {series}")
+            return doc_list
+        except requests.HTTPError as e:
+            logging.warning(f"Failed to get open Inventory Transfer documents: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error fetching open Inventory Transfer documents for series {series}: {str(e)}")
             return []
@@ -434,7 +619,11 @@ class SAPIntegration:
             )
         return []
 
-    def get_so_series(self):
+    def get_so_series(self, refresh=False):
+        """Sales Order series from SAP B1 (cached; refreshed by the background scheduler)"""
+        return self._cached_list(self._series_cache, 'SO', self._fetch_so_series, refresh)
+
+    def _fetch_so_series(self):
         """Get Sales Order series from SAP B1 - tries SQL query first, falls back to OData endpoints"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
@@ -445,25 +634,19 @@ class SAPIntegration:
             url_sql = f"{self.base_url}/b1s/v1/SQLQueries('Get_SO_Series')/List"
             logging.debug(f"🔍 Attempting SQL query Get_SO_Series: {url_sql}")
             
-            response = self.session.post(url_sql, json={}, timeout=30)
+            series_list = [
+                {
+                    'Series': item.get('Series'),
+                    'Name': item.get('SeriesName', f"Series {item.get('Series')}")
+                }
+                for item in self.iter_sql_query('Get_SO_Series', timeout=30)
+            ]
             
-            if response.status_code == 200:
-                data = response.json()
-                series_data = data.get('value', [])
-                
-                series_list = [
-                    {
-                        'Series': item.get('Series'),
-                        'Name': item.get('SeriesName', f"Series {item.get('Series')}")
-                    }
-                    for item in series_data
-                ]
-                
-                logging.info(f"✅ Retrieved {len(series_list)} SO series from SAP (SQL Query)")
-                return series_list
-            else:
-                logging.info(f"SQL query Get_SO_Series not available ({response.status_code}), trying fallback methods")
+            logging.info(f"✅ Retrieved {len(series_list)} SO series from SAP (SQL Query)")
+            return series_list
                 
+        except requests.HTTPError as e:
+            logging.info(f"SQL query Get_SO_Series not available ({str(e)}), trying fallback methods")
         except Exception as e:
             logging.debug(f"SQL query Get_SO_Series failed: {str(e)}, trying fallback")
 
@@ -472,7 +655,9 @@ class SAPIntegration:
             url_v2 = f"{self.base_url}/b1s/v2/Series?$filter=ObjectCode eq '17'&$select=Series,SeriesName"
             logging.debug(f"Attempting v2 Series endpoint: {url_v2}")
             
-            response = self.session.get(url_v2, timeout=30)
+            # iter_odata walks v1 only; one page holds every series of an object type
+            response = self.session.get(url_v2, headers={'Prefer': f'odata.maxpagesize={ODATA_PAGE_SIZE}'},
+                                        timeout=30)
             
             if response.status_code == 200:
                 data = response.json()
@@ -496,30 +681,28 @@ class SAPIntegration:
         
         # Fallback Method 3: Query v1 Orders to extract series (works but limited to recent orders)
         try:
-            url_v1 = f"{self.base_url}/b1s/v1/Orders?$select=Series&$top=200&$orderby=DocEntry desc"
-            logging.debug(f"Using fallback v1 Orders query: {url_v1}")
+            logging.debug("Using fallback v1 Orders query for the 200 latest orders")
             
-            response = self.session.get(url_v1, timeout=30)
+            # The 200 latest orders; islice stops paging once they are read
+            orders = itertools.islice(self.iter_odata('Orders', select='Series',
+                                                      params={'$orderby': 'DocEntry desc'},
+                                                      page_size=200, timeout=30), 200)
             
-            if response.status_code == 200:
-                data = response.json()
-                orders = data.get('value', [])
-                
-                # Extract unique series
-                series_set = set()
-                for order in orders:
-                    if 'Series' in order and order['Series'] is not None:
-                        series_set.add(order['Series'])
-                
-                # Convert to list of dicts
-                series_list = [{'Series': s, 'Name': f'Series {s}'} for s in sorted(series_set)]
-                
-                logging.warning(f"⚠️ Retrieved {len(series_list)} SO series using fallback method (v1 Orders). For best results, setup SQL query 'Get_SO_Series' in SAP B1.")
-                return series_list
-            else:
-                logging.error(f"Failed to get SO series via fallback: {response.status_code} - {response.text}")
-                return []
+            # Extract unique series
+            series_set = set()
+            for order in orders:
+                if 'Series' in order and order['Series'] is not None:
+                    series_set.add(order['Series'])
+            
+            # Convert to list of dicts
+            series_list = [{'Series': s, 'Name': f'Series {s}'} for s in sorted(series_set)]
+            
+            logging.warning(f"⚠️ Retrieved {len(series_list)} SO series using fallback method (v1 Orders). For best results, setup SQL query 'Get_SO_Series' in SAP B1.")
+            return series_list
                 
+        except requests.HTTPError as e:
+            logging.error(f"Failed to get SO series via fallback: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error fetching SO series (fallback method): {str(e)}")
             return []
@@ -623,6 +806,22 @@ class SAPIntegration:
             logging.error(f"Error fetching Sales Order by DocEntry {doc_entry}: {str(e)}")
             return None
 
+    def find_document_by_reference(self, resource, field, reference):
+        """Look up an already-posted SAP document by its WMS reference (NumAtCard / Reference2).
+
+        Returns {'DocEntry', 'DocNum'} or None. Raises on lookup failure so an outbox
+        retry never re-posts a document it could not rule out.
+        """
+        escaped = str(reference).replace("'", "''")
+        url = f"{self.base_url}/b1s/v1/{resource}"
+        params = {'$filter': f"{field} eq '{escaped}'", '$select': 'DocEntry,DocNum', '$top': 1}
+        response = self.session.get(url, params=params, timeout=30)
+        if response.status_code != 200:
+            raise requests.HTTPError(
+                f"SAP B1 {resource} lookup by {field} failed: {response.status_code} - {response.text}")
+        documents = response.json().get('value', [])
+        return documents[0] if documents else None
+
     def create_delivery_note(self, delivery_data):
         """Create Delivery Note in SAP B1"""
         if not self.ensure_logged_in():
@@ -667,26 +866,23 @@ class SAPIntegration:
                 'error': f'Exception: {str(e)}'
             }
 
-    def get_invt_series(self):
+    def get_invt_series(self, refresh=False):
+        """Inventory Transfer series from SAP B1 (cached; refreshed by the background scheduler)"""
+        return self._cached_list(self._series_cache, 'INVT', self._fetch_invt_series, refresh)
+
+    def _fetch_invt_series(self):
         """Get Inventory Transfer series from SAP B1 using SQLQueries"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
         try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_INVT_Series')/List"
-            params = {
-            }
-            response = self.session.post(url,params=params, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                series_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(series_list)} INVT series from SAP")
-                return series_list
-            else:
-                logging.warning(f"Failed to get INVT series: {response.status_code} - {response.text}")
-                return []
-                
+            series_list = list(self.iter_sql_query('Get_INVT_Series', timeout=30))
+            logging.info(f"✅ Retrieved {len(series_list)} INVT series from SAP")
+            return series_list
+        except requests.HTTPError as e:
+            logging.warning(f"Failed to get INVT series: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error fetching INVT series: {str(e)}")
             return []
@@ -750,25 +946,23 @@ class SAPIntegration:
             logging.error(f"Error fetching Inventory Transfer Request by DocEntry {doc_entry}: {str(e)}")
             return None
 
-    def get_invcnt_series(self):
+    def get_invcnt_series(self, refresh=False):
+        """Inventory Counting series from SAP B1 (cached; refreshed by the background scheduler)"""
+        return self._cached_list(self._series_cache, 'INVCNT', self._fetch_invcnt_series, refresh)
+
+    def _fetch_invcnt_series(self):
         """Get Inventory Counting series from SAP B1 using SQLQueries"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
         try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_INVCNT_Series')/List"
-            params = {}
-            response = self.session.post(url, params=params, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                series_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(series_list)} Inventory Counting series from SAP")
-                return series_list
-            else:
-                logging.warning(f"Failed to get Inventory Counting series: {response.status_code} - {response.text}")
-                return []
-                
+            series_list = list(self.iter_sql_query('Get_INVCNT_Series', timeout=30))
+            logging.info(f"✅ Retrieved {len(series_list)} Inventory Counting series from SAP")
+            return series_list
+        except requests.HTTPError as e:
+            logging.warning(f"Failed to get Inventory Counting series: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"Error fetching Inventory Counting series: {str(e)}")
             return []
@@ -834,6 +1028,147 @@ class SAPIntegration:
             logging.error(f"Error fetching Inventory Counting by DocEntry {doc_entry}: {str(e)}")
             return None
 
+    @staticmethod
+    def _inventory_counting_fields(invcnt_data):
+        """SAPInventoryCount column values from a SAP B1 InventoryCountings entity"""
+        count_date = invcnt_data.get('CountDate')
+        if isinstance(count_date, str):
+            count_date = datetime.fromisoformat(count_date.replace('Z', '+00:00'))
+        return {
+            'doc_number': invcnt_data.get('DocumentNumber') or invcnt_data.get('DocNumber'),
+            'series': invcnt_data.get('Series'),
+            'count_date': count_date,
+            'counting_type': invcnt_data.get('CountingType'),
+            'count_time': invcnt_data.get('CountTime'),
+            'single_counter_type': invcnt_data.get('SingleCounterType'),
+            'document_status': invcnt_data.get('DocumentStatus'),
+            'remarks': invcnt_data.get('Remarks'),
+            'reference_2': invcnt_data.get('Reference2'),
+            'branch_id': invcnt_data.get('BPL_IDAssignedToInvoice'),
+            'financial_period': invcnt_data.get('FinancialPeriod'),
+            'counter_type': invcnt_data.get('CounterType'),
+            'counter_id': invcnt_data.get('CounterID'),
+            'multiple_counter_role': invcnt_data.get('MultipleCounterRole')
+        }
+
+    @staticmethod
+    def _inventory_counting_line_fields(line_data):
+        """SAPInventoryCountLine column values from a SAP B1 InventoryCountingLines entry"""
+        in_whs_qty = float(line_data.get('InWarehouseQuantity') or 0)
+        uom_counted_qty = float(line_data.get('UoMCountedQuantity') or 0)
+        return {
+            'line_number': line_data.get('LineNumber'),
+            'item_code': line_data.get('ItemCode'),
+            'item_description': line_data.get('ItemDescription'),
+            'warehouse_code': line_data.get('WarehouseCode'),
+            'bin_entry': line_data.get('BinEntry'),
+            'in_warehouse_quantity': in_whs_qty,
+            'counted': line_data.get('Counted', 'tNO'),
+            'uom_code': line_data.get('UoMCode'),
+            'bar_code': line_data.get('BarCode'),
+            'uom_counted_quantity': uom_counted_qty,
+            'items_per_unit': float(line_data.get('ItemsPerUnit', 1)),
+            'counter_type': line_data.get('CounterType'),
+            'counter_id': line_data.get('CounterID'),
+            'multiple_counter_role': line_data.get('MultipleCounterRole'),
+            'line_status': line_data.get('LineStatus'),
+            'project_code': line_data.get('ProjectCode'),
+            'manufacturer': line_data.get('Manufacturer'),
+            'supplier_catalog_no': line_data.get('SupplierCatalogNo'),
+            'preferred_vendor': line_data.get('PreferredVendor'),
+            'cost_code': line_data.get('CostCode'),
+            'u_floor': line_data.get('U_Floor'),
+            'u_rack': line_data.get('U_Rack'),
+            'u_level': line_data.get('U_Level'),
+            'freeze': line_data.get('Freeze', 'tNO'),
+            'u_invcount': line_data.get('U_InvCount'),
+            'variance': uom_counted_qty - in_whs_qty
+        }
+
+    def sync_inventory_counting_to_local_db(self, doc_entry, invcnt_data, user_id):
+        """Sync a SAP B1 inventory counting document into the local database incrementally.
+
+        Lines are diffed by line_number against one query of the stored lines: changed
+        fields are bulk updated, new lines bulk inserted and lines SAP no longer returns
+        deleted. Dirty lines keep their local count (a count SAP has not accepted yet); those
+        counts are returned as local_counts for apply_local_counts. Every other line takes
+        SAP's values, including a count reset in SAP. Does not commit.
+        """
+        from sqlalchemy import update
+        from app import db
+        from bulk_upsert import bulk_insert
+        from models import SAPInventoryCount, SAPInventoryCountLine
+
+        doc_entry = int(doc_entry)
+        local_doc = SAPInventoryCount.query.filter_by(doc_entry=doc_entry).first()
+        if not local_doc:
+            local_doc = SAPInventoryCount(doc_entry=doc_entry, user_id=user_id)
+            db.session.add(local_doc)
+        for field, value in self._inventory_counting_fields(invcnt_data).items():
+            setattr(local_doc, field, value)
+        local_doc.last_updated_at = datetime.utcnow()
+        db.session.flush()
+
+        sap_lines = {}
+        for line_data in invcnt_data.get('InventoryCountingLines') or invcnt_data.get('InventoryCountLines') or []:
+            if line_data.get('LineNumber') is not None:
+                sap_lines[line_data['LineNumber']] = self._inventory_counting_line_fields(line_data)
+
+        fields = list(self._inventory_counting_line_fields({}))
+        columns = [getattr(SAPInventoryCountLine, field) for field in fields]
+        existing, stale_ids = {}, []
+        for row in db.session.query(SAPInventoryCountLine.id, SAPInventoryCountLine.is_dirty, *columns).filter(
+                SAPInventoryCountLine.count_id == local_doc.id):
+            values = dict(zip(fields, row[2:]), is_dirty=row.is_dirty)
+            if row.line_number in sap_lines and row.line_number not in existing:
+                existing[row.line_number] = (row.id, values)
+            else:
+                stale_ids.append(row.id)
+
+        now = datetime.utcnow()
+        updates, inserts, local_counts = [], [], {}
+        for line_number, sap_fields in sap_lines.items():
+            if line_number not in existing:
+                inserts.append(dict(sap_fields, count_id=local_doc.id))
+                continue
+            line_id, local_fields = existing[line_number]
+            if local_fields['is_dirty']:
+                # Counting progress SAP has not seen yet
+                sap_fields = dict(sap_fields, counted=local_fields['counted'],
+                                  uom_counted_quantity=local_fields['uom_counted_quantity'] or 0)
+                sap_fields['variance'] = sap_fields['uom_counted_quantity'] - sap_fields['in_warehouse_quantity']
+                local_counts[line_number] = {field: sap_fields[field]
+                                             for field in ('counted', 'uom_counted_quantity', 'variance')}
+            changes = {field: value for field, value in sap_fields.items() if local_fields[field] != value}
+            if changes:
+                updates.append(dict(changes, id=line_id, updated_at=now))
+
+        if stale_ids:
+            SAPInventoryCountLine.query.filter(SAPInventoryCountLine.id.in_(stale_ids)).delete(synchronize_session=False)
+        if updates:
+            db.session.execute(update(SAPInventoryCountLine), updates)
+        bulk_insert(SAPInventoryCountLine, inserts)
+
+        result = {'count_id': local_doc.id, 'inserted': len(inserts), 'updated': len(updates),
+                  'deleted': len(stale_ids), 'unchanged': len(existing) - len(updates),
+                  'local_counts': local_counts}
+        logging.info(f"✅ Synced counting document {doc_entry}: {result['inserted']} new, {result['updated']} "
+                     f"changed, {result['deleted']} removed, {result['unchanged']} unchanged lines")
+        return result
+
+    @staticmethod
+    def apply_local_counts(invcnt_data, local_counts):
+        """Show the local counts kept by sync_inventory_counting_to_local_db in the SAP document,
+        so the counting page loads (and saves back) those instead of SAP's older values"""
+        for line_data in invcnt_data.get('InventoryCountingLines') or invcnt_data.get('InventoryCountLines') or []:
+            local = local_counts.get(line_data.get('LineNumber'))
+            if local:
+                line_data.update({'Counted': local['counted'],
+                                  'UoMCountedQuantity': local['uom_counted_quantity'],
+                                  'CountedQuantity': local['uom_counted_quantity'],
+                                  'Variance': local['variance']})
+        return invcnt_data
+
     def get_item_master(self, item_code):
         """Get item master data from SAP B1"""
         if not self.ensure_logged_in():
@@ -855,13 +1190,9 @@ class SAPIntegration:
         if not self.ensure_logged_in():
             return []
 
-        url = f"{self.base_url}/b1s/v1/BinLocations?$filter=WhsCode eq '{warehouse_code}'"
-
         try:
-            response = self.session.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('value', [])
+            return list(self.iter_odata('BinLocations', filter_clause=f"WhsCode eq '{warehouse_code}'"))
+        except requests.HTTPError:
             return []
         except Exception as e:
             logging.error(
@@ -870,171 +1201,243 @@ class SAPIntegration:
             return []
 
     def get_bin_items(self, bin_code):
-        """Enhanced bin scanning with detailed item information using your exact API patterns"""
+        """Bin scanning scoped to the stock sitting in one bin.
+
+        Uses the SAP SQL queries 'Bin_Item_Stock' (OIBQ) and 'Bin_Batch_Serial_Stock'
+        (OBBQ/OSBQ) so latency scales with the bin's contents, not the warehouse size.
+        Falls back to the warehouse crossjoin only when those queries are not defined in SAP;
+        other SAP failures raise requests.RequestException instead of returning no items.
+        """
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning mock bin data")
             return self._get_mock_bin_items(bin_code)
 
         try:
-            logging.info(f"🔍 Enhanced bin scanning for: {bin_code}")
-            
-            # Step 1: Get bin information using your exact API pattern
-            bin_info_url = f"{self.base_url}/b1s/v1/BinLocations?$filter=BinCode eq '{bin_code}'"
-            logging.debug(f"[DEBUG] Calling URL: {bin_info_url}")
-            bin_response = self.session.get(bin_info_url)
-            logging.debug(f"[DEBUG] Status code: {bin_response.status_code}")
-
-            if bin_response.status_code != 200:
-                logging.warning(f"❌ Bin {bin_code} not found: {bin_response.status_code}")
-                return []
-
-            bin_data = bin_response.json().get('value', [])
-            if not bin_data:
+            logging.info(f"🔍 Bin scanning for: {bin_code}")
+
+            # Step 1: Resolve the bin (cached - bin codes rarely move between warehouses) and
+            # fetch the bin's stock and batch/serial quantities in the same $batch round trip
+            cached_bin = self._bin_location_cache.get(f"code:{bin_code}")
+            calls = [self._sql_query_call('Bin_Item_Stock', f"binCode='{bin_code}'"),
+                     self._sql_query_call('Bin_Batch_Serial_Stock', f"binCode='{bin_code}'")]
+            if cached_bin is None:
+                calls.append(self._bin_code_call(bin_code))
+            responses = self.batch_requests(calls, timeout=30)
+
+            bin_info = cached_bin or self._resolve_bin_code(bin_code, response=responses[2])
+            if not bin_info:
                 logging.warning(f"❌ Bin {bin_code} does not exist")
                 return []
 
-            bin_info = bin_data[0]
             warehouse_code = bin_info.get('Warehouse', '')
             abs_entry = bin_info.get('AbsEntry', 0)
-
             logging.info(f"✅ Found bin {bin_code} in warehouse {warehouse_code} (AbsEntry: {abs_entry})")
 
-            # Step 2: Get warehouse business place info using your exact API pattern
-            warehouse_info_url = (f"{self.base_url}/b1s/v1/Warehouses?"
-                                f"$select=BusinessPlaceID,WarehouseCode,DefaultBin&"
-                                f"$filter=WarehouseCode eq '{warehouse_code}'")
-            logging.debug(f"[DEBUG] Calling URL: {warehouse_info_url}")
-            warehouse_response = self.session.get(warehouse_info_url)
-            logging.debug(f"[DEBUG] Status code: {warehouse_response.status_code}")
-            
-            business_place_id = 0
-            if warehouse_response.status_code == 200:
-                warehouse_data = warehouse_response.json().get('value', [])
-                if warehouse_data:
-                    business_place_id = warehouse_data[0].get('BusinessPlaceID', 0)
-                    logging.info(f"✅ Warehouse {warehouse_code} BusinessPlaceID: {business_place_id}")
-
-            # Step 3: Get warehouse items using your exact crossjoin API pattern
-            crossjoin_url = (f"{self.base_url}/b1s/v1/$crossjoin(Items,Items/ItemWarehouseInfoCollection)?"
-                           f"$expand=Items($select=ItemCode,ItemName,QuantityOnStock),"
-                           f"Items/ItemWarehouseInfoCollection($select=InStock,Ordered,StandardAveragePrice)&"
-                           f"$filter=Items/ItemCode eq Items/ItemWarehouseInfoCollection/ItemCode and "
-                           f"Items/ItemWarehouseInfoCollection/WarehouseCode eq '{warehouse_code}'")
-
-            logging.debug(f"[DEBUG] Calling URL: {crossjoin_url}")
-            headers = {"Prefer": "odata.maxpagesize=300"}
-            crossjoin_response = self.session.get(crossjoin_url,headers=headers)
-            logging.debug(f"[DEBUG] Status code: {crossjoin_response.status_code}")
-            logging.debug(f"[DEBUG] Response text: {crossjoin_response.text[:300]}")
-
-            if crossjoin_response.status_code != 200:
-                logging.error(f"❌ Failed to get warehouse items: {crossjoin_response.status_code}")
-                return []
+            # Step 2: Warehouse BusinessPlaceID (cached)
+            business_place_id = self.get_warehouse_business_place_id(warehouse_code)
+
+            # Step 3: Stock in this bin only, plus batch/serial quantities by bin
+            stock_rows = self._sql_query_rows('Bin_Item_Stock', responses[0])
+            if stock_rows is None:
+                logging.info("SQL query Bin_Item_Stock not available, falling back to warehouse crossjoin")
+                return self._get_bin_items_from_warehouse(bin_code, warehouse_code, abs_entry,
+                                                          business_place_id)
+
+            batch_rows = self._sql_query_rows('Bin_Batch_Serial_Stock', responses[1]) or []
+            batches_by_item = {}
+            for row in batch_rows:
+                batches_by_item.setdefault(row.get('ItemCode'), []).append({
+                    'Batch': row.get('DistNumber', ''),
+                    'Quantity': float(row.get('Quantity') or 0),
+                    'Kind': 'serial' if row.get('Kind') == 'S' else 'batch',
+                    'Status': BIN_BATCH_STATUS.get(str(row.get('Status')), 'bdsStatus_Released'),
+                    'ExpirationDate': row.get('ExpDate'),
+                    'AdmissionDate': row.get('InDate')
+                })
 
-            # Step 4: Process crossjoin results and enhance with batch details
             formatted_items = []
-            crossjoin_data = crossjoin_response.json().get('value', [])
-            
-            logging.info(f"📦 Found {len(crossjoin_data)} items in warehouse {warehouse_code}")
+            for row in stock_rows:
+                item_code = row.get('ItemCode', '')
+                in_stock_qty = float(row.get('OnHandQty') or 0)
+                if not item_code or in_stock_qty <= 0:
+                    continue
+                formatted_items.append(self._build_bin_item(
+                    item_code=item_code,
+                    item_name=row.get('ItemName', ''),
+                    uom=row.get('InvntryUom', ''),
+                    quantity_on_stock=float(row.get('QuantityOnStock') or in_stock_qty),
+                    in_stock_qty=in_stock_qty,
+                    ordered=float(row.get('Ordered') or 0),
+                    avg_price=float(row.get('AvgPrice') or 0),
+                    warehouse_code=warehouse_code,
+                    bin_code=bin_code,
+                    abs_entry=abs_entry,
+                    business_place_id=business_place_id,
+                    batch_details=batches_by_item.get(item_code, [])))
+
+            logging.info(f"🎯 Found {len(formatted_items)} items in bin {bin_code}")
+            return formatted_items
+
+        except requests.RequestException as e:
+            # SAP answered with an error or not at all - an empty bin would be a wrong answer
+            logging.error(f"❌ SAP error in bin scanning: {str(e)}")
+            raise
+        except Exception as e:
+            logging.error(f"❌ Error in bin scanning: {str(e)}")
+            return []
+
+    @staticmethod
+    def _bin_code_call(bin_code):
+        return ('GET', f"BinLocations?$select=AbsEntry,BinCode,Warehouse&$filter=BinCode eq '{bin_code}'", None)
+
+    def _resolve_bin_code(self, bin_code, response=None):
+        """Look up AbsEntry and Warehouse for a bin code (optionally from a $batch response)"""
+        cache_key = f"code:{bin_code}"
+        cached = self._bin_location_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if response is None:
+            _, path, _ = self._bin_code_call(bin_code)
+            response = self.session.get(f"{self.base_url}/b1s/v1/{path}", timeout=30)
+        if response.status_code != 200:
+            logging.warning(f"❌ Bin {bin_code} lookup failed: {response.status_code}")
+            return None
+
+        bin_data = response.json().get('value', [])
+        if not bin_data:
+            return None
+        self._bin_location_cache.set(cache_key, bin_data[0])
+        return bin_data[0]
+
+    def _run_sql_query(self, query_name, param_list=None, timeout=30):
+        """Run a stored SAP SQL query; returns its rows, or None when the query is unavailable"""
+        _, path, payload = self._sql_query_call(query_name, param_list)
+        response = self.session.post(f"{self.base_url}/b1s/v1/{path}", json=payload, timeout=timeout)
+        return self._sql_query_rows(query_name, response)
+
+    def _build_bin_item(self, item_code, item_name, uom, quantity_on_stock, in_stock_qty,
+                        ordered, avg_price, warehouse_code, bin_code, abs_entry,
+                        business_place_id, batch_details):
+        """Shape one bin item the way bin_scanning.html expects it"""
+        enhanced_item = {
+            'ItemCode': item_code,
+            'ItemName': item_name,
+            'UoM': uom,
+            'QuantityOnStock': quantity_on_stock,
+            'OnHand': in_stock_qty,
+            'OnStock': in_stock_qty,
+            'InStock': in_stock_qty,
+            'Ordered': ordered,
+            'StandardAveragePrice': avg_price,
+            'WarehouseCode': warehouse_code,
+            'Warehouse': warehouse_code,
+            'BinCode': bin_code,
+            'BinAbsEntry': abs_entry,
+            'BusinessPlaceID': business_place_id,
+            'BatchDetails': batch_details
+        }
 
+        # Add batch summary for display
+        if batch_details:
+            first_batch = batch_details[0]
+            enhanced_item['BatchCount'] = len(batch_details)
+            enhanced_item['BatchNumbers'] = [b.get('Batch', '') for b in batch_details]
+            enhanced_item['ExpiryDates'] = [b.get('ExpirationDate') for b in batch_details if b.get('ExpirationDate')]
+            enhanced_item['AdmissionDates'] = [b.get('AdmissionDate') for b in batch_details if b.get('AdmissionDate')]
+            # Use first batch info for main display
+            enhanced_item['BatchNumber'] = first_batch.get('Batch', '')
+            enhanced_item['Batch'] = first_batch.get('Batch', '')
+            enhanced_item['Status'] = first_batch.get('Status', 'bdsStatus_Released')
+            enhanced_item['AdmissionDate'] = first_batch.get('AdmissionDate', '')
+            enhanced_item['ExpirationDate'] = first_batch.get('ExpirationDate', '')
+            enhanced_item['ExpiryDate'] = first_batch.get('ExpirationDate', '')
+        else:
+            enhanced_item['BatchCount'] = 0
+            enhanced_item['BatchNumbers'] = []
+            enhanced_item['ExpiryDates'] = []
+            enhanced_item['AdmissionDates'] = []
+            enhanced_item['BatchNumber'] = ''
+            enhanced_item['Batch'] = ''
+            enhanced_item['Status'] = 'No Batch'
+            enhanced_item['AdmissionDate'] = ''
+            enhanced_item['ExpirationDate'] = ''
+            enhanced_item['ExpiryDate'] = ''
+
+        # Add legacy fields for compatibility
+        enhanced_item['Quantity'] = enhanced_item['OnHand']
+        enhanced_item['ItemDescription'] = enhanced_item['ItemName']
+        return enhanced_item
+
+    def _get_bin_items_from_warehouse(self, bin_code, warehouse_code, abs_entry, business_place_id):
+        """Legacy bin scan: whole-warehouse crossjoin plus per-item batch lookups.
+
+        Only used when the bin-scoped SQL queries are not defined in SAP B1.
+        """
+        crossjoin_data = self.iter_odata(
+            '$crossjoin(Items,Items/ItemWarehouseInfoCollection)',
+            filter_clause=(f"Items/ItemCode eq Items/ItemWarehouseInfoCollection/ItemCode and "
+                           f"Items/ItemWarehouseInfoCollection/WarehouseCode eq '{warehouse_code}'"),
+            params={'$expand': ("Items($select=ItemCode,ItemName,QuantityOnStock),"
+                                "Items/ItemWarehouseInfoCollection($select=InStock,Ordered,StandardAveragePrice)")},
+            page_size=300)
+
+        formatted_items = []
+        scanned = 0
+        try:
             for item_data in crossjoin_data:
+                scanned += 1
                 try:
                     item_info = item_data.get('Items', {})
                     warehouse_info = item_data.get('Items/ItemWarehouseInfoCollection', {})
-                    
+
                     item_code = item_info.get('ItemCode', '')
                     if not item_code:
                         continue
 
-                    # Step 5: Get batch details for this item using your exact API pattern
-                    batch_details = self._get_item_batch_details(item_code)
-                    
-                    # Skip items with zero InStock quantity
+                    # Skip items with zero InStock quantity before looking up batches
                     in_stock_qty = float(warehouse_info.get('InStock', 0))
                     if in_stock_qty <= 0:
-                        logging.debug(f"⏭️ Skipping item {item_code} - InStock quantity is {in_stock_qty}")
                         continue
-                    
-                    # Create enhanced item record with all details
-                    enhanced_item = {
-                        'ItemCode': item_code,
-                        'ItemName': item_info.get('ItemName', ''),
-                        'UoM': item_info.get('InventoryUoM', ''),
-                        'QuantityOnStock': float(item_info.get('QuantityOnStock', 0)),
-                        'OnHand': in_stock_qty,
-                        'OnStock': in_stock_qty,
-                        'InStock': in_stock_qty,
-                        'Ordered': float(warehouse_info.get('Ordered', 0)),
-                        'StandardAveragePrice': float(warehouse_info.get('StandardAveragePrice', 0)),
-                        'WarehouseCode': warehouse_code,
-                        'Warehouse': warehouse_code,
-                        'BinCode': bin_code,
-                        'BinAbsEntry': abs_entry,
-                        'BusinessPlaceID': business_place_id,
-                        'BatchDetails': batch_details
-                    }
 
-                    # Add batch summary for display
-                    if batch_details:
-                        enhanced_item['BatchCount'] = len(batch_details)
-                        enhanced_item['BatchNumbers'] = [b.get('Batch', '') for b in batch_details]
-                        enhanced_item['ExpiryDates'] = [b.get('ExpirationDate') for b in batch_details if b.get('ExpirationDate')]
-                        enhanced_item['AdmissionDates'] = [b.get('AdmissionDate') for b in batch_details if b.get('AdmissionDate')]
-                        # Use first batch info for main display
-                        if batch_details:
-                            first_batch = batch_details[0]
-                            enhanced_item['BatchNumber'] = first_batch.get('Batch', '')
-                            enhanced_item['Batch'] = first_batch.get('Batch', '')
-                            enhanced_item['Status'] = first_batch.get('Status', 'bdsStatus_Released')
-                            enhanced_item['AdmissionDate'] = first_batch.get('AdmissionDate', '')
-                            enhanced_item['ExpirationDate'] = first_batch.get('ExpirationDate', '')
-                            enhanced_item['ExpiryDate'] = first_batch.get('ExpirationDate', '')
-                    else:
-                        enhanced_item['BatchCount'] = 0
-                        enhanced_item['BatchNumbers'] = []
-                        enhanced_item['ExpiryDates'] = []
-                        enhanced_item['AdmissionDates'] = []
-                        enhanced_item['BatchNumber'] = ''
-                        enhanced_item['Batch'] = ''
-                        enhanced_item['Status'] = 'No Batch'
-                        enhanced_item['AdmissionDate'] = ''
-                        enhanced_item['ExpirationDate'] = ''
-                        enhanced_item['ExpiryDate'] = ''
-
-                    # Add legacy fields for compatibility
-                    enhanced_item['Quantity'] = enhanced_item['OnHand']
-                    enhanced_item['ItemDescription'] = enhanced_item['ItemName']
-
-                    formatted_items.append(enhanced_item)
-                    
-                    logging.debug(f"✅ Enhanced item: {item_code} - OnHand: {enhanced_item['OnHand']}, Batches: {enhanced_item['BatchCount']}")
+                    formatted_items.append(self._build_bin_item(
+                        item_code=item_code,
+                        item_name=item_info.get('ItemName', ''),
+                        uom=item_info.get('InventoryUoM', ''),
+                        quantity_on_stock=float(item_info.get('QuantityOnStock', 0)),
+                        in_stock_qty=in_stock_qty,
+                        ordered=float(warehouse_info.get('Ordered', 0)),
+                        avg_price=float(warehouse_info.get('StandardAveragePrice', 0)),
+                        warehouse_code=warehouse_code,
+                        bin_code=bin_code,
+                        abs_entry=abs_entry,
+                        business_place_id=business_place_id,
+                        batch_details=self._get_item_batch_details(item_code)))
 
                 except Exception as item_error:
                     logging.error(f"❌ Error processing item: {str(item_error)}")
                     continue
-
-            logging.info(f"🎯 Successfully enhanced {len(formatted_items)} items for bin {bin_code}")
+        except requests.HTTPError as e:
+            logging.error(f"❌ Failed to get warehouse items: {str(e)}")
             return formatted_items
 
-        except Exception as e:
-            logging.error(f"❌ Error in enhanced bin scanning: {str(e)}")
-            return []
+        logging.info(f"📦 Scanned {scanned} items in warehouse {warehouse_code}")
+        logging.info(f"🎯 Successfully enhanced {len(formatted_items)} items for bin {bin_code}")
+        return formatted_items
 
     def _get_item_batch_details(self, item_code):
         """Get batch details for a specific item using your exact BatchNumberDetails API pattern"""
         try:
-            batch_url = f"{self.base_url}/b1s/v1/BatchNumberDetails?$filter=ItemCode eq '{item_code}'"
             logging.debug(f"[DEBUG] Getting batch details for {item_code}")
             
-            batch_response = self.session.get(batch_url)
-            if batch_response.status_code == 200:
-                batch_data = batch_response.json().get('value', [])
-                logging.debug(f"✅ Found {len(batch_data)} batches for item {item_code}")
-                return batch_data
-            else:
-                logging.debug(f"⚠️ No batch details found for item {item_code}")
-                return []
+            batch_data = list(self.iter_odata('BatchNumberDetails', filter_clause=f"ItemCode eq '{item_code}'",
+                                              timeout=30))
+            logging.debug(f"✅ Found {len(batch_data)} batches for item {item_code}")
+            return batch_data
                 
+        except requests.HTTPError:
+            logging.debug(f"⚠️ No batch details found for item {item_code}")
+            return []
         except Exception as e:
             logging.error(f"❌ Error getting batch details for {item_code}: {str(e)}")
             return []
@@ -1055,24 +1458,18 @@ class SAPIntegration:
 
         try:
             # Get bins from SAP B1
-            url = f"{self.base_url}/b1s/v1/BinLocations"
-            params = {
-                '$filter': f"Warehouse eq '{warehouse_code}' and Active eq 'Y'"
-            }
-
-            response = self.session.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                bins = []
-                for bin_data in data.get('value', []):
-                    bins.append({
-                        'BinCode': bin_data.get('BinCode'),
-                        'Description': bin_data.get('Description', '')
-                    })
-                return bins
-            else:
-                logging.error(f"Failed to get bins from SAP: {response.text}")
-                return []
+            bins = []
+            for bin_data in self.iter_odata('BinLocations',
+                                            filter_clause=f"Warehouse eq '{warehouse_code}' and Active eq 'Y'"):
+                bins.append({
+                    'BinCode': bin_data.get('BinCode'),
+                    'Description': bin_data.get('Description', '')
+                })
+            return bins
+
+        except requests.HTTPError as e:
+            logging.error(f"Failed to get bins from SAP: {str(e)}")
+            return []
 
         except Exception as e:
             logging.error(f"Error getting bins from SAP: {str(e)}")
@@ -1108,7 +1505,7 @@ class SAPIntegration:
         for item in grpo_document.items:
             line = {
                 "ItemCode": item.item_code,
-                "Quantity": item.received_quantity,
+                "Quantity": float(item.received_quantity or 0),
                 "UnitOfMeasure": item.unit_of_measure,
                 "WarehouseCode": "WH01",  # Default warehouse
                 "BinCode": item.bin_location
@@ -1243,8 +1640,9 @@ class SAPIntegration:
     def get_batch_numbers(self, item_code):
         """Get batch numbers for specific item from SAP B1 BatchNumberDetails"""
         # Check cache first
-        if item_code in self._batch_cache:
-            return self._batch_cache[item_code]
+        cached = self._batch_cache.get(item_code)
+        if cached is not None:
+            return cached
 
         if not self.ensure_logged_in():
             logging.warning(
@@ -1256,29 +1654,23 @@ class SAPIntegration:
             }, {
 
             }]
-            self._batch_cache[item_code] = mock_batches
             return mock_batches
 
         try:
-            url = f"{self.base_url}/b1s/v1/BatchNumberDetails?$filter=ItemCode eq '{item_code}' and Status eq 'bdsStatus_Released'"
-            logging.info(f"🔍 Fetching batch numbers from SAP B1: {url}")
+            filter_clause = f"ItemCode eq '{item_code}' and Status eq 'bdsStatus_Released'"
+            logging.info(f"🔍 Fetching batch numbers from SAP B1: {filter_clause}")
 
-            response = self.session.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                batches = data.get('value', [])
-                logging.info(
-                    f"📦 Found {len(batches)} batch numbers for item {item_code}"
-                )
+            batches = list(self.iter_odata('BatchNumberDetails', filter_clause=filter_clause, timeout=30))
+            logging.info(
+                f"📦 Found {len(batches)} batch numbers for item {item_code}"
+            )
 
-                # Cache the results
-                self._batch_cache[item_code] = batches
-                return batches
-            else:
-                logging.warning(
-                    f"Failed to fetch batch numbers: {response.status_code} - {response.text}"
-                )
-                return []
+            # Cache the results
+            self._batch_cache.set(item_code, batches)
+            return batches
+        except requests.HTTPError as e:
+            logging.warning(f"Failed to fetch batch numbers: {str(e)}")
+            return []
         except Exception as e:
             logging.error(
                 f"Error fetching batch numbers for {item_code}: {str(e)}")
@@ -1300,22 +1692,15 @@ class SAPIntegration:
             # if warehouse_code:
             #     filter_clause += f" and Warehouse eq '{warehouse_code}'"
 
-            url = f"{self.base_url}/b1s/v1/BatchNumberDetails?$filter={filter_clause}&$select=Batch,ExpirationDate,ManufacturingDate"
-
-            response = self.session.get(url)
-
-            if response.status_code == 200:
-                data = response.json()
-                batches = data.get('value', [])
-                logging.info(
-                    f"✅ Found {len(batches)} batches for item {item_code}")
-                return batches
-            else:
-                logging.error(
-                    f"❌ SAP B1 API error getting batches: {response.status_code}"
-                )
-                return self._get_mock_batch_data(item_code)
+            batches = list(self.iter_odata('BatchNumberDetails', filter_clause=filter_clause,
+                                           select='Batch,ExpirationDate,ManufacturingDate'))
+            logging.info(
+                f"✅ Found {len(batches)} batches for item {item_code}")
+            return batches
 
+        except requests.HTTPError as e:
+            logging.error(f"❌ SAP B1 API error getting batches: {str(e)}")
+            return self._get_mock_batch_data(item_code)
         except Exception as e:
             logging.error(f"❌ Error getting batches from SAP B1: {str(e)}")
             return self._get_mock_batch_data(item_code)
@@ -1377,15 +1762,15 @@ class SAPIntegration:
         """Get warehouse and bin code from BinLocations API by AbsEntry"""
         try:
             # Check cache first
-            if bin_abs_entry in self._bin_location_cache:
-                return self._bin_location_cache[bin_abs_entry]
+            cached = self._bin_location_cache.get(bin_abs_entry)
+            if cached is not None:
+                return cached
             
             if not self.ensure_logged_in():
                 logging.warning("⚠️ SAP B1 not available, returning mock bin location")
                 mock_data = {
 
                 }
-                self._bin_location_cache[bin_abs_entry] = mock_data
                 return mock_data
             
             # Use the exact API URL format from user's request
@@ -1406,7 +1791,7 @@ class SAPIntegration:
                     }
                     
                     # Cache the result
-                    self._bin_location_cache[bin_abs_entry] = result
+                    self._bin_location_cache.set(bin_abs_entry, result)
                     logging.info(f"✅ Found bin location: {result['Warehouse']} - {result['BinCode']}")
                     return result
                 else:
@@ -1437,13 +1822,20 @@ class SAPIntegration:
         try:
             if not pick_list_data or 'PickListsLines' not in pick_list_data:
                 return pick_list_data
+
+            # Resolve every bin of the pick list at once: cache, local bin map, then one SAP query
+            abs_entries = {allocation.get('BinAbsEntry')
+                           for line in pick_list_data['PickListsLines']
+                           for allocation in (line.get('DocumentLinesBinAllocations') or [])
+                           if allocation.get('BinAbsEntry')}
+            resolved = self._prefetch_bin_locations(abs_entries)
             
             for line in pick_list_data['PickListsLines']:
                 if 'DocumentLinesBinAllocations' in line and line['DocumentLinesBinAllocations']:
                     for bin_allocation in line['DocumentLinesBinAllocations']:
                         bin_abs_entry = bin_allocation.get('BinAbsEntry')
                         if bin_abs_entry:
-                            bin_details = self.get_bin_location_details(bin_abs_entry)
+                            bin_details = resolved.get(bin_abs_entry) or self.get_bin_location_details(bin_abs_entry)
                             # Add warehouse and bin code to the bin allocation
                             bin_allocation['Warehouse'] = bin_details.get('Warehouse', 'Unknown')
                             bin_allocation['BinCode'] = bin_details.get('BinCode', f'Bin-{bin_abs_entry}')
@@ -1454,11 +1846,83 @@ class SAPIntegration:
             logging.error(f"❌ Error enhancing pick list with bin details: {str(e)}")
             return pick_list_data
 
+    def _prefetch_bin_locations(self, abs_entries):
+        """Resolve bin AbsEntries to Warehouse/BinCode, filling the bin location cache.
+
+        Looks in sap_cache first, then in the local bin_locations map (sap_abs_entry, kept
+        current by the bins sync) and asks SAP only for the rest: one BinLocations query per
+        SAP_BIN_LOOKUP_CHUNK entries, whose answers are added to the local map.
+        """
+        resolved = {}
+        missing = {}
+        for abs_entry in abs_entries:
+            cached = self._bin_location_cache.get(abs_entry)
+            if cached is not None:
+                resolved[abs_entry] = cached
+            else:
+                try:
+                    missing[int(abs_entry)] = abs_entry
+                except (TypeError, ValueError):
+                    continue
+        if not missing:
+            return resolved
+
+        def remember(number, bin_code, warehouse):
+            abs_entry = missing.pop(number)
+            result = {'Warehouse': warehouse or '', 'BinCode': bin_code or '', 'AbsEntry': abs_entry}
+            self._bin_location_cache.set(abs_entry, result)
+            resolved[abs_entry] = result
+
+        from models import BinLocation
+        # Newest first: rows written before the AbsEntry moved to a renamed bin may still carry it
+        for bin_location in BinLocation.query.filter(BinLocation.sap_abs_entry.in_(list(missing))) \
+                .order_by(BinLocation.updated_at.desc()):
+            if bin_location.sap_abs_entry in missing:
+                remember(bin_location.sap_abs_entry, bin_location.bin_code, bin_location.warehouse_code)
+        if not missing or not self.ensure_logged_in():
+            return resolved
+
+        numbers = list(missing)
+        found = []
+        for start in range(0, len(numbers), BIN_LOOKUP_CHUNK):
+            chunk = numbers[start:start + BIN_LOOKUP_CHUNK]
+            try:
+                # One page holds the whole chunk, so there is no follow-up request
+                for bin_location in self.iter_odata('BinLocations',
+                                                    filter_clause=' or '.join(f"AbsEntry eq {n}" for n in chunk),
+                                                    select='AbsEntry,BinCode,Warehouse', page_size=len(chunk) + 1,
+                                                    timeout=30):
+                    if bin_location.get('AbsEntry') in missing:
+                        found.append(bin_location)
+                        remember(bin_location['AbsEntry'], bin_location.get('BinCode'), bin_location.get('Warehouse'))
+            except requests.HTTPError as e:
+                logging.warning(f"⚠️ Could not look up {len(chunk)} bin locations: {str(e)}")
+        self._store_bin_locations(found)
+        logging.info(f"✅ Resolved {len(resolved)} of {len(abs_entries)} pick list bin locations "
+                     f"({len(found)} from SAP B1)")
+        return resolved
+
+    def _store_bin_locations(self, bin_locations):
+        """Add BinLocations rows fetched from SAP to the local AbsEntry map, outside the caller's transaction"""
+        rows = [{'bin_code': b['BinCode'], 'warehouse_code': b['Warehouse'], 'sap_abs_entry': b['AbsEntry']}
+                for b in bin_locations if b.get('BinCode') and b.get('Warehouse')]
+        if not rows:
+            return
+        try:
+            from sqlalchemy.orm import Session
+            from app import db
+
+            with Session(db.engine) as session:
+                _upsert_bin_locations(rows, session=session)
+                session.commit()
+        except Exception as e:
+            logging.warning(f"⚠️ Could not store {len(rows)} bin locations locally: {str(e)}")
+
     def _get_mock_batch_data(self, item_code):
         """Return mock batch data for offline testing"""
         return []
 
-    def create_inventory_transfer(self, transfer_document):
+    def create_inventory_transfer(self, transfer_document, reference=None):
         """Create Stock Transfer in SAP B1 with correct JSON structure"""
         if not self.ensure_logged_in():
             logging.warning(
@@ -1563,6 +2027,8 @@ class SAPIntegration:
             "ToWarehouse": transfer_document.to_warehouse,
             "StockTransferLines": stock_transfer_lines
         }
+        if reference:
+            transfer_data["Reference2"] = reference
         print(f"transfer_item (repr) --> {repr(transfer_data)}")
         # Log the JSON payload for debugging
         logging.info(f"📤 Sending stock transfer to SAP B1:")
@@ -1579,13 +2045,14 @@ class SAPIntegration:
                 )
                 return {
                     'success': True,
-                    'document_number': result.get('DocNum')
+                    'document_number': result.get('DocNum'),
+                    'doc_entry': result.get('DocEntry')
                 }
             else:
                 error_msg = f"SAP B1 error: {response.text}"
                 logging.error(
                     f"❌ Failed to create stock transfer: {error_msg}")
-                return {'success': False, 'error': error_msg}
+                return {'success': False, 'error': error_msg, 'status_code': response.status_code}
         except Exception as e:
             logging.error(
                 f"❌ Error creating stock transfer in SAP B1: {str(e)}")
@@ -1754,6 +2221,32 @@ class SAPIntegration:
                 f"Error creating inventory counting in SAP B1: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    @staticmethod
+    def _pick_list_filter(status_filter=None, date_filter=None):
+        """Server-side $filter for pick lists; ps_Closed lists are excluded unless asked for"""
+        filters = []
+        if status_filter:
+            if status_filter != 'ps_Closed':
+                filters.append(f"Status eq '{status_filter}'")
+        else:
+            filters.append("Status ne 'ps_Closed'")
+        if date_filter:
+            filters.append(f"PickDate ge '{date_filter}'")
+        return " and ".join(filters) or None
+
+    def iter_pick_lists(self, status_filter=None, date_filter=None, page_size=None):
+        """Stream pick lists with their lines page by page (server-side $filter/$select).
+
+        Yields only pick lists that have ps_Released lines (or no lines yet).
+        Raises requests.HTTPError when a page cannot be fetched.
+        """
+        for pick_list in self.iter_odata('PickLists', filter_clause=self._pick_list_filter(status_filter, date_filter),
+                                         select=f'{PICK_LIST_FIELDS},PickListsLines',
+                                         page_size=page_size or PICK_LIST_PAGE_SIZE, prefetch=True):
+            pick_list_lines = pick_list.get('PickListsLines') or []
+            if not pick_list_lines or any(line.get('PickStatus') == 'ps_Released' for line in pick_list_lines):
+                yield pick_list
+
     def get_pick_lists(self, limit=100, offset=0, status_filter=None, date_filter=None):
         """Get pick lists from SAP B1 focusing on ps_released items, avoiding ps_closed"""
         if not self.ensure_logged_in():
@@ -1761,63 +2254,40 @@ class SAPIntegration:
             return self._get_mock_pick_lists()
 
         try:
-            # Build filter parameters - focus on ps_released, avoid ps_closed
-            filters = []
-            
-            # Default to filtering out ps_closed status unless specifically requested
-            if status_filter:
-                if status_filter != 'ps_Closed':
-                    filters.append(f"Status eq '{status_filter}'")
-            else:
-                # Default: avoid ps_closed items, prefer ps_released
-                filters.append(f"Status ne 'ps_Closed'")
-            
-            if date_filter:
-                filters.append(f"PickDate ge '{date_filter}'")
-            
-            filter_clause = " and ".join(filters) if filters else ""
-            
-            # Construct URL with OData parameters
-            url = f"{self.base_url}/b1s/v1/PickLists"
-            if filter_clause:
-                url += f"?$filter={filter_clause}"
-            
-            logging.info(f"🔍 Fetching pick lists from SAP B1 (avoiding ps_closed): {url}")
-            response = self.session.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                pick_lists = data.get('value', [])
-                
-                # Additional filtering for ps_released line items
-                filtered_pick_lists = []
-                for pick_list in pick_lists:
-                    # Check if pick list has ps_released line items
-                    has_released_items = False
-                    pick_list_lines = pick_list.get('PickListsLines', [])
-                    for line in pick_list_lines:
-                        if line.get('PickStatus') == 'ps_Released':
-                            has_released_items = True
-                            break
-                    
-                    # Only include pick lists that have ps_released items
-                    if has_released_items or not pick_list_lines:  # Include empty pick lists too
-                        filtered_pick_lists.append(pick_list)
-                
-                logging.info(f"✅ Found {len(filtered_pick_lists)} pick lists with ps_released items (filtered from {len(pick_lists)} total)")
-                return {
-                    'success': True,
-                    'pick_lists': filtered_pick_lists,
-                    'total_count': len(filtered_pick_lists)
-                }
-            else:
-                logging.error(f"❌ Error fetching pick lists: {response.status_code} - {response.text}")
-                return {'success': False, 'error': f'HTTP {response.status_code}'}
-                
+            logging.info(f"🔍 Fetching pick lists from SAP B1 (avoiding ps_closed): "
+                         f"{self._pick_list_filter(status_filter, date_filter)}")
+            # Only the pages needed for offset + limit are requested
+            stop = offset + limit if limit is not None else None
+            pick_lists = list(itertools.islice(
+                self.iter_pick_lists(status_filter, date_filter,
+                                     page_size=min(stop, PICK_LIST_PAGE_SIZE) if stop else None), offset, stop))
+            logging.info(f"✅ Found {len(pick_lists)} pick lists with ps_released items")
+            return {
+                'success': True,
+                'pick_lists': pick_lists,
+                'total_count': len(pick_lists)
+            }
+        except requests.HTTPError as e:
+            logging.error(f"❌ Error fetching pick lists: {str(e)}")
+            return {'success': False, 'error': f'HTTP {e.response.status_code}'}
         except Exception as e:
             logging.error(f"Error getting pick lists from SAP B1: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    def count_pick_lists(self, status_filter=None):
+        """Number of pick lists in SAP B1 matching the filter (open ones by default), or None"""
+        if not self.ensure_logged_in():
+            return None
+        try:
+            response = self.session.get(f"{self.base_url}/b1s/v1/PickLists/$count",
+                                        params={'$filter': self._pick_list_filter(status_filter)}, timeout=30)
+            if response.status_code == 200:
+                return int(response.text.strip().lstrip('\ufeff'))
+            logging.warning(f"Failed to count pick lists: {response.status_code}")
+        except Exception as e:
+            logging.warning(f"Error counting pick lists: {str(e)}")
+        return None
+
     def get_pick_list_by_id(self, absolute_entry):
         """Get specific pick list from SAP B1 by AbsoluteEntry with full line items and bin allocations"""
         if not self.ensure_logged_in():
@@ -1917,68 +2387,79 @@ class SAPIntegration:
                 }]
         }
 
+    @staticmethod
+    def _pick_list_line_rows(sap_lines, pick_list_id):
+        """PickListLine rows for the non-closed SAP lines, plus each line's bin allocation rows"""
+        line_rows = []
+        line_allocations = []
+        for sap_line in sap_lines:
+            pick_status = sap_line.get('PickStatus', 'ps_Open')
+            
+            # Skip ps_closed items - only sync ps_released and other active statuses
+            if pick_status == 'ps_Closed':
+                continue
+            
+            line_rows.append({
+                'pick_list_id': pick_list_id,
+                'absolute_entry': sap_line.get('AbsoluteEntry'),
+                'line_number': sap_line.get('LineNumber', 0),
+                'order_entry': sap_line.get('OrderEntry'),
+                'order_row_id': sap_line.get('OrderRowID'),
+                'picked_quantity': float(sap_line.get('PickedQuantity', 0)),
+                'pick_status': pick_status,
+                'released_quantity': float(sap_line.get('ReleasedQuantity', 0)),
+                'previously_released_quantity': float(sap_line.get('PreviouslyReleasedQuantity', 0)),
+                'base_object_type': sap_line.get('BaseObjectType', 17),
+                'serial_numbers': json.dumps(sap_line.get('SerialNumbers', [])),
+                'batch_numbers': json.dumps(sap_line.get('BatchNumbers', []))
+            })
+            
+            # DocumentLinesBinAllocations rows, linked to the line once its id is known
+            line_allocations.append([{
+                'bin_abs_entry': bin_allocation.get('BinAbsEntry'),
+                'quantity': float(bin_allocation.get('Quantity', 0)),
+                'allow_negative_quantity': bin_allocation.get('AllowNegativeQuantity', 'tNO'),
+                'serial_and_batch_numbers_base_line': bin_allocation.get('SerialAndBatchNumbersBaseLine', 0),
+                'base_line_number': bin_allocation.get('BaseLineNumber')
+            } for bin_allocation in sap_line.get('DocumentLinesBinAllocations') or []])
+        return line_rows, line_allocations
+
+    @staticmethod
+    def _replace_pick_list_lines(pick_list_ids, line_rows, line_allocations):
+        """Delete the lines and bin allocations of pick_list_ids and bulk insert the given ones"""
+        from app import db
+        from bulk_upsert import bulk_insert
+        from models import PickListLine, PickListBinAllocation
+        
+        if pick_list_ids:
+            line_ids = db.session.query(PickListLine.id).filter(PickListLine.pick_list_id.in_(pick_list_ids))
+            PickListBinAllocation.query.filter(PickListBinAllocation.pick_list_line_id.in_(line_ids.scalar_subquery())
+                                               ).delete(synchronize_session=False)
+            PickListLine.query.filter(PickListLine.pick_list_id.in_(pick_list_ids)).delete(synchronize_session=False)
+        
+        keys = [(row['pick_list_id'], row['line_number']) for row in line_rows]
+        if len(set(keys)) == len(keys):
+            # One executemany for the lines; their ids are read back with one query
+            bulk_insert(PickListLine, line_rows)
+            ids = {(pick_list_id, line_number): line_id for line_id, pick_list_id, line_number in
+                   db.session.query(PickListLine.id, PickListLine.pick_list_id, PickListLine.line_number)
+                   .filter(PickListLine.pick_list_id.in_({row['pick_list_id'] for row in line_rows}))}
+            inserted_ids = [ids[key] for key in keys]
+        else:
+            # Duplicate line numbers: RETURNING where supported, otherwise one INSERT per line
+            inserted_ids = bulk_insert(PickListLine, line_rows, return_ids=True)
+        bulk_insert(PickListBinAllocation, [dict(allocation, pick_list_line_id=line_id)
+                                            for line_id, allocations in zip(inserted_ids, line_allocations)
+                                            for allocation in allocations])
+
     def sync_pick_list_to_local_db(self, sap_pick_list, local_pick_list):
         """Sync SAP B1 pick list line items and bin allocations to local database"""
         from app import db
-        from models import PickListLine, PickListBinAllocation
-        import json
         
         try:
-            # Clear existing lines and bin allocations - Fix for SQLAlchemy join delete issue
-            # First get the IDs of bin allocations to delete
-            pick_list_line_ids = [line.id for line in PickListLine.query.filter_by(pick_list_id=local_pick_list.id).all()]
-            
-            if pick_list_line_ids:
-                # Delete bin allocations first (foreign key dependency)
-                PickListBinAllocation.query.filter(PickListBinAllocation.pick_list_line_id.in_(pick_list_line_ids)).delete(synchronize_session=False)
-                
-                # Then delete pick list lines
-                PickListLine.query.filter_by(pick_list_id=local_pick_list.id).delete(synchronize_session=False)
-            
-            # Sync PickListsLines from SAP B1 - Focus on ps_released, avoid ps_closed
             sap_lines = sap_pick_list.get('PickListsLines', [])
-            for sap_line in sap_lines:
-                pick_status = sap_line.get('PickStatus', 'ps_Open')
-                
-                # Skip ps_closed items - only sync ps_released and other active statuses
-                if pick_status == 'ps_Closed':
-                    logging.info(f"⏭️ Skipping ps_Closed line item {sap_line.get('LineNumber', 0)}")
-                    continue
-                
-                # Prefer ps_released items
-                if pick_status == 'ps_Released':
-                    logging.info(f"✅ Syncing ps_Released line item {sap_line.get('LineNumber', 0)}")
-                
-                # Create PickListLine
-                pick_list_line = PickListLine(
-                    pick_list_id=local_pick_list.id,
-                    absolute_entry=sap_line.get('AbsoluteEntry'),
-                    line_number=sap_line.get('LineNumber', 0),
-                    order_entry=sap_line.get('OrderEntry'),
-                    order_row_id=sap_line.get('OrderRowID'),
-                    picked_quantity=float(sap_line.get('PickedQuantity', 0)),
-                    pick_status=pick_status,
-                    released_quantity=float(sap_line.get('ReleasedQuantity', 0)),
-                    previously_released_quantity=float(sap_line.get('PreviouslyReleasedQuantity', 0)),
-                    base_object_type=sap_line.get('BaseObjectType', 17),
-                    serial_numbers=json.dumps(sap_line.get('SerialNumbers', [])),
-                    batch_numbers=json.dumps(sap_line.get('BatchNumbers', []))
-                )
-                db.session.add(pick_list_line)
-                db.session.flush()  # Get the ID
-                
-                # Sync DocumentLinesBinAllocations
-                bin_allocations = sap_line.get('DocumentLinesBinAllocations', [])
-                for bin_allocation in bin_allocations:
-                    pick_list_bin_allocation = PickListBinAllocation(
-                        pick_list_line_id=pick_list_line.id,
-                        bin_abs_entry=bin_allocation.get('BinAbsEntry'),
-                        quantity=float(bin_allocation.get('Quantity', 0)),
-                        allow_negative_quantity=bin_allocation.get('AllowNegativeQuantity', 'tNO'),
-                        serial_and_batch_numbers_base_line=bin_allocation.get('SerialAndBatchNumbersBaseLine', 0),
-                        base_line_number=bin_allocation.get('BaseLineNumber')
-                    )
-                    db.session.add(pick_list_bin_allocation)
+            line_rows, line_allocations = self._pick_list_line_rows(sap_lines, local_pick_list.id)
+            self._replace_pick_list_lines([local_pick_list.id], line_rows, line_allocations)
             
             # Update pick list totals
             total_lines = len(sap_lines)
@@ -1996,6 +2477,101 @@ class SAPIntegration:
             logging.error(f"❌ Error syncing pick list to local DB: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    def sync_open_pick_lists(self, user_id):
+        """Stream the open SAP B1 pick lists into the local database; new ones are owned by user_id
+        (None leaves them unowned until a picker imports or claims them).
+
+        Each page of PickLists is written with one IN query for the existing headers, bulk
+        header inserts/updates and a bulk replacement of their lines and bin allocations,
+        then committed, so memory stays flat however many pick lists are open.
+        """
+        from app import db
+
+        # Offline, get_pick_lists returns mock data; report the outage instead
+        if not self.ensure_logged_in():
+            return {'success': False, 'error': 'SAP B1 not available'}
+
+        counts = {'synced_count': 0, 'updated_count': 0, 'synced_lines': 0}
+        try:
+            page = []
+            for sap_pick_list in self.iter_pick_lists():
+                if sap_pick_list.get('Absoluteentry'):
+                    page.append(sap_pick_list)
+                if len(page) >= PICK_LIST_PAGE_SIZE:
+                    self._store_pick_list_page(page, user_id, counts)
+                    page = []
+            if page:
+                self._store_pick_list_page(page, user_id, counts)
+
+            logging.info(f"✅ Pick list sync: {counts['synced_count']} new, {counts['updated_count']} updated, "
+                         f"{counts['synced_lines']} lines")
+            return dict(counts, success=True)
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error syncing SAP pick lists: {str(e)}")
+            return dict(counts, success=False, error=str(e))
+
+    def _store_pick_list_page(self, sap_pick_lists, user_id, counts):
+        """Write one page of SAP pick lists (headers, lines, bin allocations) and commit"""
+        from sqlalchemy import update
+        from app import db
+        from bulk_upsert import bulk_insert
+        from models import PickList
+
+        sap_pick_lists = list({pl['Absoluteentry']: pl for pl in sap_pick_lists}.values())
+        entries = [pl['Absoluteentry'] for pl in sap_pick_lists]
+        existing = dict(db.session.query(PickList.absolute_entry, PickList.id)
+                        .filter(PickList.absolute_entry.in_(entries)))
+
+        updates, inserts, inserted = [], [], []
+        for sap_pick_list in sap_pick_lists:
+            sap_lines = sap_pick_list.get('PickListsLines') or []
+            fields = {
+                'status': sap_pick_list.get('Status') or 'ps_Open',
+                'remarks': sap_pick_list.get('Remarks'),
+                'total_items': len(sap_lines),
+                'picked_items': len([line for line in sap_lines if line.get('PickStatus') == 'ps_Closed'])
+            }
+            if sap_pick_list.get('PickDate'):
+                try:
+                    fields['pick_date'] = datetime.strptime(sap_pick_list['PickDate'][:19], '%Y-%m-%dT%H:%M:%S')
+                except ValueError:
+                    pass
+            absolute_entry = sap_pick_list['Absoluteentry']
+            if absolute_entry in existing:
+                updates.append(dict(fields, id=existing[absolute_entry]))
+            else:
+                inserts.append(dict(fields, absolute_entry=absolute_entry, user_id=user_id,
+                                    name=sap_pick_list.get('Name') or f'SAP-{absolute_entry}',
+                                    owner_code=sap_pick_list.get('OwnerCode'),
+                                    owner_name=sap_pick_list.get('OwnerName'),
+                                    object_type=sap_pick_list.get('ObjectType') or '156',
+                                    use_base_units=sap_pick_list.get('UseBaseUnits') or 'tNO'))
+                inserted.append(sap_pick_list)
+
+        if updates:
+            db.session.execute(update(PickList), updates)
+        pick_list_ids = dict(existing)
+        if inserts:
+            # absolute_entry is unique among the new rows, so their ids are read back with one query
+            bulk_insert(PickList, inserts)
+            pick_list_ids.update(db.session.query(PickList.absolute_entry, PickList.id)
+                                 .filter(PickList.absolute_entry.in_([pl['Absoluteentry'] for pl in inserted])))
+
+        line_rows, line_allocations = [], []
+        for sap_pick_list in sap_pick_lists:
+            rows, allocations = self._pick_list_line_rows(sap_pick_list.get('PickListsLines') or [],
+                                                          pick_list_ids[sap_pick_list['Absoluteentry']])
+            line_rows.extend(rows)
+            line_allocations.extend(allocations)
+        self._replace_pick_list_lines(list(existing.values()), line_rows, line_allocations)
+        db.session.commit()
+
+        counts['synced_count'] += len(inserts)
+        counts['updated_count'] += len(updates)
+        counts['synced_lines'] += len(line_rows)
+
     def _get_mock_pick_list_detail(self, absolute_entry):
         """Return mock pick list detail for development"""
         return {
@@ -2005,360 +2581,113 @@ class SAPIntegration:
             }
         }
 
-    def sync_warehouses(self):
-        """Sync warehouses from SAP B1 to local database"""
+    def sync_warehouses(self, full=False):
+        """Sync warehouses changed in SAP B1 since the last run to the local branches table"""
         if not self.ensure_logged_in():
             logging.warning("Cannot sync warehouses - SAP B1 not available")
             return False
 
         try:
-            url = f"{self.base_url}/b1s/v1/Warehouses"
-            response = self.session.get(url)
-
-            if response.status_code == 200:
-                warehouses = response.json().get('value', [])
-
-                from app import db
+            from sap_master_sync import run_delta_sync
 
-                # Clear cache and update database
-                self._warehouse_cache = {}
-
-                for wh in warehouses:
-                    # Check if warehouse exists in branches table
-                    existing = db.session.execute(
-                        db.text("SELECT id FROM branches WHERE id = :id"), {
-                            "id": wh.get('WarehouseCode')
-                        }).fetchone()
-
-                    if not existing:
-                        # Insert new warehouse as branch - use compatible SQL
-                        import os
-                        # Removed circular import
-                        db_uri = os.environ.get('DATABASE_URL', '')
-
-                        if 'postgresql' in db_uri.lower(
-                        ) or 'mysql' in db_uri.lower():
-                            insert_sql = """
-                                INSERT INTO branches (id, name, address, is_active, created_at, updated_at)
-                                VALUES (:id, :name, :address, :is_active, NOW(), NOW())
-                            """
-                        else:
-                            insert_sql = """
-                                INSERT INTO branches (id, name, address, is_active, created_at, updated_at)
-                                VALUES (:id, :name, :address, :is_active, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                            """
-
-                        db.session.execute(
-                            db.text(insert_sql), {
-                                "id": wh.get('WarehouseCode'),
-                                "name": wh.get('WarehouseName', ''),
-                                "address": wh.get('Street', ''),
-                                "is_active": wh.get('Inactive') != 'Y'
-                            })
-                    else:
-                        # Update existing warehouse - use compatible SQL
-                        import os
-                        # Removed circular import
-                        db_uri = os.environ.get('DATABASE_URL', '')
-
-                        if 'postgresql' in db_uri.lower(
-                        ) or 'mysql' in db_uri.lower():
-                            update_sql = """
-                                UPDATE branches SET 
-                                    name = :name, 
-                                    address = :address, 
-                                    is_active = :is_active,
-                                    updated_at = NOW()
-                                WHERE id = :id
-                            """
-                        else:
-                            update_sql = """
-                                UPDATE branches SET 
-                                    name = :name, 
-                                    address = :address, 
-                                    is_active = :is_active,
-                                    updated_at = CURRENT_TIMESTAMP
-                                WHERE id = :id
-                            """
-
-                        db.session.execute(
-                            db.text(update_sql), {
-                                "id": wh.get('WarehouseCode'),
-                                "name": wh.get('WarehouseName', ''),
-                                "address": wh.get('Street', ''),
-                                "is_active": wh.get('Inactive') != 'Y'
-                            })
+            # Clear cache and update database
+            self._warehouse_cache.clear()
+            self._business_place_cache.clear()
 
-                    # Cache warehouse data
-                    self._warehouse_cache[wh.get('WarehouseCode')] = {
-                        'WarehouseCode': wh.get('WarehouseCode'),
-                        'WarehouseName': wh.get('WarehouseName'),
-                        'Address': wh.get('Street'),
-                        'Active': wh.get('Inactive') != 'Y'
-                    }
-
-                db.session.commit()
-                logging.info(
-                    f"Synced {len(warehouses)} warehouses from SAP B1")
-                return True
+            synced = run_delta_sync(self, 'warehouses', 'Warehouses', 'WarehouseCode,WarehouseName,Street,Inactive',
+                                    self._write_warehouses, full=full)
+            logging.info(f"Synced {synced} warehouses from SAP B1")
+            return True
 
         except Exception as e:
             logging.error(f"Error syncing warehouses: {str(e)}")
             return False
 
-    def sync_bins(self, warehouse_code=None):
-        """Sync bin locations from SAP B1"""
+    def _write_warehouses(self, warehouses):
+        """Upsert a chunk of warehouses into the branches table"""
+        from bulk_upsert import bulk_upsert
+        from models_extensions import Branch
+
+        bulk_upsert(Branch, [{
+            "id": wh.get('WarehouseCode'),
+            "name": wh.get('WarehouseName', ''),
+            "address": wh.get('Street', ''),
+            "is_active": not _sap_flag(wh.get('Inactive'))
+        } for wh in warehouses if wh.get('WarehouseCode')], ['id'])
+
+    def sync_bins(self, warehouse_code=None, full=False):
+        """Sync bin locations changed in SAP B1 since the last run"""
         if not self.ensure_logged_in():
             logging.warning("Cannot sync bins - SAP B1 not available")
             return False
 
         try:
-            # Get bins for specific warehouse or all warehouses
-            if warehouse_code:
-                url = f"{self.base_url}/b1s/v1/BinLocations?$filter=Warehouse eq '{warehouse_code}'"
-            else:
-                url = f"{self.base_url}/b1s/v1/BinLocations"
-
-            response = self.session.get(url)
-
-            if response.status_code == 200:
-                bins = response.json().get('value', [])
-
-                # Create bins table if not exists - use compatible SQL
-                from app import db, app
-                import os
-
-                db_uri = os.environ.get('DATABASE_URL', '')
-
-                if 'postgresql' in db_uri.lower():
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS bin_locations (
-                            id SERIAL PRIMARY KEY,
-                            bin_code VARCHAR(50) NOT NULL,
-                            warehouse_code VARCHAR(10) NOT NULL,
-                            bin_name VARCHAR(100),
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT NOW(),
-                            updated_at TIMESTAMP DEFAULT NOW(),
-                            UNIQUE(bin_code, warehouse_code)
-                        )
-                    """
-                elif 'mysql' in db_uri.lower():
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS bin_locations (
-                            id INT AUTO_INCREMENT PRIMARY KEY,
-                            bin_code VARCHAR(50) NOT NULL,
-                            warehouse_code VARCHAR(10) NOT NULL,
-                            bin_name VARCHAR(100),
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT NOW(),
-                            updated_at TIMESTAMP DEFAULT NOW() ON UPDATE NOW(),
-                            UNIQUE KEY unique_bin_warehouse (bin_code, warehouse_code)
-                        )
-                    """
-                else:
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS bin_locations (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            bin_code VARCHAR(50) NOT NULL,
-                            warehouse_code VARCHAR(10) NOT NULL,
-                            bin_name VARCHAR(100),
-                            is_active BOOLEAN DEFAULT 1,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            UNIQUE(bin_code, warehouse_code)
-                        )
-                    """
-
-                db.session.execute(db.text(create_table_sql))
-
-                # Clear cache
-                self._bin_cache = {}
-
-                for bin_data in bins:
-                    bin_code = bin_data.get('BinCode')
-                    wh_code = bin_data.get(
-                        'Warehouse')  # Use 'Warehouse' not 'WarehouseCode'
-
-                    if bin_code and wh_code:
-                        # Upsert bin location - use database-specific syntax
-                        if 'postgresql' in db_uri.lower():
-                            upsert_sql = """
-                                INSERT INTO bin_locations (bin_code, warehouse_code, bin_name, is_active, created_at, updated_at)
-                                VALUES (:bin_code, :warehouse_code, :bin_name, :is_active, NOW(), NOW())
-                                ON CONFLICT (bin_code, warehouse_code) 
-                                DO UPDATE SET 
-                                    bin_name = EXCLUDED.bin_name,
-                                    is_active = EXCLUDED.is_active,
-                                    updated_at = NOW()
-                            """
-                        elif 'mysql' in db_uri.lower():
-                            upsert_sql = """
-                                INSERT INTO bin_locations (bin_code, warehouse_code, bin_name, is_active, created_at, updated_at)
-                                VALUES (:bin_code, :warehouse_code, :bin_name, :is_active, NOW(), NOW())
-                                ON DUPLICATE KEY UPDATE 
-                                    bin_name = VALUES(bin_name),
-                                    is_active = VALUES(is_active),
-                                    updated_at = NOW()
-                            """
-                        else:
-                            # SQLite - use INSERT OR REPLACE
-                            upsert_sql = """
-                                INSERT OR REPLACE INTO bin_locations (bin_code, warehouse_code, bin_name, is_active, created_at, updated_at)
-                                VALUES (:bin_code, :warehouse_code, :bin_name, :is_active, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                            """
-
-                        db.session.execute(
-                            db.text(upsert_sql), {
-                                "bin_code": bin_code,
-                                "warehouse_code": wh_code,
-                                "bin_name": bin_data.get('Description', ''),
-                                "is_active": bin_data.get('Inactive') != 'Y'
-                            })
+            from sap_master_sync import run_delta_sync
 
-                        # Cache bin data
-                        cache_key = f"{wh_code}:{bin_code}"
-                        self._bin_cache[cache_key] = {
-                            'BinCode': bin_code,
-                            'WarehouseCode': wh_code,
-                            'Description': bin_data.get('Description', ''),
-                            'Active': bin_data.get('Inactive') != 'Y'
-                        }
+            # Clear cache
+            self._bin_cache.clear()
+            self._bin_location_cache.clear()
 
-                db.session.commit()
-                logging.info(f"Synced {len(bins)} bin locations from SAP B1")
-                return True
+            # One watermark per warehouse filter, so a single-warehouse sync never skips other warehouses
+            synced = run_delta_sync(self, f'bins:{warehouse_code}' if warehouse_code else 'bins', 'BinLocations',
+                                    'AbsEntry,BinCode,Warehouse,Description,Inactive', self._write_bins,
+                                    base_filter=f"Warehouse eq '{warehouse_code}'" if warehouse_code else None,
+                                    full=full)
+            logging.info(f"Synced {synced} bin locations from SAP B1")
+            return True
 
         except Exception as e:
             logging.error(f"Error syncing bins: {str(e)}")
             return False
 
-    def sync_business_partners(self):
-        """Sync business partners (suppliers/customers) from SAP B1"""
+    def _write_bins(self, bins):
+        """Upsert a chunk of bin locations"""
+        _upsert_bin_locations([{
+            "bin_code": bin_data.get('BinCode'),
+            "warehouse_code": bin_data.get('Warehouse'),  # Use 'Warehouse' not 'WarehouseCode'
+            "bin_name": bin_data.get('Description', ''),
+            "is_active": not _sap_flag(bin_data.get('Inactive')),
+            "sap_abs_entry": bin_data.get('AbsEntry')
+        } for bin_data in bins if bin_data.get('BinCode') and bin_data.get('Warehouse')])
+
+    def sync_business_partners(self, full=False):
+        """Sync business partners (suppliers/customers) changed in SAP B1 since the last run"""
         if not self.ensure_logged_in():
             logging.warning(
                 "Cannot sync business partners - SAP B1 not available")
             return False
 
         try:
-            # Get suppliers and customers
-            url = f"{self.base_url}/b1s/v1/BusinessPartners?$filter=CardType eq 'cSupplier' or CardType eq 'cCustomer'"
-            response = self.session.get(url)
-
-            if response.status_code == 200:
-                partners = response.json().get('value', [])
-
-                from app import db, app
-
-                # Create business_partners table if not exists - use database-specific syntax
-                db_uri = os.environ.get('DATABASE_URL', '')
-
-                if 'postgresql' in db_uri.lower():
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS business_partners (
-                            id SERIAL PRIMARY KEY,
-                            card_code VARCHAR(50) UNIQUE NOT NULL,
-                            card_name VARCHAR(200) NOT NULL,
-                            card_type VARCHAR(20) NOT NULL,
-                            phone VARCHAR(50),
-                            email VARCHAR(100),
-                            address TEXT,
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT NOW(),
-                            updated_at TIMESTAMP DEFAULT NOW()
-                        )
-                    """
-                elif 'mysql' in db_uri.lower():
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS business_partners (
-                            id INT AUTO_INCREMENT PRIMARY KEY,
-                            card_code VARCHAR(50) UNIQUE NOT NULL,
-                            card_name VARCHAR(200) NOT NULL,
-                            card_type VARCHAR(20) NOT NULL,
-                            phone VARCHAR(50),
-                            email VARCHAR(100),
-                            address TEXT,
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT NOW(),
-                            updated_at TIMESTAMP DEFAULT NOW() ON UPDATE NOW()
-                        )
-                    """
-                else:
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS business_partners (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            card_code VARCHAR(50) UNIQUE NOT NULL,
-                            card_name VARCHAR(200) NOT NULL,
-                            card_type VARCHAR(20) NOT NULL,
-                            phone VARCHAR(50),
-                            email VARCHAR(100),
-                            address TEXT,
-                            is_active BOOLEAN DEFAULT 1,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """
-
-                db.session.execute(db.text(create_table_sql))
-
-                for partner in partners:
-                    card_code = partner.get('CardCode')
-                    if card_code:
-                        # Use database-specific upsert syntax
-                        if 'postgresql' in db_uri.lower():
-                            upsert_sql = """
-                                INSERT INTO business_partners (card_code, card_name, card_type, phone, email, address, is_active, created_at, updated_at)
-                                VALUES (:card_code, :card_name, :card_type, :phone, :email, :address, :is_active, NOW(), NOW())
-                                ON CONFLICT (card_code) 
-                                DO UPDATE SET 
-                                    card_name = EXCLUDED.card_name,
-                                    card_type = EXCLUDED.card_type,
-                                    phone = EXCLUDED.phone,
-                                    email = EXCLUDED.email,
-                                    address = EXCLUDED.address,
-                                    is_active = EXCLUDED.is_active,
-                                    updated_at = NOW()
-                            """
-                        elif 'mysql' in db_uri.lower():
-                            upsert_sql = """
-                                INSERT INTO business_partners (card_code, card_name, card_type, phone, email, address, is_active, created_at, updated_at)
-                                VALUES (:card_code, :card_name, :card_type, :phone, :email, :address, :is_active, NOW(), NOW())
-                                ON DUPLICATE KEY UPDATE 
-                                    card_name = VALUES(card_name),
-                                    card_type = VALUES(card_type),
-                                    phone = VALUES(phone),
-                                    email = VALUES(email),
-                                    address = VALUES(address),
-                                    is_active = VALUES(is_active),
-                                    updated_at = NOW()
-                            """
-                        else:
-                            # SQLite - use INSERT OR REPLACE
-                            upsert_sql = """
-                                INSERT OR REPLACE INTO business_partners (card_code, card_name, card_type, phone, email, address, is_active, created_at, updated_at)
-                                VALUES (:card_code, :card_name, :card_type, :phone, :email, :address, :is_active, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                            """
-
-                        db.session.execute(
-                            db.text(upsert_sql), {
-                                "card_code": card_code,
-                                "card_name": partner.get('CardName', ''),
-                                "card_type": partner.get('CardType', ''),
-                                "phone": partner.get('Phone1', ''),
-                                "email": partner.get('EmailAddress', ''),
-                                "address": partner.get('Address', ''),
-                                "is_active": partner.get('Valid') == 'Y'
-                            })
+            from sap_master_sync import run_delta_sync
 
-                db.session.commit()
-                logging.info(
-                    f"Synced {len(partners)} business partners from SAP B1")
-                return True
+            synced = run_delta_sync(self, 'business_partners', 'BusinessPartners',
+                                    'CardCode,CardName,CardType,Phone1,EmailAddress,Address,Valid',
+                                    self._write_business_partners,
+                                    base_filter="CardType eq 'cSupplier' or CardType eq 'cCustomer'",
+                                    time_field='UpdateTime', full=full)
+            logging.info(
+                f"Synced {synced} business partners from SAP B1")
+            return True
 
         except Exception as e:
             logging.error(f"Error syncing business partners: {str(e)}")
             return False
 
+    def _write_business_partners(self, partners):
+        """Upsert a chunk of business partners"""
+        from bulk_upsert import bulk_upsert
+        from models import BusinessPartner
+
+        bulk_upsert(BusinessPartner, [{
+            "card_code": partner.get('CardCode'),
+            "card_name": partner.get('CardName', ''),
+            "card_type": partner.get('CardType', ''),
+            "phone": partner.get('Phone1', ''),
+            "email": partner.get('EmailAddress', ''),
+            "address": partner.get('Address', ''),
+            "is_active": _sap_flag(partner.get('Valid'))
+        } for partner in partners if partner.get('CardCode')], ['card_code'])
+
     def update_pick_list_status_to_picked(self, absolute_entry, pick_list_data):
         """Update pick list status to 'ps_Picked' in SAP B1 via PATCH API"""
         if not self.ensure_logged_in():
@@ -2549,56 +2878,156 @@ class SAPIntegration:
                 'error': error_msg
             }
 
-    def update_inventory_counting(self, doc_entry, counting_document):
-        """Update inventory counting document in SAP B1 via PATCH API"""
+    def update_inventory_counting(self, doc_entry, counting_document, chunk_size=None, progress=None):
+        """Update inventory counting document in SAP B1 via PATCH API.
+
+        The Service Layer merges InventoryCountingLines by LineNumber, so more than chunk_size
+        lines are sent as several PATCHes (header fields go with the first one).
+        progress(sent_lines, total_lines, line_numbers) is called after each accepted PATCH.
+        """
         if not self.ensure_logged_in():
             # Return success for offline mode with mock response
             return {
                 'success': True,
                 'message': f'Inventory counting {doc_entry} updated (offline mode)',
-                'sap_response': {'DocumentEntry': doc_entry}
+                'sap_response': {'DocumentEntry': doc_entry},
+                'posted_lines': 0
             }
 
+        sent_lines = 0
         try:
             # Build the PATCH URL with the document entry
             url = f"{self.base_url}/b1s/v1/InventoryCountings({doc_entry})"
             
-            # Prepare the JSON payload - use the exact structure provided by the user
-            payload = counting_document
-            
-            # Execute PATCH request to SAP B1
-            logging.info(f"Sending PATCH request to {url}")
-            logging.info(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = self.session.patch(url, json=payload, timeout=30)
+            lines = list(counting_document.get('InventoryCountingLines') or [])
+            header = {field: value for field, value in counting_document.items() if field != 'InventoryCountingLines'}
+            chunk_size = max(1, chunk_size or COUNTING_PATCH_CHUNK)
+            chunks = [lines[start:start + chunk_size] for start in range(0, len(lines), chunk_size)] or [[]]
             
-            if response.status_code == 204:
+            for index, chunk in enumerate(chunks):
+                payload = dict(header) if index == 0 else {}
+                if chunk:
+                    payload['InventoryCountingLines'] = chunk
+                if not payload:
+                    continue
+                
+                # Execute PATCH request to SAP B1
+                logging.info(f"Sending PATCH request to {url} ({index + 1}/{len(chunks)}, {len(chunk)} lines)")
+                logging.debug(f"Payload: {json.dumps(payload, indent=2)}")
+                
+                response = self.session.patch(url, json=payload, timeout=30)
+                
+                if response.status_code != 204:
+                    error_msg = f"SAP B1 PATCH failed with status {response.status_code}: {response.text}"
+                    logging.error(error_msg)
+                    return {
+                        'success': False,
+                        'error': error_msg,
+                        'sap_response': response.text,
+                        'posted_lines': sent_lines
+                    }
+                
                 # SAP B1 returns 204 No Content for successful PATCH
-                logging.info(f"Successfully updated inventory counting {doc_entry} in SAP B1")
-                return {
-                    'success': True,
-                    'message': f'Inventory counting {doc_entry} updated successfully',
-                    'sap_response': {'DocumentEntry': doc_entry}
-                }
-            else:
-                error_msg = f"SAP B1 PATCH failed with status {response.status_code}: {response.text}"
-                logging.error(error_msg)
-                return {
-                    'success': False,
-                    'error': error_msg,
-                    'sap_response': response.text
-                }
+                sent_lines += len(chunk)
+                if progress:
+                    progress(sent_lines, len(lines), [line.get('LineNumber') for line in chunk])
+            
+            logging.info(f"Successfully updated inventory counting {doc_entry} in SAP B1 "
+                         f"({sent_lines} lines in {len(chunks)} PATCH requests)")
+            return {
+                'success': True,
+                'message': f'Inventory counting {doc_entry} updated successfully',
+                'sap_response': {'DocumentEntry': doc_entry},
+                'posted_lines': sent_lines
+            }
                 
         except Exception as e:
             error_msg = f"Error updating inventory counting in SAP B1: {str(e)}"
             logging.error(error_msg)
             return {
                 'success': False,
-                'error': error_msg
+                'error': error_msg,
+                'posted_lines': sent_lines
             }
 
+    def post_inventory_counting_changes(self, doc_entry, counting_document, chunk_size=None, progress=None):
+        """Record submitted counts on the local copy and PATCH only the lines that changed.
+
+        counting_document should carry only the lines the user edited (the counting page tracks
+        edits), so counts recorded since the page loaded - by other devices' sessions or an
+        earlier save - are not reverted. Submitted lines whose Counted/UoMCountedQuantity
+        differ from the local line are marked is_dirty. Every dirty line of the document, including ones left over from an earlier
+        failed save, is sent with update_inventory_counting and cleared chunk by chunk as SAP
+        accepts it. Documents not stored locally are sent as submitted.
+        """
+        from sqlalchemy import update
+        from app import db
+        from models import SAPInventoryCount, SAPInventoryCountLine
+
+        local_doc = SAPInventoryCount.query.filter_by(doc_entry=int(doc_entry)).first()
+        if not local_doc:
+            logging.warning(f"⚠️ Local document {doc_entry} not found, sending the full update")
+            return self.update_inventory_counting(doc_entry, counting_document, chunk_size, progress)
+
+        submitted = {}
+        for line_data in counting_document.get('InventoryCountingLines') or counting_document.get('InventoryCountLines') or []:
+            if line_data.get('LineNumber') is not None:
+                submitted[line_data['LineNumber']] = line_data
+
+        now = datetime.utcnow()
+        changes = []
+        for line_id, line_number, counted, uom_counted_qty, in_whs_qty in db.session.query(
+                SAPInventoryCountLine.id, SAPInventoryCountLine.line_number, SAPInventoryCountLine.counted,
+                SAPInventoryCountLine.uom_counted_quantity, SAPInventoryCountLine.in_warehouse_quantity).filter(
+                SAPInventoryCountLine.count_id == local_doc.id,
+                SAPInventoryCountLine.line_number.in_(list(submitted))):
+            line_data = submitted[line_number]
+            new_counted = line_data.get('Counted', 'tNO')
+            new_qty = float(line_data.get('UoMCountedQuantity', line_data.get('CountedQuantity')) or 0)
+            if (new_counted, new_qty) != (counted, uom_counted_qty or 0):
+                changes.append({'id': line_id, 'counted': new_counted, 'uom_counted_quantity': new_qty,
+                                'variance': new_qty - (in_whs_qty or 0), 'is_dirty': True, 'updated_at': now})
+        if changes:
+            db.session.execute(update(SAPInventoryCountLine), changes)
+        local_doc.last_updated_at = now
+        db.session.commit()
+
+        dirty_lines = []
+        for line_number, counted, uom_counted_qty in db.session.query(
+                SAPInventoryCountLine.line_number, SAPInventoryCountLine.counted,
+                SAPInventoryCountLine.uom_counted_quantity).filter(
+                SAPInventoryCountLine.count_id == local_doc.id, SAPInventoryCountLine.is_dirty.is_(True)
+                ).order_by(SAPInventoryCountLine.line_number):
+            dirty_lines.append(submitted.get(line_number) or
+                               {'LineNumber': line_number, 'Counted': counted, 'UoMCountedQuantity': uom_counted_qty})
+        if not dirty_lines:
+            return {'success': True, 'message': f'Inventory counting {doc_entry} has no changed lines',
+                    'sap_response': {'DocumentEntry': doc_entry}, 'posted_lines': 0, 'pending_lines': 0}
+
+        def sent(sent_lines, total_lines, line_numbers):
+            # Lines edited again while the PATCH was in flight stay dirty
+            SAPInventoryCountLine.query.filter(
+                SAPInventoryCountLine.count_id == local_doc.id,
+                SAPInventoryCountLine.line_number.in_(line_numbers),
+                SAPInventoryCountLine.updated_at <= now).update({'is_dirty': False}, synchronize_session=False)
+            db.session.commit()
+            logging.info(f"📤 Counting {doc_entry}: {sent_lines}/{total_lines} changed lines sent to SAP")
+            if progress:
+                progress(sent_lines, total_lines, line_numbers)
+
+        header = {field: value for field, value in counting_document.items()
+                  if field not in ('InventoryCountingLines', 'InventoryCountLines')}
+        result = self.update_inventory_counting(doc_entry, dict(header, InventoryCountingLines=dirty_lines),
+                                                chunk_size, sent)
+        result['pending_lines'] = len(dirty_lines) - result.get('posted_lines', 0)
+        return result
+
     def get_warehouse_business_place_id(self, warehouse_code):
         """Get BusinessPlaceID for a warehouse from SAP B1"""
+        cached = self._business_place_cache.get(warehouse_code)
+        if cached is not None:
+            return cached
+
         if not self.ensure_logged_in():
             return 5  # Default fallback
 
@@ -2613,7 +3042,9 @@ class SAPIntegration:
             if response.status_code == 200:
                 data = response.json()
                 if data.get('value') and len(data['value']) > 0:
-                    return data['value'][0].get('BusinessPlaceID', 5)
+                    business_place_id = data['value'][0].get('BusinessPlaceID', 5)
+                    self._business_place_cache.set(warehouse_code, business_place_id)
+                    return business_place_id
             return 5  # Default fallback
 
         except Exception as e:
@@ -2633,15 +3064,6 @@ class SAPIntegration:
         try:
             from app import db
 
-            # Create sequence table if not exists
-            create_sequence_table = """
-                CREATE TABLE IF NOT EXISTS pdn_sequence (
-                    date_key VARCHAR(8) PRIMARY KEY,
-                    sequence_number INTEGER DEFAULT 0
-                )
-            """
-            db.session.execute(db.text(create_sequence_table))
-
             # Get or create sequence for today
             result = db.session.execute(
                 db.text(
@@ -2681,7 +3103,7 @@ class SAPIntegration:
             timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
             return f"EXT-REF-{timestamp}"
 
-    def create_purchase_delivery_note(self, grpo_document):
+    def create_purchase_delivery_note(self, grpo_document, external_ref=None):
         """Create Purchase Delivery Note in SAP B1 with exact JSON structure specified"""
         if not self.ensure_logged_in():
             # Return success for offline mode
@@ -2722,8 +3144,9 @@ class SAPIntegration:
                 'error': 'Missing CardCode or PO DocEntry from SAP B1'
             }
 
-        # Generate unique external reference number
-        external_ref = self.generate_external_reference_number(grpo_document)
+        # Generate unique external reference number (the outbox passes the one it reserved)
+        if not external_ref:
+            external_ref = self.generate_external_reference_number(grpo_document)
 
         # Get first warehouse code from PO DocumentLines to determine BusinessPlaceID
         first_warehouse_code = None
@@ -2784,7 +3207,7 @@ class SAPIntegration:
                 "BaseEntry": po_doc_entry,
                 "BaseLine": po_line_num,
                 "ItemCode": item.item_code,
-                "Quantity": item.received_quantity,
+                "Quantity": float(item.received_quantity or 0),
                 "WarehouseCode": warehouse_code
             }
 
@@ -2868,7 +3291,7 @@ class SAPIntegration:
                     "BatchNumber":
                     item.batch_number,
                     "Quantity":
-                    item.received_quantity,
+                    float(item.received_quantity or 0),
                     "BaseLineNumber":
                     line_number,
                     "ManufacturerSerialNumber":
@@ -2936,13 +3359,13 @@ class SAPIntegration:
             else:
                 error_msg = f"SAP B1 error creating Purchase Delivery Note: {response.text}"
                 logging.error(error_msg)
-                return {'success': False, 'error': error_msg}
+                return {'success': False, 'error': error_msg, 'status_code': response.status_code}
         except Exception as e:
             error_msg = f"Error creating Purchase Delivery Note in SAP B1: {str(e)}"
             logging.error(error_msg)
             return {'success': False, 'error': error_msg}
 
-    def post_grpo_to_sap(self, grpo_document):
+    def post_grpo_to_sap(self, grpo_document, external_ref=None):
         """Post approved GRPO to SAP B1 as Purchase Delivery Note"""
         if not self.ensure_logged_in():
             logging.warning("Cannot post GRPO - SAP B1 not available")
@@ -2950,7 +3373,7 @@ class SAPIntegration:
 
         try:
             # Create Purchase Delivery Note to close PO
-            result = self.create_purchase_delivery_note(grpo_document)
+            result = self.create_purchase_delivery_note(grpo_document, external_ref=external_ref)
 
             if result.get('success'):
                 # Update WMS record with SAP document number
@@ -2969,27 +3392,28 @@ class SAPIntegration:
                     True,
                     'sap_document_number':
                     result.get('document_number'),
+                    'doc_entry':
+                    result.get('doc_entry'),
                     'message':
                     f'GRPO posted to SAP B1 as Purchase Delivery Note {result.get("document_number")}'
                 }
             else:
                 return {
                     'success': False,
-                    'error': result.get('error', 'Unknown error occurred')
+                    'error': result.get('error', 'Unknown error occurred'),
+                    'status_code': result.get('status_code')
                 }
         except Exception as e:
             logging.error(f"Error posting GRPO to SAP: {str(e)}")
             return {'success': False, 'error': str(e)}
 
-    def sync_all_master_data(self):
-        """Sync all master data from SAP B1"""
-        logging.info("Starting full SAP B1 master data synchronization...")
+    def sync_all_master_data(self, full=False):
+        """Sync all master data from SAP B1 (only records changed since the last run unless full)"""
+        from sap_master_sync import sync_master_data
 
-        results = {
-            'warehouses': self.sync_warehouses(),
-            'bins': self.sync_bins(),
-            'business_partners': self.sync_business_partners()
-        }
+        logging.info(f"Starting {'full' if full else 'delta'} SAP B1 master data synchronization...")
+
+        results = sync_master_data(self, full=full)
 
         success_count = sum(1 for result in results.values() if result)
         logging.info(
@@ -3041,12 +3465,53 @@ class SAPIntegration:
             }
         }
 
+    @staticmethod
+    def _sales_order_fields(order_data):
+        """SalesOrder column values from a SAP B1 Orders entity"""
+        def parse_date(value):
+            if isinstance(value, str):
+                return datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return value
+
+        return {
+            'doc_entry': order_data.get('DocEntry'),
+            'doc_num': order_data.get('DocNum'),
+            'doc_type': order_data.get('DocType'),
+            'doc_date': parse_date(order_data.get('DocDate')) if order_data.get('DocDate') else None,
+            'doc_due_date': parse_date(order_data.get('DocDueDate')) if order_data.get('DocDueDate') else None,
+            'card_code': order_data.get('CardCode'),
+            'card_name': order_data.get('CardName'),
+            'address': order_data.get('Address'),
+            'doc_total': order_data.get('DocTotal'),
+            'doc_currency': order_data.get('DocCurrency'),
+            'comments': order_data.get('Comments'),
+            'document_status': order_data.get('DocumentStatus'),
+            'last_sap_sync': datetime.utcnow()
+        }
+
+    @staticmethod
+    def _sales_order_line_fields(line_data):
+        """SalesOrderLine column values from a SAP B1 DocumentLines entry"""
+        return {
+            'line_num': line_data.get('LineNum'),
+            'item_code': line_data.get('ItemCode'),
+            'item_description': line_data.get('ItemDescription') or line_data.get('Dscription'),
+            'quantity': line_data.get('Quantity'),
+            'open_quantity': line_data.get('OpenQuantity'),
+            'delivered_quantity': line_data.get('DeliveredQuantity'),
+            'unit_price': line_data.get('UnitPrice'),
+            'line_total': line_data.get('LineTotal'),
+            'warehouse_code': line_data.get('WarehouseCode'),
+            'unit_of_measure': line_data.get('UoMCode'),
+            'line_status': line_data.get('LineStatus')
+        }
+
     def sync_sales_order_to_local_db(self, order_data):
         """Sync Sales Order data to local database"""
         try:
             from app import db
+            from bulk_upsert import bulk_insert
             from models import SalesOrder, SalesOrderLine
-            from datetime import datetime
             
             doc_entry = order_data.get('DocEntry')
             if not doc_entry:
@@ -3059,72 +3524,37 @@ class SAPIntegration:
                 sales_order = SalesOrder()
                 db.session.add(sales_order)
             
-            # Update Sales Order fields
-            sales_order.doc_entry = doc_entry
-            sales_order.doc_num = order_data.get('DocNum')
-            sales_order.doc_type = order_data.get('DocType')
-            
-            # Parse dates
-            doc_date = order_data.get('DocDate')
-            if doc_date:
-                if isinstance(doc_date, str):
-                    sales_order.doc_date = datetime.fromisoformat(doc_date.replace('Z', '+00:00'))
-                else:
-                    sales_order.doc_date = doc_date
-            
-            doc_due_date = order_data.get('DocDueDate')
-            if doc_due_date:
-                if isinstance(doc_due_date, str):
-                    sales_order.doc_due_date = datetime.fromisoformat(doc_due_date.replace('Z', '+00:00'))
-                else:
-                    sales_order.doc_due_date = doc_due_date
-            
-            sales_order.card_code = order_data.get('CardCode')
-            sales_order.card_name = order_data.get('CardName')
-            sales_order.address = order_data.get('Address')
-            sales_order.doc_total = order_data.get('DocTotal')
-            sales_order.doc_currency = order_data.get('DocCurrency')
-            sales_order.comments = order_data.get('Comments')
-            sales_order.document_status = order_data.get('DocumentStatus')
-            sales_order.last_sap_sync = datetime.utcnow()
+            # Update Sales Order fields (dates left unset by SAP keep their stored value)
+            for field, value in self._sales_order_fields(order_data).items():
+                if value is not None or field not in ('doc_date', 'doc_due_date'):
+                    setattr(sales_order, field, value)
             
             db.session.flush()  # Get the ID
             
-            # Sync Sales Order Lines
+            # Sync Sales Order Lines - existing lines are loaded with one query and updated in place,
+            # new lines are bulk inserted
             lines_synced = 0
             document_lines = order_data.get('DocumentLines', [])
+            existing_lines = {line.line_num: line for line in
+                              SalesOrderLine.query.filter_by(sales_order_id=sales_order.id)}
+            new_lines = {}
             
             for line_data in document_lines:
                 line_num = line_data.get('LineNum')
                 if line_num is None:
                     continue
-                    
-                # Check if line already exists
-                order_line = SalesOrderLine.query.filter_by(
-                    sales_order_id=sales_order.id,
-                    line_num=line_num
-                ).first()
-                
-                if not order_line:
-                    order_line = SalesOrderLine()
-                    order_line.sales_order_id = sales_order.id
-                    db.session.add(order_line)
                 
-                # Update line fields
-                order_line.line_num = line_num
-                order_line.item_code = line_data.get('ItemCode')
-                order_line.item_description = line_data.get('ItemDescription') or line_data.get('Dscription')
-                order_line.quantity = line_data.get('Quantity')
-                order_line.open_quantity = line_data.get('OpenQuantity')
-                order_line.delivered_quantity = line_data.get('DeliveredQuantity')
-                order_line.unit_price = line_data.get('UnitPrice')
-                order_line.line_total = line_data.get('LineTotal')
-                order_line.warehouse_code = line_data.get('WarehouseCode')
-                order_line.unit_of_measure = line_data.get('UoMCode')
-                order_line.line_status = line_data.get('LineStatus')
+                fields = self._sales_order_line_fields(line_data)
+                order_line = existing_lines.get(line_num)
+                if order_line:
+                    for field, value in fields.items():
+                        setattr(order_line, field, value)
+                else:
+                    new_lines[line_num] = dict(fields, sales_order_id=sales_order.id)
                 
                 lines_synced += 1
             
+            bulk_insert(SalesOrderLine, list(new_lines.values()))
             db.session.commit()
             
             logging.info(f"✅ Synced Sales Order {doc_entry} with {lines_synced} lines")
@@ -3139,14 +3569,77 @@ class SAPIntegration:
             logging.error(f"Error syncing Sales Order to local DB: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    def insert_sales_orders_to_local_db(self, orders_data):
+        """Bulk insert Sales Orders that do not exist locally yet, with their lines.
+
+        Falls back to sync_sales_order_to_local_db per order when the bulk insert fails
+        (e.g. another request stored one of the orders meanwhile).
+        """
+        from app import db
+        from bulk_upsert import bulk_insert
+        from models import SalesOrder, SalesOrderLine
+
+        orders_data = list({order.get('DocEntry'): order for order in orders_data if order.get('DocEntry')}.values())
+        if not orders_data:
+            return 0
+        try:
+            order_ids = bulk_insert(SalesOrder, [self._sales_order_fields(order) for order in orders_data],
+                                    return_ids=True, key_columns=['doc_entry'])
+            lines = []
+            for order_id, order in zip(order_ids, orders_data):
+                line_nums = set()
+                for line_data in order.get('DocumentLines', []):
+                    line_num = line_data.get('LineNum')
+                    if line_num is None or line_num in line_nums:
+                        continue
+                    line_nums.add(line_num)
+                    lines.append(dict(self._sales_order_line_fields(line_data), sales_order_id=order_id))
+            bulk_insert(SalesOrderLine, lines)
+            db.session.commit()
+            logging.info(f"✅ Stored {len(orders_data)} Sales Orders with {len(lines)} lines")
+            return len(orders_data)
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"⚠️ Bulk Sales Order insert failed ({str(e)}), storing orders one by one")
+            return sum(1 for order in orders_data if self.sync_sales_order_to_local_db(order).get('success'))
+
+    @staticmethod
+    def _load_local_sales_orders(doc_entries):
+        """{doc_entry: (SalesOrder, {line_num: SalesOrderLine})} with one query for orders and one for lines"""
+        from models import SalesOrder, SalesOrderLine
+
+        if not doc_entries:
+            return {}
+        orders = {order.id: order for order in SalesOrder.query.filter(SalesOrder.doc_entry.in_(list(doc_entries)))}
+        lines = {order_id: {} for order_id in orders}
+        if orders:
+            for order_line in SalesOrderLine.query.filter(SalesOrderLine.sales_order_id.in_(list(orders))):
+                lines[order_line.sales_order_id][order_line.line_num] = order_line
+        return {order.doc_entry: (order, lines[order_id]) for order_id, order in orders.items()}
+
     def enhance_picklist_with_sales_order_data(self, picklist_lines):
-        """Enhance picklist lines with Sales Order item details"""
+        """Enhance picklist lines with Sales Order item details.
+
+        Orders and their lines are loaded for the whole pick list at once; orders missing
+        locally are fetched from SAP B1 concurrently and stored in bulk first.
+        """
         enhanced_lines = []
         
         try:
-            from app import db
-            from models import SalesOrder, SalesOrderLine
-            
+            order_entries = {line.get('OrderEntry') for line in picklist_lines
+                             if line.get('OrderEntry') and line.get('OrderRowID') is not None}
+            local_orders = self._load_local_sales_orders(order_entries)
+            
+            missing_entries = [order_entry for order_entry in order_entries if order_entry not in local_orders]
+            if missing_entries:
+                # get_sales_order_by_doc_entry returns the SAP order itself (None when not found or closed)
+                sap_orders = [result.value for result in fan_out(self.get_sales_order_by_doc_entry, missing_entries)
+                              if result.ok and result.value]
+                if sap_orders:
+                    self.insert_sales_orders_to_local_db(sap_orders)
+                    local_orders.update(self._load_local_sales_orders(missing_entries))
+            
+            enhanced_count = 0
             for line in picklist_lines:
                 enhanced_line = line.copy()
                 
@@ -3154,23 +3647,11 @@ class SAPIntegration:
                 order_row_id = line.get('OrderRowID')
                 
                 if order_entry and order_row_id is not None:
-                    # First try to get from local database
-                    sales_order = SalesOrder.query.filter_by(doc_entry=order_entry).first()
-                    
-                    if not sales_order:
-                        # Fetch from SAP B1 and sync to local
-                        sap_result = self.get_sales_order_by_doc_entry(order_entry)
-                        if sap_result.get('success'):
-                            sync_result = self.sync_sales_order_to_local_db(sap_result['sales_order'])
-                            if sync_result.get('success'):
-                                sales_order = SalesOrder.query.filter_by(doc_entry=order_entry).first()
+                    sales_order, order_lines = local_orders.get(order_entry, (None, {}))
                     
                     if sales_order:
-                        # Get the specific line based on OrderRowID (which corresponds to LineNum)
-                        order_line = SalesOrderLine.query.filter_by(
-                            sales_order_id=sales_order.id,
-                            line_num=order_row_id
-                        ).first()
+                        # OrderRowID corresponds to the Sales Order LineNum
+                        order_line = order_lines.get(order_row_id)
                         
                         if order_line:
                             # Enhance the picklist line with Sales Order data directly on the line object
@@ -3187,8 +3668,7 @@ class SAPIntegration:
                                 'UnitPrice': order_line.unit_price,
                                 'LineTotal': order_line.line_total
                             })
-                            
-                            logging.info(f"✅ Enhanced picklist line {line.get('LineNumber')} with Sales Order data: {order_line.item_code}")
+                            enhanced_count += 1
                         else:
                             logging.warning(f"⚠️ Sales Order line not found: OrderEntry={order_entry}, OrderRowID={order_row_id}")
                     else:
@@ -3197,6 +3677,9 @@ class SAPIntegration:
                     logging.debug(f"No OrderEntry or OrderRowID for picklist line {line.get('LineNumber')}")
                 
                 enhanced_lines.append(enhanced_line)
+            
+            logging.info(f"✅ Enhanced {enhanced_count} of {len(picklist_lines)} picklist lines with data from "
+                         f"{len(order_entries)} Sales Orders ({len(missing_entries)} fetched from SAP B1)")
                 
         except Exception as e:
             logging.error(f"Error enhancing picklist with Sales Order data: {str(e)}")
@@ -3212,6 +3695,20 @@ class SAPIntegration:
             item_code: The item code to check against
             warehouse_code: Optional warehouse code to check series availability in specific warehouse
         """
+        from sap_serial_index import lookup_serial, record_lookup
+
+        indexed = lookup_serial(serial_number, item_code, warehouse_code)
+        if indexed and indexed.get('warehouse_code') and indexed['warehouse_code'] == (warehouse_code or indexed['warehouse_code']):
+            return {
+                'valid': True,
+                'DistNumber': indexed['serial_number'],
+                'ItemCode': indexed['item_code'],
+                'WhsCode': indexed['warehouse_code'],
+                'available_in_warehouse': True,
+                'message': f'Series {serial_number} is available in warehouse {indexed["warehouse_code"]}',
+                'source': 'wms_serial_index'
+            }
+
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, cannot validate series")
             return {
@@ -3242,6 +3739,8 @@ class SAPIntegration:
                 if data.get('value') and len(data['value']) > 0:
                     # Series found in the specified warehouse
                     series_data = data['value'][0]
+                    record_lookup(series_data.get('DistNumber') or serial_number,
+                                  series_data.get('ItemCode') or item_code, series_data.get('WhsCode'))
                     return {
                         'valid': True,
                         'DistNumber': series_data.get('DistNumber'),
@@ -3278,136 +3777,27 @@ class SAPIntegration:
                 'error': f'Validation error: {str(e)}'
             }
 
-    def validate_batch_series_with_warehouse(self, serial_numbers, item_code, warehouse_code, batch_size=100):
-        """Batch validate multiple series against SAP B1 API for improved performance
-        
+    def validate_batch_series_with_warehouse(self, serial_numbers, item_code, warehouse_code, batch_size=None):
+        """Batch validate multiple series against SAP B1 with set-based queries
+
         Args:
             serial_numbers: List of serial numbers to validate
             item_code: The item code to check against
             warehouse_code: Warehouse code to check series availability
-            batch_size: Number of serials to process in each batch (default 100)
-            
+            batch_size: Serials per SQL query (default SAP_SERIAL_VALIDATION_CHUNK)
+
         Returns:
             Dict with validation results for each serial number
         """
-        if not self.ensure_logged_in():
-            logging.warning("SAP B1 not available, cannot validate batch series")
-            return {serial: {'valid': False, 'error': 'SAP B1 not available'} for serial in serial_numbers}
-        
-        if not serial_numbers:
-            return {}
-            
-        results = {}
-        total_serials = len(serial_numbers)
-        
-        try:
-            # Process serials in batches to avoid API limits and improve performance
-            for i in range(0, total_serials, batch_size):
-                batch = serial_numbers[i:i+batch_size]
-                batch_results = self._validate_batch_chunk(batch, item_code, warehouse_code)
-                results.update(batch_results)
-                
-                # Log progress for large batches
-                if total_serials > 100:
-                    processed = min(i + batch_size, total_serials)
-                    logging.info(f"📊 Batch validation progress: {processed}/{total_serials} serial numbers processed")
-            
-            logging.info(f"✅ Completed batch validation for {total_serials} serial numbers")
-            return results
-            
-        except Exception as e:
-            logging.error(f"❌ Error in batch series validation: {str(e)}")
-            # Return error for all serials if batch fails
-            return {serial: {'valid': False, 'error': f'Batch validation error: {str(e)}'} for serial in serial_numbers}
-    
-    def _validate_batch_chunk(self, serial_batch, item_code, warehouse_code):
-        """Validate a chunk of serial numbers using SAP B1 bulk query
-        
-        Args:
-            serial_batch: List of serial numbers in this chunk
-            item_code: The item code to check against  
-            warehouse_code: Warehouse code to check series availability
-            
-        Returns:
-            Dict with validation results for each serial in the batch
-        """
-        results = {}
-        
-        try:
-            # Create SQL query for batch validation
-            serial_list = "','".join(serial_batch)
-            sql_query = f"""
-            SELECT 
-                SN.DistNumber as SerialNumber,
-                SN.ItemCode,
-                SN.WhsCode,
-                CASE WHEN SN.WhsCode = '{warehouse_code}' THEN 1 ELSE 0 END as AvailableInWarehouse
-            FROM OSRN SN 
-            WHERE SN.DistNumber IN ('{serial_list}')
-            AND SN.ItemCode = '{item_code}'
-            """
-            
-            # Use custom SQL query endpoint
-            api_url = f"{self.base_url}/b1s/v1/SQLQueries('Batch_Series_Validation')/List"
-            
-            payload = {
-                "ParamList": f"sqlQuery={sql_query}"
-            }
-            
-            response = self.session.post(api_url, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                data = response.json()
-                found_serials = {item.get('SerialNumber'): item for item in data.get('value', [])}
-                
-                # Process each serial in the batch
-                for serial in serial_batch:
-                    if serial in found_serials:
-                        series_data = found_serials[serial]
-                        available_in_warehouse = bool(series_data.get('AvailableInWarehouse', 0))
-                        
-                        results[serial] = {
-                            'valid': True,
-                            'DistNumber': series_data.get('SerialNumber'),
-                            'ItemCode': series_data.get('ItemCode'),
-                            'WhsCode': series_data.get('WhsCode'),
-                            'available_in_warehouse': available_in_warehouse,
-                            'validation_type': 'batch_warehouse_specific' if available_in_warehouse else 'batch_warehouse_unavailable',
-                            'message': f'Series {serial} validated in batch'
-                        }
-                        
-                        if not available_in_warehouse:
-                            results[serial]['warning'] = f'Series {serial} is not available in warehouse {warehouse_code}'
-                    else:
-                        # Serial not found in SAP
-                        results[serial] = {
-                            'valid': False,
-                            'error': f'Series {serial} not found in SAP system',
-                            'available_in_warehouse': False,
-                            'validation_type': 'batch_not_found'
-                        }
-            else:
-                # API error - mark all serials as failed
-                error_msg = f'SAP API error: {response.status_code} - {response.text}'
-                for serial in serial_batch:
-                    results[serial] = {
-                        'valid': False,
-                        'error': error_msg,
-                        'validation_type': 'batch_api_error'
-                    }
-                
-        except Exception as e:
-            logging.error(f"❌ Error in batch chunk validation: {str(e)}")
-            # Mark all serials in chunk as failed
-            error_msg = f'Batch chunk validation error: {str(e)}'
-            for serial in serial_batch:
-                results[serial] = {
-                    'valid': False,
-                    'error': error_msg,
-                    'validation_type': 'batch_exception'
-                }
-        
-        return results
+        from sap_serial_index import validate_serials_indexed
+
+        return validate_serials_indexed(self, serial_numbers, item_code, warehouse_code, chunk_size=batch_size)
+
+    def iter_batch_series_validation(self, serial_numbers, item_code, warehouse_code, batch_size=None):
+        """Like validate_batch_series_with_warehouse, yielding (serial, result) as SAP answers"""
+        from sap_serial_index import iter_indexed_serial_validation
+
+        return iter_indexed_serial_validation(self, serial_numbers, item_code, warehouse_code, chunk_size=batch_size)
 
 
     def create_serial_number_stock_transfer(self, serial_transfer_document):
@@ -3510,13 +3900,13 @@ class SAPIntegration:
             logging.error(error_msg)
             return {'success': False, 'error': error_msg}
 
-    def post_inventory_transfer_to_sap(self, transfer_document):
+    def post_inventory_transfer_to_sap(self, transfer_document, reference=None):
         """Post inventory transfer to SAP B1 as Stock Transfer"""
         try:
             logging.info(f"🚀 Posting Inventory Transfer {transfer_document.id} to SAP B1...")
             
             # Use the existing create_inventory_transfer function
-            result = self.create_inventory_transfer(transfer_document)
+            result = self.create_inventory_transfer(transfer_document, reference=reference)
             
             if result.get('success'):
                 logging.info(f"✅ Inventory Transfer {transfer_document.id} posted successfully to SAP B1")
@@ -3535,7 +3925,27 @@ class SAPIntegration:
         Validate serial number and get item details using SAP B1 SQL Query for Serial Item Transfer
         Uses the specific API endpoint: SQLQueries('Item_Validation')/List
         """
+        from sap_serial_index import lookup_serial, record_lookup
+
         try:
+            indexed = lookup_serial(serial_number, warehouse_code=warehouse_code)
+            if indexed and indexed.get('warehouse_code') == warehouse_code:
+                logging.info(f"✅ Serial number {serial_number} validated from the serial index")
+                return {
+                    'valid': True,
+                    'item_code': indexed['item_code'],
+                    'item_description': self._get_item_description(indexed['item_code']),
+                    'warehouse_code': indexed['warehouse_code'],
+                    'dist_number': indexed['serial_number'],
+                    'source': 'wms_serial_index'
+                }
+            if indexed:
+                return {
+                    'valid': False,
+                    'error': f'Serial number {serial_number} not found in warehouse {warehouse_code} or quantity is 0',
+                    'source': 'wms_serial_index'
+                }
+
             if not self.ensure_logged_in():
                 logging.warning("SAP B1 not available, returning mock validation for Serial Item Transfer")
                 return {
@@ -3569,6 +3979,7 @@ class SAPIntegration:
                     item_code = result.get('ItemCode', '')
                     dist_number = result.get('DistNumber', '')
                     whs_code = result.get('WhsCode', '')
+                    record_lookup(dist_number or serial_number, item_code, whs_code)
                     
                     # For item description, we'll need to make another call to get item details
                     item_description = self._get_item_description(item_code)
@@ -3617,6 +4028,10 @@ class SAPIntegration:
         try:
             if not item_code:
                 return "Unknown Item"
+
+            cached = self._item_cache.get(item_code)
+            if cached is not None:
+                return cached
                 
             # Try to get item description from Items master data
             url = f"{self.base_url}/b1s/v1/Items?$filter=ItemCode eq '{item_code}'&$select=ItemCode,ItemName"
@@ -3626,7 +4041,9 @@ class SAPIntegration:
                 data = response.json()
                 items = data.get('value', [])
                 if items and len(items) > 0:
-                    return items[0].get('ItemName', f'Item {item_code}')
+                    item_name = items[0].get('ItemName', f'Item {item_code}')
+                    self._item_cache.set(item_code, item_name)
+                    return item_name
                     
         except Exception as e:
             logging.warning(f"⚠️ Could not fetch item description for {item_code}: {str(e)}")
@@ -3637,21 +4054,21 @@ class SAPIntegration:
     def get_warehouses(self):
         """Get warehouse list from SAP B1"""
         try:
+            cached = self._warehouse_cache.get('all')
+            if cached is not None:
+                return cached
+
             if not self.ensure_logged_in():
                 return []
             
-            url = f"{self.base_url}/b1s/v1/Warehouses?$select=WarehouseCode,WarehouseName"
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                warehouses = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(warehouses)} warehouses from SAP B1")
-                return warehouses
-            else:
-                logging.error(f"❌ Failed to get warehouses: {response.status_code} - {response.text}")
-                return []
+            warehouses = list(self.iter_odata('Warehouses', select='WarehouseCode,WarehouseName', timeout=10))
+            logging.info(f"✅ Retrieved {len(warehouses)} warehouses from SAP B1")
+            self._warehouse_cache.set('all', warehouses)
+            return warehouses
                 
+        except requests.HTTPError as e:
+            logging.error(f"❌ Failed to get warehouses: {str(e)}")
+            return []
         except Exception as e:
             logging.error(f"❌ Error getting warehouses: {str(e)}")
             return []
@@ -3717,7 +4134,7 @@ class SAPIntegration:
                 'error': f'Error validating item: {str(e)}'
             }
 
-    def post_direct_inventory_transfer_to_sap(self, transfer):
+    def post_direct_inventory_transfer_to_sap(self, transfer, reference=None):
         """
         Post Direct Inventory Transfer to SAP B1 as StockTransfer
         Handles both serial and batch managed items
@@ -3769,6 +4186,8 @@ class SAPIntegration:
                 'ToWarehouse': transfer.to_warehouse,
                 'StockTransferLines': stock_transfer_lines
             }
+            if reference:
+                payload['Reference2'] = reference
             
             url = f"{self.base_url}/b1s/v1/StockTransfers"
             response = self.session.post(url, json=payload, timeout=30)
@@ -3789,7 +4208,8 @@ class SAPIntegration:
                 logging.error(f"❌ SAP B1 StockTransfer posting failed: {response.status_code} - {error_msg}")
                 return {
                     'success': False,
-                    'error': f'SAP B1 posting failed: {error_msg}'
+                    'error': f'SAP B1 posting failed: {error_msg}',
+                    'status_code': response.status_code
                 }
                 
         except Exception as e:
@@ -3800,15 +4220,15 @@ class SAPIntegration:
             }
 
     def logout(self):
-        """Logout from SAP B1"""
+        """Release this client's SAP B1 session.
+
+        Sessions are shared through the process-wide pool, so the Service Layer
+        Logout call is left to the pool on shutdown instead of killing a session
+        other requests are still using.
+        """
         if self.session_id:
-            try:
-                logout_url = f"{self.base_url}/b1s/v1/Logout"
-                self.session.post(logout_url)
-                self.session_id = None
-                logging.info("Logged out from SAP B1")
-            except Exception as e:
-                logging.error(f"Error logging out from SAP B1: {str(e)}")
+            self.session_id = None
+            logging.info("Released pooled SAP B1 session")
 
 
 # Create global SAP integration instance for backward compatibility
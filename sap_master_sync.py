@@ -0,0 +1,200 @@
+"""
+SAP B1 Master Data Delta Sync
+Warehouses, bin locations and business partners are synced incrementally: every entity
+keeps an UpdateDate(/UpdateTime) watermark in sap_sync_state and each run fetches only the
+records SAP changed since then. Runs happen in the background - as the master_data
+scheduler job (sap_scheduler) and whenever /sync-sap-data asks for one - never inside an
+HTTP request.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from app import db
+from models import SAPSyncState
+
+# Seconds between scheduled delta syncs; 0 = only at startup and when requested
+SYNC_INTERVAL = float(os.environ.get('SAP_MASTER_SYNC_INTERVAL', '900'))
+WRITE_CHUNK = int(os.environ.get('SAP_MASTER_SYNC_WRITE_CHUNK', '500'))
+
+# SAPIntegration method per entity, in sync order (bins reference warehouses)
+MASTER_DATA_ENTITIES = {
+    'warehouses': 'sync_warehouses',
+    'bins': 'sync_bins',
+    'business_partners': 'sync_business_partners',
+}
+
+# Entities whose collection rejected UpdateDate filtering; synced in full from then on
+_no_delta = set()
+_run_lock = threading.Lock()
+_status = {'running': False, 'requested_full': False, 'last_results': None, 'last_finished_at': None}
+
+
+def _parse_sap_timestamp(date_value, time_value=None):
+    """SAP UpdateDate ('2026-10-16T00:00:00Z' or '2026-10-16') plus optional UpdateTime ('14:05:09')"""
+    if not date_value:
+        return None
+    try:
+        stamp = datetime.strptime(str(date_value)[:10], '%Y-%m-%d')
+        if time_value:
+            parts = [int(part) for part in str(time_value).split(':')[:3]]
+            stamp = stamp.replace(hour=parts[0], minute=parts[1] if len(parts) > 1 else 0,
+                                  second=parts[2] if len(parts) > 2 else 0)
+        return stamp
+    except (ValueError, IndexError):
+        return None
+
+
+def changed_since_filter(since, time_field=None):
+    """OData filter for records updated at or after the watermark.
+
+    UpdateDate has no time part; with an UpdateTime field the filter is exact to the
+    second, otherwise the watermark day is fetched again (upserts make that harmless).
+    """
+    day = since.strftime('%Y-%m-%d')
+    if not time_field:
+        return f"UpdateDate ge '{day}'"
+    return (f"(UpdateDate gt '{day}' or (UpdateDate eq '{day}' and "
+            f"{time_field} ge '{since.strftime('%H:%M:%S')}'))")
+
+
+def run_delta_sync(sap, entity, collection, select, write_rows, base_filter=None, time_field=None, full=False):
+    """Stream records of collection changed since entity's watermark into write_rows().
+
+    write_rows(rows) gets chunks of at most SAP_MASTER_SYNC_WRITE_CHUNK records; each chunk
+    is committed on its own and the watermark only advances once all of them are in.
+    Returns the number of records written.
+    """
+    state = db.session.get(SAPSyncState, entity)
+    if state is None:
+        state = SAPSyncState(entity=entity, rows_synced=0)
+        db.session.add(state)
+    started = datetime.utcnow()
+    state.last_run_at = started
+    since = None if (full or entity in _no_delta) else state.last_update_date
+    db.session.commit()
+
+    stamp_fields = 'UpdateDate' + (f',{time_field}' if time_field else '')
+    filters = [f'({base_filter})'] if base_filter else []
+
+    def records(delta):
+        clauses = filters + ([changed_since_filter(since, time_field)] if since and delta else [])
+        return sap.iter_odata(collection, filter_clause=' and '.join(clauses) or None,
+                              select=f'{select},{stamp_fields}' if delta else select, prefetch=True)
+
+    written = 0
+    newest = since
+    delta = entity not in _no_delta
+    try:
+        try:
+            rows = records(delta)
+            first = next(rows, None)
+        except requests.HTTPError as e:
+            if not delta or getattr(e.response, 'status_code', None) != 400:
+                raise
+            # The collection does not expose UpdateDate: fall back to full pulls for this entity
+            logging.warning(f"⚠️ SAP B1 {collection} cannot be filtered by UpdateDate, syncing it in full")
+            _no_delta.add(entity)
+            delta = False
+            rows = records(False)
+            first = next(rows, None)
+
+        batch = [first] if first is not None else []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= WRITE_CHUNK:
+                newest = _newest(batch, newest, time_field) if delta else None
+                write_rows(batch)
+                db.session.commit()
+                written += len(batch)
+                batch = []
+        if batch:
+            newest = _newest(batch, newest, time_field) if delta else None
+            write_rows(batch)
+            db.session.commit()
+            written += len(batch)
+    except Exception as e:
+        db.session.rollback()
+        state = db.session.get(SAPSyncState, entity)
+        state.last_error = str(e)
+        db.session.commit()
+        raise
+
+    state = db.session.get(SAPSyncState, entity)
+    state.last_update_date = newest if delta else None
+    state.last_success_at = started
+    state.rows_synced = written
+    state.last_error = None
+    db.session.commit()
+    mode = f"changed since {since:%Y-%m-%d %H:%M:%S}" if since and delta else 'full'
+    logging.info(f"🔄 {collection} sync ({mode}): {written} records")
+    return written
+
+
+def _newest(rows, newest, time_field):
+    for row in rows:
+        stamp = _parse_sap_timestamp(row.get('UpdateDate'), row.get(time_field) if time_field else None)
+        if stamp and (newest is None or stamp > newest):
+            newest = stamp
+    return newest
+
+
+def sync_master_data(sap=None, full=False):
+    """Run every master data sync; returns {entity: success}"""
+    from sap_integration import SAPIntegration
+
+    sap = sap or SAPIntegration()
+    return {entity: bool(getattr(sap, method)(full=full)) for entity, method in MASTER_DATA_ENTITIES.items()}
+
+
+def _run(app, full):
+    started = time.monotonic()
+    results = None
+    try:
+        with app.app_context():
+            try:
+                results = sync_master_data(full=full)
+            finally:
+                db.session.remove()
+        logging.info(f"✅ Master data sync finished in {time.monotonic() - started:.1f}s: {results}")
+    except Exception as e:
+        logging.error(f"❌ Master data sync failed: {str(e)}")
+    finally:
+        _status.update(running=False, last_results=results, last_finished_at=datetime.utcnow().isoformat())
+        _run_lock.release()
+
+
+def request_master_data_sync(app, full=False):
+    """Start a background master data sync; returns False when one is already running"""
+    if not _run_lock.acquire(blocking=False):
+        return False
+    _status.update(running=True, requested_full=full)
+    threading.Thread(target=_run, args=(app, full), name='sap-master-sync', daemon=True).start()
+    return True
+
+
+def run_master_data_sync(full=False):
+    """sync_master_data() in the calling thread under the lock request_master_data_sync
+    takes, so scheduled and manual runs never overlap; returns None when a run is in progress"""
+    if not _run_lock.acquire(blocking=False):
+        return None
+    _status.update(running=True, requested_full=full)
+    results = None
+    try:
+        results = sync_master_data(full=full)
+        return results
+    finally:
+        _status.update(running=False, last_results=results, last_finished_at=datetime.utcnow().isoformat())
+        _run_lock.release()
+
+
+def get_master_sync_status():
+    """Background run state plus the stored watermark of every master data entity"""
+    states = {state.entity: state.to_dict() for state in
+              SAPSyncState.query.filter(SAPSyncState.entity.in_(list(MASTER_DATA_ENTITIES)))}
+    return dict(_status, interval_seconds=SYNC_INTERVAL, full_sync_only=sorted(_no_delta),
+                entities={entity: states.get(entity) for entity in MASTER_DATA_ENTITIES})
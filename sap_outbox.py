@@ -0,0 +1,417 @@
+"""
+SAP B1 Posting Outbox
+A QC approval writes a SAPPostingJob row in the same transaction as the status change
+and returns at once. A background worker posts queued documents to the Service Layer
+with retries and exponential backoff. Every job carries a reference that is sent to
+SAP (NumAtCard / Reference2) and looked up before each attempt, so a post whose
+response was lost is recognised instead of being created a second time.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_
+
+from app import db
+from models import SAPPostingJob
+
+# Set SAP_OUTBOX_WORKER=false on processes that should only enqueue (e.g. extra web nodes)
+OUTBOX_WORKER_ENABLED = os.environ.get('SAP_OUTBOX_WORKER', 'true').lower() != 'false'
+POLL_INTERVAL = float(os.environ.get('SAP_OUTBOX_POLL_INTERVAL', '5'))
+MAX_ATTEMPTS = int(os.environ.get('SAP_OUTBOX_MAX_ATTEMPTS', '5'))
+BACKOFF_BASE = float(os.environ.get('SAP_OUTBOX_BACKOFF_BASE', '15'))
+BACKOFF_MAX = float(os.environ.get('SAP_OUTBOX_BACKOFF_MAX', '900'))
+# A running job whose worker died is picked up again after this long; keep it above
+# SAP_DEFAULT_WRITE_TIMEOUT so a slow post is never attempted twice at the same time
+STALE_LOCK_SECONDS = float(os.environ.get('SAP_OUTBOX_STALE_LOCK', '600'))
+CLAIM_BATCH_SIZE = 10
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# SAP answers business-rule violations with 4xx; retrying those cannot succeed
+RETRYABLE_STATUS_CODES = (401, 408, 429)
+
+
+def enqueue_posting(job_type, document_id, created_by=None):
+    """Queue a document for posting; the caller commits it with the approval.
+
+    Returns the already-active job when the document is queued or being posted.
+    """
+    if job_type not in _HANDLERS:
+        raise ValueError(f"Unknown SAP posting job type: {job_type}")
+    job = SAPPostingJob.query.filter(SAPPostingJob.job_type == job_type,
+                                     SAPPostingJob.document_id == document_id,
+                                     SAPPostingJob.status.in_(ACTIVE_STATUSES)).first()
+    if job:
+        return job
+    job = SAPPostingJob(job_type=job_type, document_id=document_id, status=QUEUED,
+                        attempts=0, max_attempts=MAX_ATTEMPTS,
+                        next_attempt_at=datetime.utcnow(), created_by=created_by)
+    db.session.add(job)
+    db.session.flush()
+    logging.info(f"📥 Queued SAP posting job {job.id} for {job_type} {document_id}")
+    return job
+
+
+def retry_posting(job):
+    """Put a failed job back in the queue with a fresh attempt budget"""
+    if job.status != FAILED:
+        return False
+    job.status = QUEUED
+    job.attempts = 0
+    job.next_attempt_at = datetime.utcnow()
+    job.completed_at = None
+    job.locked_by = None
+    job.locked_at = None
+    return True
+
+
+def _backoff_seconds(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _is_permanent(result):
+    status_code = result.get('status_code')
+    return (status_code is not None and 400 <= status_code < 500
+            and status_code not in RETRYABLE_STATUS_CODES)
+
+
+def _require_doc_entry(result):
+    """The SAP client simulates success while offline; only a DocEntry proves SAP created the document"""
+    if result.get('success') and not result.get('doc_entry'):
+        return {'success': False, 'error': 'SAP B1 went offline during posting - no DocEntry returned'}
+    return result
+
+
+def _post_once(sap, job, resource, field, post):
+    """Post unless SAP already holds a document carrying this job's reference"""
+    existing = sap.find_document_by_reference(resource, field, job.reference)
+    if existing:
+        logging.info(f"♻️ SAP posting job {job.id}: {resource} {existing.get('DocNum')} already carries "
+                     f"reference {job.reference} - not posting again")
+        return {'success': True, 'document_number': existing.get('DocNum'),
+                'doc_entry': existing.get('DocEntry'), 'already_posted': True}
+    return _require_doc_entry(post())
+
+
+# ================================
+# Job handlers: post one document and apply the result to the WMS record
+# ================================
+
+def _post_grpo(sap, job):
+    from modules.grpo.models import GRPODocument
+    grpo = GRPODocument.query.get(job.document_id)
+    if grpo is None:
+        return {'success': False, 'error': f'GRPO {job.document_id} no longer exists', 'status_code': 404}
+    if not job.reference:
+        # Reserve the EXT-REF number once; every retry reuses it as NumAtCard
+        job.reference = sap.generate_external_reference_number(grpo)
+        db.session.commit()
+    result = _post_once(sap, job, 'PurchaseDeliveryNotes', 'NumAtCard',
+                        lambda: sap.create_purchase_delivery_note(grpo, external_ref=job.reference))
+    if result.get('success'):
+        grpo.sap_document_number = str(result.get('document_number'))
+        grpo.status = 'posted'
+    return result
+
+
+def _post_inventory_transfer(sap, job):
+    from models import InventoryTransfer
+    transfer = InventoryTransfer.query.get(job.document_id)
+    if transfer is None:
+        return {'success': False, 'error': f'Inventory Transfer {job.document_id} no longer exists', 'status_code': 404}
+    if not job.reference:
+        job.reference = f'WMS-IT-{transfer.id}-{job.id}'
+    result = _post_once(sap, job, 'StockTransfers', 'Reference2',
+                        lambda: sap.post_inventory_transfer_to_sap(transfer, reference=job.reference))
+    if result.get('success'):
+        transfer.sap_document_number = str(result.get('document_number'))
+        transfer.status = 'posted'
+    return result
+
+
+def _post_direct_inventory_transfer(sap, job):
+    from models import DirectInventoryTransfer
+    transfer = DirectInventoryTransfer.query.get(job.document_id)
+    if transfer is None:
+        return {'success': False, 'error': f'Direct Inventory Transfer {job.document_id} no longer exists',
+                'status_code': 404}
+    if not job.reference:
+        job.reference = f'WMS-DIT-{transfer.id}-{job.id}'
+
+    def post():
+        result = sap.post_direct_inventory_transfer_to_sap(transfer, reference=job.reference)
+        if result.get('success'):
+            result['doc_entry'] = result.get('document_entry')
+        return result
+
+    result = _post_once(sap, job, 'StockTransfers', 'Reference2', post)
+    if result.get('success'):
+        transfer.sap_document_number = str(result.get('document_number'))
+        transfer.status = 'posted'
+    return result
+
+
+def build_delivery_note_payload(delivery, approved_by=None):
+    """DeliveryNotes payload for a QC-approved Sales Delivery"""
+    document_lines = []
+    for item in delivery.items:
+        line_data = {
+            'BaseType': 17,
+            'BaseEntry': delivery.so_doc_entry,
+            'BaseLine': item.base_line,
+            'ItemCode': item.item_code,
+            'Quantity': item.quantity,
+            'WarehouseCode': item.warehouse_code,
+            'UnitPrice': item.unit_price
+        }
+
+        if item.batch_required and item.batch_number:
+            line_data['BatchNumbers'] = [{
+                'BatchNumber': item.batch_number,
+                'Quantity': item.quantity
+            }]
+
+        if item.serial_required and item.serial_number:
+            line_data['SerialNumbers'] = [{
+                'InternalSerialNumber': item.serial_number,
+                'Quantity': 1
+            }]
+
+        document_lines.append(line_data)
+
+    return {
+        'CardCode': delivery.card_code,
+        'DocDate': delivery.doc_date.strftime('%Y-%m-%d') if delivery.doc_date else datetime.utcnow().strftime('%Y-%m-%d'),
+        'DocCurrency': delivery.doc_currency or 'INR',
+        'Series': delivery.delivery_series or delivery.so_series,
+        'Comments': delivery.remarks or f'Delivery against SO {delivery.so_doc_num} - QC Approved by {approved_by}',
+        'DocumentLines': document_lines
+    }
+
+
+def _post_sales_delivery(sap, job):
+    from modules.sales_delivery.models import DeliveryDocument
+    delivery = DeliveryDocument.query.get(job.document_id)
+    if delivery is None:
+        return {'success': False, 'error': f'Sales Delivery {job.document_id} no longer exists', 'status_code': 404}
+    if not job.reference:
+        job.reference = f'WMS-DLV-{delivery.id}-{job.id}'
+    approved_by = delivery.qc_approver.username if delivery.qc_approver else 'System'
+    delivery_data = build_delivery_note_payload(delivery, approved_by)
+    delivery_data['NumAtCard'] = job.reference
+    result = _post_once(sap, job, 'DeliveryNotes', 'NumAtCard',
+                        lambda: sap.create_delivery_note(delivery_data))
+    if result.get('success'):
+        result['document_number'] = result.get('doc_num') or result.get('document_number')
+        delivery.sap_doc_entry = result.get('doc_entry')
+        delivery.sap_doc_num = result.get('document_number')
+        delivery.status = 'posted'
+    return result
+
+
+_HANDLERS = {
+    'grpo': _post_grpo,
+    'inventory_transfer': _post_inventory_transfer,
+    'direct_inventory_transfer': _post_direct_inventory_transfer,
+    'sales_delivery': _post_sales_delivery,
+}
+
+
+class SAPOutboxWorker:
+    """Background thread that claims due jobs and posts them to SAP B1"""
+
+    def __init__(self, app):
+        self.app = app
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'claimed': 0, 'succeeded': 0, 'already_posted': 0, 'retried': 0,
+                       'failed': 0, 'deferred_offline': 0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sap-outbox', daemon=True)
+        self._thread.start()
+        logging.info(f"✅ SAP posting outbox worker started ({self.worker_id})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _record(self, counter):
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, worker_id=self.worker_id,
+                        running=bool(self._thread and self._thread.is_alive()))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    processed = self.run_once()
+            except Exception as e:
+                logging.error(f"❌ SAP posting outbox error: {str(e)}")
+                processed = 0
+            if not processed:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+
+    def run_once(self):
+        """Claim and post the jobs that are due; returns how many were claimed"""
+        try:
+            job_ids = self._claim_due_jobs()
+        finally:
+            db.session.remove()
+        for job_id in job_ids:
+            try:
+                self._process(job_id)
+            finally:
+                db.session.remove()
+        return len(job_ids)
+
+    def _claim_due_jobs(self):
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=STALE_LOCK_SECONDS)
+        candidates = db.session.query(SAPPostingJob.id, SAPPostingJob.status, SAPPostingJob.locked_at).filter(
+            or_(and_(SAPPostingJob.status == QUEUED,
+                     or_(SAPPostingJob.next_attempt_at.is_(None), SAPPostingJob.next_attempt_at <= now)),
+                and_(SAPPostingJob.status == RUNNING, SAPPostingJob.locked_at < stale_before))
+        ).order_by(SAPPostingJob.next_attempt_at).limit(CLAIM_BATCH_SIZE).all()
+
+        claimed = []
+        for job_id, status, locked_at in candidates:
+            # Conditional update: only one worker (in any process) wins each job
+            query = SAPPostingJob.query.filter(SAPPostingJob.id == job_id, SAPPostingJob.status == status)
+            if status == RUNNING:
+                query = query.filter(SAPPostingJob.locked_at == locked_at)
+                logging.warning(f"⚠️ Reclaiming SAP posting job {job_id} left running by another worker")
+            updated = query.update({'status': RUNNING, 'locked_by': self.worker_id, 'locked_at': now},
+                                   synchronize_session=False)
+            if updated == 1:
+                claimed.append(job_id)
+        db.session.commit()
+        for _ in claimed:
+            self._record('claimed')
+        return claimed
+
+    def _process(self, job_id):
+        from sap_integration import SAPIntegration
+
+        job = SAPPostingJob.query.get(job_id)
+        if job is None or job.locked_by != self.worker_id:
+            return
+        handler = _HANDLERS.get(job.job_type)
+        if handler is None:
+            self._finish(job, {'success': False, 'error': f'Unknown job type {job.job_type}', 'status_code': 400})
+            return
+
+        sap = SAPIntegration()
+        if not sap.ensure_logged_in():
+            # Offline: wait for SAP without spending an attempt (the client would only simulate a post)
+            job.status = QUEUED
+            job.locked_by = None
+            job.last_error = 'SAP B1 not available - waiting to retry'
+            job.next_attempt_at = datetime.utcnow() + timedelta(seconds=_backoff_seconds(job.attempts + 1))
+            db.session.commit()
+            self._record('deferred_offline')
+            return
+
+        job.attempts += 1
+        db.session.commit()
+        logging.info(f"🚀 SAP posting job {job.id}: {job.job_type} {job.document_id} (attempt {job.attempts}/{job.max_attempts})")
+        try:
+            result = handler(sap, job)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"❌ SAP posting job {job_id} raised: {str(e)}")
+            job = SAPPostingJob.query.get(job_id)
+            result = {'success': False, 'error': str(e)}
+        self._finish(job, result)
+
+    def _finish(self, job, result):
+        now = datetime.utcnow()
+        job.locked_by = None
+        job.locked_at = None
+        if result.get('success'):
+            job.status = SUCCEEDED
+            job.sap_document_number = str(result.get('document_number'))
+            doc_entry = result.get('doc_entry')
+            job.sap_doc_entry = int(doc_entry) if str(doc_entry).isdigit() else None
+            job.last_error = None
+            job.completed_at = now
+            self._record('already_posted' if result.get('already_posted') else 'succeeded')
+            logging.info(f"✅ SAP posting job {job.id}: {job.job_type} {job.document_id} posted as {job.sap_document_number}")
+        elif _is_permanent(result) or job.attempts >= job.max_attempts:
+            job.status = FAILED
+            job.last_error = result.get('error', 'Unknown SAP error')
+            job.completed_at = now
+            self._record('failed')
+            logging.error(f"❌ SAP posting job {job.id}: {job.job_type} {job.document_id} failed after "
+                          f"{job.attempts} attempt(s): {job.last_error}")
+        else:
+            job.status = QUEUED
+            job.last_error = result.get('error', 'Unknown SAP error')
+            job.next_attempt_at = now + timedelta(seconds=_backoff_seconds(job.attempts))
+            self._record('retried')
+            logging.warning(f"⚠️ SAP posting job {job.id} will retry at {job.next_attempt_at:%H:%M:%S}: {job.last_error}")
+        db.session.commit()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_outbox_worker(app):
+    """Start this process's outbox worker (no-op when SAP_OUTBOX_WORKER=false)"""
+    global _worker
+    if not OUTBOX_WORKER_ENABLED:
+        logging.info("ℹ️ SAP posting outbox worker disabled (SAP_OUTBOX_WORKER=false)")
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = SAPOutboxWorker(app)
+        _worker.start()
+        return _worker
+
+
+def stop_outbox_worker(timeout=30):
+    """Stop this process's outbox worker and wait for a posting in flight to finish"""
+    if _worker is None or not (_worker._thread and _worker._thread.is_alive()):
+        return
+    _worker.stop()
+    _worker._thread.join(timeout)
+
+
+def wake_outbox_worker():
+    """Post newly committed jobs now instead of at the next poll"""
+    if _worker is not None:
+        _worker.wake()
+
+
+def get_outbox_stats():
+    """Job counts by status plus this process's worker counters"""
+    counts = dict(db.session.query(SAPPostingJob.status, func.count(SAPPostingJob.id))
+                  .group_by(SAPPostingJob.status).all())
+    return {
+        'jobs': {status: counts.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)},
+        'worker': _worker.stats() if _worker is not None else None
+    }
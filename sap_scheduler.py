@@ -0,0 +1,500 @@
+"""
+SAP Background Scheduler
+Runs the periodic SAP jobs - master data and serial index delta syncs, the open pick-list
+refresh, the counting session flush, the document series / open document number lists and
+the startup cache warm-up - on one thread per process, never inside an HTTP request. Jobs
+that write to the database run only in the leader: the process holding an exclusive flock
+on SAP_SCHEDULER_LOCK_FILE, so exactly one gunicorn worker syncs and another takes over when
+it exits. Cache jobs run in every process because each one has its own sap_cache. Leader
+job outcomes are stored in sap_scheduler_jobs for the admin status page; every-process jobs
+keep their outcome in the process, and their "Run now" request (run_requested_at) is run
+once by every process.
+"""
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, every process acts as leader
+    fcntl = None
+
+from app import db
+from models import SAPSchedulerJob
+
+SCHEDULER_ENABLED = os.environ.get('SAP_SCHEDULER', 'true').lower() != 'false'
+LOCK_FILE = (os.environ.get('SAP_SCHEDULER_LOCK_FILE')
+             or os.path.join(tempfile.gettempdir(), 'wms_sap_scheduler.lock'))
+# Seconds between checks for due jobs, "Run now" requests and leadership
+POLL_INTERVAL = float(os.environ.get('SAP_SCHEDULER_POLL_INTERVAL', '5'))
+# Job intervals in seconds; 0 disables the periodic runs of a job
+PICK_LIST_INTERVAL = float(os.environ.get('SAP_SCHEDULE_PICK_LISTS', '300'))
+OPEN_DOCUMENTS_INTERVAL = float(os.environ.get('SAP_SCHEDULE_OPEN_DOCUMENTS', '120'))
+
+# Documents whose creation can close the source document of an open-document list
+CLOSING_DOCUMENTS = ('PurchaseDeliveryNotes', 'StockTransfers', 'DeliveryNotes')
+
+
+def _runner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ScheduledJob:
+    """A job function plus its schedule; func() returns a JSON-able summary or raises"""
+
+    def __init__(self, name, func, interval, description, leader_only=True, run_at_startup=True):
+        self.name = name
+        self.func = func
+        self.interval = interval if interval and interval > 0 else None
+        self.description = description
+        self.leader_only = leader_only
+        self.next_run = 0.0 if run_at_startup else self._after(time.monotonic())
+
+    def _after(self, now):
+        return now + self.interval if self.interval else None
+
+    def due(self, now):
+        return self.next_run is not None and now >= self.next_run
+
+    def done(self, now):
+        self.next_run = self._after(now)
+
+    def __repr__(self):
+        return f"<ScheduledJob {self.name} every {self.interval or '-'}s>"
+
+
+class LeaderLock:
+    """Non-blocking exclusive flock held for the lifetime of the leader process"""
+
+    def __init__(self, path):
+        self.path = path
+        self._handle = None
+        self.held = False
+
+    def acquire(self):
+        if self.held:
+            return True
+        if fcntl is None:
+            logging.warning("⚠️ fcntl.flock unavailable, this process runs every scheduler job")
+            self.held = True
+            return True
+        handle = open(self.path, 'a+')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(_runner())
+        handle.flush()
+        self._handle = handle
+        self.held = True
+        return True
+
+    def release(self):
+        if self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+        self.held = False
+
+    def holder(self):
+        """host:pid written by the current leader"""
+        try:
+            with open(self.path) as handle:
+                return handle.read().strip() or None
+        except OSError:
+            return None
+
+
+class SAPScheduler:
+    """Scheduler thread: runs due jobs one after another inside an app context"""
+
+    def __init__(self, app, lock_path=LOCK_FILE):
+        self.app = app
+        self.jobs = {}
+        self.lock = LeaderLock(lock_path)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Every-process jobs: this process's last outcome and the last run request it honoured
+        self._outcomes = {}
+        self._seen_requests = {}
+
+    def add_job(self, job):
+        self.jobs[job.name] = job
+        return job
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sap-scheduler', daemon=True)
+        self._thread.start()
+        logging.info(f"✅ SAP scheduler started with jobs: {', '.join(self.jobs)}")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def run_soon(self, name):
+        """Run a job of this process on the next poll"""
+        job = self.jobs.get(name)
+        if job is None:
+            return False
+        job.next_run = 0.0
+        self._wake.set()
+        return True
+
+    def _run(self):
+        with self.app.app_context():
+            try:
+                self._register_jobs()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"❌ Scheduler job registration failed: {str(e)}")
+            finally:
+                db.session.remove()
+
+        while not self._stop.is_set():
+            was_leader = self.lock.held
+            try:
+                leader = self.lock.acquire()
+            except OSError as e:
+                logging.error(f"❌ Scheduler lock {self.lock.path} unusable: {str(e)}")
+                leader = False
+            if leader and not was_leader:
+                logging.info(f"👑 SAP scheduler leader is {_runner()}")
+
+            requested = self._take_run_requests(leader)
+            for job in list(self.jobs.values()):
+                if self._stop.is_set():
+                    break
+                if job.leader_only and not leader:
+                    continue
+                if job.name in requested or job.due(time.monotonic()):
+                    self._execute(job)
+
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+        self.lock.release()
+
+    def _register_jobs(self):
+        for job in self.jobs.values():
+            row = db.session.get(SAPSchedulerJob, job.name)
+            if row is None:
+                row = SAPSchedulerJob(name=job.name, run_count=0, failure_count=0, run_requested=False)
+                db.session.add(row)
+            row.description = job.description
+            row.interval_seconds = int(job.interval) if job.interval else None
+            row.leader_only = job.leader_only
+            if not job.leader_only:
+                # Requests made before this process started are covered by its startup run
+                self._seen_requests[job.name] = row.run_requested_at
+        db.session.commit()
+
+    def _take_run_requests(self, leader):
+        """Names of jobs an admin asked to run now.
+
+        The leader takes (and clears) the requests for leader jobs; every process runs each new
+        request for its every-process jobs once, since each fills its own cache.
+        """
+        local = [job.name for job in self.jobs.values() if not job.leader_only]
+        with self.app.app_context():
+            try:
+                names = set()
+                if leader:
+                    rows = SAPSchedulerJob.query.filter_by(run_requested=True).all()
+                    for row in rows:
+                        names.add(row.name)
+                        row.run_requested = False
+                    db.session.commit()
+                if local:
+                    for name, requested_at in db.session.query(
+                            SAPSchedulerJob.name, SAPSchedulerJob.run_requested_at).filter(
+                            SAPSchedulerJob.name.in_(local), SAPSchedulerJob.run_requested_at.isnot(None)):
+                        if requested_at != self._seen_requests.get(name):
+                            self._seen_requests[name] = requested_at
+                            names.add(name)
+                return names
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"❌ Scheduler could not read run requests: {str(e)}")
+                return set()
+            finally:
+                db.session.remove()
+
+    def _execute(self, job):
+        started = time.monotonic()
+        started_at = datetime.utcnow()
+        with self.app.app_context():
+            if not job.leader_only:
+                self._execute_local(job, started, started_at)
+                return
+            try:
+                self._record(job, status='running', last_started_at=started_at, last_runner=_runner())
+            except Exception as e:
+                db.session.rollback()
+                logging.warning(f"⚠️ Could not record start of job {job.name}: {str(e)}")
+
+            result, error = None, None
+            try:
+                result = job.func()
+                if isinstance(result, dict) and result.get('success') is False:
+                    raise RuntimeError(result.get('error') or 'job reported failure')
+            except Exception as e:
+                db.session.rollback()
+                error = str(e)
+
+            duration_ms = int((time.monotonic() - started) * 1000)
+            try:
+                row = self._record(job, status='failed' if error else 'success',
+                                   last_finished_at=datetime.utcnow(), last_duration_ms=duration_ms,
+                                   last_error=error,
+                                   last_result=None if error else json.dumps(result, default=str)[:2000])
+                row.run_count = (row.run_count or 0) + 1
+                if error:
+                    row.failure_count = (row.failure_count or 0) + 1
+                else:
+                    row.last_success_at = started_at
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.warning(f"⚠️ Could not record outcome of job {job.name}: {str(e)}")
+            finally:
+                db.session.remove()
+
+        self._finish(job, duration_ms, error)
+
+    def _execute_local(self, job, started, started_at):
+        """Run an every-process job, keeping its outcome in this process instead of the shared row"""
+        outcome = self._outcomes.setdefault(job.name, {'run_count': 0, 'failure_count': 0, 'last_success_at': None})
+        outcome.update(status='running', last_started_at=started_at.isoformat(), last_runner=_runner())
+        result, error = None, None
+        try:
+            result = job.func()
+            if isinstance(result, dict) and result.get('success') is False:
+                raise RuntimeError(result.get('error') or 'job reported failure')
+        except Exception as e:
+            db.session.rollback()
+            error = str(e)
+        finally:
+            db.session.remove()
+
+        duration_ms = int((time.monotonic() - started) * 1000)
+        outcome.update(status='failed' if error else 'success', last_finished_at=datetime.utcnow().isoformat(),
+                       last_duration_ms=duration_ms, last_error=error,
+                       last_result=None if error else json.dumps(result, default=str)[:2000],
+                       run_count=outcome['run_count'] + 1,
+                       failure_count=outcome['failure_count'] + (1 if error else 0))
+        if not error:
+            outcome['last_success_at'] = started_at.isoformat()
+        self._finish(job, duration_ms, error)
+
+    def _finish(self, job, duration_ms, error):
+        job.done(time.monotonic())
+        if error:
+            logging.error(f"❌ Scheduled job {job.name} failed after {duration_ms}ms: {error}")
+        else:
+            logging.info(f"⏱️ Scheduled job {job.name} finished in {duration_ms}ms")
+
+    def _record(self, job, **fields):
+        row = db.session.get(SAPSchedulerJob, job.name)
+        if row is None:
+            row = SAPSchedulerJob(name=job.name, description=job.description, run_count=0,
+                                  failure_count=0, run_requested=False)
+            db.session.add(row)
+        for field, value in fields.items():
+            setattr(row, field, value)
+        db.session.commit()
+        return row
+
+
+# ================================
+# Jobs
+# ================================
+
+def _master_data_job():
+    from sap_master_sync import run_master_data_sync
+
+    results = run_master_data_sync()
+    if results is None:
+        return {'skipped': 'master data sync already running'}
+    failed = [entity for entity, ok in results.items() if not ok]
+    if failed:
+        raise RuntimeError(f"sync failed for {', '.join(failed)}")
+    return results
+
+
+def _serial_index_job():
+    from sap_serial_index import refresh_serial_index
+
+    return refresh_serial_index()
+
+
+def _pick_list_job():
+    from sap_integration import SAPIntegration
+
+    # New pick lists stay unowned until a picker imports or claims them
+    return SAPIntegration().sync_open_pick_lists(None)
+
+
+def _open_documents_job():
+    """Reload the document series and open document number lists into sap_cache"""
+    from sap_fanout import fan_out
+    from sap_integration import SAPIntegration
+
+    sap = SAPIntegration()
+    if not sap.ensure_logged_in():
+        raise RuntimeError('SAP B1 not available')
+    summary = {'so_series': len(sap.get_so_series(refresh=True)),
+               'invcnt_series': len(sap.get_invcnt_series(refresh=True))}
+    for kind, get_series, get_docnums in (('po', sap.get_po_series, sap.get_open_po_docnums),
+                                          ('invt', sap.get_invt_series, sap.get_open_invt_docnums)):
+        series = [entry.get('Series') for entry in get_series(refresh=True) if entry.get('Series') is not None]
+        outcomes = fan_out(lambda code: get_docnums(code, refresh=True), series)
+        summary[f'{kind}_series'] = len(series)
+        summary[f'{kind}_open_documents'] = sum(len(outcome.value or []) for outcome in outcomes if outcome.ok)
+    return summary
+
+
+def _counting_flush_job():
+    from sap_counting_sessions import flush_counting_sessions
+
+    return flush_counting_sessions()
+
+
+def _cache_warmup_job():
+    """Load warehouses and their bins so the first scans after a restart hit the cache"""
+    from sap_fanout import fan_out
+    from sap_integration import SAPIntegration
+
+    sap = SAPIntegration()
+    if not sap.ensure_logged_in():
+        raise RuntimeError('SAP B1 not available')
+    warehouses = [w.get('WarehouseCode') for w in sap.get_warehouses() if w.get('WarehouseCode')]
+    outcomes = fan_out(sap.get_bins, warehouses)
+    return {'warehouses': len(warehouses),
+            'bins': sum(len(outcome.value or []) for outcome in outcomes if outcome.ok)}
+
+
+def default_jobs():
+    """The jobs this deployment runs, in execution order"""
+    from sap_counting_sessions import FLUSH_INTERVAL
+    from sap_master_sync import SYNC_INTERVAL
+    from sap_serial_index import REFRESH_INTERVAL, SERIAL_INDEX_ENABLED
+
+    jobs = [
+        ScheduledJob('cache_warmup', _cache_warmup_job, None,
+                     'Load warehouses and bins into the SAP cache at startup', leader_only=False),
+        ScheduledJob('open_documents', _open_documents_job, OPEN_DOCUMENTS_INTERVAL,
+                     'Refresh document series and open PO / transfer request numbers', leader_only=False),
+        ScheduledJob('master_data', _master_data_job, SYNC_INTERVAL,
+                     'Delta sync of warehouses, bins and business partners'),
+        ScheduledJob('open_pick_lists', _pick_list_job, PICK_LIST_INTERVAL,
+                     'Sync open SAP pick lists with their lines'),
+        ScheduledJob('counting_flush', _counting_flush_job, FLUSH_INTERVAL,
+                     'Merge counting session entries and send changed counting lines to SAP'),
+    ]
+    if SERIAL_INDEX_ENABLED:
+        jobs.append(ScheduledJob('serial_index', _serial_index_job, REFRESH_INTERVAL,
+                                 'Delta pull of SAP serial numbers into the local index'))
+    return jobs
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _on_document_created(url, response):
+    """Session-pool listener: a posting may have closed a PO or transfer request"""
+    if _scheduler is None:
+        return
+    collection = url.split('/b1s/v1/', 1)[-1].split('?', 1)[0].split('(', 1)[0]
+    if collection in CLOSING_DOCUMENTS:
+        from sap_cache import sap_cache
+        sap_cache.invalidate('open_docnums')
+        _scheduler.run_soon('open_documents')
+
+
+def start_scheduler(app):
+    """Start this process's scheduler thread (no-op when SAP_SCHEDULER=false)"""
+    global _scheduler
+    if not SCHEDULER_ENABLED:
+        logging.info("ℹ️ SAP scheduler disabled (SAP_SCHEDULER=false)")
+        return None
+    from sap_session_pool import add_document_listener
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SAPScheduler(app)
+            for job in default_jobs():
+                _scheduler.add_job(job)
+        add_document_listener(_on_document_created)
+        _scheduler.start()
+        return _scheduler
+
+
+def stop_scheduler(timeout=30):
+    """Stop this process's scheduler thread and wait for a running job to finish"""
+    if _scheduler is None or not _scheduler.running():
+        return
+    _scheduler.stop()
+    _scheduler._thread.join(timeout)
+
+
+def request_job_run(name):
+    """Ask the leader, or every process for every-process jobs, to run a job; False for unknown jobs"""
+    row = db.session.get(SAPSchedulerJob, name)
+    if row is None:
+        return False
+    if row.leader_only is False:
+        row.run_requested_at = datetime.utcnow()
+    else:
+        row.run_requested = True
+    db.session.commit()
+    if _scheduler is not None:
+        _scheduler.wake()
+    return True
+
+
+# Outcome fields of every-process jobs, which come from this process instead of the shared row
+_LOCAL_OUTCOME_FIELDS = ('status', 'last_started_at', 'last_finished_at', 'last_duration_ms', 'last_success_at',
+                         'last_error', 'last_result', 'last_runner', 'run_count', 'failure_count')
+
+
+def get_scheduler_status():
+    """Leader, this process's role and the recorded outcome of every job (this process's own
+    outcome for jobs every process runs)"""
+    local = _scheduler.jobs if _scheduler else {}
+    outcomes = _scheduler._outcomes if _scheduler else {}
+    now = time.monotonic()
+    jobs = []
+    for row in SAPSchedulerJob.query.order_by(SAPSchedulerJob.name):
+        job = row.to_dict()
+        if row.leader_only is False:
+            outcome = outcomes.get(row.name, {})
+            job.update({field: outcome.get(field) for field in _LOCAL_OUTCOME_FIELDS})
+        if row.name in local and local[row.name].next_run is not None:
+            job['next_run_in_seconds'] = max(0, int(local[row.name].next_run - now))
+        jobs.append(job)
+    return {
+        'enabled': SCHEDULER_ENABLED,
+        'running': bool(_scheduler and _scheduler.running()),
+        'this_process': _runner(),
+        'is_leader': bool(_scheduler and _scheduler.lock.held),
+        'leader': _scheduler.lock.holder() if _scheduler else None,
+        'poll_interval_seconds': POLL_INTERVAL,
+        'jobs': jobs
+    }
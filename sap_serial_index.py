@@ -0,0 +1,452 @@
+"""
+SAP B1 Serial Number Index
+Local mirror of SAP serial numbers (OSRN/OSRQ/OSBQ): serial -> item, warehouse, bin and
+status. A scheduler job (sap_scheduler) pulls only the serials changed since its last run
+(OSRN.UpdateDate and new OITL inventory-log entries), and documents this WMS posts update
+the index as soon as SAP creates them. Serial validation answers current entries with an
+indexed local lookup and asks SAP only about serials that are missing or stale.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+
+import requests
+from sqlalchemy import func
+
+from app import db
+from bulk_upsert import bulk_upsert
+from models import SAPSerialIndex, SAPSyncState
+from sap_serial_validation import iter_serial_validation, serial_result
+
+# Set SAP_SERIAL_INDEX=false to validate every serial against SAP
+SERIAL_INDEX_ENABLED = os.environ.get('SAP_SERIAL_INDEX', 'true').lower() != 'false'
+# Entries not confirmed by SAP (lookup or delta pull) within this many seconds are re-checked
+MAX_AGE_SECONDS = float(os.environ.get('SAP_SERIAL_INDEX_MAX_AGE', '900'))
+# Seconds between delta pulls from SAP (serial_index scheduler job); 0 = only at startup
+REFRESH_INTERVAL = float(os.environ.get('SAP_SERIAL_INDEX_REFRESH_INTERVAL', '300'))
+DELTA_PAGE_SIZE = int(os.environ.get('SAP_SERIAL_INDEX_PAGE_SIZE', '1000'))
+
+DELTA_QUERY = 'Serial_Index_Delta'
+SYNC_ENTITY = 'serial_index'
+LOOKUP_CHUNK = 500
+WRITE_CHUNK = 500
+FLUSH_INTERVAL = 2
+
+# Serials on these documents enter the line's warehouse, leave stock, or move warehouse
+RECEIPT_DOCUMENTS = ('PurchaseDeliveryNotes', 'InventoryGenEntries', 'Returns')
+ISSUE_DOCUMENTS = ('DeliveryNotes', 'InventoryGenExits', 'PurchaseReturns', 'Invoices')
+TRANSFER_DOCUMENTS = ('StockTransfers',)
+
+# Index updates waiting for the refresher thread, keyed by (serial, item); lookups see them at once
+_pending = {}
+_pending_lock = threading.Lock()
+_sync_cache = {'checked': 0.0, 'last_success_at': None}
+_stats = {'hits': 0, 'misses': 0, 'recorded': 0, 'postings': 0}
+_stats_lock = threading.Lock()
+
+
+def _record(counter, amount=1):
+    with _stats_lock:
+        _stats[counter] += amount
+
+
+def _parse_sap_date(value):
+    """SAP dates arrive as '2026-10-16T00:00:00Z', '2026-10-16' or '20261016'"""
+    if not value:
+        return None
+    digits = str(value)[:10].replace('-', '')
+    try:
+        return datetime.strptime(digits[:8], '%Y%m%d')
+    except ValueError:
+        return None
+
+
+# ================================
+# Lookups
+# ================================
+
+def _last_synced_at():
+    """Start of the last successful delta pull (any process); cached for a few seconds"""
+    now = time.monotonic()
+    if now - _sync_cache['checked'] > 10:
+        state = db.session.get(SAPSyncState, SYNC_ENTITY)
+        _sync_cache.update(checked=now, last_success_at=state.last_success_at if state else None)
+    return _sync_cache['last_success_at']
+
+
+def lookup_serials(serial_numbers, item_code=None):
+    """Current index entries as {serial: [entry, ...]}; missing and stale serials are left out.
+
+    An entry is current when SAP confirmed it within SAP_SERIAL_INDEX_MAX_AGE, either
+    directly or through a delta pull that would have caught any later change.
+    """
+    wanted = list(dict.fromkeys(s for s in serial_numbers if s))
+    cutoff = datetime.utcnow() - timedelta(seconds=MAX_AGE_SECONDS)
+    synced_at = _last_synced_at()
+    sync_current = synced_at is not None and synced_at >= cutoff
+
+    found = {}
+    columns = (SAPSerialIndex.serial_number, SAPSerialIndex.item_code, SAPSerialIndex.system_number,
+               SAPSerialIndex.warehouse_code, SAPSerialIndex.bin_code, SAPSerialIndex.status,
+               SAPSerialIndex.refreshed_at)
+    for start in range(0, len(wanted), LOOKUP_CHUNK):
+        query = db.session.query(*columns).filter(SAPSerialIndex.serial_number.in_(wanted[start:start + LOOKUP_CHUNK]))
+        if item_code:
+            query = query.filter(SAPSerialIndex.item_code == item_code)
+        for row in query:
+            found[(row.serial_number, row.item_code)] = row._asdict()
+
+    with _pending_lock:
+        if _pending:
+            wanted_set = set(wanted)
+            for key, entry in _pending.items():
+                if key[0] in wanted_set and (not item_code or key[1] == item_code):
+                    found[key] = dict(found.get(key, {}), **entry)
+
+    current = {}
+    for (serial, _), entry in found.items():
+        if sync_current or entry['refreshed_at'] >= cutoff:
+            current.setdefault(serial, []).append(entry)
+    return current
+
+
+def _pick(entries, warehouse_code):
+    """The entry stocked in warehouse_code if there is one (a serial can exist for several items)"""
+    for entry in entries:
+        if warehouse_code and entry.get('warehouse_code') == warehouse_code:
+            return entry
+    return next((entry for entry in entries if entry.get('warehouse_code')), entries[0])
+
+
+def lookup_serial(serial_number, item_code=None, warehouse_code=None):
+    """Current index entry for one serial, or None when SAP has to be asked"""
+    if not SERIAL_INDEX_ENABLED:
+        return None
+    try:
+        entries = lookup_serials([serial_number], item_code).get(serial_number)
+    except Exception as e:
+        logging.warning(f"⚠️ Serial index lookup failed, asking SAP: {str(e)}")
+        return None
+    _record('hits' if entries else 'misses')
+    return _pick(entries, warehouse_code) if entries else None
+
+
+def _as_sap_row(entry, warehouse_code):
+    stocked = entry.get('warehouse_code')
+    return {
+        'SerialNumber': entry['serial_number'],
+        'ItemCode': entry['item_code'],
+        'SystemNumber': entry.get('system_number'),
+        'WhsCode': stocked,
+        'AvailableInWarehouse': 1 if (stocked == warehouse_code if warehouse_code else stocked) else 0
+    }
+
+
+def iter_indexed_serial_validation(sap, serial_numbers, item_code=None, warehouse_code=None,
+                                   chunk_size=None, timeout=60):
+    """iter_serial_validation() that answers current index entries locally.
+
+    Only missing and stale serials go to SAP; what SAP returns is written back.
+    """
+    serials = list(dict.fromkeys(s for s in serial_numbers if s))
+    if not SERIAL_INDEX_ENABLED:
+        yield from iter_serial_validation(sap, serials, item_code, warehouse_code, chunk_size, timeout)
+        return
+
+    try:
+        entries = lookup_serials(serials, item_code)
+    except Exception as e:
+        logging.warning(f"⚠️ Serial index lookup failed, validating against SAP: {str(e)}")
+        entries = {}
+
+    for serial in serials:
+        if serial in entries:
+            result = serial_result(serial, _as_sap_row(_pick(entries[serial], warehouse_code), warehouse_code),
+                                   warehouse_code)
+            result['source'] = 'wms_serial_index'
+            yield serial, result
+
+    missing = [serial for serial in serials if serial not in entries]
+    _record('hits', len(serials) - len(missing))
+    _record('misses', len(missing))
+    learned = []
+    for serial, result in iter_serial_validation(sap, missing, item_code, warehouse_code, chunk_size, timeout):
+        if result.get('ItemCode'):
+            learned.append({'serial_number': result.get('SerialNumber') or serial,
+                            'item_code': result['ItemCode'],
+                            'system_number': result.get('SystemNumber'),
+                            'warehouse_code': result.get('WhsCode') or None,
+                            'source': 'sap_lookup'})
+        yield serial, result
+    record_entries(learned)
+
+    if serials:
+        logging.info(f"🗂️ Serial index answered {len(serials) - len(missing)}/{len(serials)} serials, "
+                     f"{len(missing)} checked with SAP")
+
+
+def validate_serials_indexed(sap, serial_numbers, item_code=None, warehouse_code=None, chunk_size=None, timeout=60):
+    """Like sap_serial_validation.validate_serials, answering current entries from the index"""
+    return dict(iter_indexed_serial_validation(sap, serial_numbers, item_code, warehouse_code, chunk_size, timeout))
+
+
+# ================================
+# Updates
+# ================================
+
+def record_entries(entries):
+    """Queue index updates (dicts of SAPSerialIndex fields); visible to lookups at once.
+
+    Fields left out keep their stored value, except that the bin is cleared when a
+    serial changes warehouse without a new bin.
+    """
+    if not SERIAL_INDEX_ENABLED or not entries:
+        return
+    now = datetime.utcnow()
+    with _pending_lock:
+        for entry in entries:
+            key = (entry['serial_number'], entry['item_code'])
+            _pending[key] = dict(_pending.get(key, {}), refreshed_at=now, **entry)
+    _record('recorded', len(entries))
+    if _refresher is not None:
+        _refresher.wake()
+
+
+def record_lookup(serial_number, item_code, warehouse_code, system_number=None):
+    """Remember what a single-serial SAP validation returned"""
+    if serial_number and item_code:
+        record_entries([{'serial_number': serial_number, 'item_code': item_code, 'system_number': system_number,
+                         'warehouse_code': warehouse_code or None, 'source': 'sap_lookup'}])
+
+
+def _write_entries(entries):
+    """Upsert entries into sap_serial_index, WRITE_CHUNK rows per round trip and commit"""
+    for start in range(0, len(entries), WRITE_CHUNK):
+        chunk = entries[start:start + WRITE_CHUNK]
+        existing = {(row.serial_number, row.item_code): row for row in SAPSerialIndex.query.filter(
+            SAPSerialIndex.serial_number.in_({entry['serial_number'] for entry in chunk}))}
+        for entry in chunk:
+            key = (entry['serial_number'], entry['item_code'])
+            row = existing.get(key)
+            if row is None:
+                row = SAPSerialIndex(serial_number=entry['serial_number'], item_code=entry['item_code'])
+                db.session.add(row)
+                existing[key] = row
+            elif 'warehouse_code' in entry and entry['warehouse_code'] != row.warehouse_code and 'bin_code' not in entry:
+                row.bin_code = None
+                row.bin_abs_entry = None
+            for field, value in entry.items():
+                setattr(row, field, value)
+        db.session.commit()
+
+
+def flush_pending():
+    """Write queued index updates; returns how many were written"""
+    with _pending_lock:
+        entries = list(_pending.values())
+    if not entries:
+        return 0
+    _write_entries(entries)
+    with _pending_lock:
+        for entry in entries:
+            key = (entry['serial_number'], entry['item_code'])
+            if _pending.get(key) is entry:
+                del _pending[key]
+    return len(entries)
+
+
+def _on_document_created(url, response):
+    """Session-pool listener: move the serials of a document SAP has just created"""
+    collection = unquote(url.split('/b1s/v1/', 1)[-1]).split('?', 1)[0].split('(', 1)[0]
+    if collection not in RECEIPT_DOCUMENTS + ISSUE_DOCUMENTS + TRANSFER_DOCUMENTS:
+        return
+    try:
+        document = response.json()
+    except ValueError:
+        return
+    entries = []
+    for line in document.get('StockTransferLines') or document.get('DocumentLines') or []:
+        item_code = line.get('ItemCode')
+        for serial in line.get('SerialNumbers') or []:
+            serial_number = serial.get('InternalSerialNumber') or serial.get('ManufacturerSerialNumber')
+            if not serial_number or not item_code:
+                continue
+            # The new bin is filled in by the next delta pull
+            entries.append({'serial_number': serial_number, 'item_code': item_code,
+                            'warehouse_code': None if collection in ISSUE_DOCUMENTS else line.get('WarehouseCode'),
+                            'bin_code': None, 'bin_abs_entry': None, 'source': 'wms_posting'})
+    if entries:
+        record_entries(entries)
+        _record('postings')
+        logging.info(f"🗂️ Serial index updated for {len(entries)} serials on new SAP {collection} "
+                     f"{document.get('DocNum', '')}")
+
+
+# ================================
+# Delta pulls from SAP
+# ================================
+
+def _entry_from_row(row, refreshed_at):
+    status = row.get('Status')
+    return {
+        'serial_number': row.get('SerialNumber'),
+        'item_code': row.get('ItemCode'),
+        'system_number': row.get('SystemNumber'),
+        'warehouse_code': row.get('WhsCode') or None,
+        'bin_code': row.get('BinCode') or None,
+        'bin_abs_entry': row.get('BinAbs') or None,
+        'status': str(status) if status is not None else None,
+        'sap_update_date': _parse_sap_date(row.get('UpdateDate')),
+        'sap_log_entry': row.get('LogEntry'),
+        'source': 'sap_sync',
+        'refreshed_at': refreshed_at
+    }
+
+
+def refresh_serial_index(sap=None):
+    """Pull serials changed in SAP since the stored watermarks into the index"""
+    from sap_integration import SAPIntegration
+
+    sap = sap or SAPIntegration()
+    state = db.session.get(SAPSyncState, SYNC_ENTITY)
+    if state is None:
+        state = SAPSyncState(entity=SYNC_ENTITY, rows_synced=0)
+        db.session.add(state)
+    started = datetime.utcnow()
+    state.last_run_at = started
+    if not sap.ensure_logged_in():
+        state.last_error = 'SAP B1 not available'
+        db.session.commit()
+        return {'success': False, 'error': state.last_error}
+
+    # UpdateDate has no time part, so the date watermark overlaps a day; upserts make that harmless
+    since_date = (state.last_update_date or datetime(1900, 1, 1)).strftime('%Y-%m-%d')
+    since_log = state.last_log_entry or 0
+    db.session.commit()
+
+    rows_synced = 0
+    max_log_entry = since_log
+    batch = []
+    try:
+        for row in sap.iter_sql_query(DELTA_QUERY, f"sinceDate='{since_date}'&sinceLog='{since_log}'",
+                                      page_size=DELTA_PAGE_SIZE, timeout=120):
+            if not row.get('SerialNumber') or not row.get('ItemCode'):
+                continue
+            batch.append(_entry_from_row(row, started))
+            max_log_entry = max(max_log_entry, int(row.get('LogEntry') or 0))
+            if len(batch) >= WRITE_CHUNK:
+                bulk_upsert(SAPSerialIndex, batch, ['serial_number', 'item_code'])
+                db.session.commit()
+                rows_synced += len(batch)
+                batch = []
+        bulk_upsert(SAPSerialIndex, batch, ['serial_number', 'item_code'])
+        db.session.commit()
+        rows_synced += len(batch)
+    except Exception as e:
+        db.session.rollback()
+        state = db.session.get(SAPSyncState, SYNC_ENTITY)
+        state.last_error = str(e)
+        db.session.commit()
+        if isinstance(e, requests.HTTPError) and getattr(e.response, 'status_code', None) == 404:
+            logging.warning(f"⚠️ SQL query {DELTA_QUERY} is not registered in SAP - serial index relies on lookups")
+        else:
+            logging.error(f"❌ Serial index delta pull failed after {rows_synced} rows: {str(e)}")
+        return {'success': False, 'error': str(e), 'rows': rows_synced}
+
+    state = db.session.get(SAPSyncState, SYNC_ENTITY)
+    state.last_update_date = started
+    state.last_log_entry = max_log_entry
+    state.last_success_at = started
+    state.rows_synced = rows_synced
+    state.last_error = None
+    db.session.commit()
+    _sync_cache.update(checked=time.monotonic(), last_success_at=started)
+    logging.info(f"✅ Serial index delta pull: {rows_synced} serials changed since {since_date} / log {since_log}")
+    return {'success': True, 'rows': rows_synced}
+
+
+class SerialIndexRefresher:
+    """Background thread: writes queued index updates (delta pulls run as a scheduler job)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sap-serial-index', daemon=True)
+        self._thread.start()
+        logging.info("✅ SAP serial index refresher started")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    flush_pending()
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"❌ Serial index write failed: {str(e)}")
+                finally:
+                    db.session.remove()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_serial_index(app):
+    """Hook WMS postings into the index and start the refresher (no-op when SAP_SERIAL_INDEX=false)"""
+    global _refresher
+    if not SERIAL_INDEX_ENABLED:
+        logging.info("ℹ️ SAP serial index disabled (SAP_SERIAL_INDEX=false)")
+        return None
+    from sap_session_pool import add_document_listener
+    add_document_listener(_on_document_created)
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = SerialIndexRefresher(app)
+        _refresher.start()
+        return _refresher
+
+
+def stop_serial_index(timeout=30):
+    """Stop the refresher thread after it has written the queued index updates"""
+    if _refresher is None or not _refresher.running():
+        return
+    _refresher.stop()
+    _refresher._thread.join(timeout)
+
+
+def get_serial_index_stats():
+    """Index size, sync state and this process's lookup counters"""
+    state = db.session.get(SAPSyncState, SYNC_ENTITY)
+    with _stats_lock:
+        counters = dict(_stats)
+    with _pending_lock:
+        counters['pending_writes'] = len(_pending)
+    return {
+        'enabled': SERIAL_INDEX_ENABLED,
+        'serials': db.session.query(func.count(SAPSerialIndex.id)).scalar(),
+        'sync': state.to_dict() if state else None,
+        'process': counters,
+        'refresher_running': bool(_refresher and _refresher.running())
+    }
@@ -0,0 +1,241 @@
+"""
+SAP B1 Set-based Serial Validation
+Validates whole serial sets against OSRN/OSRQ with as few SQL queries as possible:
+runs of consecutive serials (SN0001..SN1500) collapse into BETWEEN ranges, the rest
+is sent as large IN lists, query chunks run concurrently through sap_fanout and
+per-serial results stream back as each chunk completes.
+"""
+import logging
+import os
+import re
+import time
+
+from sap_fanout import fan_out_iter
+
+# Serials per validation query (IN-list entries plus serials covered by ranges)
+SERIAL_CHUNK_SIZE = int(os.environ.get('SAP_SERIAL_VALIDATION_CHUNK', '1000'))
+# Shortest run of consecutive serials sent as one BETWEEN range instead of IN-list entries
+SERIAL_RANGE_MIN = int(os.environ.get('SAP_SERIAL_RANGE_MIN', '5'))
+# Rows per Service Layer page for validation results (Prefer: odata.maxpagesize)
+SERIAL_PAGE_SIZE = int(os.environ.get('SAP_SERIAL_VALIDATION_PAGE_SIZE', '1000'))
+
+VALIDATION_QUERY = 'Batch_Series_Validation'
+
+_NUMBERED_SERIAL = re.compile(r'^(.*?)(\d+)$')
+
+
+class SerialQueryChunk:
+    """One validation query: BETWEEN ranges plus an IN list, and every serial they cover"""
+
+    def __init__(self):
+        self.ranges = []
+        self.singles = []
+        self.serials = []
+
+    def add_range(self, members):
+        self.ranges.append((members[0], members[-1]))
+        self.serials.extend(members)
+
+    def add_single(self, serial):
+        self.singles.append(serial)
+        self.serials.append(serial)
+
+    def __len__(self):
+        return len(self.serials)
+
+    def __repr__(self):
+        return f"<SerialQueryChunk {len(self.serials)} serials, {len(self.ranges)} ranges>"
+
+
+def sql_literal(value):
+    """Quote a value as a SQL string literal"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def compress_serial_ranges(serial_numbers, min_run=SERIAL_RANGE_MIN):
+    """Split serials into runs of consecutive numbers and leftovers.
+
+    Serials group by prefix and digit width, so every run is lexically contiguous
+    (SN0098..SN0102) and can be queried with BETWEEN. Returns (runs, singles) where
+    each run is the ordered list of serials it covers.
+    """
+    groups = {}
+    singles = []
+    for serial in serial_numbers:
+        match = _NUMBERED_SERIAL.match(serial)
+        if not match:
+            singles.append(serial)
+            continue
+        prefix, digits = match.groups()
+        groups.setdefault((prefix, len(digits)), []).append((int(digits), serial))
+
+    runs = []
+    for members in groups.values():
+        members.sort()
+        run = [members[0]]
+        for member in members[1:] + [None]:
+            if member is not None and member[0] == run[-1][0] + 1:
+                run.append(member)
+                continue
+            if len(run) >= min_run:
+                runs.append([serial for _, serial in run])
+            else:
+                singles.extend(serial for _, serial in run)
+            run = [member]
+    return runs, singles
+
+
+def build_serial_chunks(serial_numbers, chunk_size=None, min_run=SERIAL_RANGE_MIN):
+    """Pack serials into query chunks of at most chunk_size serials each"""
+    chunk_size = max(1, chunk_size or SERIAL_CHUNK_SIZE)
+    runs, singles = compress_serial_ranges(serial_numbers, min_run)
+    chunks = [SerialQueryChunk()]
+
+    def room():
+        if len(chunks[-1]) >= chunk_size:
+            chunks.append(SerialQueryChunk())
+        return chunk_size - len(chunks[-1])
+
+    for run in runs:
+        while run:
+            take = room()
+            piece, run = run[:take], run[take:]
+            if len(piece) >= min_run:
+                chunks[-1].add_range(piece)
+            else:
+                for serial in piece:
+                    chunks[-1].add_single(serial)
+    for serial in singles:
+        room()
+        chunks[-1].add_single(serial)
+    return [chunk for chunk in chunks if len(chunk)]
+
+
+def build_validation_sql(chunk, item_code=None, warehouse_code=None):
+    """OSRN/OSRQ query returning one row per matching serial and stocked warehouse"""
+    predicates = [f"T0.DistNumber BETWEEN {sql_literal(low)} AND {sql_literal(high)}"
+                  for low, high in chunk.ranges]
+    if chunk.singles:
+        predicates.append(f"T0.DistNumber IN ({', '.join(sql_literal(s) for s in chunk.singles)})")
+    if warehouse_code:
+        available = f"CASE WHEN T1.WhsCode = {sql_literal(warehouse_code)} THEN 1 ELSE 0 END"
+    else:
+        available = "CASE WHEN T1.WhsCode IS NULL THEN 0 ELSE 1 END"
+    item_filter = f"T0.ItemCode = {sql_literal(item_code)} AND " if item_code else ""
+    return f"""
+            SELECT
+                T0.DistNumber as SerialNumber,
+                T0.ItemCode,
+                T0.SysNumber as SystemNumber,
+                T1.WhsCode,
+                {available} as AvailableInWarehouse
+            FROM OSRN T0
+            LEFT JOIN OSRQ T1 ON T1.ItemCode = T0.ItemCode AND T1.SysNumber = T0.SysNumber AND T1.Quantity > 0
+            WHERE {item_filter}({' OR '.join(predicates)})
+            ORDER BY T0.DistNumber
+            """
+
+
+def _query_chunk(sap, chunk, item_code, warehouse_code, timeout):
+    """Run one validation query, following Service Layer paging; returns all rows"""
+    return list(sap.iter_sql_query(VALIDATION_QUERY,
+                                   f"sqlQuery={build_validation_sql(chunk, item_code, warehouse_code)}",
+                                   page_size=SERIAL_PAGE_SIZE, timeout=timeout))
+
+
+def serial_result(serial, row, warehouse_code):
+    """Result for one serial from its OSRN/OSRQ row (None when SAP does not know it).
+
+    Same shape as validate_series_with_warehouse_sap: valid only with stock in
+    warehouse_code (or anywhere, without one).
+    """
+    if row is None:
+        return {
+            'valid': False,
+            'error': f'Series {serial} not found in SAP system',
+            'available_in_warehouse': False,
+            'validation_type': 'batch_not_found'
+        }
+    if row.get('AvailableInWarehouse'):
+        return {
+            'valid': True,
+            'SerialNumber': row.get('SerialNumber'),
+            'DistNumber': row.get('SerialNumber'),
+            'SystemNumber': row.get('SystemNumber'),
+            'ItemCode': row.get('ItemCode'),
+            'WhsCode': row.get('WhsCode'),
+            'available_in_warehouse': True,
+            'validation_type': 'batch_warehouse_specific'
+        }
+    location = f'warehouse {warehouse_code}' if warehouse_code else 'any warehouse'
+    return {
+        'valid': False,
+        'error': f'Series {serial} is not available in {location}',
+        'SerialNumber': row.get('SerialNumber'),
+        'SystemNumber': row.get('SystemNumber'),
+        'ItemCode': row.get('ItemCode'),
+        'WhsCode': row.get('WhsCode'),
+        'available_in_warehouse': False,
+        'validation_type': 'batch_warehouse_unavailable'
+    }
+
+
+def _chunk_results(chunk, rows, warehouse_code):
+    """Per-serial results for one chunk"""
+    found = {}
+    for row in rows:
+        serial = row.get('SerialNumber')
+        current = found.get(serial)
+        # A serial can be listed once per warehouse; the FromWarehouse row wins
+        if current is None or (row.get('AvailableInWarehouse') and not current.get('AvailableInWarehouse')):
+            found[serial] = row
+    # SAP collations are usually case-insensitive, so match the same way
+    folded = {str(serial).upper(): row for serial, row in found.items()}
+
+    for serial in chunk.serials:
+        yield serial, serial_result(serial, found.get(serial) or folded.get(serial.upper()), warehouse_code)
+
+
+def iter_serial_validation(sap, serial_numbers, item_code=None, warehouse_code=None,
+                           chunk_size=None, timeout=60):
+    """Validate serials against SAP B1 and yield (serial, result) as chunks complete.
+
+    A serial is valid when it exists (for item_code, if given) and has stock in
+    warehouse_code (or anywhere, without one). Each distinct serial is yielded
+    exactly once; results of a failed chunk carry its error instead.
+    """
+    serials = list(dict.fromkeys(s for s in serial_numbers if s))
+    if not serials:
+        return
+    if not sap.ensure_logged_in():
+        logging.warning("SAP B1 not available, cannot validate serial numbers")
+        for serial in serials:
+            yield serial, {'valid': False, 'error': 'SAP B1 not available'}
+        return
+
+    started = time.monotonic()
+    chunks = build_serial_chunks(serials, chunk_size)
+    valid = 0
+    for outcome in fan_out_iter(lambda chunk: _query_chunk(sap, chunk, item_code, warehouse_code, timeout),
+                                chunks):
+        if outcome.ok:
+            for serial, result in _chunk_results(outcome.item, outcome.value, warehouse_code):
+                valid += 1 if result['valid'] else 0
+                yield serial, result
+        else:
+            logging.error(f"❌ Serial validation chunk failed ({outcome.item!r}): {outcome.error}")
+            for serial in outcome.item.serials:
+                yield serial, {
+                    'valid': False,
+                    'error': f'Batch validation error: {outcome.error}',
+                    'validation_type': 'batch_api_error'
+                }
+
+    ranges = sum(len(chunk.ranges) for chunk in chunks)
+    logging.info(f"✅ Validated {len(serials)} serial numbers in {time.monotonic() - started:.2f}s "
+                 f"({valid} valid) using {len(chunks)} SAP queries, {ranges} serial ranges")
+
+
+def validate_serials(sap, serial_numbers, item_code=None, warehouse_code=None, chunk_size=None, timeout=60):
+    """Validate serials against SAP B1; returns a dict of serial -> result"""
+    return dict(iter_serial_validation(sap, serial_numbers, item_code, warehouse_code, chunk_size, timeout))
@@ -0,0 +1,417 @@
+"""
+SAP B1 Service Layer Session Pool
+Process-wide pool of already-authenticated Service Layer sessions (B1SESSION cookies)
+shared by SAPIntegration and SAPMultiGRNService, so building a client per request
+no longer costs a /b1s/v1/Login round trip.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+import urllib3
+
+from metrics import record_sap_call, sap_endpoint
+from sap_circuit_breaker import (DEFAULT_WRITE_TIMEOUT, UNHEALTHY_STATUS_CODES, SAPCircuitOpenError,
+                                 get_circuit_breaker)
+from sap_singleflight import SINGLE_FLIGHT_ENABLED, is_read_request, request_key, sap_single_flight
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Pool configuration (environment variables, like the rest of the SAP settings)
+DEFAULT_POOL_SIZE = int(os.environ.get('SAP_SESSION_POOL_SIZE', '4'))
+DEFAULT_LEASE_TIMEOUT = float(os.environ.get('SAP_SESSION_LEASE_TIMEOUT', '30'))
+DEFAULT_KEEPALIVE_INTERVAL = float(os.environ.get('SAP_SESSION_KEEPALIVE_INTERVAL', '60'))
+LOGIN_TIMEOUT = 30
+
+# Re-login / ping this many seconds before the Service Layer would expire the session
+EXPIRY_MARGIN_SECONDS = 120
+# Service Layer default when the Login response does not report SessionTimeout
+DEFAULT_SESSION_TIMEOUT_MINUTES = 30
+
+
+class SAPLoginError(requests.exceptions.RequestException):
+    """Raised when the Service Layer rejects a pooled session login"""
+
+
+class SAPPoolExhaustedError(requests.exceptions.RequestException):
+    """Raised when no pooled session could be leased within the lease timeout"""
+
+
+class SAPPooledSession:
+    """One authenticated Service Layer session owned by a SAPSessionPool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.http = requests.Session()
+        self.http.verify = False  # For development, in production use proper SSL
+        self.session_id = None
+        self.timeout_minutes = DEFAULT_SESSION_TIMEOUT_MINUTES
+        self.last_used = 0.0
+
+    def login(self):
+        """Perform the Service Layer Login and remember the session timeout"""
+        self.http.cookies.clear()
+        response = self.http.post(f"{self.pool.base_url}/b1s/v1/Login",
+                                  json={
+                                      "UserName": self.pool.username,
+                                      "Password": self.pool.password,
+                                      "CompanyDB": self.pool.company_db
+                                  },
+                                  timeout=LOGIN_TIMEOUT)
+        if response.status_code != 200:
+            self.session_id = None
+            raise SAPLoginError(f"SAP B1 login failed: {response.text}")
+
+        data = response.json()
+        self.session_id = data.get('SessionId')
+        self.timeout_minutes = data.get('SessionTimeout') or DEFAULT_SESSION_TIMEOUT_MINUTES
+        self.last_used = time.monotonic()
+        self.pool._record('logins')
+        logging.info("🔐 SAP B1 pooled session logged in")
+        return self.session_id
+
+    def is_expired(self):
+        """True when the Service Layer has (or is about to) time the session out"""
+        if not self.session_id:
+            return True
+        idle = time.monotonic() - self.last_used
+        return idle >= self.timeout_minutes * 60 - EXPIRY_MARGIN_SECONDS
+
+    def needs_keepalive(self, interval):
+        """True when the session would expire before the next keep-alive pass"""
+        if not self.session_id:
+            return False
+        idle = time.monotonic() - self.last_used
+        return idle + interval >= self.timeout_minutes * 60 - EXPIRY_MARGIN_SECONDS
+
+    def ping(self):
+        """Cheap authenticated read that resets the Service Layer idle timer"""
+        url = f"{self.pool.base_url}/b1s/v1/Warehouses?$top=1&$select=WarehouseCode"
+        response = self.http.get(url, timeout=LOGIN_TIMEOUT)
+        if response.status_code == 401:
+            self.login()
+        else:
+            self.last_used = time.monotonic()
+        self.pool._record('keepalives')
+
+    def logout(self):
+        """Close the session on the Service Layer side"""
+        if not self.session_id:
+            return
+        try:
+            self.http.post(f"{self.pool.base_url}/b1s/v1/Logout", timeout=5)
+        except Exception as e:
+            logging.debug(f"SAP B1 pooled session logout failed: {str(e)}")
+        self.session_id = None
+
+
+class SAPSessionPool:
+    """Bounded pool of authenticated sessions for one SAP B1 server / company"""
+
+    def __init__(self, base_url, username, password, company_db,
+                 size=DEFAULT_POOL_SIZE, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                 keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.company_db = company_db
+        self.size = max(1, size)
+        self.lease_timeout = lease_timeout
+        self.keepalive_interval = keepalive_interval
+
+        self._idle = []
+        self._created = 0
+        self._leased = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._keepalive_thread = None
+        self._stats = {'leases': 0, 'waits': 0, 'logins': 0, 'relogins': 0, 'keepalives': 0}
+
+    def _record(self, counter, amount=1):
+        with self._condition:
+            self._stats[counter] += amount
+
+    def acquire(self):
+        """Lease an authenticated session, logging in lazily up to the pool size"""
+        deadline = time.monotonic() + self.lease_timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise SAPPoolExhaustedError("SAP B1 session pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SAPPoolExhaustedError(
+                        f"No SAP B1 session available within {self.lease_timeout}s "
+                        f"(pool size {self.size})")
+                self._stats['waits'] += 1
+                self._condition.wait(remaining)
+            self._leased += 1
+            self._stats['leases'] += 1
+
+        try:
+            if pooled is None:
+                pooled = SAPPooledSession(self)
+                pooled.login()
+                self._start_keepalive()
+            elif pooled.is_expired():
+                pooled.login()
+                self._record('relogins')
+        except Exception:
+            with self._condition:
+                self._created -= 1
+                self._leased -= 1
+                self._condition.notify()
+            raise
+        return pooled
+
+    def release(self, pooled, discard=False):
+        """Return a leased session to the pool (or drop it when it is broken)"""
+        with self._condition:
+            self._leased -= 1
+            if discard or self._closed:
+                self._created -= 1
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self):
+        """Context manager around acquire()/release()"""
+        pooled = self.acquire()
+        discard = False
+        try:
+            yield pooled
+        except requests.exceptions.ConnectionError:
+            discard = True
+            raise
+        finally:
+            self.release(pooled, discard=discard)
+
+    def ensure_session(self):
+        """Make sure at least one authenticated session exists and return its SessionId"""
+        with self.lease() as pooled:
+            return pooled.session_id
+
+    def relogin(self, pooled):
+        """Re-authenticate a leased session after the Service Layer answered 401"""
+        pooled.login()
+        self._record('relogins')
+
+    def _start_keepalive(self):
+        if self.keepalive_interval <= 0:
+            return
+        with self._condition:
+            if self._keepalive_thread and self._keepalive_thread.is_alive():
+                return
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop,
+                                                      name='sap-session-keepalive',
+                                                      daemon=True)
+            self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        """Ping idle sessions before the Service Layer session timeout hits them"""
+        while not self._closed:
+            time.sleep(self.keepalive_interval)
+            if get_circuit_breaker(self.base_url).state != 'closed':
+                continue  # Service Layer is down - don't burn keep-alives on it
+            with self._condition:
+                due = [p for p in self._idle if p.needs_keepalive(self.keepalive_interval)]
+                for pooled in due:
+                    self._idle.remove(pooled)
+                    self._leased += 1
+            for pooled in due:
+                discard = False
+                try:
+                    pooled.ping()
+                except Exception as e:
+                    logging.warning(f"⚠️ SAP B1 session keep-alive failed: {str(e)}")
+                    discard = True
+                self.release(pooled, discard=discard)
+
+    def stats(self):
+        """Snapshot of pool counters for diagnostics"""
+        with self._condition:
+            return dict(self._stats, size=self.size, created=self._created,
+                        idle=len(self._idle), leased=self._leased)
+
+    def close(self):
+        """Log out every idle session and stop handing out new ones"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            pooled.logout()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_session_pool(base_url, username, password, company_db):
+    """Return the process-wide pool for these SAP B1 credentials, creating it once"""
+    key = (base_url, username, password, company_db)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = SAPSessionPool(base_url, username, password, company_db)
+            _pools[key] = pool
+        return pool
+
+
+def get_pool_stats():
+    """Counters for every pool in this process, keyed by server/company"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {f"{p.base_url}/{p.company_db}": p.stats() for p in pools}
+
+
+# Called as listener(url, response) after the Service Layer creates a document (HTTP 201)
+_document_listeners = []
+
+
+def add_document_listener(listener):
+    """Register a callback for every document created through a pooled session"""
+    if listener not in _document_listeners:
+        _document_listeners.append(listener)
+
+
+def _notify_document_created(url, response):
+    for listener in list(_document_listeners):
+        try:
+            listener(url, response)
+        except Exception as e:
+            logging.warning(f"⚠️ SAP document listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+
+@atexit.register
+def shutdown_pools():
+    """Log out of all pooled Service Layer sessions when the process exits"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class SAPSessionProxy:
+    """Drop-in replacement for the per-client requests.Session
+
+    Every get/post/patch leases a pooled session for the duration of one HTTP call,
+    transparently re-logging in and retrying once when the Service Layer answers 401.
+    Identical concurrent reads are coalesced into one call (see sap_singleflight), and
+    calls fail fast with SAPCircuitOpenError while the host's circuit breaker is open.
+    """
+
+    def __init__(self, base_url, username, password, company_db):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.company_db = company_db
+        self.verify = False  # Kept for compatibility with code that sets session.verify
+
+    @property
+    def pool(self):
+        return get_session_pool(self.base_url, self.username, self.password, self.company_db)
+
+    @property
+    def breaker(self):
+        return get_circuit_breaker(self.base_url)
+
+    def circuit_open(self):
+        """True while the Service Layer is considered down and calls are short-circuited"""
+        return self.breaker.is_open()
+
+    def ensure_session(self):
+        """pool.ensure_session() guarded by the circuit breaker; returns a SessionId"""
+        breaker = self.breaker
+        if not breaker.allow_request():
+            raise SAPCircuitOpenError(f"SAP B1 circuit open for {self.base_url} - failing fast")
+        try:
+            session_id = self.pool.ensure_session()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure(str(e))
+            raise
+        except Exception:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return session_id
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('verify', self.verify)
+        key = request_key(method, url, kwargs) if SINGLE_FLIGHT_ENABLED else None
+        if key is None:
+            return self._send(method, url, **kwargs)
+        return sap_single_flight.do((self.username, self.company_db) + key,
+                                    lambda: self._send(method, url, **kwargs))
+
+    def _send(self, method, url, **kwargs):
+        breaker = self.breaker
+        if not breaker.allow_request():
+            record_sap_call(method, url, error='circuit_open')
+            raise SAPCircuitOpenError(f"SAP B1 circuit open for {self.base_url} - failing fast")
+        endpoint = sap_endpoint(url)
+        if is_read_request(method, url):
+            kwargs['timeout'] = breaker.adaptive_timeout(kwargs.get('timeout'), endpoint)
+        elif kwargs.get('timeout') is None:
+            kwargs['timeout'] = DEFAULT_WRITE_TIMEOUT
+
+        call_started = time.monotonic()
+        try:
+            with self.pool.lease() as pooled:
+                started = time.monotonic()
+                response = pooled.http.request(method, url, **kwargs)
+                if response.status_code == 401:
+                    logging.info("🔄 SAP B1 session expired, re-authenticating pooled session")
+                    self.pool.relogin(pooled)
+                    started = time.monotonic()
+                    response = pooled.http.request(method, url, **kwargs)
+                elapsed = time.monotonic() - started
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure(str(e))
+            record_sap_call(method, url, elapsed=time.monotonic() - call_started,
+                            error='timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection_error')
+            raise
+        except Exception as e:
+            breaker.release_probe()
+            record_sap_call(method, url, elapsed=time.monotonic() - call_started, error=type(e).__name__)
+            raise
+
+        if response.status_code in UNHEALTHY_STATUS_CODES:
+            breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            breaker.record_success(elapsed, endpoint)
+        # Caller-visible latency, including any wait for a pooled session
+        record_sap_call(method, url, response.status_code, time.monotonic() - call_started)
+        if response.status_code == 201 and _document_listeners:
+            _notify_document_created(url, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
@@ -0,0 +1,102 @@
+"""
+SAP B1 Single-flight Request Coalescing
+Concurrent callers asking the Service Layer for the same read share one in-flight
+HTTP call and its response, so a burst of identical scans at shift start costs one
+round trip instead of dozens.
+"""
+import json
+import os
+import threading
+
+# Set SAP_SINGLE_FLIGHT=false to send every read individually
+SINGLE_FLIGHT_ENABLED = os.environ.get('SAP_SINGLE_FLIGHT', 'true').lower() != 'false'
+
+
+class _Call:
+    """One in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Run fn() once per key among concurrent callers and hand everyone its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'calls': 0, 'executed': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Counters: calls seen, HTTP calls executed, callers served by another's call"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+def is_read_request(method, url):
+    """True for Service Layer reads; SQLQueries('...')/List is a read even though it is a POST"""
+    method = method.upper()
+    return method == 'GET' or (method == 'POST' and url.endswith('/List'))
+
+
+def request_key(method, url, kwargs):
+    """Coalescing key for a Service Layer read, or None when the request must not be shared"""
+    if not is_read_request(method, url):
+        return None
+    method = method.upper()
+    if kwargs.get('data') is not None or kwargs.get('stream'):
+        return None
+    params = kwargs.get('params')
+    if isinstance(params, dict):
+        params = sorted(params.items())
+    headers = kwargs.get('headers')
+    if isinstance(headers, dict):
+        headers = sorted(headers.items())
+    try:
+        body = json.dumps(kwargs.get('json'), sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return None
+    return method, url, repr(params), repr(headers), body
+
+
+sap_single_flight = SingleFlight()
+
+
+def get_single_flight_stats():
+    """Coalescing counters for this process"""
+    return sap_single_flight.stats()
@@ -0,0 +1,1216 @@
+#!/usr/bin/env python3
+"""
+SAP B1 Service Layer Stand-in Server
+A local, dependency-free imitation of the Service Layer endpoints SAPIntegration
+uses (Login, SQLQueries('...')/List, $batch, $crossjoin, BinLocations, Items,
+PickLists, PurchaseOrders, PurchaseDeliveryNotes, StockTransfers,
+InventoryCountings, ...) so flows can be benchmarked and load-tested without a
+live SAP box.
+
+- Generated data: warehouses, bins, items, batches/serials, purchase and sales
+  orders, pick lists, transfer requests and inventory countings, sized by flags.
+- Injection: base latency, jitter, error rate/status and hanging requests,
+  globally or per endpoint (--profile JSON), changeable at runtime.
+- Record/replay: --record proxies to a real Service Layer and stores every
+  response as a fixture; --replay serves stored fixtures first and falls back
+  to generated data. --import-assets loads pasted OData responses (e.g. the
+  PurchaseOrders/Orders dumps in attached_assets) as real data.
+
+Usage:
+    python sap_standin_server.py --port 50000 --items 5000 --latency-ms 80 --jitter-ms 40
+    SAP_B1_SERVER=http://127.0.0.1:50000 python main.py
+
+    python sap_standin_server.py --record https://10.0.0.5:50000 --fixtures sap_fixtures
+    python sap_standin_server.py --replay sap_fixtures --import-assets attached_assets
+
+Control endpoints: GET /__standin/stats, POST /__standin/config (JSON with any
+injection setting), POST /__standin/reset.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+SERVICE_ROOT = '/b1s/v1/'
+NEXT_LINK_SAFE = "$,'()/"
+DEFAULT_PAGE_SIZE = 20  # Service Layer default when the client sends no Prefer header
+
+ISO_DAY = re.compile(r'^\d{4}-\d{2}-\d{2}(T00:00:00Z?)?$')
+
+KEY_FIELDS = {
+    'Warehouses': 'WarehouseCode',
+    'Items': 'ItemCode',
+    'BinLocations': 'AbsEntry',
+    'BusinessPartners': 'CardCode',
+    'PickLists': 'Absoluteentry',
+    'InventoryCountings': 'DocumentEntry',
+}
+# Line collections that PATCH merges by line number instead of replacing
+LINE_COLLECTIONS = {
+    'PickListsLines': 'LineNumber',
+    'InventoryCountingLines': 'LineNumber',
+    'DocumentLines': 'LineNum',
+    'StockTransferLines': 'LineNum',
+}
+CREATED_DOCUMENTS = ('PurchaseDeliveryNotes', 'StockTransfers', 'DeliveryNotes')
+# Created documents that bring serials into a warehouse or take them out of stock
+SERIAL_RECEIPTS = ('PurchaseDeliveryNotes', 'InventoryGenEntries', 'Returns')
+SERIAL_ISSUES = ('DeliveryNotes', 'InventoryGenExits', 'PurchaseReturns', 'Invoices')
+
+
+def sap_error(code, message):
+    return {'error': {'code': code, 'message': {'lang': 'en-us', 'value': message}}}
+
+
+# ================================
+# Injection settings
+# ================================
+
+class InjectionSettings:
+    """Latency and failure injection, global with per-endpoint overrides"""
+
+    FIELDS = ('latency_ms', 'jitter_ms', 'error_rate', 'error_status', 'hang_rate', 'hang_seconds')
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503,
+                 hang_rate=0.0, hang_seconds=120, endpoints=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.endpoints = endpoints or {}  # substring of endpoint -> dict of overrides
+        self._lock = threading.Lock()
+
+    def update(self, settings):
+        with self._lock:
+            for field in self.FIELDS:
+                if field in settings:
+                    setattr(self, field, type(getattr(self, field))(settings[field]))
+            if 'endpoints' in settings:
+                self.endpoints = dict(settings['endpoints'] or {})
+
+    def for_endpoint(self, endpoint):
+        with self._lock:
+            effective = {field: getattr(self, field) for field in self.FIELDS}
+            for pattern, overrides in self.endpoints.items():
+                if pattern in endpoint:
+                    effective.update(overrides)
+            return effective
+
+    def as_dict(self):
+        with self._lock:
+            return dict({field: getattr(self, field) for field in self.FIELDS}, endpoints=self.endpoints)
+
+
+# ================================
+# Generated data
+# ================================
+
+class StandinDataset:
+    """In-memory SAP company: master data, open documents and bin stock"""
+
+    def __init__(self, warehouses=3, bins_per_warehouse=40, items=500, business_partners=50,
+                 purchase_orders=100, sales_orders=100, pick_lists=50, transfer_requests=50,
+                 countings=20, lines_per_document=8, seed=42):
+        self._lock = threading.RLock()
+        self.collections = {}
+        self.bin_item_stock = []    # OIBQ-like rows
+        self.bin_batch_stock = []   # OBBQ/OSBQ-like rows
+        self.serials = []           # OSRN-like rows
+        self.series = {
+            'PO': [{'Series': 101, 'SeriesName': 'PO2026'}, {'Series': 102, 'SeriesName': 'POIMP26'}],
+            'SO': [{'Series': 201, 'SeriesName': 'SO2026'}],
+            'INVT': [{'Series': 301, 'SeriesName': 'OTHR2026'}],
+            'INVCNT': [{'Series': 401, 'SeriesName': 'CNT2026'}],
+        }
+        self._counters = {}
+        self._generate(random.Random(seed), warehouses, bins_per_warehouse, items, business_partners,
+                       purchase_orders, sales_orders, pick_lists, transfer_requests, countings,
+                       lines_per_document)
+        for serial in self.serials:
+            self._stamp_serial(serial)
+
+    def next_number(self, name, start):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, start) + 1
+            return self._counters[name]
+
+    def _generate(self, rng, warehouse_count, bins_per_warehouse, item_count, bp_count, po_count,
+                  so_count, pick_count, request_count, counting_count, lines):
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        iso = lambda d: d.strftime('%Y-%m-%dT00:00:00Z')
+
+        warehouses = [{'WarehouseCode': f'WH{n:02d}', 'WarehouseName': f'Warehouse {n:02d}',
+                       'BusinessPlaceID': 1 + n % 3, 'EnableBinLocations': 'tYES', 'Inactive': 'tNO'}
+                      for n in range(1, warehouse_count + 1)]
+        bins = []
+        for warehouse in warehouses:
+            for n in range(1, bins_per_warehouse + 1):
+                abs_entry = len(bins) + 1
+                bins.append({'AbsEntry': abs_entry,
+                             'BinCode': f"{warehouse['WarehouseCode']}-A{(n - 1) // 10 + 1:02d}-{n:03d}",
+                             'Warehouse': warehouse['WarehouseCode'], 'Sublevel1': f'A{(n - 1) // 10 + 1:02d}',
+                             'Sublevel2': f'{n:03d}', 'Inactive': 'tNO', 'Description': f'Bin {n}'})
+
+        items = []
+        for n in range(1, item_count + 1):
+            managed = rng.random()
+            items.append({
+                'ItemCode': f'ITM{n:05d}', 'ItemName': f'Stand-in item {n}',
+                'InventoryUOM': rng.choice(['EA', 'KG', 'BOX', 'PC']),
+                'ManageBatchNumbers': 'tYES' if managed < 0.3 else 'tNO',
+                'ManageSerialNumbers': 'tYES' if 0.3 <= managed < 0.45 else 'tNO',
+                'QuantityOnStock': 0.0, 'ItemWarehouseInfoCollection': [],
+            })
+
+        batches = []
+        serial_seq = batch_seq = 0
+        for item in items:
+            for warehouse in rng.sample(warehouses, k=min(len(warehouses), rng.randint(1, 2))):
+                in_stock = 0.0
+                for bin_row in rng.sample([b for b in bins if b['Warehouse'] == warehouse['WarehouseCode']],
+                                          k=min(bins_per_warehouse, rng.randint(1, 3))):
+                    quantity = float(rng.randint(1, 40))
+                    if item['ManageSerialNumbers'] == 'tYES':
+                        quantity = float(rng.randint(1, 5))
+                    in_stock += quantity
+                    self.bin_item_stock.append({'BinAbs': bin_row['AbsEntry'], 'BinCode': bin_row['BinCode'],
+                                                'WhsCode': warehouse['WarehouseCode'], 'ItemCode': item['ItemCode'],
+                                                'OnHandQty': quantity})
+                    if item['ManageBatchNumbers'] == 'tYES':
+                        batch_seq += 1
+                        admitted = today - timedelta(days=rng.randint(1, 200))
+                        batch = {'DocEntry': batch_seq, 'ItemCode': item['ItemCode'], 'Batch': f'B{batch_seq:06d}',
+                                 'Status': 'bdsStatus_Released', 'AdmissionDate': iso(admitted),
+                                 'ExpirationDate': iso(admitted + timedelta(days=365)), 'ManufacturingDate': None}
+                        batches.append(batch)
+                        self.bin_batch_stock.append({'Kind': 'B', 'BinCode': bin_row['BinCode'],
+                                                     'ItemCode': item['ItemCode'], 'DistNumber': batch['Batch'],
+                                                     'Quantity': quantity, 'ExpDate': batch['ExpirationDate'],
+                                                     'InDate': batch['AdmissionDate'], 'Status': '0'})
+                    elif item['ManageSerialNumbers'] == 'tYES':
+                        for _ in range(int(quantity)):
+                            serial_seq += 1
+                            serial = f'SN{serial_seq:07d}'
+                            self.serials.append({'DistNumber': serial, 'ItemCode': item['ItemCode'],
+                                                 'WhsCode': warehouse['WarehouseCode'], 'BinCode': bin_row['BinCode']})
+                            self.bin_batch_stock.append({'Kind': 'S', 'BinCode': bin_row['BinCode'],
+                                                         'ItemCode': item['ItemCode'], 'DistNumber': serial,
+                                                         'Quantity': 1.0, 'ExpDate': None,
+                                                         'InDate': iso(today), 'Status': '0'})
+                item['ItemWarehouseInfoCollection'].append({
+                    'ItemCode': item['ItemCode'], 'WarehouseCode': warehouse['WarehouseCode'], 'InStock': in_stock,
+                    'Ordered': float(rng.randint(0, 20)), 'Committed': 0.0,
+                    'StandardAveragePrice': round(rng.uniform(1, 500), 2)})
+                item['QuantityOnStock'] += in_stock
+
+        partners = ([{'CardCode': f'V{n:04d}', 'CardName': f'Stand-in Supplier {n}', 'CardType': 'cSupplier'}
+                     for n in range(1, bp_count // 2 + 1)] +
+                    [{'CardCode': f'C{n:04d}', 'CardName': f'Stand-in Customer {n}', 'CardType': 'cCustomer'}
+                     for n in range(1, bp_count - bp_count // 2 + 1)])
+        # Master data change stamps for delta syncs, spread deterministically over the last 90 days
+        for n, row in enumerate(warehouses + bins + partners):
+            row['UpdateDate'] = iso(today - timedelta(days=(n * 7) % 90))
+        for n, partner in enumerate(partners):
+            partner.update(UpdateTime=f'{n % 24:02d}:{n % 60:02d}:00', Valid='tYES')
+        suppliers = [p for p in partners if p['CardType'] == 'cSupplier'] or partners
+        customers = [p for p in partners if p['CardType'] == 'cCustomer'] or partners
+
+        def document_lines(warehouse_code):
+            rows = []
+            for line_num, item in enumerate(rng.sample(items, k=min(len(items), lines))):
+                quantity = float(rng.randint(1, 20))
+                rows.append({'LineNum': line_num, 'ItemCode': item['ItemCode'], 'ItemDescription': item['ItemName'],
+                             'Quantity': quantity, 'OpenQuantity': quantity, 'RemainingOpenQuantity': quantity,
+                             'WarehouseCode': warehouse_code, 'UnitPrice': round(rng.uniform(1, 500), 2),
+                             'UoMCode': item['InventoryUOM'], 'LineStatus': 'bost_Open'})
+            return rows
+
+        def order(doc_entry, series, partner):
+            warehouse = rng.choice(warehouses)['WarehouseCode']
+            doc_date = today - timedelta(days=rng.randint(0, 30))
+            document = {'DocEntry': doc_entry, 'DocNum': series['Series'] * 100000 + doc_entry,
+                        'Series': series['Series'], 'DocType': 'dDocument_Items', 'DocDate': iso(doc_date),
+                        'DocDueDate': iso(doc_date + timedelta(days=7)), 'CardCode': partner['CardCode'],
+                        'CardName': partner['CardName'], 'DocumentStatus': 'bost_Open', 'DocCurrency': 'INR',
+                        'NumAtCard': None, 'Comments': 'Stand-in document', 'BPL_IDAssignedToInvoice': 1,
+                        'DocumentLines': document_lines(warehouse)}
+            document['DocTotal'] = round(sum(l['Quantity'] * l['UnitPrice'] for l in document['DocumentLines']), 2)
+            return document
+
+        purchase_orders = [order(n, rng.choice(self.series['PO']), rng.choice(suppliers)) for n in range(1, po_count + 1)]
+        sales_orders = [order(n, self.series['SO'][0], rng.choice(customers)) for n in range(1, so_count + 1)]
+
+        bins_by_warehouse = {}
+        for bin_row in bins:
+            bins_by_warehouse.setdefault(bin_row['Warehouse'], []).append(bin_row)
+        pick_lists = []
+        for n in range(1, pick_count + 1):
+            sales_order = rng.choice(sales_orders) if sales_orders else None
+            pick_lines = []
+            for line in (sales_order['DocumentLines'] if sales_order else []):
+                bin_row = rng.choice(bins_by_warehouse.get(line['WarehouseCode']) or bins)
+                pick_lines.append({'AbsoluteEntry': n, 'LineNumber': line['LineNum'],
+                                   'OrderEntry': sales_order['DocEntry'], 'OrderRowID': line['LineNum'],
+                                   'PickedQuantity': 0.0, 'PickStatus': 'ps_Released',
+                                   'ReleasedQuantity': line['Quantity'], 'PreviouslyReleasedQuantity': line['Quantity'],
+                                   'BaseObjectType': '17',
+                                   'DocumentLinesBinAllocations': [{
+                                       'BinAbsEntry': bin_row['AbsEntry'], 'Quantity': line['Quantity'],
+                                       'AllowNegativeQuantity': 'tNO', 'SerialAndBatchNumbersBaseLine': -1,
+                                       'BaseLineNumber': line['LineNum']}]})
+            pick_lists.append({'Absoluteentry': n, 'Name': 'manager', 'OwnerCode': 1, 'OwnerName': 'manager',
+                               'PickDate': iso(today), 'Remarks': None, 'Status': 'ps_Released',
+                               'ObjectType': '156', 'UseBaseUnits': 'tNO', 'PickListsLines': pick_lines})
+
+        transfer_requests = []
+        for n in range(1, request_count + 1):
+            source, target = (rng.sample(warehouses, 2) if len(warehouses) > 1 else (warehouses[0], warehouses[0]))
+            lines_ = document_lines(target['WarehouseCode'])
+            for line in lines_:
+                line['FromWarehouseCode'] = source['WarehouseCode']
+            transfer_requests.append({'DocEntry': n, 'DocNum': 5000000 + n, 'Series': 301, 'DocDate': iso(today),
+                                      'DueDate': iso(today + timedelta(days=3)), 'FromWarehouse': source['WarehouseCode'],
+                                      'ToWarehouse': target['WarehouseCode'], 'DocumentStatus': 'bost_Open',
+                                      'DocStatus': 'O', 'Comments': 'Stand-in transfer request',
+                                      'StockTransferLines': lines_})
+
+        countings = []
+        for n in range(1, counting_count + 1):
+            counting_lines = []
+            for line_number, row in enumerate(rng.sample(self.bin_item_stock, k=min(lines, len(self.bin_item_stock))), 1):
+                counting_lines.append({'LineNumber': line_number, 'ItemCode': row['ItemCode'],
+                                       'ItemDescription': f"Stand-in item {int(row['ItemCode'][3:])}",
+                                       'WarehouseCode': row['WhsCode'], 'BinEntry': row['BinAbs'],
+                                       'InWarehouseQuantity': row['OnHandQty'], 'CountedQuantity': 0.0,
+                                       'Counted': 'tNO', 'Variance': 0.0, 'UoMCode': 'EA', 'Freeze': 'tNO'})
+            countings.append({'DocumentEntry': n, 'DocumentNumber': 400000 + n, 'Series': 401,
+                              'CountDate': iso(today), 'CountTime': '09:00:00', 'DocumentStatus': 'cdsOpen',
+                              'Remarks': 'Stand-in counting', 'InventoryCountingLines': counting_lines})
+
+        self.collections = {
+            'Warehouses': warehouses, 'BinLocations': bins, 'Items': items,
+            'BatchNumberDetails': batches, 'BusinessPartners': partners,
+            'PurchaseOrders': purchase_orders, 'Orders': sales_orders, 'PickLists': pick_lists,
+            'InventoryTransferRequests': transfer_requests, 'InventoryCountings': countings,
+            'PurchaseDeliveryNotes': [], 'StockTransfers': [], 'DeliveryNotes': [],
+        }
+
+    def _stamp_serial(self, serial):
+        """Give a serial its OSRN SysNumber on first use and a new OITL log entry on every change"""
+        serial.setdefault('SysNumber', self.next_number(f"serial:{serial['ItemCode']}", 0))
+        serial.setdefault('Status', '0')
+        serial['LogEntry'] = self.next_number('OITL', 0)
+        serial['UpdateDate'] = datetime.utcnow().strftime('%Y-%m-%dT00:00:00Z')
+
+    def _move_serials(self, name, document):
+        """Move the serials on a created receipt, delivery or transfer like SAP would"""
+        by_key = {(s['DistNumber'], s['ItemCode']): s for s in self.serials}
+        for line in document.get('StockTransferLines') or document.get('DocumentLines') or []:
+            for entry in line.get('SerialNumbers') or []:
+                key = (entry.get('InternalSerialNumber'), line.get('ItemCode'))
+                serial = by_key.get(key)
+                if serial is None and name in SERIAL_RECEIPTS:
+                    serial = {'DistNumber': key[0], 'ItemCode': key[1]}
+                    self.serials.append(serial)
+                if serial is None:
+                    continue
+                serial['WhsCode'] = None if name in SERIAL_ISSUES else line.get('WarehouseCode')
+                serial['BinCode'] = None
+                self._stamp_serial(serial)
+
+    def add_serials(self, item_code, warehouse_code, count, prefix='BSN'):
+        """Put count serials of one item into a warehouse, e.g. for large serial-transfer runs"""
+        bins = [b for b in self.collections['BinLocations'] if b['Warehouse'] == warehouse_code]
+        bin_code = bins[0]['BinCode'] if bins else None
+        serials = [f'{prefix}{n:07d}' for n in range(1, count + 1)]
+        with self._lock:
+            for serial in serials:
+                row = {'DistNumber': serial, 'ItemCode': item_code, 'WhsCode': warehouse_code, 'BinCode': bin_code}
+                self._stamp_serial(row)
+                self.serials.append(row)
+        return serials
+
+    def collection(self, name):
+        with self._lock:
+            return self.collections.get(name)
+
+    def find(self, name, key):
+        rows = self.collection(name)
+        if rows is None:
+            return None
+        field = KEY_FIELDS.get(name, 'DocEntry')
+        for row in rows:
+            if str(row.get(field)) == str(key):
+                return row
+        return None
+
+    def create(self, name, payload):
+        with self._lock:
+            rows = self.collections.setdefault(name, [])
+            doc_entry = self.next_number(name, len(rows))
+            document = dict(payload, DocEntry=doc_entry, DocNum=900000 + doc_entry,
+                            DocumentStatus='bost_Open', CreationDate=datetime.utcnow().strftime('%Y-%m-%dT00:00:00Z'))
+            for index, line in enumerate(document.get('DocumentLines') or document.get('StockTransferLines') or []):
+                line.setdefault('LineNum', index)
+            rows.append(document)
+            if name in SERIAL_RECEIPTS + SERIAL_ISSUES + ('StockTransfers',):
+                self._move_serials(name, document)
+            return document
+
+    def update(self, name, key, payload):
+        with self._lock:
+            row = self.find(name, key)
+            if row is None:
+                return None
+            for field, value in payload.items():
+                line_key = LINE_COLLECTIONS.get(field)
+                if line_key and isinstance(value, list) and isinstance(row.get(field), list):
+                    existing = {line.get(line_key): line for line in row[field]}
+                    for line in value:
+                        target = existing.get(line.get(line_key))
+                        if target is not None:
+                            target.update(line)
+                        else:
+                            row[field].append(line)
+                else:
+                    row[field] = value
+            return row
+
+    def load_odata_dump(self, path):
+        """Replace a collection with a pasted OData response ({"odata.metadata": ...#Entity, "value": [...]})"""
+        try:
+            with open(path, encoding='utf-8') as handle:
+                data = json.load(handle)
+        except (ValueError, UnicodeDecodeError, OSError):
+            return None
+        metadata = data.get('odata.metadata', '') if isinstance(data, dict) else ''
+        entity = metadata.rsplit('#', 1)[-1] if '#' in metadata else ''
+        if not entity or '.' in entity or not isinstance(data.get('value'), list):
+            return None  # SQL query results and single entities cannot be mapped to a collection
+        with self._lock:
+            self.collections[entity] = data['value']
+        return entity
+
+
+# ================================
+# OData query support ($filter subset, $select, $orderby, $top, $skip)
+# ================================
+
+_TOKEN_RE = re.compile(r"\s*(?:(?P<str>'(?:[^']|'')*')|(?P<num>-?\d+(?:\.\d+)?)(?![\w])|(?P<punct>[(),])"
+                       r"|(?P<word>[A-Za-z_$][\w/.$]*))")
+_COMPARISONS = {'eq', 'ne', 'gt', 'ge', 'lt', 'le'}
+
+
+class ODataFilter:
+    """Recursive-descent evaluator for the $filter expressions the WMS sends"""
+
+    def __init__(self, text):
+        self.tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = _TOKEN_RE.match(text, position)
+            if not match or match.end() == position:
+                raise ValueError(f"Unsupported $filter near: {text[position:position + 20]!r}")
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'str':
+                value = value[1:-1].replace("''", "'")
+            elif kind == 'num':
+                value = float(value) if '.' in value else int(value)
+            self.tokens.append((kind, value))
+            position = match.end()
+        self.position = 0
+        self.predicate = self._or()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token in $filter: {self.tokens[self.position][1]!r}")
+
+    def __call__(self, entity):
+        return bool(self.predicate(entity))
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self):
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def _keyword(self, word):
+        kind, value = self._peek()
+        if kind == 'word' and value.lower() == word:
+            self.position += 1
+            return True
+        return False
+
+    def _or(self):
+        left = self._and()
+        while self._keyword('or'):
+            right = self._and()
+            left = (lambda l, r: lambda e: l(e) or r(e))(left, right)
+        return left
+
+    def _and(self):
+        left = self._not()
+        while self._keyword('and'):
+            right = self._not()
+            left = (lambda l, r: lambda e: l(e) and r(e))(left, right)
+        return left
+
+    def _not(self):
+        if self._keyword('not'):
+            inner = self._not()
+            return lambda e: not inner(e)
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._operand()
+        kind, value = self._peek()
+        if kind == 'word' and value.lower() in _COMPARISONS:
+            self.position += 1
+            right = self._operand()
+            op = value.lower()
+            return lambda e: _compare(op, left(e), right(e))
+        return left
+
+    def _operand(self):
+        kind, value = self._take()
+        if kind == 'punct' and value == '(':
+            inner = self._or()
+            self._expect(')')
+            return inner
+        if kind in ('str', 'num'):
+            return lambda e: value
+        if kind == 'word':
+            lowered = value.lower()
+            if lowered in ('true', 'false', 'null'):
+                constant = {'true': True, 'false': False, 'null': None}[lowered]
+                return lambda e: constant
+            if self._peek() == ('punct', '('):
+                return self._function(lowered)
+            return lambda e: _field(e, value)
+        raise ValueError(f"Unexpected token in $filter: {value!r}")
+
+    def _function(self, name):
+        self._expect('(')
+        args = [self._or()]
+        while self._peek() == ('punct', ','):
+            self.position += 1
+            args.append(self._or())
+        self._expect(')')
+        functions = {
+            'startswith': lambda a, b: str(a or '').startswith(str(b)),
+            'endswith': lambda a, b: str(a or '').endswith(str(b)),
+            'contains': lambda a, b: str(b) in str(a or ''),
+            'substringof': lambda a, b: str(a) in str(b or ''),
+            'tolower': lambda a: str(a or '').lower(),
+            'toupper': lambda a: str(a or '').upper(),
+        }
+        if name not in functions:
+            raise ValueError(f"Unsupported $filter function: {name}")
+        function = functions[name]
+        return lambda e: function(*(arg(e) for arg in args))
+
+    def _expect(self, punct):
+        if self._take() != ('punct', punct):
+            raise ValueError(f"Expected {punct!r} in $filter")
+
+
+def _field(entity, path):
+    value = entity
+    for part in path.split('/'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _compare(op, left, right):
+    # SAP compares Edm.DateTime values by day: '2026-10-16T00:00:00Z' eq '2026-10-16'
+    if isinstance(left, str) and isinstance(right, str) and len(left) != len(right) and ISO_DAY.match(left) and ISO_DAY.match(right):
+        left, right = left[:10], right[:10]
+    if isinstance(left, (int, float)) and isinstance(right, str) or isinstance(right, (int, float)) and isinstance(left, str):
+        try:
+            left, right = float(left), float(right)
+        except (TypeError, ValueError):
+            left, right = str(left), str(right)
+    if op == 'eq':
+        return left == right
+    if op == 'ne':
+        return left != right
+    if left is None or right is None:
+        return False
+    return {'gt': left > right, 'ge': left >= right, 'lt': left < right, 'le': left <= right}[op]
+
+
+def apply_query(rows, params):
+    """Filter, order and project rows according to OData system query options"""
+    if params.get('$filter'):
+        predicate = ODataFilter(params['$filter'])
+        rows = [row for row in rows if predicate(row)]
+    if params.get('$orderby'):
+        for clause in reversed(params['$orderby'].split(',')):
+            field, _, direction = clause.strip().partition(' ')
+            rows = sorted(rows, key=lambda r: (_field(r, field) is None, _field(r, field) or 0),
+                          reverse=direction.strip().lower() == 'desc')
+    if params.get('$select'):
+        fields = [f.strip() for f in params['$select'].split(',') if f.strip()]
+        rows = [{f: row.get(f) for f in fields} for row in rows]
+    return rows
+
+
+# ================================
+# SQL queries (SQLQueries('Name')/List)
+# ================================
+
+def parse_param_list(param_list):
+    """ParamList "a='1'&b='2'" -> {'a': '1', 'b': '2'}"""
+    if not param_list:
+        return {}
+    if param_list.startswith('sqlQuery='):
+        return {'sqlQuery': param_list[len('sqlQuery='):]}
+    params = {}
+    for pair in param_list.split('&'):
+        name, _, value = pair.partition('=')
+        params[name.strip()] = value.strip().strip("'")
+    return params
+
+
+class SQLQueryCatalog:
+    """The custom SQL queries the WMS expects to be registered in SAP, answered from the dataset"""
+
+    def __init__(self, dataset):
+        self.data = dataset
+        self.handlers = {
+            'ItemCode_Batch_Serial_Val': self._item_management,
+            'ItemCode_Validation': self._item_management,
+            'Item_Validation': self._serial_lookup,
+            'Series_Validation': self._series_validation,
+            'Batch_Series_Validation': self._batch_series_validation,
+            'Serial_Index_Delta': self._serial_index_delta,
+            'Get_PO_Series': lambda p: self.data.series['PO'],
+            'Get_SO_Series': lambda p: self.data.series['SO'],
+            'Get_INVT_Series': lambda p: self.data.series['INVT'],
+            'Get_INVCNT_Series': lambda p: self.data.series['INVCNT'],
+            'Get_PO_DocEntry': lambda p: self._doc_entry('PurchaseOrders', p.get('series'), p.get('docNum')),
+            'Get_SO_Details': lambda p: self._doc_entry('Orders', p.get('Series'), p.get('SONumber')),
+            'Get_INVT_DocEntry': lambda p: self._doc_entry('InventoryTransferRequests', p.get('series'), p.get('docNum')),
+            'Get_INVCNT_DocEntry': self._counting_doc_entry,
+            'Get_Open_PO_DocNum': lambda p: self._open_documents('PurchaseOrders', p.get('series'), 'PO'),
+            'Get_Open_INVTRNF_DocNum': lambda p: self._open_documents('InventoryTransferRequests', p.get('series'), 'INVT'),
+            'Bin_Item_Stock': self._bin_item_stock,
+            'Bin_Batch_Serial_Stock': self._bin_batch_stock,
+        }
+
+    def run(self, name, params):
+        handler = self.handlers.get(name)
+        return None if handler is None else handler(params)
+
+    def _item_management(self, params):
+        item = self.data.find('Items', params.get('itemCode'))
+        if item is None:
+            return []
+        batch = 'Y' if item.get('ManageBatchNumbers') == 'tYES' else 'N'
+        serial = 'Y' if item.get('ManageSerialNumbers') == 'tYES' else 'N'
+        return [{'ItemCode': item['ItemCode'], 'ItemName': item['ItemName'], 'BatchNum': batch, 'SerialNum': serial,
+                 'NonBatch_NonSerialMethod': 'Y' if batch == serial == 'N' else 'N'}]
+
+    def _serial_lookup(self, params):
+        serial, warehouse = params.get('seriel_number'), params.get('whcode')
+        return [{'ItemCode': s['ItemCode'], 'DistNumber': s['DistNumber'], 'WhsCode': s['WhsCode']}
+                for s in self.data.serials if s['DistNumber'] == serial and (not warehouse or s['WhsCode'] == warehouse)]
+
+    def _series_validation(self, params):
+        serial, item_code, warehouse = params.get('series'), params.get('itemCode'), params.get('whsCode')
+        return [{'DistNumber': s['DistNumber'], 'ItemCode': s['ItemCode'], 'WhsCode': s['WhsCode']}
+                for s in self.data.serials
+                if s['DistNumber'] == serial and s['ItemCode'] == item_code and (not warehouse or s['WhsCode'] == warehouse)]
+
+    def _batch_series_validation(self, params):
+        """Raw OSRN/OSRQ SQL: DistNumber IN (...) lists and BETWEEN ranges, optional ItemCode/WhsCode"""
+        sql = params.get('sqlQuery', '')
+        literal = r"'((?:[^']|'')*)'"
+        wanted = set()
+        for in_list in re.findall(r"DistNumber\s+IN\s*\(((?:[^')]|'(?:[^']|'')*')*)\)", sql, re.IGNORECASE):
+            wanted.update(value.replace("''", "'") for value in re.findall(literal, in_list))
+        ranges = [(low.replace("''", "'"), high.replace("''", "'")) for low, high in
+                  re.findall(rf"DistNumber\s+BETWEEN\s+{literal}\s+AND\s+{literal}", sql, re.IGNORECASE)]
+        item = re.search(rf"ItemCode\s*=\s*{literal}", sql)
+        warehouse = re.search(rf"WhsCode\s*=\s*{literal}", sql)
+        rows = []
+        for s in self.data.serials:
+            serial = s['DistNumber']
+            if serial not in wanted and not any(low <= serial <= high for low, high in ranges):
+                continue
+            if item and s['ItemCode'] != item.group(1):
+                continue
+            in_stock = s['WhsCode'] and (not warehouse or s['WhsCode'] == warehouse.group(1))
+            rows.append({'SerialNumber': serial, 'ItemCode': s['ItemCode'], 'SystemNumber': s['SysNumber'],
+                         'WhsCode': s['WhsCode'], 'AvailableInWarehouse': 1 if in_stock else 0})
+        return sorted(rows, key=lambda row: row['SerialNumber'])
+
+    def _serial_index_delta(self, params):
+        """Serials changed since sinceDate (OSRN.UpdateDate) or sinceLog (OITL.LogEntry)"""
+        since_date, since_log = params.get('sinceDate', '1900-01-01'), int(params.get('sinceLog') or 0)
+        bins = {b['BinCode']: b['AbsEntry'] for b in self.data.collections.get('BinLocations', [])}
+        return [{'SerialNumber': s['DistNumber'], 'ItemCode': s['ItemCode'], 'SystemNumber': s['SysNumber'],
+                 'Status': s['Status'], 'WhsCode': s['WhsCode'], 'BinCode': s.get('BinCode'),
+                 'BinAbs': bins.get(s.get('BinCode')), 'UpdateDate': s['UpdateDate'], 'LogEntry': s['LogEntry']}
+                for s in self.data.serials if s['UpdateDate'][:10] >= since_date or s['LogEntry'] > since_log]
+
+    def _doc_entry(self, collection, series, doc_num):
+        return [{'DocEntry': d['DocEntry'], 'DocNum': d['DocNum']} for d in self.data.collection(collection) or []
+                if str(d.get('DocNum')) == str(doc_num) and (not series or str(d.get('Series')) == str(series))]
+
+    def _counting_doc_entry(self, params):
+        return [{'DocEntry': d['DocumentEntry'], 'DocNum': d['DocumentNumber']}
+                for d in self.data.collection('InventoryCountings') or []
+                if str(d.get('DocumentNumber')) == str(params.get('docNum'))]
+
+    def _open_documents(self, collection, series, series_kind):
+        names = {str(s['Series']): s['SeriesName'] for s in self.data.series[series_kind]}
+        return [{'DocEntry': d['DocEntry'], 'DocNum': d['DocNum'], 'Series': d.get('Series'),
+                 'SeriesName': names.get(str(d.get('Series'))), 'CardCode': d.get('CardCode'),
+                 'CardName': d.get('CardName')}
+                for d in self.data.collection(collection) or []
+                if d.get('DocumentStatus') == 'bost_Open' and (not series or str(d.get('Series')) == str(series))]
+
+    def _bin_item_stock(self, params):
+        items = {i['ItemCode']: i for i in self.data.collection('Items') or []}
+        rows = []
+        for row in self.data.bin_item_stock:
+            if row['BinCode'] != params.get('binCode') or row['OnHandQty'] <= 0:
+                continue
+            item = items.get(row['ItemCode'], {})
+            warehouse_info = next((w for w in item.get('ItemWarehouseInfoCollection', [])
+                                   if w['WarehouseCode'] == row['WhsCode']), {})
+            rows.append({'ItemCode': row['ItemCode'], 'ItemName': item.get('ItemName'),
+                         'InvntryUom': item.get('InventoryUOM'), 'OnHandQty': row['OnHandQty'],
+                         'QuantityOnStock': item.get('QuantityOnStock'), 'WhsCode': row['WhsCode'],
+                         'Ordered': warehouse_info.get('Ordered', 0),
+                         'AvgPrice': warehouse_info.get('StandardAveragePrice', 0)})
+        return rows
+
+    def _bin_batch_stock(self, params):
+        return [{k: v for k, v in row.items() if k != 'BinCode'}
+                for row in self.data.bin_batch_stock if row['BinCode'] == params.get('binCode')]
+
+
+# ================================
+# Record / replay fixtures
+# ================================
+
+def fixture_key(method, path, query, body):
+    """Stable key for one request: method, path, sorted query and canonical JSON body"""
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True)
+        except (ValueError, UnicodeDecodeError):
+            body = body.decode('utf-8', errors='replace') if isinstance(body, bytes) else body
+    canonical = json.dumps([method.upper(), unquote(path), sorted(query), body or ''])
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class FixtureStore:
+    """Recorded Service Layer responses, one JSON file per distinct request"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._fixtures = {}
+        if directory and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    try:
+                        with open(os.path.join(directory, name), encoding='utf-8') as handle:
+                            fixture = json.load(handle)
+                        self._fixtures[fixture['key']] = fixture
+                    except (ValueError, KeyError, OSError) as e:
+                        logging.warning(f"⚠️ Skipping unreadable fixture {name}: {e}")
+
+    def __len__(self):
+        return len(self._fixtures)
+
+    def get(self, key):
+        with self._lock:
+            return self._fixtures.get(key)
+
+    def save(self, key, method, path, query, body, status, content_type, text):
+        entity = re.sub(r'[^A-Za-z0-9_]+', '_', unquote(path)[len(SERVICE_ROOT):].split('(')[0])[:60] or 'root'
+        fixture = {'key': key, 'method': method, 'path': path, 'query': query,
+                   'body': body.decode('utf-8', errors='replace') if isinstance(body, bytes) else body,
+                   'status': status, 'content_type': content_type, 'response': text,
+                   'recorded_at': datetime.utcnow().isoformat()}
+        with self._lock:
+            self._fixtures[key] = fixture
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{method}_{entity}_{key[:12]}.json"), 'w', encoding='utf-8') as handle:
+                json.dump(fixture, handle, indent=2)
+
+
+# ================================
+# HTTP server
+# ================================
+
+def endpoint_label(path):
+    """Entity keys collapsed so stats group by endpoint rather than by document"""
+    path = unquote(path.split('?', 1)[0])
+    if path.startswith(SERVICE_ROOT):
+        path = path[len(SERVICE_ROOT):]
+    if path.startswith('SQLQueries('):
+        return path
+    return re.sub(r"\((?:'[^']*'|[^)]*)\)", '({key})', path)
+
+
+class StandinState:
+    def __init__(self, dataset, injection, fixtures=None, upstream=None, require_session=True,
+                 session_timeout=30):
+        self.dataset = dataset
+        self.sql = SQLQueryCatalog(dataset)
+        self.injection = injection
+        self.fixtures = fixtures
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.require_session = require_session
+        self.session_timeout = session_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, endpoint, status, elapsed):
+        with self.lock:
+            entry = self.stats.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_ms': 0.0})
+            entry['count'] += 1
+            entry['errors'] += 1 if status >= 400 else 0
+            entry['total_ms'] += elapsed * 1000
+
+    def stats_snapshot(self):
+        with self.lock:
+            return {endpoint: dict(entry, avg_ms=round(entry['total_ms'] / entry['count'], 2) if entry['count'] else 0)
+                    for endpoint, entry in sorted(self.stats.items())}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'SAPStandin/1.0'
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        logging.debug("standin: " + format % args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    # -- plumbing ---------------------------------------------------------
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, status, payload=None, content_type='application/json', headers=None, raw=None):
+        body = raw if raw is not None else (b'' if payload is None else json.dumps(payload).encode('utf-8'))
+        self.send_response(status)
+        if body or status not in (204, 304):
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or []):
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method):
+        started = time.monotonic()
+        body = self._body()
+        split = urlsplit(self.path)
+        path = split.path
+
+        if path.startswith('/__standin/'):
+            return self._control(method, path, body)
+
+        endpoint = endpoint_label(path)
+        injected = self.state.injection.for_endpoint(endpoint)
+        if injected['hang_rate'] and random.random() < injected['hang_rate']:
+            time.sleep(injected['hang_seconds'])
+            self.close_connection = True
+            return
+        delay_ms = injected['latency_ms'] + random.uniform(-injected['jitter_ms'], injected['jitter_ms'])
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+        if injected['error_rate'] and random.random() < injected['error_rate'] and not path.endswith('/Login'):
+            status = int(injected['error_status'])
+            self._reply(status, sap_error(-1, f'Injected stand-in error ({status})'))
+        else:
+            status = self._dispatch(method, path, parse_qsl(split.query, keep_blank_values=True), body)
+        self.state.record(endpoint, status, time.monotonic() - started)
+
+    def _control(self, method, path, body):
+        if path == '/__standin/stats':
+            return self._reply(200, {'endpoints': self.state.stats_snapshot(), 'injection': self.state.injection.as_dict(),
+                                     'sessions': len(self.state.sessions),
+                                     'fixtures': len(self.state.fixtures) if self.state.fixtures else 0})
+        if path == '/__standin/config' and method == 'POST':
+            self.state.injection.update(json.loads(body or b'{}'))
+            return self._reply(200, self.state.injection.as_dict())
+        if path == '/__standin/reset' and method == 'POST':
+            with self.state.lock:
+                self.state.stats.clear()
+            for name in CREATED_DOCUMENTS:
+                self.state.dataset.collections[name] = []
+            return self._reply(204)
+        return self._reply(404, sap_error(-1, 'Unknown stand-in control endpoint'))
+
+    # -- routing ----------------------------------------------------------
+
+    def _dispatch(self, method, path, query, body):
+        if self.state.upstream:
+            return self._proxy(method, path, query, body)
+
+        if self.state.fixtures is not None and not path.endswith(('/Login', '/Logout', '/$batch')):
+            fixture = self.state.fixtures.get(fixture_key(method, path, query, body))
+            if fixture:
+                self._reply(fixture['status'], raw=(fixture['response'] or '').encode('utf-8'),
+                            content_type=fixture.get('content_type') or 'application/json')
+                return fixture['status']
+
+        if not path.startswith(SERVICE_ROOT):
+            self._reply(404, sap_error(-1, 'Not a Service Layer path'))
+            return 404
+        resource = unquote(path[len(SERVICE_ROOT):])
+
+        if resource == 'Login' and method == 'POST':
+            return self._login(body)
+        if resource == 'Logout':
+            self._drop_session()
+            self._reply(204)
+            return 204
+        if self.state.require_session and not self._valid_session():
+            self._reply(401, sap_error(301, 'Invalid session or session already timeout.'))
+            return 401
+
+        status, payload, headers = self.route(method, resource, dict(query), body, self.headers)
+        if isinstance(payload, (bytes, bytearray)):
+            self._reply(status, raw=bytes(payload), content_type=headers.get('Content-Type', 'application/json'))
+        else:
+            self._reply(status, payload)
+        return status
+
+    def route(self, method, resource, params, body, headers):
+        """Answer one Service Layer call; returns (status, payload or bytes, response headers)"""
+        try:
+            if resource == '$batch' and method == 'POST':
+                content_type, raw = self._batch(headers.get('Content-Type', ''), body)
+                return 202, raw, {'Content-Type': content_type}
+
+            sql = re.match(r"^SQLQueries\('([^']+)'\)/List$", resource)
+            if sql:
+                payload = json.loads(body or b'{}')
+                rows = self.state.sql.run(sql.group(1), parse_param_list(payload.get('ParamList', '')))
+                if rows is None:
+                    return 404, sap_error(-1, f"SQL query '{sql.group(1)}' is not defined"), {}
+                if 'odata.maxpagesize' in (headers.get('Prefer') or ''):
+                    # Paged like the Service Layer; the nextLink is POSTed again with the same body
+                    return self._list_rows(resource, rows, params, headers)
+                return 200, {'odata.metadata': f'$metadata#SAPB1.SQLQueryResult', 'SqlText': '', 'value': rows}, {}
+
+            if resource.startswith('$crossjoin('):
+                return self._crossjoin(params, headers)
+
+            entity_match = re.match(r"^([A-Za-z]+)(?:\((?:'((?:[^']|'')*)'|([^)]*))\))?(?:/(.*))?$", resource)
+            if not entity_match:
+                return 404, sap_error(-1, f'Unknown resource {resource}'), {}
+            name, string_key, plain_key, sub_resource = entity_match.groups()
+            key = string_key.replace("''", "'") if string_key is not None else plain_key
+            if self.state.dataset.collection(name) is None:
+                return 404, sap_error(-1, f'Entity set {name} is not provided by the stand-in'), {}
+
+            if key is None and sub_resource == '$count' and method == 'GET':
+                return 200, len(apply_query(self.state.dataset.collection(name), params)), {}
+            if key is None:
+                if method == 'GET':
+                    return self._list(name, params, headers)
+                if method == 'POST':
+                    document = self.state.dataset.create(name, json.loads(body or b'{}'))
+                    return 201, document, {}
+            else:
+                if method == 'GET':
+                    row = self.state.dataset.find(name, key)
+                    return (200, row, {}) if row is not None else (404, sap_error(-2028, 'No matching records found (ODBC -2028)'), {})
+                if method in ('PATCH', 'PUT'):
+                    row = self.state.dataset.update(name, key, json.loads(body or b'{}'))
+                    return (204, None, {}) if row is not None else (404, sap_error(-2028, 'No matching records found (ODBC -2028)'), {})
+            return 405, sap_error(-1, f'{method} is not supported on {name}'), {}
+        except ValueError as e:
+            return 400, sap_error(-1, str(e)), {}
+
+    def _list(self, name, params, headers):
+        rows = apply_query(self.state.dataset.collection(name), params)
+        prefer = re.search(r'odata\.maxpagesize=(\d+)', headers.get('Prefer', '') or '')
+        page_size = int(prefer.group(1)) if prefer else DEFAULT_PAGE_SIZE
+        skip = int(params.get('$skip') or 0)
+        top = int(params['$top']) if params.get('$top') else None
+        window = rows[skip:]
+        if top is not None:
+            window = window[:top]
+        page = window[:page_size]
+        payload = {'odata.metadata': f'$metadata#{name}', 'value': page}
+        if len(window) > page_size:
+            next_params = dict(params, **{'$skip': skip + page_size})
+            if top is not None:
+                next_params['$top'] = top - page_size
+            payload['odata.nextLink'] = f"{name}?{urlencode(next_params, safe=NEXT_LINK_SAFE)}"
+        return 200, payload, {}
+
+    def _crossjoin(self, params, headers):
+        """$crossjoin(Items,Items/ItemWarehouseInfoCollection) filtered to one warehouse"""
+        warehouse = re.search(r"WarehouseCode eq '([^']*)'", params.get('$filter', ''))
+        rows = []
+        for item in self.state.dataset.collection('Items') or []:
+            for info in item.get('ItemWarehouseInfoCollection', []):
+                if warehouse and info['WarehouseCode'] != warehouse.group(1):
+                    continue
+                rows.append({'Items': {'ItemCode': item['ItemCode'], 'ItemName': item['ItemName'],
+                                       'QuantityOnStock': item['QuantityOnStock']},
+                             'Items/ItemWarehouseInfoCollection': {'InStock': info['InStock'], 'Ordered': info['Ordered'],
+                                                                   'StandardAveragePrice': info['StandardAveragePrice']}})
+        params = {k: v for k, v in params.items() if k not in ('$filter', '$expand')}
+        status, payload, response_headers = self._list_rows('$crossjoin(Items,Items/ItemWarehouseInfoCollection)',
+                                                            rows, params, headers)
+        return status, payload, response_headers
+
+    def _list_rows(self, name, rows, params, headers):
+        collections = self.state.dataset.collections
+        collections['__rows__'] = rows
+        try:
+            status, payload, response_headers = self._list('__rows__', params, headers)
+        finally:
+            collections.pop('__rows__', None)
+        payload['odata.metadata'] = f'$metadata#{name}'
+        if 'odata.nextLink' in payload:
+            payload['odata.nextLink'] = payload['odata.nextLink'].replace('__rows__', name, 1)
+        return status, payload, response_headers
+
+    def _batch(self, content_type, body):
+        """Run every part of a multipart $batch through route() and answer in kind"""
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type or '')
+        if not boundary:
+            raise ValueError('Missing $batch boundary')
+        response_boundary = f'batchresponse_{uuid.uuid4().hex}'
+        out = []
+        for part in _split_multipart(body.decode('utf-8', errors='replace'), boundary.group(1)):
+            part_headers, content = _split_part(part)
+            out.append(f'--{response_boundary}')
+            nested = re.search(r'boundary="?([^";]+)"?', part_headers.get('content-type', ''))
+            if nested:
+                changeset = f'changesetresponse_{uuid.uuid4().hex}'
+                out += [f'Content-Type: multipart/mixed;boundary={changeset}', '']
+                for inner in _split_multipart(content, nested.group(1)):
+                    _, inner_content = _split_part(inner)
+                    out += [f'--{changeset}'] + self._batch_part(inner_content)
+                out.append(f'--{changeset}--')
+            else:
+                out += self._batch_part(content)
+        out += [f'--{response_boundary}--', '']
+        return f'multipart/mixed;boundary={response_boundary}', '\r\n'.join(out).encode('utf-8')
+
+    def _batch_part(self, request_text):
+        request_line, _, rest = request_text.replace('\r\n', '\n').lstrip('\n').partition('\n')
+        method, _, target = request_line.partition(' ')
+        target = target.rsplit(' ', 1)[0]
+        part_headers, part_body = _split_part(rest)
+        split = urlsplit(target)
+        resource = unquote(split.path)
+        if resource.startswith(SERVICE_ROOT):
+            resource = resource[len(SERVICE_ROOT):]
+        status, payload, _ = self.route(method.upper(), resource, dict(parse_qsl(split.query, keep_blank_values=True)),
+                                        part_body.encode('utf-8'), {k.title(): v for k, v in part_headers.items()})
+        text = '' if payload is None else json.dumps(payload)
+        reason = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found'}.get(status, '')
+        return ['Content-Type: application/http', 'Content-Transfer-Encoding: binary', '',
+                f'HTTP/1.1 {status} {reason}', 'Content-Type: application/json', '', text]
+
+    # -- sessions ---------------------------------------------------------
+
+    def _login(self, body):
+        try:
+            credentials = json.loads(body or b'{}')
+        except ValueError:
+            credentials = {}
+        if not credentials.get('UserName') or not credentials.get('CompanyDB'):
+            self._reply(401, sap_error(100000027, 'Login failed'))
+            return 401
+        session_id = str(uuid.uuid4())
+        with self.state.lock:
+            self.state.sessions[session_id] = time.monotonic()
+        self._reply(200, {'odata.metadata': '$metadata#B1Sessions/@Element', 'SessionId': session_id,
+                          'Version': '1000200', 'SessionTimeout': self.state.session_timeout},
+                    headers=[('Set-Cookie', f'B1SESSION={session_id}; path=/b1s; HttpOnly'),
+                             ('Set-Cookie', 'ROUTEID=.node1; path=/b1s')])
+        return 200
+
+    def _session_id(self):
+        match = re.search(r'B1SESSION=([^;\s]+)', self.headers.get('Cookie', '') or '')
+        return match.group(1) if match else None
+
+    def _valid_session(self):
+        session_id = self._session_id()
+        with self.state.lock:
+            last_seen = self.state.sessions.get(session_id)
+            if last_seen is None or time.monotonic() - last_seen > self.state.session_timeout * 60:
+                self.state.sessions.pop(session_id, None)
+                return False
+            self.state.sessions[session_id] = time.monotonic()
+            return True
+
+    def _drop_session(self):
+        with self.state.lock:
+            self.state.sessions.pop(self._session_id(), None)
+
+    # -- record mode ------------------------------------------------------
+
+    def _proxy(self, method, path, query, body):
+        import requests
+        url = self.state.upstream + self.path
+        forward = {k: v for k, v in self.headers.items() if k.lower() not in ('host', 'content-length', 'connection')}
+        try:
+            response = requests.request(method, url, headers=forward, data=body or None, verify=False, timeout=300)
+        except requests.RequestException as e:
+            self._reply(502, sap_error(-1, f'Upstream Service Layer unreachable: {e}'))
+            return 502
+        content_type = response.headers.get('Content-Type', 'application/json')
+        cookies = [('Set-Cookie', c) for c in response.raw.headers.getlist('Set-Cookie')] \
+            if hasattr(response.raw.headers, 'getlist') else []
+        self._reply(response.status_code, raw=response.content, content_type=content_type, headers=cookies)
+        # Never store credentials or session handshakes; $batch bodies carry random boundaries
+        if self.state.fixtures is not None and not path.endswith(('/Login', '/Logout', '/$batch')):
+            self.state.fixtures.save(fixture_key(method, path, query, body), method, path, query, body,
+                                     response.status_code, content_type, response.text)
+        return response.status_code
+
+
+def _split_multipart(text, boundary):
+    parts = []
+    for chunk in text.split(f'--{boundary}')[1:]:
+        if chunk.startswith('--'):
+            break
+        parts.append(chunk.strip('\r\n'))
+    return parts
+
+
+def _split_part(text):
+    head, _, content = text.replace('\r\n', '\n').partition('\n\n')
+    headers = {}
+    for line in head.split('\n'):
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers, content
+
+
+def start_standin_server(host='127.0.0.1', port=0, dataset=None, injection=None, fixtures_dir=None,
+                         upstream=None, require_session=True, session_timeout=30):
+    """Start the stand-in in a background thread; returns (server, base_url) for benchmarks and tests"""
+    fixtures = FixtureStore(fixtures_dir) if (fixtures_dir or upstream) else None
+    if upstream and not fixtures_dir:
+        raise ValueError('Record mode needs a fixtures directory')
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(dataset or StandinDataset(), injection or InjectionSettings(), fixtures,
+                                upstream, require_session, session_timeout)
+    threading.Thread(target=server.serve_forever, name='sap-standin', daemon=True).start()
+    return server, f'http://{server.server_address[0]}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local SAP B1 Service Layer stand-in for benchmarking')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50000)
+    volumes = parser.add_argument_group('data volumes')
+    volumes.add_argument('--warehouses', type=int, default=3)
+    volumes.add_argument('--bins-per-warehouse', type=int, default=40)
+    volumes.add_argument('--items', type=int, default=500)
+    volumes.add_argument('--business-partners', type=int, default=50)
+    volumes.add_argument('--purchase-orders', type=int, default=100)
+    volumes.add_argument('--sales-orders', type=int, default=100)
+    volumes.add_argument('--pick-lists', type=int, default=50)
+    volumes.add_argument('--transfer-requests', type=int, default=50)
+    volumes.add_argument('--countings', type=int, default=20)
+    volumes.add_argument('--lines-per-document', type=int, default=8)
+    volumes.add_argument('--seed', type=int, default=42)
+    injection = parser.add_argument_group('latency and failure injection')
+    injection.add_argument('--latency-ms', type=float, default=0)
+    injection.add_argument('--jitter-ms', type=float, default=0)
+    injection.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with --error-status')
+    injection.add_argument('--error-status', type=int, default=503)
+    injection.add_argument('--hang-rate', type=float, default=0.0, help='fraction of calls that never answer')
+    injection.add_argument('--hang-seconds', type=float, default=120)
+    injection.add_argument('--profile', help='JSON file: {"default": {...}, "endpoints": {"BinLocations": {"latency_ms": 300}}}')
+    fixtures = parser.add_argument_group('record and replay')
+    fixtures.add_argument('--record', metavar='UPSTREAM', help='proxy to this Service Layer and record responses')
+    fixtures.add_argument('--replay', metavar='DIR', help='serve recorded fixtures from DIR before generated data')
+    fixtures.add_argument('--fixtures', metavar='DIR', help='where --record writes fixtures (default sap_fixtures)')
+    fixtures.add_argument('--import-assets', metavar='DIR', help='load pasted OData responses as real collections')
+    parser.add_argument('--no-auth', action='store_true', help='accept calls without a B1SESSION cookie')
+    parser.add_argument('--session-timeout', type=int, default=30, help='minutes of inactivity before a session expires')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    settings = InjectionSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status,
+                                 args.hang_rate, args.hang_seconds)
+    if args.profile:
+        with open(args.profile, encoding='utf-8') as handle:
+            profile = json.load(handle)
+        settings.update(dict(profile.get('default', {}), endpoints=profile.get('endpoints', {})))
+
+    dataset = StandinDataset(args.warehouses, args.bins_per_warehouse, args.items, args.business_partners,
+                             args.purchase_orders, args.sales_orders, args.pick_lists, args.transfer_requests,
+                             args.countings, args.lines_per_document, args.seed)
+    if args.import_assets:
+        for name in sorted(os.listdir(args.import_assets)):
+            entity = dataset.load_odata_dump(os.path.join(args.import_assets, name))
+            if entity:
+                logging.info(f"📥 Loaded {len(dataset.collection(entity))} {entity} from {name}")
+
+    fixtures_dir = args.fixtures or ('sap_fixtures' if args.record else None) or args.replay
+    server, url = start_standin_server(args.host, args.port, dataset, settings, fixtures_dir, args.record,
+                                       require_session=not args.no_auth, session_timeout=args.session_timeout)
+    mode = f"recording {args.record} into {fixtures_dir}" if args.record else \
+        f"replaying {len(server.state.fixtures)} fixture(s) from {fixtures_dir}" if args.replay else "generated data"
+    logging.info(f"✅ SAP B1 stand-in Service Layer at {url}{SERVICE_ROOT} ({mode})")
+    logging.info(f"💡 Point the WMS at it with SAP_B1_SERVER={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+// SAP B1 posting job status - approvals queue the SAP post and return a job_id to poll
+function pollSapJob(jobId, options = {}) {
+    const interval = options.interval || 2000;
+    const timeout = options.timeout || 120000;
+    const onUpdate = options.onUpdate || function () {};
+    const startedAt = Date.now();
+
+    return new Promise((resolve, reject) => {
+        function check() {
+            fetch(`/api/sap-jobs/${jobId}`, { headers: { 'Accept': 'application/json' } })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                    }
+                    return response.json();
+                })
+                .then(job => {
+                    onUpdate(job);
+                    if (job.status === 'succeeded' || job.status === 'failed') {
+                        resolve(job);
+                    } else if (Date.now() - startedAt > timeout) {
+                        // Still queued (e.g. SAP offline) - the worker keeps retrying in the background
+                        resolve(job);
+                    } else {
+                        setTimeout(check, interval);
+                    }
+                })
+                .catch(reject);
+        }
+        check();
+    });
+}
+
+function describeSapJob(job) {
+    if (job.status === 'succeeded') {
+        return `Posted to SAP B1 as document ${job.sap_document_number}`;
+    }
+    if (job.status === 'failed') {
+        return `SAP B1 posting failed after ${job.attempts} attempt(s): ${job.last_error}`;
+    }
+    const retryNote = job.last_error ? ` - last error: ${job.last_error}` : '';
+    return `SAP B1 posting is still queued (job #${job.job_id}, attempt ${job.attempts}/${job.max_attempts})${retryNote}. It will keep retrying in the background.`;
+}